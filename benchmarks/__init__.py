@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+"""
+TableQA 基准测试工具包
+
+- stub_llm_server: OpenAI 兼容的本地桩模型服务
+- dataset: 基准数据集与问题集
+- run_benchmark: 端到端回放压测（/query、/chat、/execute_raw_sql）
+- compare: 对比两次压测结果
+- bench_sql_lexer: SQL 校验/提取微基准
+- bench_sql_prepare: SQL 参数化与预编译语句缓存微基准
+- bench_prefix_cache: prompt 前缀缓存的首 token 耗时对比
+- bench_generation: NL2SQL stop / 预填的解码耗时对比
+- bench_serialization: 查询结果序列化与压缩的 CPU 耗时和字节数
+- bench_startup: 服务冷启动导入耗时（python -X importtime），检查重依赖是否懒加载
+- bench_materialization: 高频聚合查询扫描基础表与读取物化汇总表的耗时对比
+- bench_result_spill: 大结果全部读入内存与落盘为结果句柄的内存峰值、耗时及分页读取耗时
+- bench_engines: 同一批 SQL 由 SQLite 与 DuckDB（读业务库 / Parquet 镜像）执行的耗时对比
+- bench_hot_tier: 同一批 SQL 读取数据库文件与读取内存热表的耗时对比
+"""
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+执行引擎基准：同一批 SQL 分别由 SQLite 与 DuckDB（直接读业务库 / 读 Parquet 镜像）执行
+
+    python -m benchmarks.bench_engines --rows 1000000 --repeat 5
+    python -m benchmarks.bench_engines --check
+
+需要安装 duckdb。对 dataset.SAMPLE_SQLS 中的每条 SQL 记录各引擎的耗时，并校验结果与 SQLite 一致
+（没有 ORDER BY 的分组结果两种引擎的行顺序不同，比较前排序）。Parquet 模式另记录导出镜像的耗时。
+
+--check 只做正确性校验：把基准表路由到 DuckDB，经由 EngineRouter.route / execute 执行 SAMPLE_SQLS 与
+方言差异的探测查询，检查实际执行的引擎（SQLite 特有写法应退回 SQLite）、列名与结果是否与 SQLite 一致，
+有不一致时以非零状态码退出。
+"""
+import argparse
+import importlib.util
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from src.services.query_engine import DuckDBEngine, EngineRouter, SQLiteEngine
+from src.utils.sql_normalizer import normalize_sql
+
+from .bench_materialization import same_rows
+from .dataset import BENCH_TABLE, SAMPLE_SQLS, generate_dataset
+from .stats import save_results, summarize
+
+# 方言差异的探测查询：(SQL 模板, 期望实际执行的引擎)
+DIALECT_SQLS = [
+    ("SELECT `件数` / 3 AS q, COUNT(*) AS n FROM {table} GROUP BY q", "duckdb"),  # 整数相除
+    ("SELECT `件数` / 0 AS q FROM {table} LIMIT 1", "duckdb"),  # 除以 0 得到 NULL
+    ("SELECT COUNT(*) FROM {table} WHERE `销售渠道` || 'X' LIKE '%x'", "duckdb"),  # LIKE 不区分 ASCII 大小写
+    ("SELECT NULLIF(`件数`, 1) AS n FROM {table} ORDER BY n LIMIT 5", "duckdb"),  # 升序时 NULL 在前
+    ("SELECT NULLIF(`件数`, 1) AS n FROM {table} ORDER BY n DESC LIMIT 5", "duckdb"),  # 降序时 NULL 在后
+    ("SELECT strftime('%Y', `签单日期`) AS y, COUNT(*) FROM {table} GROUP BY y", "sqlite"),  # SQLite 的参数顺序
+    ("SELECT total(`保费`) FROM {table}", "sqlite"),  # DuckDB 没有 total()
+    ("SELECT COUNT(*) FROM {table} -- 行尾注释", "duckdb"),  # 列名探测不被行尾注释截断
+]
+
+
+def timed(execute, repeat: int):
+    samples = []
+    rows: List[tuple] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cur = execute()
+        rows = [tuple(row) for row in cur.fetchall()]
+        samples.append(time.perf_counter() - start)
+        cur.close()
+    return samples, sorted(rows, key=repr)
+
+
+class FileSQLiteEngine(SQLiteEngine):
+    """读取指定数据库文件的 SQLite 引擎（服务中的 SQLiteEngine 读取业务库）"""
+
+    def __init__(self, db_path: str):
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+
+    def connection(self) -> sqlite3.Connection:
+        return self.conn
+
+    def close(self):
+        self.conn.close()
+
+
+def fetch(cur) -> Dict[str, Any]:
+    columns = [d[0] for d in cur.description]
+    rows = [tuple(row) for row in cur.fetchall()]
+    cur.close()
+    return {"columns": columns, "rows": rows}
+
+
+def check_router(db_path: str, engine: DuckDBEngine) -> List[Dict[str, Any]]:
+    """经由路由器执行 SAMPLE_SQLS 与方言探测查询，逐条与 SQLite 比较"""
+    sqlite_engine = FileSQLiteEngine(db_path)
+    router = EngineRouter({"sqlite": sqlite_engine, engine.name: engine}, default="sqlite",
+                          table_routes={BENCH_TABLE: engine.name}, aggregate="")
+    checks = [(t, engine.name) for t in SAMPLE_SQLS] + DIALECT_SQLS
+    results = []
+    try:
+        for template, expected in checks:
+            sql = template.format(table=BENCH_TABLE)
+            norm = normalize_sql(sql)
+            base = fetch(sqlite_engine.execute(sql, norm))
+            cur, used = router.execute(router.route(sql), sql, norm)
+            got = fetch(cur)
+            if "ORDER BY" in sql.upper():
+                identical = same_rows(base["rows"], got["rows"])
+            elif "LIMIT" in sql.upper():
+                identical = len(base["rows"]) == len(got["rows"])  # 没有 ORDER BY 时返回哪些行不确定
+            else:
+                identical = same_rows(sorted(base["rows"], key=repr), sorted(got["rows"], key=repr))
+            entry = {"sql": sql, "engine": used.name, "expected_engine": expected,
+                     "columns_match": got["columns"] == base["columns"], "identical": identical}
+            entry["ok"] = used.name == expected and entry["columns_match"] and identical
+            results.append(entry)
+            print(f"[{'INFO' if entry['ok'] else 'WARNING'}] engine={used.name:<7} columns_match={entry['columns_match']}"
+                  f"  identical={identical}  {sql[:60]}")
+    finally:
+        sqlite_engine.close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SQLite 与 DuckDB 执行同一批 SQL 的耗时对比")
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--sources", nargs="+", default=["sqlite", "parquet"], choices=["sqlite", "parquet"],
+                        help="DuckDB 的数据源")
+    parser.add_argument("--check", action="store_true", help="只经由路由器校验结果与 SQLite 一致，不计时")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    if importlib.util.find_spec("duckdb") is None:
+        print("[WARNING] 未安装 duckdb（pip install duckdb），无法对比执行引擎")
+        return
+    if args.check:
+        sys.exit(0 if run_checks(args) else 1)
+
+    work_dir = tempfile.mkdtemp(prefix="tableqa-bench-")
+    try:
+        db_path = generate_dataset(work_dir, rows=args.rows)["db_path"]
+        engines = {}
+        prepare_ms = {}
+        for source in args.sources:
+            engine = DuckDBEngine(db_path=db_path, source=source, parquet_dir=f"{work_dir}/parquet")
+            start = time.perf_counter()
+            engine.prepare_table(BENCH_TABLE)
+            prepare_ms[source] = round((time.perf_counter() - start) * 1000, 1)
+            engines[f"duckdb_{source}"] = engine
+            print(f"[INFO] DuckDB（{source}）准备表耗时 {prepare_ms[source]:.1f}ms")
+
+        conn = sqlite3.connect(db_path)
+        results: List[Dict[str, Any]] = []
+        try:
+            for template in SAMPLE_SQLS:
+                sql = template.format(table=BENCH_TABLE)
+                norm = normalize_sql(sql)
+                base_samples, base_rows = timed(lambda: conn.execute(norm.text, norm.params), args.repeat)
+                entry: Dict[str, Any] = {"sql": sql, "sqlite_ms": summarize(base_samples)}
+                line = f"[INFO] sqlite_p50={entry['sqlite_ms']['p50']:>8.2f}ms"
+                for name, engine in engines.items():
+                    samples, rows = timed(lambda: engine.execute(sql, norm), args.repeat)
+                    # 带 LIMIT 的明细查询两种引擎返回的行可以不同，只比较行数
+                    identical = len(rows) == len(base_rows) if "LIMIT" in sql.upper() else same_rows(base_rows, rows)
+                    entry[name] = {"ms": summarize(samples), "identical": identical}
+                    line += f"  {name}_p50={entry[name]['ms']['p50']:>8.2f}ms identical={identical}"
+                results.append(entry)
+                print(f"{line}  {sql[:50]}")
+        finally:
+            conn.close()
+            for engine in engines.values():
+                engine.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    for name in engines:
+        total = sum(r[name]["ms"]["p50"] for r in results)
+        base = sum(r["sqlite_ms"]["p50"] for r in results)
+        print(f"[INFO] 每轮合计 sqlite={base:.1f}ms  {name}={total:.1f}ms")
+
+    meta = {"rows": args.rows, "repeat": args.repeat, "duckdb": duckdb.__version__, "prepare_ms": prepare_ms}
+    output = save_results("engines", meta, results, args.output)
+    print(f"[INFO] 结果已保存: {output}")
+
+
+def run_checks(args) -> bool:
+    work_dir = tempfile.mkdtemp(prefix="tableqa-bench-")
+    failed = 0
+    try:
+        db_path = generate_dataset(work_dir, rows=min(args.rows, 50000))["db_path"]
+        for source in args.sources:
+            engine = DuckDBEngine(db_path=db_path, source=source, parquet_dir=f"{work_dir}/parquet")
+            try:
+                engine.prepare_table(BENCH_TABLE)
+                print(f"[INFO] 校验 DuckDB（{source}，sqlite_scan={engine.stats()['sqlite_scan']}）")
+                failed += sum(1 for r in check_router(db_path, engine) if not r["ok"])
+            finally:
+                engine.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    if failed:
+        print(f"[WARNING] {failed} 条查询经由路由器执行的结果与 SQLite 不一致")
+    else:
+        print("[INFO] 所有查询经由路由器执行的引擎、列名与结果均符合预期")
+    return not failed
+
+
+if __name__ == "__main__":
+    main()
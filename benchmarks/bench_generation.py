@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+NL2SQL 生成参数基准：stop / 预填对解码耗时的影响
+
+    python -m benchmarks.bench_generation --requests 100 --token-rate 50
+
+经 call_model_api 调用桩模型（解码速度 token_rate），桩模型与真实服务一样按 stop / max_tokens / 预填截取回复。
+对比场景（均校验提取出的 SQL 与 baseline 一致）：
+- baseline:     不设 stop，模型在 SQL 代码块之后继续输出解释
+- stop:         默认配置，在代码块结束标记 "\\n```" 处停止
+- prefill_stop: 预填 "```sql\\n"，在 "```" 处停止（需要后端支持续写 assistant 消息，如 vLLM）
+"""
+import argparse
+import json
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import src.config.config_loader as config_loader
+from src.services.sql_service import call_model_api
+from src.utils.metrics import start_request_timer
+from src.utils.sql_parser import extract_sql
+
+from .dataset import BENCH_TABLE, SYNTHETIC_QUESTIONS, generate_dataset
+from .stats import save_results, summarize
+from .stub_llm_server import StubConfig, StubLLMServer
+
+MODEL_NAME = "stub"
+CASES = {
+    "baseline": {"stop": []},
+    "stop": {},
+    "prefill_stop": {"prefill": "```sql\n", "stop": ["```"]},
+}
+
+
+def run_case(url: str, generation: Dict[str, Any], questions: List[str]) -> Dict[str, Any]:
+    config_loader.model_config = {
+        "models": {MODEL_NAME: {"type": "local", "url": url, "generation": {"nl2sql": generation}}},
+        "default_model": MODEL_NAME,
+    }
+    samples, completion_tokens, sqls = [], [], []
+    for question in questions:
+        timer = start_request_timer("bench")
+        start = time.perf_counter()
+        response = call_model_api(question, [BENCH_TABLE], MODEL_NAME)
+        samples.append(time.perf_counter() - start)
+        completion_tokens.append(timer.usage.get("completion_tokens", 0))
+        sqls.append(extract_sql(response))
+    return {"samples": samples, "completion_tokens": completion_tokens, "sqls": sqls}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="NL2SQL stop / 预填解码耗时基准")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--token-rate", type=float, default=50, help="桩模型每秒生成的 token 数")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="tableqa-bench-")
+    server = StubLLMServer(config=StubConfig(token_rate=args.token_rate)).start()
+    try:
+        with open(generate_dataset(work_dir, rows=10)["db_config_file"], encoding="utf-8") as f:
+            config_loader.db_config = json.load(f)
+        questions = [SYNTHETIC_QUESTIONS[i % len(SYNTHETIC_QUESTIONS)] for i in range(args.requests)]
+        runs = {name: run_case(server.url, generation, questions) for name, generation in CASES.items()}
+    finally:
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    baseline = runs["baseline"]
+    results = []
+    for name, run in runs.items():
+        latency = summarize(run["samples"])
+        tokens = sum(run["completion_tokens"]) / len(run["completion_tokens"])
+        same_sql = run["sqls"] == baseline["sqls"]
+        results.append({"case": name, "requests": len(run["samples"]), "latency_ms": latency,
+                        "completion_tokens_mean": round(tokens, 1), "same_sql_as_baseline": same_sql})
+        print(f"[INFO] {name:<13} p50={latency['p50']:>8.2f}ms  mean={latency['mean']:>8.2f}ms  "
+              f"completion_tokens={tokens:>6.1f}  sql_identical={same_sql}")
+
+    base_mean = results[0]["latency_ms"]["mean"]
+    for result in results[1:]:
+        saved = base_mean - result["latency_ms"]["mean"]
+        print(f"[INFO] {result['case']}: 每请求节省解码耗时 {saved:.1f}ms（{saved / base_mean:.1%}）")
+
+    meta = {"requests": args.requests, "token_rate": args.token_rate}
+    output = save_results("generation", meta, results, args.output)
+    print(f"[INFO] 结果已保存: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+内存热表基准：同一批 SQL 读取数据库文件 vs 读取共享内存库中的常驻表
+
+    python -m benchmarks.bench_hot_tier --rows 20000 --repeat 200
+
+生成基准数据集（另加一张 100 行的维度表，模拟高频的小参考表），由 HotTierEngine 挑选并加载常驻表，
+然后对 dataset.SAMPLE_SQLS 与维度表的点查分别记录两种方式的耗时，并校验结果一致。
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from src.services.hot_tier import HotTierEngine
+from src.services.log_store_service import QueryLogStore
+from src.utils.sql_normalizer import normalize_sql
+
+from .dataset import BENCH_TABLE, SAMPLE_SQLS, generate_dataset
+from .stats import save_results, summarize
+
+DIM_TABLE = "bench_region"
+DIM_SQLS = [
+    f"SELECT `负责人` FROM {DIM_TABLE} WHERE `区域编码` = 'R042'",
+    f"SELECT COUNT(*) FROM {DIM_TABLE} WHERE `级别` = 2",
+]
+
+
+def create_dim_table(db_path: str):
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute(f"CREATE TABLE {DIM_TABLE} (`区域编码` TEXT PRIMARY KEY, `负责人` TEXT, `级别` INTEGER)")
+        conn.executemany(f"INSERT INTO {DIM_TABLE} VALUES (?, ?, ?)",
+                         [(f"R{i:03d}", f"负责人{i}", i % 3) for i in range(100)])
+        conn.execute(f"CREATE INDEX idx_{DIM_TABLE}_level ON {DIM_TABLE} (`级别`)")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def timed(conn: sqlite3.Connection, sql: str, repeat: int):
+    norm = normalize_sql(sql)
+    samples = []
+    rows: List[tuple] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = conn.execute(norm.text, norm.params).fetchall()
+        samples.append(time.perf_counter() - start)
+    return samples, rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="数据库文件与内存热表的查询耗时对比")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="tableqa-bench-")
+    tier = None
+    try:
+        db_path = generate_dataset(work_dir, rows=args.rows)["db_path"]
+        create_dim_table(db_path)
+        store = QueryLogStore(db_path=os.path.join(work_dir, "log_store.db"), log_file=os.path.join(work_dir, "q.jsonl"))
+        tier = HotTierEngine(db_path=db_path, store=store)
+        start = time.perf_counter()
+        refreshed = tier.refresh()
+        load_ms = (time.perf_counter() - start) * 1000
+        print(f"[INFO] 加载常驻表 {refreshed['resident']} 耗时 {load_ms:.1f}ms，占用 {tier.stats()['used_bytes']} 字节")
+
+        file_conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        results: List[Dict[str, Any]] = []
+        try:
+            for sql in [t.format(table=BENCH_TABLE) for t in SAMPLE_SQLS] + DIM_SQLS:
+                file_samples, file_rows = timed(file_conn, sql, args.repeat)
+                mem_samples, mem_rows = timed(tier.connection(), sql, args.repeat)
+                entry = {"sql": sql, "file_ms": summarize(file_samples), "memory_ms": summarize(mem_samples),
+                         "identical": file_rows == mem_rows}
+                results.append(entry)
+                print(f"[INFO] file_p50={entry['file_ms']['p50']:>8.3f}ms  memory_p50={entry['memory_ms']['p50']:>8.3f}ms"
+                      f"  identical={entry['identical']}  {sql[:50]}")
+        finally:
+            file_conn.close()
+    finally:
+        if tier is not None:
+            tier.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    file_total = sum(r["file_ms"]["p50"] for r in results)
+    mem_total = sum(r["memory_ms"]["p50"] for r in results)
+    print(f"[INFO] 每轮合计 file={file_total:.2f}ms  memory={mem_total:.2f}ms")
+
+    meta = {"rows": args.rows, "repeat": args.repeat, "load_ms": round(load_ms, 2), "resident": refreshed["resident"]}
+    output = save_results("hot_tier", meta, results, args.output)
+    print(f"[INFO] 结果已保存: {output}")
+
+
+if __name__ == "__main__":
+    main()
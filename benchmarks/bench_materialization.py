@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+物化汇总表基准：高频聚合查询直接扫描基础表 vs 改写为读取汇总表
+
+    python -m benchmarks.bench_materialization --rows 500000 --repeat 5
+
+步骤：生成基准数据集 → 把 dataset.SAMPLE_SQLS 作为查询日志写入临时日志索引库 →
+挖掘并构建汇总表 → 对每条 SQL 分别执行原 SQL 与改写后的 SQL，校验结果一致并对比耗时。
+不能由汇总表还原的 SQL（明细查询等）标记为 not_rewritten。
+"""
+import argparse
+import math
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from src.services.log_store_service import QueryLogStore
+from src.services.materialization_service import MaterializationManager
+from src.utils.sql_normalizer import normalize_sql
+
+from .dataset import BENCH_TABLE, SAMPLE_SQLS, generate_dataset
+from .stats import save_results, summarize
+
+
+def same_rows(a: List[tuple], b: List[tuple]) -> bool:
+    """逐行比较；浮点数允许求和顺序带来的微小误差"""
+    if len(a) != len(b):
+        return False
+    for row_a, row_b in zip(a, b):
+        for x, y in zip(row_a, row_b):
+            if isinstance(x, float) and isinstance(y, (int, float)):
+                if not math.isclose(x, y, rel_tol=1e-9, abs_tol=1e-6):
+                    return False
+            elif x != y:
+                return False
+    return True
+
+
+def timed(conn: sqlite3.Connection, sql: str, repeat: int):
+    samples = []
+    rows: List[tuple] = []
+    columns: List[str] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cur = conn.execute(sql)
+        rows = cur.fetchall()
+        samples.append(time.perf_counter() - start)
+        columns = [c[0] for c in cur.description]
+    return samples, columns, rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="物化汇总表查询耗时基准")
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--log-count", type=int, default=20, help="每条 SQL 写入查询日志的次数")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="tableqa-bench-")
+    try:
+        db_path = generate_dataset(work_dir, rows=args.rows)["db_path"]
+        store = QueryLogStore(db_path=os.path.join(work_dir, "log_store.db"), log_file=os.path.join(work_dir, "q.jsonl"))
+        now = time.time()
+        sqls = [template.format(table=BENCH_TABLE) for template in SAMPLE_SQLS]
+        records = []
+        for sql in sqls:
+            norm = normalize_sql(sql)
+            records.extend({
+                "timestamp": now, "tables": [BENCH_TABLE], "type": 3, "query": "", "sql": sql,
+                "fingerprint": norm.fingerprint, "fingerprint_id": norm.fingerprint_id,
+            } for _ in range(args.log_count))
+        store.ingest(records)
+
+        manager = MaterializationManager(db_path=db_path)
+        start = time.perf_counter()
+        refreshed = manager.refresh(store=store)
+        build_ms = (time.perf_counter() - start) * 1000
+        print(f"[INFO] 构建汇总表 {len(refreshed['built'])} 个，耗时 {build_ms:.1f}ms")
+
+        conn = sqlite3.connect(db_path)
+        results: List[Dict[str, Any]] = []
+        try:
+            for sql in sqls:
+                rewritten = manager.rewrite(sql)
+                base_samples, base_cols, base_rows = timed(conn, sql, args.repeat)
+                base = summarize(base_samples)
+                entry: Dict[str, Any] = {"sql": sql, "base_ms": base}
+                if rewritten is None:
+                    entry["case"] = "not_rewritten"
+                    print(f"[INFO] not_rewritten  base_p50={base['p50']:>8.2f}ms  {sql[:60]}")
+                else:
+                    mv_sql, view = rewritten
+                    mv_samples, mv_cols, mv_rows = timed(conn, mv_sql, args.repeat)
+                    mv = summarize(mv_samples)
+                    identical = mv_cols == base_cols and same_rows(base_rows, mv_rows)
+                    entry.update({"case": "materialized", "view": view.name, "view_rows": view.rows,
+                                  "materialized_ms": mv, "identical": identical})
+                    print(f"[INFO] materialized   base_p50={base['p50']:>8.2f}ms  mv_p50={mv['p50']:>7.2f}ms  "
+                          f"identical={identical}  {sql[:60]}")
+                results.append(entry)
+        finally:
+            conn.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    served = [r for r in results if r["case"] == "materialized"]
+    if served:
+        saved = sum(r["base_ms"]["p50"] - r["materialized_ms"]["p50"] for r in served)
+        print(f"[INFO] 改写 {len(served)}/{len(results)} 条，每轮合计节省 {saved:.1f}ms")
+
+    meta = {"rows": args.rows, "repeat": args.repeat, "build_ms": round(build_ms, 2), "views": refreshed["built"]}
+    output = save_results("materialization", meta, results, args.output)
+    print(f"[INFO] 结果已保存: {output}")
+
+
+if __name__ == "__main__":
+    main()
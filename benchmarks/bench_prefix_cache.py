@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Prompt 前缀缓存基准：首 token 耗时（TTFT）对比
+
+    python -m benchmarks.bench_prefix_cache --requests 300 --rescan-every 50 --prefill-rate 2000
+
+桩模型开启前缀缓存模拟（见 stub_llm_server.PrefixCache），prefill 耗时只计未命中缓存的 prompt token。
+回放的请求随机选取 2~3 张表（顺序随机）与一个问题，每 rescan_every 个请求重新扫描一次表结构。对比场景：
+- legacy: 原实现，样例值每次扫描随机抽取、表按请求顺序拼接、建表语句位于注意事项之前
+- stable: 样例值固定种子抽取、表按名称排序、固定的注意事项在前，建表语句其次，问题最后
+"""
+import argparse
+import random
+import time
+from typing import Dict, List, Tuple
+
+import pandas as pd
+import requests
+
+from src.config.settings import PROMPT_TEMPLATE_FILE
+from src.utils.excel_importer import generate_create_table_with_comments
+from src.utils.schema_trimmer import render_schema
+from src.utils.template_loader import load_template
+
+from .dataset import CHANNELS, COLUMNS, INSURANCE_TYPES, PRODUCTS, REGIONS, SYNTHETIC_QUESTIONS
+from .stats import save_results, summarize
+from .stub_llm_server import StubConfig, StubLLMServer
+
+BUILD_SECTION = "# 建表语句\n{build}\n\n"
+
+
+def legacy_layout(template: str) -> str:
+    """还原调整前的默认布局：建表语句紧跟在角色描述之后、注意事项之前"""
+    if BUILD_SECTION not in template:
+        return template
+    rest = template.replace(BUILD_SECTION, "")
+    head, sep, tail = rest.partition("\n\n")
+    return head + sep + BUILD_SECTION + tail
+
+
+def make_tables(count: int, rows: int, seed: int = 42) -> Dict[str, pd.DataFrame]:
+    """生成 count 张结构相同、数据不同的销售表"""
+    rng = random.Random(seed)
+    tables = {}
+    for t in range(count):
+        records = []
+        for _ in range(rows):
+            i = rng.randrange(len(PRODUCTS))
+            records.append((
+                PRODUCTS[i], INSURANCE_TYPES[i], rng.choice(CHANNELS), rng.choice(REGIONS),
+                round(rng.lognormvariate(9.5, 1.0), 2), rng.randint(1, 20),
+                f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            ))
+        tables[f"sales_{2020 + t}"] = pd.DataFrame.from_records(records, columns=[name for name, _ in COLUMNS])
+    return tables
+
+
+def make_requests(table_names: List[str], count: int, seed: int = 7) -> List[Tuple[List[str], str]]:
+    rng = random.Random(seed)
+    return [
+        (rng.sample(table_names, rng.randint(2, min(3, len(table_names)))), rng.choice(SYNTHETIC_QUESTIONS))
+        for _ in range(count)
+    ]
+
+
+def build_prompts(tables: Dict[str, pd.DataFrame], replay: List[Tuple[List[str], str]],
+                  rescan_every: int, stable: bool) -> List[str]:
+    template = load_template(PROMPT_TEMPLATE_FILE)
+    if not stable:
+        template = legacy_layout(template)
+    prompts = []
+    builds: Dict[str, str] = {}
+    for i, (names, question) in enumerate(replay):
+        if i % rescan_every == 0:
+            # 重新扫描：原实现每次随机抽取样例值，这里用扫描序号作种子模拟
+            seed = 0 if stable else i // rescan_every + 1
+            builds = {name: generate_create_table_with_comments(df, name, seed=seed) for name, df in tables.items()}
+        ordered = sorted(names) if stable else names
+        schema = render_schema([(name, builds[name]) for name in ordered])
+        prompts.append(template.format(query=question, build=schema))
+    return prompts
+
+
+def run_case(prompts: List[str], latency: float, prefill_rate: float) -> Tuple[List[float], float]:
+    """依次发送 prompt，返回各请求耗时（非流式且不模拟解码，即 TTFT）与缓存命中的 token 比例"""
+    server = StubLLMServer(config=StubConfig(latency=latency, prefill_rate=prefill_rate, prefix_cache=True)).start()
+    session = requests.Session()
+    samples = []
+    prompt_tokens = cached_tokens = 0
+    try:
+        for prompt in prompts:
+            start = time.perf_counter()
+            resp = session.post(server.url + "/v1/chat/completions",
+                                json={"messages": [{"role": "user", "content": prompt}]}, timeout=60)
+            resp.raise_for_status()
+            samples.append(time.perf_counter() - start)
+            usage = resp.json()["usage"]
+            prompt_tokens += usage["prompt_tokens"]
+            cached_tokens += usage["prompt_tokens_details"]["cached_tokens"]
+    finally:
+        server.stop()
+    return samples, cached_tokens / prompt_tokens if prompt_tokens else 0.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prompt 前缀缓存 TTFT 基准")
+    parser.add_argument("--tables", type=int, default=4, help="候选表数量")
+    parser.add_argument("--rows", type=int, default=200, help="每张表用于抽取样例值的行数")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--rescan-every", type=int, default=50, help="每多少个请求重新扫描一次表结构")
+    parser.add_argument("--latency", type=float, default=0.02, help="桩模型固定延迟（秒）")
+    parser.add_argument("--prefill-rate", type=float, default=2000, help="桩模型每秒处理的 prompt token 数")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    tables = make_tables(args.tables, args.rows)
+    replay = make_requests(sorted(tables), args.requests)
+
+    results = []
+    for name, stable in (("legacy", False), ("stable", True)):
+        prompts = build_prompts(tables, replay, args.rescan_every, stable)
+        samples, hit_ratio = run_case(prompts, args.latency, args.prefill_rate)
+        ttft = summarize(samples)
+        results.append({"case": name, "requests": len(samples), "ttft_ms": ttft,
+                        "cached_token_ratio": round(hit_ratio, 3)})
+        print(f"[INFO] {name:<8} p50={ttft['p50']:>8.2f}ms  p95={ttft['p95']:>8.2f}ms  "
+              f"mean={ttft['mean']:>8.2f}ms  cached={hit_ratio:.1%}")
+
+    legacy, stable = results[0]["ttft_ms"], results[1]["ttft_ms"]
+    if legacy["mean"]:
+        print(f"[INFO] 平均 TTFT 降低 {(1 - stable['mean'] / legacy['mean']):.1%}")
+
+    meta = {
+        "tables": args.tables,
+        "requests": args.requests,
+        "rescan_every": args.rescan_every,
+        "latency": args.latency,
+        "prefill_rate": args.prefill_rate,
+    }
+    output = save_results("prefix_cache", meta, results, args.output)
+    print(f"[INFO] 结果已保存: {output}")
+
+
+if __name__ == "__main__":
+    main()
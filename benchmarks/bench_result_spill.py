@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+大结果落盘基准：全部读入内存（fetchall + 转字典）vs 写入结果文件并返回句柄
+
+    python -m benchmarks.bench_result_spill --rows 300000 1000000
+
+对每个规模执行 SELECT * 全表查询，记录耗时与 Python 对象的内存峰值（tracemalloc）；
+落盘方式另外测量按句柄随机分页读取与 CSV 导出的耗时。落盘方式的内存峰值应基本不随行数增长。
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+from src.config.settings import RESULT_PAGE_ROWS, RESULT_SPILL_ROWS
+from src.services.result_store import ResultStore
+
+from .dataset import BENCH_TABLE, generate_dataset
+from .stats import save_results, summarize
+
+
+def run_in_memory(conn: sqlite3.Connection, sql: str) -> int:
+    cur = conn.execute(sql)
+    columns = [c[0] for c in cur.description]
+    rows = cur.fetchall()
+    data = [{columns[i]: row[i] for i in range(len(columns))} for row in rows]
+    return len(data)
+
+
+def run_spill(conn: sqlite3.Connection, sql: str, store: ResultStore) -> str:
+    cur = conn.execute(sql)
+    head = cur.fetchmany(RESULT_SPILL_ROWS + 1)
+    return store.spill(cur, head).handle
+
+
+def measure(fn, *args):
+    """先不开 tracemalloc 计时（跟踪分配会显著拖慢执行），再执行一次记录内存峰值"""
+    start = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    value = fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return value, elapsed, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="大结果落盘的内存峰值与耗时基准")
+    parser.add_argument("--rows", type=int, nargs="+", default=[100000, 300000])
+    parser.add_argument("--pages", type=int, default=50, help="随机分页读取次数")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    results: List[Dict[str, Any]] = []
+    for rows in args.rows:
+        work_dir = tempfile.mkdtemp(prefix="tableqa-bench-")
+        try:
+            db_path = generate_dataset(work_dir, rows=rows)["db_path"]
+            store = ResultStore(directory=f"{work_dir}/results", cleanup_interval=0)
+            sql = f"SELECT * FROM {BENCH_TABLE}"
+            conn = sqlite3.connect(db_path)
+            try:
+                _, mem_s, mem_peak = measure(run_in_memory, conn, sql)
+                handle, spill_s, spill_peak = measure(run_spill, conn, sql, store)
+            finally:
+                conn.close()
+
+            rng = random.Random(0)
+            page_samples = []
+            with store.open(handle) as spilled:
+                for _ in range(args.pages):
+                    offset = rng.randrange(0, max(1, spilled.total_rows - RESULT_PAGE_ROWS))
+                    start = time.perf_counter()
+                    spilled.read(offset, RESULT_PAGE_ROWS)
+                    page_samples.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                csv_rows = sum(len(block) for block in spilled.iter_blocks())
+                scan_s = time.perf_counter() - start
+            file_bytes = os.path.getsize(store.path(handle))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        page = summarize(page_samples)
+        entry = {
+            "rows": rows,
+            "in_memory": {"ms": round(mem_s * 1000, 1), "peak_mb": round(mem_peak / 2 ** 20, 1)},
+            "spill": {"ms": round(spill_s * 1000, 1), "peak_mb": round(spill_peak / 2 ** 20, 1),
+                      "file_mb": round(file_bytes / 2 ** 20, 1)},
+            "page_ms": page,
+            "full_scan_ms": round(scan_s * 1000, 1),
+            "full_scan_rows": csv_rows,
+        }
+        results.append(entry)
+        print(f"[INFO] rows={rows:>8}  in_memory: {entry['in_memory']['ms']:>8.1f}ms peak={entry['in_memory']['peak_mb']:>7.1f}MB"
+              f"  spill: {entry['spill']['ms']:>8.1f}ms peak={entry['spill']['peak_mb']:>6.1f}MB"
+              f" file={entry['spill']['file_mb']:.1f}MB  page_p50={page['p50']:.2f}ms  scan={entry['full_scan_ms']:.1f}ms")
+
+    meta = {"pages": args.pages, "spill_rows": RESULT_SPILL_ROWS, "page_rows": RESULT_PAGE_ROWS}
+    output = save_results("result_spill", meta, results, args.output)
+    print(f"[INFO] 结果已保存: {output}")
+
+
+if __name__ == "__main__":
+    main()
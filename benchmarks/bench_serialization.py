@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+查询结果响应的序列化与压缩基准
+
+    python -m benchmarks.bench_serialization --sizes 100 5000 50000 --repeat 5
+
+结果行取自基准数据集（中文文本 + 数值列），对比：
+- 序列化（CPU 耗时、字节数）
+  - pydantic_stdlib: 原实现，QueryResponse 校验 + jsonable_encoder + 标准库 json
+  - fast_json:       直接序列化结果字典（安装了 orjson 时使用 orjson）
+- 压缩（在 fast_json 输出上，CPU 耗时与压缩后字节数）：gzip、br（安装了 brotli 时）
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+from fastapi.encoders import jsonable_encoder
+
+from src.models import QueryResponse
+from src.utils import compression
+from src.utils.fast_json import dumps, orjson
+
+from .dataset import BENCH_TABLE, generate_dataset
+from .stats import save_results, summarize
+
+
+def load_rows(count: int) -> Dict[str, Any]:
+    work_dir = tempfile.mkdtemp(prefix="tableqa-bench-")
+    try:
+        db_path = generate_dataset(work_dir, rows=count)["db_path"]
+        conn = sqlite3.connect(db_path)
+        try:
+            cur = conn.execute(f"SELECT * FROM {BENCH_TABLE}")
+            columns = [c[0] for c in cur.description]
+            data = [dict(zip(columns, row)) for row in cur.fetchall()]
+        finally:
+            conn.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return {
+        "success": True, "sql": f"SELECT * FROM {BENCH_TABLE}", "data": data, "columns": columns,
+        "total_rows": len(data), "error": None, "model_response": "```sql\nSELECT ...\n```",
+    }
+
+
+def legacy_serialize(content: Dict[str, Any]) -> bytes:
+    """FastAPI 默认路径：按 response_model 校验，jsonable_encoder 转换，再由 JSONResponse 序列化"""
+    response = QueryResponse(**content)
+    return json.dumps(jsonable_encoder(response), ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def _measure(fn: Callable[[], bytes], repeat: int):
+    samples = []
+    output = b""
+    for _ in range(repeat):
+        start = time.process_time()
+        output = fn()
+        samples.append(time.process_time() - start)
+    return summarize(samples), len(output), output
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="查询结果序列化与压缩基准")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 5000, 50000], help="结果行数")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    encodings = ["gzip"] + (["br"] if compression.brotli is not None else [])
+    results: List[Dict[str, Any]] = []
+    for size in args.sizes:
+        content = load_rows(size)
+        cases = {"pydantic_stdlib": lambda: legacy_serialize(content), "fast_json": lambda: dumps(content)}
+        body = b""
+        for name, fn in cases.items():
+            cpu, nbytes, body = _measure(fn, args.repeat)
+            results.append({"rows": size, "case": name, "cpu_ms": cpu, "bytes": nbytes})
+            print(f"[INFO] rows={size:<6} {name:<16} cpu_p50={cpu['p50']:>9.2f}ms  bytes={nbytes:>10}")
+        for encoding in encodings:
+            cpu, nbytes, _ = _measure(lambda: compression.compress(body, encoding), args.repeat)
+            results.append({"rows": size, "case": f"compress_{encoding}", "cpu_ms": cpu, "bytes": nbytes})
+            print(f"[INFO] rows={size:<6} {'compress_' + encoding:<16} cpu_p50={cpu['p50']:>9.2f}ms  "
+                  f"bytes={nbytes:>10}  ({nbytes / len(body):.1%})")
+
+    meta = {"sizes": args.sizes, "repeat": args.repeat, "orjson": orjson is not None,
+            "brotli": compression.brotli is not None, "cpu_count": os.cpu_count()}
+    output = save_results("serialization", meta, results, args.output)
+    print(f"[INFO] 结果已保存: {output}")
+
+
+if __name__ == "__main__":
+    main()
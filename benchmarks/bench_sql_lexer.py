@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+SQL 校验/提取微基准：单遍词法分析 vs 原先的多次正则扫描
+
+    python -m benchmarks.bench_sql_lexer --iterations 2000
+
+对比场景：
+- legacy_validate:      原实现（SELECT 开头 + 分号 + 20 个黑名单 re.search）
+- lexer_validate_cold:  每次清空结论缓存，完整走词法分析 + 检查
+- lexer_validate_warm:  相同 SQL 重复校验（文本缓存命中）
+- lexer_validate_fp:    只差在字面量上的 SQL（指纹缓存命中）
+- legacy_extract / lexer_extract: 从模型输出中提取 SQL 代码块
+"""
+import argparse
+import json
+import os
+import re
+import time
+from typing import Callable, Dict, List
+
+from fastapi import HTTPException
+
+from src.utils import sql_validator
+from src.utils.sql_parser import extract_sql
+from src.utils.sql_validator import validate_sql_readonly
+
+from .dataset import BENCH_TABLE, SAMPLE_SQLS
+from .stats import save_results, summarize
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_LEGACY_BLACKLIST = [
+    r"\bINSERT\b", r"\bUPDATE\b", r"\bDELETE\b", r"\bREPLACE\b", r"\bMERGE\b",
+    r"\bCREATE\b", r"\bALTER\b", r"\bDROP\b", r"\bTRUNCATE\b",
+    r"\bATTACH\b", r"\bDETACH\b", r"\bVACUUM\b", r"\bPRAGMA\b",
+    r"\bBEGIN\b", r"\bCOMMIT\b", r"\bROLLBACK\b", r"\bSAVEPOINT\b", r"\bRELEASE\b",
+    r"\bEXEC\b", r"\bEXECUTE\b",
+]
+
+
+def legacy_validate(sql: str) -> bool:
+    """原 validate_sql_readonly 的实现，仅用于对比"""
+    clean_sql = sql.strip()
+    if not re.match(r'^\s*SELECT\b', clean_sql, re.I):
+        raise HTTPException(status_code=403, detail="select")
+    if ";" in clean_sql and not re.match(r'^[^;]+;\s*$', clean_sql):
+        raise HTTPException(status_code=403, detail="semicolon")
+    for pattern in _LEGACY_BLACKLIST:
+        if re.search(pattern, clean_sql, re.I):
+            raise HTTPException(status_code=403, detail=pattern)
+    return True
+
+
+def legacy_extract(resp: str) -> str:
+    text = str(resp).strip()
+    m = re.search(r"```(?:sql)?\s*([\s\S]*?)```", text, flags=re.IGNORECASE)
+    return m.group(1).strip() if m else text
+
+
+def load_sqls(log_file: str) -> List[str]:
+    """查询日志中的 SQL 加基准 SQL"""
+    sqls = [s.format(table=BENCH_TABLE) for s in SAMPLE_SQLS]
+    if os.path.exists(log_file):
+        with open(log_file, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    sql = json.loads(line).get("sql")
+                except (json.JSONDecodeError, AttributeError):
+                    continue
+                if sql:
+                    sqls.append(sql)
+    return sqls
+
+
+def _time_per_call(fn: Callable[[str], object], inputs: List[str], iterations: int,
+                   before_each: Callable[[], None] = None) -> List[float]:
+    samples = []
+    for i in range(iterations):
+        value = inputs[i % len(inputs)]
+        if before_each is not None:
+            before_each()
+        start = time.perf_counter()
+        try:
+            fn(value)
+        except HTTPException:
+            pass
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def _clear_caches():
+    sql_validator._text_cache.clear()
+    sql_validator._fingerprint_cache.clear()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SQL 词法分析微基准")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--log-file", default=os.path.join(REPO_ROOT, "query_logs.jsonl"))
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    sqls = load_sqls(args.log_file)
+    # 只差在字面量上的变体，用于验证指纹缓存
+    variants = [f"SELECT `产品名称` FROM {BENCH_TABLE} WHERE `产品名称` LIKE '%{i}%' LIMIT {i % 50 + 1}"
+                for i in range(args.iterations)]
+    responses = [f"好的，SQL 如下：\n```sql\n{s}\n```\n说明：按问题筛选相关字段。" for s in sqls]
+
+    cases: Dict[str, List[float]] = {}
+    cases["legacy_validate"] = _time_per_call(legacy_validate, sqls, args.iterations)
+    cases["lexer_validate_cold"] = _time_per_call(validate_sql_readonly, sqls, args.iterations, _clear_caches)
+    _clear_caches()
+    cases["lexer_validate_warm"] = _time_per_call(validate_sql_readonly, sqls, args.iterations)
+    _clear_caches()
+    validate_sql_readonly(variants[0])
+    cases["lexer_validate_fp"] = _time_per_call(validate_sql_readonly, variants[1:], args.iterations - 1)
+    cases["legacy_extract"] = _time_per_call(legacy_extract, responses, args.iterations)
+    cases["lexer_extract"] = _time_per_call(extract_sql, responses, args.iterations)
+
+    results = []
+    for name, samples in cases.items():
+        # 微基准以微秒为单位更直观
+        lat_us = summarize(samples, scale=1e6)
+        results.append({"case": name, "iterations": len(samples), "latency_us": lat_us})
+        print(f"[INFO] {name:<22} p50={lat_us['p50']:>8.2f}us  p99={lat_us['p99']:>8.2f}us  mean={lat_us['mean']:>8.2f}us")
+
+    output = save_results("sql_lexer", {"iterations": args.iterations, "sql_count": len(sqls)}, results, args.output)
+    print(f"[INFO] 结果已保存: {output}")
+
+
+if __name__ == "__main__":
+    main()
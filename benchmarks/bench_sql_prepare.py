@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+SQL 解析/预编译开销基准：参数化 + 预编译语句缓存 vs 原文执行
+
+    python -m benchmarks.bench_sql_prepare --rows 200 --iterations 4000
+
+回放的 SQL 由基准 SQL（或查询日志中的 SQL）替换字面量得到，模拟"同一形态、不同字面量"的模型输出。
+为了突出解析/预编译部分，默认使用小表，SQL 统一改为 LIMIT 1。对比场景：
+- legacy_connect_raw:  原实现，每次新建只读连接并按原文执行
+- pooled_raw:          复用连接，按原文执行（字面量不同，语句缓存几乎不命中）
+- pooled_normalized:   复用连接，归一化后参数化执行（同一指纹共用一条预编译语句）
+"""
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from src.config.settings import SQL_STATEMENT_CACHE_SIZE
+from src.utils.sql_normalizer import normalize_sql
+
+from .dataset import BENCH_TABLE, CHANNELS, PRODUCTS, REGIONS, SAMPLE_SQLS, generate_dataset
+from .stats import save_results, summarize
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w`])\d+(?:\.\d+)?(?![\w`])")
+
+
+def load_templates(log_file: str) -> List[str]:
+    """基准 SQL 加查询日志中的 SQL（仅保留针对基准表的）"""
+    sqls = [s.format(table=BENCH_TABLE) for s in SAMPLE_SQLS]
+    if os.path.exists(log_file):
+        with open(log_file, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    sql = json.loads(line).get("sql")
+                except (json.JSONDecodeError, AttributeError):
+                    continue
+                if sql and BENCH_TABLE in sql:
+                    sqls.append(sql)
+    return sqls
+
+
+def make_variants(templates: List[str], count: int, seed: int = 7) -> List[str]:
+    """把模板中的字面量替换为随机值，得到只差在字面量上的 SQL"""
+    rng = random.Random(seed)
+    words = PRODUCTS + CHANNELS + REGIONS
+    variants = []
+    for i in range(count):
+        sql = templates[i % len(templates)]
+        sql = _STRING_LITERAL.sub(lambda m: f"'%{rng.choice(words)[:2]}{rng.randint(0, 999)}%'"
+                                  if "%" in m.group(0) else f"'{rng.choice(words)}{rng.randint(0, 999)}'", sql)
+        sql = _NUMBER_LITERAL.sub(lambda m: str(rng.randint(1, 100000)), sql)
+        if " LIMIT " in sql:
+            sql = re.sub(r" LIMIT \d+", " LIMIT 1", sql)
+        else:
+            sql += " LIMIT 1"
+        variants.append(sql)
+    return variants
+
+
+def _time_each(run: Callable[[str], None], sqls: List[str]) -> List[float]:
+    samples = []
+    for sql in sqls:
+        start = time.perf_counter()
+        run(sql)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def run_cases(db_path: str, sqls: List[str]) -> Dict[str, List[float]]:
+    uri = f"file:{db_path}?mode=ro"
+
+    def legacy(sql: str):
+        conn = sqlite3.connect(uri, uri=True)
+        try:
+            conn.execute(sql).fetchall()
+        finally:
+            conn.close()
+
+    raw_conn = sqlite3.connect(uri, uri=True, cached_statements=SQL_STATEMENT_CACHE_SIZE)
+    norm_conn = sqlite3.connect(uri, uri=True, cached_statements=SQL_STATEMENT_CACHE_SIZE)
+
+    def pooled_raw(sql: str):
+        raw_conn.execute(sql).fetchall()
+
+    def pooled_normalized(sql: str):
+        norm = normalize_sql(sql)
+        norm_conn.execute(norm.text, norm.params).fetchall()
+
+    # 预热：打开文件、加载表结构、填充归一化缓存
+    for sql in sqls[:50]:
+        legacy(sql)
+        pooled_raw(sql)
+        pooled_normalized(sql)
+
+    try:
+        return {
+            "legacy_connect_raw": _time_each(legacy, sqls),
+            "pooled_raw": _time_each(pooled_raw, sqls),
+            "pooled_normalized": _time_each(pooled_normalized, sqls),
+        }
+    finally:
+        raw_conn.close()
+        norm_conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SQL 参数化与预编译语句缓存基准")
+    parser.add_argument("--rows", type=int, default=200, help="基准表行数（行数越大，执行开销占比越高）")
+    parser.add_argument("--iterations", type=int, default=4000, help="回放的 SQL 条数")
+    parser.add_argument("--log-file", default=os.path.join(REPO_ROOT, "query_logs.jsonl"))
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    templates = load_templates(args.log_file)
+    sqls = make_variants(templates, args.iterations)
+    fingerprints = {normalize_sql(s).fingerprint_id for s in sqls}
+
+    work_dir = tempfile.mkdtemp(prefix="tableqa-bench-")
+    try:
+        db_path = generate_dataset(work_dir, rows=args.rows)["db_path"]
+        cases = run_cases(db_path, sqls)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = []
+    for name, samples in cases.items():
+        lat_us = summarize(samples, scale=1e6)
+        results.append({"case": name, "iterations": len(samples), "latency_us": lat_us})
+        print(f"[INFO] {name:<20} p50={lat_us['p50']:>8.2f}us  p99={lat_us['p99']:>8.2f}us  mean={lat_us['mean']:>8.2f}us")
+
+    meta = {
+        "rows": args.rows,
+        "iterations": args.iterations,
+        "templates": len(templates),
+        "distinct_sql": len(set(sqls)),
+        "distinct_fingerprints": len(fingerprints),
+        "cached_statements": SQL_STATEMENT_CACHE_SIZE,
+    }
+    print(f"[INFO] 不同 SQL {meta['distinct_sql']} 条，不同指纹 {meta['distinct_fingerprints']} 个")
+    output = save_results("sql_prepare", meta, results, args.output)
+    print(f"[INFO] 结果已保存: {output}")
+
+
+if __name__ == "__main__":
+    main()
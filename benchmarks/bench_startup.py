@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+服务冷启动导入耗时基准
+
+    python -m benchmarks.bench_startup --runs 5 --max-ms 800
+
+在全新的子进程中执行 python -X importtime -c "import src.app"，解析 importtime 输出：
+- 导入 src.app 的累计耗时（多次运行取分位数）
+- 自身耗时最高的模块
+- 重依赖（pandas / numpy / openpyxl / jieba）是否在启动时被导入（应为懒加载）
+
+指定 --max-ms 时，p50 超过阈值或重依赖出现在启动导入中即以非零状态退出，可用于 CI 检查回归。
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import Any, Dict, List, Tuple
+
+from .stats import save_results, summarize
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TARGET_MODULE = "src.app"
+HEAVY_MODULES = ("pandas", "numpy", "openpyxl", "jieba", "duckdb")
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """解析 "import time: self [us] | cumulative | imported package" 行，返回 (模块, 自身微秒, 累计微秒)"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue  # 表头行
+        entries.append((parts[2].strip(), self_us, cumulative_us))
+    return entries
+
+
+def run_once(module: str) -> List[Tuple[str, int, int]]:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{proc.stderr[-2000:]}")
+    return parse_importtime(proc.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="服务冷启动导入耗时基准")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--module", default=TARGET_MODULE)
+    parser.add_argument("--top", type=int, default=10, help="列出自身耗时最高的模块数")
+    parser.add_argument("--max-ms", type=float, default=None, help="导入耗时 p50 上限（毫秒），超过则失败")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    samples = []
+    self_times: Dict[str, List[int]] = {}
+    imported = set()
+    for _ in range(args.runs):
+        entries = run_once(args.module)
+        total = next((cumulative for name, _, cumulative in entries if name == args.module), 0)
+        samples.append(total / 1e6)
+        for name, self_us, _ in entries:
+            self_times.setdefault(name, []).append(self_us)
+            imported.add(name)
+
+    total = summarize(samples)
+    print(f"[INFO] import {args.module}: p50={total['p50']:.1f}ms  mean={total['mean']:.1f}ms  max={total['max']:.1f}ms")
+
+    top = sorted(self_times.items(), key=lambda item: -sum(item[1]) / len(item[1]))[:args.top]
+    top_modules = []
+    for name, values in top:
+        mean_ms = sum(values) / len(values) / 1000
+        top_modules.append({"module": name, "self_ms": round(mean_ms, 3)})
+        print(f"[INFO]   {name:<50} self={mean_ms:>8.2f}ms")
+
+    heavy = {name: name in imported for name in HEAVY_MODULES}
+    eager = [name for name, loaded in heavy.items() if loaded]
+    if eager:
+        print(f"[WARNING] 启动时导入了重依赖: {', '.join(eager)}")
+    else:
+        print(f"[INFO] 启动时未导入重依赖: {', '.join(HEAVY_MODULES)}")
+
+    results: List[Dict[str, Any]] = [{"module": args.module, "import_ms": total,
+                                      "heavy_imported": heavy, "top_self": top_modules}]
+    meta = {"runs": args.runs, "python": sys.version.split()[0], "max_ms": args.max_ms}
+    output = save_results("startup", meta, results, args.output)
+    print(f"[INFO] 结果已保存: {output}")
+
+    if args.max_ms is not None:
+        if total["p50"] > args.max_ms:
+            print(f"[WARNING] 导入耗时 p50 {total['p50']:.1f}ms 超过上限 {args.max_ms:.1f}ms")
+            sys.exit(1)
+        if eager:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
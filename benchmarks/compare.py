@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+对比两次基准测试结果
+
+    python -m benchmarks.compare benchmarks/results/e2e-old.json benchmarks/results/e2e-new.json
+
+按 (endpoint, concurrency) 或 (case) 对齐两份结果，输出吞吐与延迟的变化百分比，
+p99 变慢超过 --threshold 时以非零状态码退出，便于在 CI 中拦截性能回归。
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, Tuple
+
+
+def _key(result: Dict[str, Any]) -> Tuple:
+    if "case" in result:
+        return (result["case"],)
+    return (result.get("endpoint"), result.get("concurrency"))
+
+
+def _delta(old: float, new: float) -> str:
+    if not old:
+        return "   n/a"
+    return f"{(new - old) / old * 100:+6.1f}%"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="对比两次基准测试结果")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="p99 回归阈值（百分比）")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = {_key(r): r for r in json.load(f)["results"]}
+    with open(args.candidate, encoding="utf-8") as f:
+        candidate = {_key(r): r for r in json.load(f)["results"]}
+
+    regressions = 0
+    for key, new in candidate.items():
+        old = baseline.get(key)
+        name = " c=".join(str(k) for k in key)
+        if old is None:
+            print(f"{name:<32} (新增)")
+            continue
+        unit = "us" if "latency_us" in new else "ms"
+        old_lat, new_lat = old.get(f"latency_{unit}", {}), new.get(f"latency_{unit}", {})
+        line = f"{name:<32}"
+        if "throughput_rps" in new:
+            line += f" rps {old['throughput_rps']:>9.1f} -> {new['throughput_rps']:>9.1f} ({_delta(old['throughput_rps'], new['throughput_rps'])})"
+        for p in ("p50", "p99"):
+            if p in new_lat:
+                line += f"  {p} {old_lat.get(p, 0):>8.2f} -> {new_lat[p]:>8.2f}{unit} ({_delta(old_lat.get(p, 0), new_lat[p])})"
+        old_p99, new_p99 = old_lat.get("p99", 0), new_lat.get("p99", 0)
+        if old_p99 and (new_p99 - old_p99) / old_p99 * 100 > args.threshold:
+            regressions += 1
+            line += "  <-- 回归"
+        print(line)
+
+    if regressions:
+        print(f"[WARNING] {regressions} 项 p99 回归超过 {args.threshold:g}%")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+基准测试数据集
+
+生成一张结构与导入 Excel 表类似的 SQLite 表，以及对应的 config.json 建表语句，
+并提供桩模型返回的 SQL 与合成问题集。
+"""
+import json
+import os
+import random
+import sqlite3
+from typing import Dict, List
+
+BENCH_TABLE = "bench_sales"
+
+PRODUCTS = ["安心守护终身寿险", "康健无忧重疾险", "金色年华年金险", "畅行意外险", "医保通百万医疗险", "福满堂两全险"]
+INSURANCE_TYPES = ["寿险", "重疾险", "年金险", "意外险", "医疗险", "两全险"]
+CHANNELS = ["个险渠道", "银保渠道", "团险渠道", "线上渠道", "经代渠道"]
+REGIONS = ["华东", "华南", "华北", "西南", "西北", "东北", "华中"]
+
+COLUMNS = [
+    ("产品名称", "TEXT"),
+    ("险种名称", "TEXT"),
+    ("销售渠道", "TEXT"),
+    ("销售区域", "TEXT"),
+    ("保费", "REAL"),
+    ("件数", "INT"),
+    ("签单日期", "TEXT"),
+]
+
+# 桩模型返回的 SQL，覆盖过滤、聚合、排序等常见形态
+SAMPLE_SQLS = [
+    "SELECT `产品名称`, `保费` FROM {table} WHERE `产品名称` LIKE '%重疾%' LIMIT 20",
+    "SELECT `销售渠道`, COUNT(*) AS cnt FROM {table} GROUP BY `销售渠道`",
+    "SELECT `险种名称`, SUM(`保费`) AS total FROM {table} GROUP BY `险种名称` ORDER BY total DESC",
+    "SELECT `销售区域`, AVG(`件数`) AS avg_cnt FROM {table} WHERE (`销售渠道` = '线上渠道') GROUP BY `销售区域`",
+    "SELECT * FROM {table} WHERE `签单日期` >= '2024-06-01' LIMIT 100",
+    "SELECT `产品名称`, `销售区域`, `保费` FROM {table} WHERE (`保费` > 50000) AND (`销售区域` = '华东') LIMIT 50",
+    "SELECT COUNT(*) FROM {table} WHERE `险种名称` = '医疗险'",
+    "SELECT `产品名称`, MAX(`保费`) AS max_fee FROM {table} GROUP BY `产品名称`",
+]
+
+SYNTHETIC_QUESTIONS = [
+    "重疾险产品的保费是多少",
+    "各销售渠道分别有多少单",
+    "按险种统计总保费并排序",
+    "线上渠道各区域平均件数",
+    "2024年6月以后的签单明细",
+    "华东地区保费超过5万的产品",
+    "医疗险一共有多少条记录",
+    "每个产品的最高保费",
+    "这个表有哪些内容",
+    "银保渠道的年金险卖得怎么样",
+]
+
+
+def generate_dataset(data_dir: str, rows: int = 100000, seed: int = 42) -> Dict[str, str]:
+    """
+    在 data_dir 下生成基准数据库与配置文件
+
+    Returns:
+        包含 db_path / db_config_file 的字典
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    db_path = os.path.join(data_dir, "bench.db")
+    config_path = os.path.join(data_dir, "config.json")
+
+    rng = random.Random(seed)
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        columns_sql = ", ".join(f"`{name}` {col_type}" for name, col_type in COLUMNS)
+        conn.execute(f"CREATE TABLE {BENCH_TABLE} ({columns_sql})")
+
+        def row_iter():
+            for _ in range(rows):
+                i = rng.randrange(len(PRODUCTS))
+                yield (
+                    PRODUCTS[i],
+                    INSURANCE_TYPES[i],
+                    rng.choice(CHANNELS),
+                    rng.choice(REGIONS),
+                    round(rng.lognormvariate(9.5, 1.0), 2),
+                    rng.randint(1, 20),
+                    f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                )
+
+        conn.executemany(f"INSERT INTO {BENCH_TABLE} VALUES ({', '.join('?' for _ in COLUMNS)})", row_iter())
+        conn.commit()
+    finally:
+        conn.close()
+
+    samples = {"产品名称": PRODUCTS[1], "险种名称": INSURANCE_TYPES[1], "销售渠道": CHANNELS[0],
+               "销售区域": REGIONS[0], "保费": "12000.5", "件数": "3", "签单日期": "2024-05-12"}
+    fields = ", ".join(f"`{name}` {col_type} COMMENT '样例：{samples[name]}'" for name, col_type in COLUMNS)
+    db_config = {BENCH_TABLE: {"build": f"CREATE TABLE {BENCH_TABLE} ({fields});"}}
+    with open(config_path, "w", encoding="utf-8") as f:
+        json.dump(db_config, f, ensure_ascii=False, indent=2)
+
+    return {"db_path": db_path, "db_config_file": config_path}
+
+
+def write_model_config(data_dir: str, stub_url: str, model_type: str = "local") -> str:
+    """生成指向桩服务的 model_config.json"""
+    path = os.path.join(data_dir, "model_config.json")
+    config = {
+        "models": {
+            "stub": {
+                "type": model_type,
+                "url": stub_url,
+                "model": "stub",
+                "api_key": "Bearer stub",
+                "description": "基准测试桩模型",
+            }
+        },
+        "default_model": "stub",
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def load_questions(log_file: str = None, limit: int = 0) -> List[str]:
+    """从查询日志中读取问题（去重保序）；没有日志时返回合成问题集"""
+    questions: List[str] = []
+    if log_file and os.path.exists(log_file):
+        seen = set()
+        with open(log_file, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    query = json.loads(line).get("query")
+                except (json.JSONDecodeError, AttributeError):
+                    continue
+                if query and query not in seen:
+                    seen.add(query)
+                    questions.append(query)
+    if not questions:
+        questions = list(SYNTHETIC_QUESTIONS)
+    return questions[:limit] if limit else questions
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+端到端回放压测
+
+启动桩模型服务、生成基准数据集并以独立进程启动 TableQA 服务，
+按指定并发回放问题到 /query、/chat、/execute_raw_sql，输出吞吐与 p50/p95/p99 延迟，
+结果保存为 JSON，便于用 benchmarks.compare 对比回归。
+
+示例：
+    python -m benchmarks.run_benchmark --concurrency 1,8,32 --requests 200 --latency 0.2 --token-rate 80
+    python -m benchmarks.run_benchmark --questions log --log-file query_logs.jsonl --endpoints query
+"""
+import argparse
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+import requests
+
+from .dataset import BENCH_TABLE, SAMPLE_SQLS, generate_dataset, load_questions, write_model_config
+from .stats import save_results, summarize
+from .stub_llm_server import StubConfig, StubLLMServer
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHAT_TABLE_INFO = "\n".join(
+    ["| 销售渠道 | 件数 | 保费 |", "|---|---|---|"]
+    + [f"| 渠道{i} | {i * 7} | {i * 1234.5} |" for i in range(1, 31)]
+)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_app_server(env: Dict[str, str], port: int, workers: int, log_path: str) -> subprocess.Popen:
+    """以子进程启动 uvicorn，并等待 /health 可用"""
+    log_fp = open(log_path, "w", encoding="utf-8")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.app:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        cwd=REPO_ROOT,
+        env={**os.environ, **env},
+        stdout=log_fp,
+        stderr=subprocess.STDOUT,
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"服务启动失败，详见 {log_path}")
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return proc
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"服务启动超时，详见 {log_path}")
+
+
+def build_requests(endpoint: str, questions: List[str], count: int) -> List[Tuple[str, Dict[str, Any]]]:
+    """生成 (path, json) 请求列表"""
+    items = []
+    for i in range(count):
+        question = questions[i % len(questions)]
+        if endpoint == "query":
+            items.append(("/query", {"query": question, "table_name": BENCH_TABLE}))
+        elif endpoint == "chat":
+            items.append(("/chat/", {"table_info": CHAT_TABLE_INFO, "question": question}))
+        elif endpoint == "execute_raw_sql":
+            items.append(("/execute_raw_sql", {"sql": SAMPLE_SQLS[i % len(SAMPLE_SQLS)].format(table=BENCH_TABLE)}))
+        else:
+            raise ValueError(f"未知的压测接口: {endpoint}")
+    return items
+
+
+def run_load(
+    base_url: str,
+    items: List[Tuple[str, Dict[str, Any]]],
+    concurrency: int,
+    is_success: Callable[[requests.Response], bool],
+) -> Dict[str, Any]:
+    """以固定并发发送请求，返回统计结果"""
+    local = threading.local()
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(item):
+        nonlocal errors
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        path, body = item
+        start = time.perf_counter()
+        try:
+            resp = session.post(base_url + path, json=body, timeout=120)
+            ok = is_success(resp)
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, items))
+    duration = time.perf_counter() - started
+
+    return {
+        "requests": len(items),
+        "errors": errors,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(len(items) / duration, 2) if duration else 0.0,
+        "latency_ms": summarize(latencies),
+    }
+
+
+def _json_success(resp: requests.Response) -> bool:
+    if resp.status_code != 200:
+        return False
+    try:
+        return bool(resp.json().get("success"))
+    except ValueError:
+        return False
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="TableQA 端到端回放压测")
+    parser.add_argument("--endpoints", default="query,chat,execute_raw_sql", help="逗号分隔的压测接口")
+    parser.add_argument("--concurrency", default="1,8,32", help="逗号分隔的并发级别")
+    parser.add_argument("--requests", type=int, default=200, help="每个接口、每个并发级别的请求数")
+    parser.add_argument("--rows", type=int, default=100000, help="基准表行数")
+    parser.add_argument("--latency", type=float, default=0.05, help="桩模型首 token 延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="桩模型随机延迟上限（秒）")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="桩模型每秒 token 数，0 表示不模拟解码")
+    parser.add_argument("--questions", choices=["synthetic", "log"], default="synthetic", help="问题来源")
+    parser.add_argument("--log-file", default=os.path.join(REPO_ROOT, "query_logs.jsonl"), help="回放的查询日志")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker 数")
+    parser.add_argument("--server-url", default=None, help="压测已运行的服务（跳过桩服务与数据集生成）")
+    parser.add_argument("--output", default=None, help="结果 JSON 路径")
+    parser.add_argument("--keep-data", action="store_true", help="保留临时数据集与服务日志")
+    args = parser.parse_args(argv)
+
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    questions = load_questions(args.log_file if args.questions == "log" else None)
+
+    stub = None
+    proc = None
+    work_dir = tempfile.mkdtemp(prefix="tableqa-bench-")
+    try:
+        if args.server_url:
+            base_url = args.server_url.rstrip("/")
+        else:
+            stub = StubLLMServer(config=StubConfig(args.latency, args.jitter, args.token_rate)).start()
+            print(f"[INFO] 桩模型服务: {stub.url}")
+            t0 = time.time()
+            paths = generate_dataset(work_dir, rows=args.rows)
+            print(f"[INFO] 生成基准数据集 {args.rows} 行，耗时 {time.time() - t0:.1f}s: {paths['db_path']}")
+            env = {
+                "TABLEQA_DB_PATH": paths["db_path"],
+                "TABLEQA_DB_CONFIG_FILE": paths["db_config_file"],
+                "TABLEQA_MODEL_CONFIG_FILE": write_model_config(work_dir, stub.url),
+                "TABLEQA_LOG_FILE": os.path.join(work_dir, "query_logs.jsonl"),
+                "TABLEQA_LOG_STORE_PATH": os.path.join(work_dir, "query_log_store.db"),
+            }
+            port = _free_port()
+            proc = start_app_server(env, port, args.workers, os.path.join(work_dir, "server.log"))
+            base_url = f"http://127.0.0.1:{port}"
+            print(f"[INFO] TableQA 服务: {base_url}（workers={args.workers}）")
+
+        results = []
+        for endpoint in endpoints:
+            for concurrency in levels:
+                items = build_requests(endpoint, questions, args.requests)
+                stats = run_load(base_url, items, concurrency, _json_success)
+                results.append({"endpoint": endpoint, "concurrency": concurrency, **stats})
+                lat = stats["latency_ms"]
+                print(
+                    f"[INFO] {endpoint:<16} c={concurrency:<4} {stats['throughput_rps']:>8.1f} req/s  "
+                    f"p50={lat['p50']:.1f}ms p95={lat['p95']:.1f}ms p99={lat['p99']:.1f}ms  errors={stats['errors']}"
+                )
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        if stub is not None:
+            stub.stop()
+        if args.keep_data:
+            print(f"[INFO] 临时数据保留在: {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    meta = {
+        "endpoints": endpoints,
+        "concurrency": levels,
+        "requests_per_level": args.requests,
+        "rows": args.rows,
+        "stub_latency_s": args.latency,
+        "stub_jitter_s": args.jitter,
+        "stub_token_rate": args.token_rate,
+        "questions": args.questions,
+        "question_count": len(questions),
+        "workers": args.workers,
+        "server_url": args.server_url,
+    }
+    output = save_results("e2e", meta, results, args.output)
+    print(f"[INFO] 结果已保存: {output}")
+    return output
+
+
+if __name__ == "__main__":
+    main()
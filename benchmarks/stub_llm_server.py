@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+OpenAI 兼容的本地桩服务（/v1/chat/completions）
+
+用于在不调用真实模型的情况下压测 TableQA：
+- latency:     首 token 之前的固定延迟（秒），可叠加 jitter 随机抖动
+- token_rate:  每秒生成的 token 数，决定解码阶段耗时；0 表示瞬间返回
+- prefill_rate: 每秒处理的 prompt token 数，决定首 token 前的 prefill 耗时；0 表示不模拟
+- 请求中的 stop / max_tokens / assistant 预填与真实服务一样生效，回复按其截取，解码耗时只计实际生成的 token
+- prefix_cache: 模拟 vLLM 自动前缀缓存：prompt 按固定长度分块、逐块链式哈希，
+                与已缓存前缀相同的块不再计入 prefill，命中数通过 usage.prompt_tokens_details.cached_tokens 返回
+
+NL2SQL 请求（prompt 中含"建表语句"）返回基于基准数据集的 SQL 代码块，
+其余请求返回一段分析文本。
+
+独立运行：
+    python -m benchmarks.stub_llm_server --port 9000 --latency 0.5 --token-rate 50
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from .dataset import BENCH_TABLE, SAMPLE_SQLS
+
+ANSWER_TEXT = "根据查询结果，销售额主要集中在线上渠道，其中重疾险占比最高，建议重点关注该险种的续保情况。"
+EXPLANATION_TEXT = "\n\n说明：以上 SQL 按用户问题筛选了相关字段，并对结果数量做了限制，以便快速返回。"
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中文约 1 字 1 token，英文约 4 字符 1 token"""
+    cjk = sum(1 for ch in text if "一" <= ch <= "鿿")
+    return cjk + (len(text) - cjk) // 4 + 1
+
+
+PREFIX_BLOCK_CHARS = 64
+PREFIX_CACHE_BLOCKS = 4096
+
+
+class PrefixCache:
+    """按块链式哈希的前缀缓存（LRU），只有从开头起逐字节相同的块才能命中"""
+
+    def __init__(self, block_chars: int = PREFIX_BLOCK_CHARS, capacity: int = PREFIX_CACHE_BLOCKS):
+        self.block_chars = block_chars
+        self.capacity = capacity
+        self._blocks: "OrderedDict[int, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def match(self, prompt: str) -> int:
+        """返回命中的前缀字符数，并把本次 prompt 的完整块加入缓存"""
+        matched = 0
+        prefix_hash = 0
+        missed = False
+        with self._lock:
+            for start in range(0, len(prompt) - self.block_chars + 1, self.block_chars):
+                block = prompt[start:start + self.block_chars]
+                prefix_hash = zlib.crc32(block.encode("utf-8"), prefix_hash) ^ (start << 1)
+                if not missed and prefix_hash in self._blocks:
+                    self._blocks.move_to_end(prefix_hash)
+                    matched = start + self.block_chars
+                    continue
+                missed = True
+                self._blocks[prefix_hash] = None
+                if len(self._blocks) > self.capacity:
+                    self._blocks.popitem(last=False)
+        return matched
+
+    def clear(self):
+        with self._lock:
+            self._blocks.clear()
+
+
+class StubConfig:
+    """桩服务运行参数（可在运行中修改）"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, token_rate: float = 0.0,
+                 prefill_rate: float = 0.0, prefix_cache: bool = False):
+        self.latency = latency
+        self.jitter = jitter
+        self.token_rate = token_rate
+        self.prefill_rate = prefill_rate
+        self.prefix_cache = PrefixCache() if prefix_cache else None
+        self.requests = 0
+        self.lock = threading.Lock()
+
+
+def _pick_sql(prompt: str) -> str:
+    """按 prompt 内容稳定地选择一条基准 SQL"""
+    question = prompt.rsplit("用户问题", 1)[-1]
+    index = zlib.crc32(question.encode("utf-8")) % len(SAMPLE_SQLS)
+    return SAMPLE_SQLS[index].format(table=BENCH_TABLE)
+
+
+def _apply_generation(content: str, messages: list, payload: dict):
+    """按请求中的预填、stop 与 max_tokens 截取回复，返回 (回复, finish_reason)"""
+    if messages and messages[-1].get("role") == "assistant":
+        prefill = messages[-1].get("content", "")
+        if content.startswith(prefill):
+            content = content[len(prefill):]
+    finish_reason = "stop"
+    stops = payload.get("stop") or []
+    if isinstance(stops, str):
+        stops = [stops]
+    cut = min((i for i in (content.find(stop) for stop in stops if stop) if i >= 0), default=-1)
+    if cut >= 0:
+        content = content[:cut]
+    max_tokens = payload.get("max_tokens")
+    while max_tokens and estimate_tokens(content) > max_tokens:
+        content = content[:max(0, len(content) * max_tokens // estimate_tokens(content) - 1)]
+        finish_reason = "length"
+    return content, finish_reason
+
+
+def _make_handler(config: StubConfig):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/v1/chat/completions"):
+                self.send_error(404)
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                payload = json.loads(self.rfile.read(length) or b"{}")
+            except json.JSONDecodeError:
+                self.send_error(400)
+                return
+
+            with config.lock:
+                config.requests += 1
+
+            messages = payload.get("messages", [])
+            prompt = "".join(m.get("content", "") for m in messages)
+            if "建表语句" in prompt:
+                user_prompt = "".join(m.get("content", "") for m in messages if m.get("role") != "assistant")
+                content = f"```sql\n{_pick_sql(user_prompt)}\n```" + EXPLANATION_TEXT
+            else:
+                content = ANSWER_TEXT
+            content, finish_reason = _apply_generation(content, messages, payload)
+
+            prompt_tokens = estimate_tokens(prompt)
+            completion_tokens = estimate_tokens(content)
+            cached_chars = config.prefix_cache.match(prompt) if config.prefix_cache else 0
+            cached_tokens = prompt_tokens - estimate_tokens(prompt[cached_chars:]) if cached_chars else 0
+
+            delay = config.latency + (random.uniform(0, config.jitter) if config.jitter else 0.0)
+            if config.prefill_rate:
+                delay += (prompt_tokens - cached_tokens) / config.prefill_rate
+            if config.token_rate:
+                delay += completion_tokens / config.token_rate
+            if delay > 0:
+                time.sleep(delay)
+
+            body = json.dumps({
+                "id": f"stub-{config.requests}",
+                "object": "chat.completion",
+                "model": payload.get("model") or "stub",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": finish_reason}],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                    "prompt_tokens_details": {"cached_tokens": cached_tokens},
+                },
+            }, ensure_ascii=False).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class StubLLMServer:
+    """在后台线程中运行的桩服务"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, config: Optional[StubConfig] = None):
+        self.config = config or StubConfig()
+        ThreadingHTTPServer.daemon_threads = True
+        self._server = ThreadingHTTPServer((host, port), _make_handler(self.config))
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubLLMServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI 兼容的本地桩服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.0, help="首 token 前固定延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="额外随机延迟上限（秒）")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="每秒生成 token 数，0 表示不模拟解码耗时")
+    parser.add_argument("--prefill-rate", type=float, default=0.0, help="每秒处理 prompt token 数，0 表示不模拟")
+    parser.add_argument("--prefix-cache", action="store_true", help="模拟自动前缀缓存")
+    args = parser.parse_args()
+
+    config = StubConfig(args.latency, args.jitter, args.token_rate, args.prefill_rate, args.prefix_cache)
+    server = StubLLMServer(args.host, args.port, config).start()
+    print(f"[INFO] 桩模型服务已启动: {server.url}/v1/chat/completions")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -16,6 +16,34 @@ export const queryAPI = {
 
   chat: (data) => api.post('/chat', data),
 
+  // 一站式问答：服务端按阶段返回 NDJSON，每解析出一个阶段调用一次 onEvent
+  ask: async (data, onEvent) => {
+    const response = await fetch(`${api.defaults.baseURL}/ask`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(data),
+    })
+    if (!response.ok) {
+      const body = await response.json().catch(() => ({}))
+      const error = new Error(body.detail || response.statusText)
+      error.response = { status: response.status, data: body }
+      throw error
+    }
+
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ''
+    for (;;) {
+      const { done, value } = await reader.read()
+      if (done) break
+      buffer += decoder.decode(value, { stream: true })
+      const lines = buffer.split('\n')
+      buffer = lines.pop()
+      lines.filter((line) => line.trim()).forEach((line) => onEvent(JSON.parse(line)))
+    }
+    if (buffer.trim()) onEvent(JSON.parse(buffer))
+  },
+
   previewTable: (tableName, limit = 50) =>
     api.get(`/table_preview/${tableName}`, { params: { limit } }),
 
@@ -252,7 +252,10 @@ function DBManagePage() {
                     <EyeOutlined />
                     <Text strong>数据预览: {selectedTable}</Text>
                     {tableData && (
-                      <Tag color="blue">{tableData.total_rows} 条记录</Tag>
+                      <Tag color="blue">
+                        {tableData.sampled ? `随机抽样 ${tableData.total_rows} 条` : `${tableData.total_rows} 条记录`}
+                        {tableData.estimated_rows != null && ` / 约 ${tableData.estimated_rows} 条`}
+                      </Tag>
                     )}
                   </Space>
                 }
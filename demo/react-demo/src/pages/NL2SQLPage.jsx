@@ -84,99 +84,64 @@ function NL2SQLPage() {
     })
 
     try {
-      // 步骤1: 生成并执行 SQL
+      // 服务端依次完成 生成SQL -> 执行 -> 结果分析，按阶段流式返回
       addToHistory({
         type: 'loading',
         content: '正在生成并执行 SQL 查询...'
       })
 
-      const queryResponse = await queryAPI.executeQuery({
+      await queryAPI.ask({
         query: query.trim(),
         table_names: selectedTables,
         model_name: selectedModel
-      })
-
-      // 移除加载消息
-      removeLastHistory()
-
-      if (queryResponse.data.success) {
-        // 添加完成消息
-        addToHistory({
-          type: 'success',
-          content: '✅ SQL 查询执行完成'
-        })
-
-        // 步骤2: 调用 Chat API 分析结果
-        addToHistory({
-          type: 'loading',
-          content: '正在分析查询结果...'
-        })
-
-        // 将查询结果格式化为字符串
-        const resultData = queryResponse.data.data
-        const resultColumns = queryResponse.data.columns
-        let tableInfo = ''
-
-        if (resultData && resultData.length > 0) {
-          // 格式化为表格字符串
-          tableInfo = `查询结果（共 ${resultData.length} 条记录）：\n\n`
-          tableInfo += resultColumns.join(' | ') + '\n'
-          tableInfo += resultColumns.map(() => '---').join(' | ') + '\n'
-
-          // 只取前10条数据，避免内容过长
-          const displayData = resultData.slice(0, 20)
-          displayData.forEach(row => {
-            const rowValues = resultColumns.map(col => {
-              const val = row[col]
-              return val !== null && val !== undefined ? String(val) : ''
+      }, (event) => {
+        if (event.stage === 'sql') {
+          // 移除加载消息
+          removeLastHistory()
+          if (!event.success) {
+            addToHistory({
+              type: 'error',
+              content: event.error || 'SQL 查询失败'
             })
-            tableInfo += rowValues.join(' | ') + '\n'
-          })
-
-          if (resultData.length > 10) {
-            tableInfo += `\n... 还有 ${resultData.length - 10} 条记录未显示`
+            message.error('查询失败')
           }
-        } else {
-          tableInfo = '查询结果为空'
-        }
-
-        const chatResponse = await queryAPI.chat({
-          table_info: tableInfo,
-          question: query.trim(),
-          model_name: selectedModel
-        })
-
-        // 移除加载消息
-        removeLastHistory()
-
-        if (chatResponse.data.success) {
-          // 添加完成消息
+        } else if (event.stage === 'result') {
+          const digest = event.digest
           addToHistory({
             type: 'success',
-            content: '✅ 结果分析完成'
+            content: digest && digest.mode === 'digest'
+              ? `✅ SQL 查询执行完成（共 ${event.total_rows} 条，已压缩为统计摘要，节省约 ${digest.saved_tokens} tokens）`
+              : '✅ SQL 查询执行完成'
           })
-
-          // 显示分析结果
           addToHistory({
-            type: 'chat',
-            content: chatResponse.data.answer,
-            model: selectedModel
+            type: 'loading',
+            content: '正在分析查询结果...'
           })
+        } else if (event.stage === 'answer') {
+          // 移除加载消息
+          removeLastHistory()
+          if (event.success) {
+            addToHistory({
+              type: 'success',
+              content: '✅ 结果分析完成'
+            })
 
-          message.success('查询和分析完成!')
-        } else {
-          addToHistory({
-            type: 'error',
-            content: '分析失败: ' + (chatResponse.data.error || '未知错误')
-          })
+            // 显示分析结果
+            addToHistory({
+              type: 'chat',
+              content: event.answer,
+              model: selectedModel
+            })
+
+            message.success('查询和分析完成!')
+          } else {
+            addToHistory({
+              type: 'error',
+              content: '分析失败: ' + (event.error || '未知错误')
+            })
+          }
         }
-      } else {
-        addToHistory({
-          type: 'error',
-          content: queryResponse.data.error || 'SQL 查询失败'
-        })
-        message.error('查询失败')
-      }
+      })
     } catch (err) {
       // 移除可能存在的加载消息
       if (conversationHistory.length > 0 && conversationHistory[conversationHistory.length - 1].type === 'loading') {
@@ -4,6 +4,9 @@ from .health_routes import router as health_router
 from .excel_routes import router as excel_router
 from .chat_routes import router as chat_router
 from .config_routes import router as config_router
+from .log_routes import router as log_router
+from .materialization_routes import router as materialization_router
+from .result_routes import router as result_router
 
 __all__ = [
     "query_router",
@@ -11,4 +14,7 @@ __all__ = [
     "excel_router",
     "chat_router",
     "config_router",
+    "log_router",
+    "materialization_router",
+    "result_router",
 ]
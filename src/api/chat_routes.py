@@ -3,9 +3,11 @@
 Chat 对话相关的 API 路由
 """
 from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
 
 from ..models.chat_models import ChatRequest, ChatResponse
-from ..services.chat_service import call_chat_api
+from ..services import AdmissionRejected, get_single_flight, run_admitted
+from ..services.chat_service import call_chat_api, chat_key, summarize_handle
 
 router = APIRouter(prefix="/chat")
 
@@ -16,16 +18,29 @@ async def chat(request: ChatRequest):
     与大模型进行对话，基于表结构信息回答用户问题
 
     - **table_info**: 表结构信息字符串（可以是建表语句或表描述）
+    - **result_handle**: 落盘查询结果的句柄（可选，指定时由该结果生成表信息，代替 table_info）
     - **question**: 用户的问题
     - **model_name**: 使用的模型名称（可选，不指定则使用默认模型）
 
     返回模型的回答
     """
     try:
-        answer = call_chat_api(
-            table_info=request.table_info,
-            question=request.question,
-            model_name=request.model_name
+        table_info = request.table_info
+        if request.result_handle:
+            table_info = (await run_in_threadpool(summarize_handle, request.result_handle)).text
+        if table_info is None:
+            raise HTTPException(status_code=400, detail="必须指定 table_info 或 result_handle")
+
+        # 相同的在途对话请求只调用一次模型
+        answer, _ = await get_single_flight("chat").do(
+            chat_key(table_info, request.question, request.model_name),
+            lambda: run_admitted(
+                request.model_name,
+                call_chat_api,
+                table_info=table_info,
+                question=request.question,
+                model_name=request.model_name
+            ),
         )
 
         return ChatResponse(
@@ -33,6 +48,8 @@ async def chat(request: ChatRequest):
             answer=answer,
             model_name=request.model_name
         )
+    except AdmissionRejected:
+        raise
     except HTTPException as e:
         return ChatResponse(
             success=False,
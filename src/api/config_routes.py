@@ -12,6 +12,7 @@ from ..config import (
     PROMPT_TEMPLATE_FILE,
     CHAT_TEMPLATE_FILE,
 )
+from ..utils.template_loader import invalidate_template
 
 router = APIRouter(prefix="/config", tags=["配置管理"])
 
@@ -89,6 +90,7 @@ async def save_template_api(template_type: str, request: TemplateSaveRequest):
 
         with open(template_file, "w", encoding="utf-8") as f:
             f.write(request.content)
+        invalidate_template(template_file)
 
         return {"success": True, "message": f"{template_type} 模板保存成功"}
     except Exception as e:
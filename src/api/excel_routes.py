@@ -2,10 +2,13 @@
 """
 Excel 导入相关的 API 路由
 """
-from fastapi import APIRouter, HTTPException, UploadFile, File
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
+from typing import AsyncIterator, Optional
 import os
-import shutil
-import time
+from ..config.settings import UPLOAD_CHUNK_BYTES
 from ..models.excel_models import (
     ExcelImportRequest,
     ExcelImportResponse,
@@ -18,12 +21,12 @@ from ..models.excel_models import (
     BatchImportResult
 )
 from ..services.excel_service import ExcelImportService
+from ..services.upload_store import get_upload_store
 
 router = APIRouter(prefix="/excel")
 
-# 文件上传目录
-UPLOAD_DIR = "./uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+# multipart 边界与各部分头部的额外字节数上限
+MULTIPART_OVERHEAD = 64 * 1024
 
 
 @router.post("/import", response_model=ExcelImportResponse, summary="导入 Excel 文件到数据库")
@@ -37,11 +40,14 @@ async def import_excel(request: ExcelImportRequest):
     - **if_exists**: 表存在时的处理方式 (fail/replace/append)
     """
     try:
-        result = ExcelImportService.import_excel(
+        # 读取 Excel 与等待写线程都在线程池中进行，导入期间不阻塞事件循环
+        result = await run_in_threadpool(
+            ExcelImportService.import_excel,
             excel_path=request.excel_path,
             sheet_name=request.sheet_name,
             table_name=request.table_name,
-            if_exists=request.if_exists
+            if_exists=request.if_exists,
+            force=request.force
         )
         return ExcelImportResponse(success=True, **result)
     except FileNotFoundError as e:
@@ -80,7 +86,7 @@ async def update_config(request: ConfigUpdateRequest):
       - `replace`: 完全重新生成配置文件
     """
     try:
-        result = ExcelImportService.update_config(mode=request.mode)
+        result = await run_in_threadpool(ExcelImportService.update_config, mode=request.mode)
         return ConfigUpdateResponse(success=True, **result)
     except Exception as e:
         return ConfigUpdateResponse(success=False, error=str(e))
@@ -97,7 +103,8 @@ async def batch_import(request: BatchImportRequest):
     """
     try:
         configs = [cfg.dict() for cfg in request.configs]
-        result = ExcelImportService.batch_import(
+        result = await run_in_threadpool(
+            ExcelImportService.batch_import,
             configs=configs,
             if_exists=request.if_exists,
             auto_update_config=request.auto_update_config
@@ -115,33 +122,91 @@ async def batch_import(request: BatchImportRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/upload", summary="上传 Excel 文件")
-async def upload_excel(file: UploadFile = File(...)):
+async def _limited(stream: AsyncIterator[bytes], limit: int) -> AsyncIterator[bytes]:
+    """请求体超过 limit 字节时中止接收（413）"""
+    received = 0
+    async for chunk in stream:
+        received += len(chunk)
+        if received > limit:
+            raise get_upload_store().too_large()
+        yield chunk
+
+
+async def _read_chunks(file: UploadFile) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            return
+        yield chunk
+
+
+@router.post(
+    "/upload",
+    summary="上传 Excel 文件",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {"file": {"type": "string", "format": "binary"}},
+                        "required": ["file"],
+                    }
+                },
+                "application/octet-stream": {"schema": {"type": "string", "format": "binary"}},
+            },
+        }
+    },
+)
+async def upload_excel(request: Request, filename: Optional[str] = None):
     """
     上传 Excel 文件到服务器
 
-    返回上传后的文件路径
-    """
-    try:
-        # 检查文件类型
-        if not file.filename.endswith(('.xlsx', '.xls')):
-            raise HTTPException(status_code=400, detail="仅支持 .xlsx 或 .xls 文件")
+    - multipart/form-data：文件放在 `file` 字段中
+    - 其他 Content-Type：请求体即文件内容，文件名由查询参数 **filename** 给出
 
-        # 生成唯一文件名
-        timestamp = int(time.time() * 1000)
-        file_extension = os.path.splitext(file.filename)[1]
-        saved_filename = f"{timestamp}_{file.filename}"
-        file_path = os.path.join(UPLOAD_DIR, saved_filename)
+    文件边接收边计算 SHA-256，按内容哈希保存；相同内容的文件已存在时不再重复保存（`duplicate` 为 true）。
+    超过上传大小上限返回 413。返回上传后的文件路径
+    """
+    store = get_upload_store()
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > store.max_bytes + MULTIPART_OVERHEAD:
+        raise store.too_large()
 
-        # 保存文件
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+    try:
+        if request.headers.get("content-type", "").startswith("multipart/form-data"):
+            # starlette 解析 multipart 时仍会把文件部分写入临时文件（超过 1MB 落盘），这里限制请求体大小并分块读取
+            parser = MultiPartParser(
+                request.headers,
+                _limited(request.stream(), store.max_bytes + MULTIPART_OVERHEAD),
+                max_files=1,
+                max_fields=10,
+            )
+            try:
+                form = await parser.parse()
+            except MultiPartException as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            try:
+                file = form.get("file")
+                if not isinstance(file, UploadFile):
+                    raise HTTPException(status_code=400, detail="缺少文件字段 file")
+                filename = file.filename
+                stored = await store.save(_read_chunks(file), filename)
+            finally:
+                await form.close()
+        else:
+            # 请求体直接是文件内容：完全流式写入，不经过临时文件
+            stored = await store.save(request.stream(), filename)
 
         return {
             "success": True,
-            "file_path": file_path,
-            "filename": file.filename,
-            "saved_filename": saved_filename
+            "file_path": stored.path,
+            "filename": filename,
+            "saved_filename": os.path.basename(stored.path),
+            "size": stored.size,
+            "sha256": stored.sha256,
+            "duplicate": stored.duplicate
         }
     except HTTPException:
         raise
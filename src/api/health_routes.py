@@ -4,8 +4,12 @@
 """
 import time
 from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
 
 from ..config import get_db_config, get_model_config
+from ..services import admission_stats, get_db_writer, get_engine_router, get_upload_store, router_stats, single_flight_stats
+from ..utils import get_query_log_writer
+from ..utils.metrics import REGISTRY
 
 router = APIRouter()
 
@@ -26,4 +30,17 @@ async def health_check():
         "tables_loaded": len(db_config) if db_config else 0,
         "models_loaded": len(model_config["models"]) if model_config else 0,
         "default_model": model_config.get("default_model") if model_config else None,
+        "query_log": get_query_log_writer().stats(),
+        "llm_admission": admission_stats(),
+        "llm_endpoints": router_stats(),
+        "single_flight": single_flight_stats(),
+        "db_writer": get_db_writer().stats(),
+        "engines": get_engine_router().stats(),
+        "uploads": get_upload_store().stats(),
     }
+
+
+@router.get("/metrics", summary="Prometheus 指标", response_class=PlainTextResponse)
+async def metrics():
+    """以 Prometheus 文本格式导出各阶段耗时直方图、缓存命中率、连接池与在途模型调用等指标"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
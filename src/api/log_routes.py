@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+查询日志统计相关的 API 路由
+
+统计查询直接读取 SQLite 索引库，都放到线程池中执行，避免大索引库阻塞事件循环
+"""
+import time
+from typing import Optional, Tuple
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+
+from ..services.log_store_service import get_query_log_store
+from ..utils import get_query_log_writer
+
+router = APIRouter(prefix="/logs")
+
+
+def _time_range(
+    since: Optional[float], until: Optional[float], days: Optional[float]
+) -> Tuple[Optional[float], Optional[float]]:
+    """days 优先：表示最近 N 天"""
+    if days is not None:
+        return time.time() - days * 86400, None
+    return since, until
+
+
+@router.get("/stats/types", summary="按结果类型统计查询")
+async def stats_types(
+    table: Optional[str] = Query(None, description="表名，不指定则统计全部"),
+    model: Optional[str] = Query(None, description="模型名称"),
+    since: Optional[float] = Query(None, description="起始时间戳（秒）"),
+    until: Optional[float] = Query(None, description="结束时间戳（秒）"),
+    days: Optional[float] = Query(None, description="最近 N 天，优先于 since/until"),
+):
+    """
+    统计各 type 的请求数与占比（按小时粒度聚合）
+
+    type: 0 未提取到 SQL，1 SQL 执行失败，2 查询结果为空，3 查询有结果
+    """
+    since, until = _time_range(since, until, days)
+    try:
+        stats = await run_in_threadpool(get_query_log_store().type_breakdown, table, model, since, until)
+        return {"success": True, **stats}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"统计失败: {str(e)}")
+
+
+@router.get("/stats/latency", summary="查询耗时分位数")
+async def stats_latency(
+    table: Optional[str] = Query(None, description="表名，不指定则统计全部"),
+    model: Optional[str] = Query(None, description="模型名称"),
+    since: Optional[float] = Query(None, description="起始时间戳（秒）"),
+    until: Optional[float] = Query(None, description="结束时间戳（秒）"),
+    days: Optional[float] = Query(None, description="最近 N 天，优先于 since/until"),
+):
+    """返回 /query 总耗时的 p50/p90/p95/p99（毫秒）及各阶段平均耗时"""
+    since, until = _time_range(since, until, days)
+    try:
+        stats = await run_in_threadpool(get_query_log_store().latency_percentiles, table, model, since, until)
+        return {"success": True, **stats}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"统计失败: {str(e)}")
+
+
+@router.get("/stats/failing_questions", summary="失败最多的问题")
+async def stats_failing_questions(
+    table: Optional[str] = Query(None, description="表名，不指定则统计全部"),
+    model: Optional[str] = Query(None, description="模型名称"),
+    since: Optional[float] = Query(None, description="起始时间戳（秒）"),
+    until: Optional[float] = Query(None, description="结束时间戳（秒）"),
+    days: Optional[float] = Query(None, description="最近 N 天，优先于 since/until"),
+    include_empty: bool = Query(False, description="是否把结果为空 (type=2) 也算作失败"),
+    limit: int = Query(20, ge=1, le=500),
+):
+    since, until = _time_range(since, until, days)
+    types = (0, 1, 2) if include_empty else (0, 1)
+    try:
+        questions = await run_in_threadpool(
+            get_query_log_store().top_failing_questions, table, model, since, until, limit, types
+        )
+        return {"success": True, "questions": questions}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"统计失败: {str(e)}")
+
+
+@router.get("/stats/fingerprints", summary="最常执行的 SQL 形态")
+async def stats_fingerprints(
+    table: Optional[str] = Query(None, description="表名，不指定则统计全部"),
+    since: Optional[float] = Query(None, description="起始时间戳（秒）"),
+    until: Optional[float] = Query(None, description="结束时间戳（秒）"),
+    days: Optional[float] = Query(None, description="最近 N 天，优先于 since/until"),
+    limit: int = Query(20, ge=1, le=500),
+):
+    """按 SQL 指纹（字面量替换为 ?）分组统计执行次数、失败次数与平均执行耗时"""
+    since, until = _time_range(since, until, days)
+    try:
+        fingerprints = await run_in_threadpool(get_query_log_store().top_fingerprints, table, since, until, limit)
+        return {"success": True, "fingerprints": fingerprints}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"统计失败: {str(e)}")
+
+
+@router.get("/stats/top_tables", summary="查询最多的表")
+async def stats_top_tables(
+    model: Optional[str] = Query(None, description="模型名称"),
+    since: Optional[float] = Query(None, description="起始时间戳（秒）"),
+    until: Optional[float] = Query(None, description="结束时间戳（秒）"),
+    days: Optional[float] = Query(None, description="最近 N 天，优先于 since/until"),
+    limit: int = Query(20, ge=1, le=500),
+):
+    since, until = _time_range(since, until, days)
+    try:
+        tables = await run_in_threadpool(get_query_log_store().top_tables, model, since, until, limit)
+        return {"success": True, "tables": tables}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"统计失败: {str(e)}")
+
+
+def _rebuild_log_store():
+    """先写出已提交的日志，再在暂停写入器期间重建，重建期间写盘的批次不会被重复计入"""
+    writer = get_query_log_writer()
+    writer.flush()
+    with writer.paused():
+        return get_query_log_store().rebuild()
+
+
+@router.post("/rebuild", summary="从 JSONL 日志重建索引库")
+async def rebuild_log_store():
+    """清空索引库，并重新导入当前及已轮转（含 .gz）的查询日志文件（在线程池中执行，期间查询日志暂缓写盘）"""
+    try:
+        return {"success": True, **await run_in_threadpool(_rebuild_log_store)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"重建索引库失败: {str(e)}")
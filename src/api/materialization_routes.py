@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+物化汇总表相关的 API 路由
+"""
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from ..services.materialization_service import get_materialization_manager
+
+router = APIRouter(prefix="/materializations")
+
+
+@router.get("", summary="汇总表与命中统计")
+async def list_materializations():
+    """
+    列出各汇总表的定义（基础表、维度、度量、行数）以及命中次数与估算节省的耗时
+
+    命中次数与节省耗时自服务启动起累计，节省耗时 = 建表时扫描基础表的耗时 - 改写后查询的耗时
+    """
+    try:
+        return {"success": True, **get_materialization_manager().report()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取汇总表失败: {str(e)}")
+
+
+@router.post("/refresh", summary="挖掘查询日志并重建汇总表")
+async def refresh_materializations():
+    """从最近的查询日志中挖掘高频 GROUP BY 查询形态，重建汇总表并删除不再高频的汇总表"""
+    try:
+        result = await run_in_threadpool(get_materialization_manager().refresh)
+        return {"success": True, **result}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"刷新汇总表失败: {str(e)}")
@@ -2,13 +2,40 @@
 """
 查询相关的 API 路由
 """
+import asyncio
 from fastapi import APIRouter, HTTPException
-from typing import Dict, List
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import Any, Dict, List, Tuple
 
-from ..models import QueryRequest, QueryResponse, TablesResponse, ModelsResponse
-from ..services import call_model_api, execute_sql, DatabaseService
-from ..utils import extract_sql, fix_table_name, save_query_log
+from ..models import QueryRequest, BatchQueryRequest, QueryResponse, TablesResponse, ModelsResponse
+from ..services import (
+    call_chat_api,
+    chat_key,
+    summarize_result,
+    summarize_handle,
+    execute_sql,
+    run_nl2sql,
+    nl2sql_key,
+    get_single_flight,
+    DatabaseService,
+    get_db_writer,
+    AdmissionRejected,
+    NO_SQL_ERROR,
+    run_admitted,
+)
+from ..utils import normalize_sql, save_query_log
+from ..utils.fast_json import FastJSONResponse, dumps
+from ..utils.metrics import stage, current_timer, start_request_timer, StageTimer
+from ..utils.table_sampler import quote_identifier
 from ..config import get_db_config, get_model_config
+from ..config.settings import (
+    ASK_PREVIEW_ROWS,
+    BATCH_QUERY_CONCURRENCY,
+    BATCH_QUERY_MAX_CONCURRENCY,
+    BATCH_QUERY_MAX_ITEMS,
+    PREVIEW_SAMPLE_ROWS,
+)
 
 router = APIRouter()
 
@@ -43,142 +70,329 @@ async def get_models():
     )
 
 
-@router.post("/query", response_model=QueryResponse, summary="执行SQL查询")
-async def query_data(request: QueryRequest):
-    """根据自然语言查询生成并执行SQL"""
-    db_config = get_db_config()
-    if db_config is None:
-        raise HTTPException(status_code=500, detail="数据库配置未加载")
-
-    table_names = []
+def _resolve_tables(request: QueryRequest, db_config: Dict) -> List[str]:
+    """校验并返回请求涉及的表"""
     if request.table_names:
-        table_names = request.table_names
-        for table_name in table_names:
+        for table_name in request.table_names:
             if table_name not in db_config:
                 raise HTTPException(status_code=400, detail=f"表 '{table_name}' 不存在")
-    elif request.table_name:
+        return request.table_names
+    if request.table_name:
         if request.table_name not in db_config:
             raise HTTPException(status_code=400, detail=f"表 '{request.table_name}' 不存在")
-        table_names = [request.table_name]
-    else:
-        raise HTTPException(status_code=400, detail="必须指定table_name或table_names")
+        return [request.table_name]
+    raise HTTPException(status_code=400, detail="必须指定table_name或table_names")
 
-    query_text = request.query
-    model_name = request.model_name
-    model_response = ""
-    sql = ""
-    log_type = 0
 
+def _log_query(request: QueryRequest, table_names: List[str], outcome: Dict[str, Any], timer: StageTimer,
+               coalesced: bool):
+    """写入查询日志"""
+    model_config = get_model_config() or {}
+    stages = timer.as_ms()
+    sql = outcome["sql"]
+    result = outcome["result"]
+    norm = normalize_sql(sql) if sql else None
+    usage = outcome.get("usage") or {}
+    save_query_log(
+        {
+            "query": request.query,
+            "tables": table_names,
+            "model": request.model_name or model_config.get("default_model", ""),
+            "llm_res": outcome["model_response"],
+            "sql": sql,
+            "fingerprint_id": norm.fingerprint_id if norm else "",
+            "fingerprint": norm.fingerprint if norm else "",
+            "type": outcome["type"],
+            "total_rows": result["total_rows"] if result else None,
+            "total_ms": round(timer.elapsed() * 1000, 1),
+            "llm_ms": stages.get("llm_call"),
+            "queue_ms": stages.get("llm_queue"),
+            "sql_ms": stages.get("sql_execute"),
+            "prompt_tokens": usage.get("prompt_tokens"),
+            "completion_tokens": usage.get("completion_tokens"),
+            "prompt_tokens_est": usage.get("prompt_tokens_est"),
+            "coalesced": coalesced,
+            "stages": stages,
+        }
+    )
+
+
+def _build_response(outcome: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    按 QueryResponse 的字段组装响应
+
+    结果行直接放入字典，由 FastJSONResponse 序列化，不再逐行经过 pydantic 校验。
+    """
+    result = outcome["result"]
+    if result is None:
+        return {
+            "success": False,
+            "sql": None,
+            "data": None,
+            "columns": None,
+            "total_rows": None,
+            "error": outcome["error"],
+            # 未能提取 SQL 时返回模型原文，便于排查
+            "model_response": outcome["model_response"] if outcome["error"] == NO_SQL_ERROR else None,
+        }
+    response = {
+        "success": True,
+        "sql": outcome["sql"],
+        "data": result["data"],
+        "columns": result["columns"],
+        "total_rows": result["total_rows"],
+        "error": None,
+        "model_response": outcome["model_response"],
+    }
+    if "result_handle" in result:
+        # 结果已落盘：data 只是首页，其余行通过 /results/{result_handle} 读取
+        response["result_handle"] = result["result_handle"]
+    return response
+
+
+def _json_response(content: Any) -> FastJSONResponse:
+    with stage("serialize"):
+        return FastJSONResponse(content)
+
+
+async def _run_query(request: QueryRequest, table_names: List[str], key: str) -> Tuple[Dict[str, Any], bool]:
+    """
+    生成并执行 SQL；相同的在途请求只调用一次模型、执行一次 SQL。
+    模型调用与 SQL 执行放到线程池中，避免阻塞事件循环；模型并发名额在事件循环中排队获取。
+    """
     try:
-        model_response = call_model_api(query_text, table_names, model_name)
-        print(f"[INFO] 模型请求成功 {model_response}")
-        sql = extract_sql(model_response)
-        print(f"[INFO] 提取SQL成功 {sql}")
-        if sql == model_response.strip():
-            save_query_log(
-                {
-                    "query": query_text,
-                    "tables": table_names,
-                    "llm_res": model_response,
-                    "sql": "",
-                    "type": 0,
-                }
-            )
-            return QueryResponse(
-                success=False,
-                error="无法从模型响应中提取SQL语句",
-                model_response=model_response,
+        return await get_single_flight("query").do(
+            key, lambda: run_admitted(
+                request.model_name, run_nl2sql, request.query, table_names, request.model_name, request.spill
             )
+        )
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        error = str(e.detail) if isinstance(e, HTTPException) else str(e)
+        return {"model_response": "", "sql": "", "result": None, "type": 0, "error": error}, False
+
+
+@router.post("/query", response_model=QueryResponse, summary="执行SQL查询")
+async def query_data(request: QueryRequest):
+    """根据自然语言查询生成并执行SQL"""
+    db_config = get_db_config()
+    if db_config is None:
+        raise HTTPException(status_code=500, detail="数据库配置未加载")
+    table_names = _resolve_tables(request, db_config)
+    timer = current_timer() or start_request_timer("/query")
+
+    # 排队已满/超时（AdmissionRejected）直接返回 429/503，便于调用方退避重试
+    outcome, coalesced = await _run_query(
+        request, table_names, nl2sql_key(request.query, table_names, request.model_name, request.spill)
+    )
+    response = _json_response(_build_response(outcome))
+    _log_query(request, table_names, outcome, timer, coalesced)
+    return response
+
 
-        sql = fix_table_name(sql, table_names)
+@router.post("/query/batch", summary="批量执行SQL查询")
+async def query_batch(request: BatchQueryRequest):
+    """
+    批量根据自然语言查询生成并执行SQL，按完成顺序以 NDJSON 流式返回
 
-        # 执行 SQL
+    - **items**: 查询列表，每项与 /query 的请求体相同
+    - **concurrency**: 同时处理的查询数（默认 BATCH_QUERY_CONCURRENCY）
+
+    每行一个 JSON：{"index": 在 items 中的下标, ...与 /query 相同的响应字段}。
+    完全相同的查询只执行一次，结果返回给每个下标；每一项都会写入查询日志。
+    """
+    db_config = get_db_config()
+    if db_config is None:
+        raise HTTPException(status_code=500, detail="数据库配置未加载")
+    if len(request.items) > BATCH_QUERY_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"单次最多 {BATCH_QUERY_MAX_ITEMS} 条查询")
+    concurrency = max(1, min(request.concurrency or BATCH_QUERY_CONCURRENCY, BATCH_QUERY_MAX_CONCURRENCY))
+
+    # 按合并键分组去重；表校验失败的项直接返回错误
+    groups: Dict[str, List[int]] = {}
+    invalid: List[Tuple[int, str]] = []
+    tables_by_index: Dict[int, List[str]] = {}
+    for index, item in enumerate(request.items):
         try:
-            result = execute_sql(sql)
-            total_rows = result.get("total_rows", 0)
-            if total_rows > 0:
-                log_type = 3
-            else:
-                log_type = 2
-        except Exception:
-            log_type = 1
-            raise
-
-        save_query_log(
-            {
-                "query": query_text,
-                "tables": table_names,
-                "llm_res": model_response,
-                "sql": sql,
-                "type": log_type,
-            }
+            table_names = _resolve_tables(item, db_config)
+        except HTTPException as e:
+            invalid.append((index, e.detail))
+            continue
+        tables_by_index[index] = table_names
+        groups.setdefault(nl2sql_key(item.query, table_names, item.model_name, item.spill), []).append(index)
+
+    def ndjson(index: int, response: Dict[str, Any]) -> bytes:
+        return dumps({"index": index, **response}) + b"\n"
+
+    def error_response(error: str) -> Dict[str, Any]:
+        return _build_response({"result": None, "error": error, "model_response": ""})
+
+    semaphore = asyncio.Semaphore(concurrency)
+    lines: "asyncio.Queue[bytes]" = asyncio.Queue()
+
+    async def run_group(key: str, indices: List[int]):
+        first = request.items[indices[0]]
+        timer = start_request_timer("/query/batch")
+        try:
+            with stage("batch_wait"):
+                await semaphore.acquire()
+            try:
+                outcome, coalesced = await _run_query(first, tables_by_index[indices[0]], key)
+            finally:
+                semaphore.release()
+            response = _build_response(outcome)
+        except Exception as e:
+            # 单项失败（含排队已满）只影响该项，不中断整个批次
+            error = str(e.detail) if isinstance(e, HTTPException) else str(e)
+            outcome, coalesced = {"model_response": "", "sql": "", "result": None, "type": 0, "error": error}, False
+            response = error_response(error)
+        for n, index in enumerate(indices):
+            _log_query(request.items[index], tables_by_index[index], outcome, timer, coalesced or n > 0)
+            await lines.put(ndjson(index, response))
+
+    async def stream():
+        for index, error in invalid:
+            yield ndjson(index, error_response(error))
+        tasks = [asyncio.ensure_future(run_group(key, indices)) for key, indices in groups.items()]
+        remaining = len(request.items) - len(invalid)
+        try:
+            while remaining:
+                yield await lines.get()
+                remaining -= 1
+        finally:
+            # 客户端断开时取消未完成的查询
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@router.post("/ask", summary="一站式问答（NL2SQL + 结果分析）")
+async def ask(request: QueryRequest):
+    """
+    在服务端依次完成：生成 SQL -> 执行 SQL -> 整理结果摘要 -> Chat 模型分析，
+    查询结果只在服务端内存中流转，不再经由前端回传给 /chat。
+
+    以 NDJSON 流式返回各阶段结果，每行一个 JSON，stage 字段依次为：
+    - sql:    {"success", "sql", "model_response", "error"}
+    - result: {"success", "columns", "total_rows", "preview", "digest", "result_handle"}
+              （preview 为前 ASK_PREVIEW_ROWS 行；digest 为发给 Chat 模型的结果文本是否压缩及节省的 token 数；
+              请求 spill 为 true 且结果已落盘时 result_handle 为结果句柄，否则为 null）
+    - answer: {"success", "answer", "model_name", "error"}
+    - done:   {"success", "total_ms"}
+    """
+    db_config = get_db_config()
+    if db_config is None:
+        raise HTTPException(status_code=500, detail="数据库配置未加载")
+    table_names = _resolve_tables(request, db_config)
+    timer = current_timer() or start_request_timer("/ask")
+
+    def event(stage_name: str, **fields) -> bytes:
+        return dumps({"stage": stage_name, **fields}) + b"\n"
+
+    async def stream():
+        try:
+            outcome, coalesced = await _run_query(
+                request, table_names, nl2sql_key(request.query, table_names, request.model_name, request.spill)
+            )
+        except AdmissionRejected as e:
+            outcome, coalesced = {"model_response": "", "sql": "", "result": None, "type": 0,
+                                  "error": str(e.detail)}, False
+        _log_query(request, table_names, outcome, timer, coalesced)
+
+        result = outcome["result"]
+        yield event(
+            "sql",
+            success=result is not None,
+            sql=outcome["sql"],
+            model_response=outcome["model_response"],
+            error=outcome["error"],
         )
+        if result is None:
+            yield event("done", success=False, total_ms=round(timer.elapsed() * 1000, 1))
+            return
 
-        return QueryResponse(
+        if "result_handle" in result:
+            # 结果已落盘时由结果文件等间隔抽样生成摘要
+            try:
+                digest = await run_in_threadpool(summarize_handle, result["result_handle"])
+            except HTTPException as e:
+                yield event("result", success=False, error=str(e.detail))
+                yield event("done", success=False, total_ms=round(timer.elapsed() * 1000, 1))
+                return
+        else:
+            digest = summarize_result(result["columns"], result["data"])
+        table_info = digest.text
+        yield event(
+            "result",
             success=True,
-            sql=sql,
-            data=result["data"],
             columns=result["columns"],
             total_rows=result["total_rows"],
-            model_response=model_response,
+            preview=result["data"][:ASK_PREVIEW_ROWS],
+            digest=digest.stats(),
+            result_handle=result.get("result_handle"),
         )
-
-    except Exception as e:
-        if log_type == 0:
-            save_query_log(
-                {
-                    "query": query_text,
-                    "tables": table_names,
-                    "llm_res": model_response,
-                    "sql": sql,
-                    "type": 1 if sql else 0,
-                }
+        try:
+            answer, _ = await get_single_flight("chat").do(
+                chat_key(table_info, request.query, request.model_name),
+                lambda: run_admitted(request.model_name, call_chat_api, table_info, request.query, request.model_name),
             )
-        error_message = str(e.detail) if isinstance(e, HTTPException) else str(e)
-        return QueryResponse(success=False, error=error_message)
+            yield event("answer", success=True, answer=answer, model_name=request.model_name)
+            success = True
+        except Exception as e:
+            error = str(e.detail) if isinstance(e, HTTPException) else f"Chat 调用失败: {e}"
+            yield event("answer", success=False, model_name=request.model_name, error=error)
+            success = False
+        yield event("done", success=success, total_ms=round(timer.elapsed() * 1000, 1))
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
 
 @router.post("/execute_raw_sql", summary="直接执行自定义SQL")
-async def execute_raw_sql(request: Dict[str, str]):
+async def execute_raw_sql(request: Dict[str, Any]):
+    """执行只读 SQL；spill 为 true 时大结果写入结果文件，只返回首页与 result_handle"""
     sql = request.get("sql")
     try:
-        result = execute_sql(sql)
-        return {"success": True, **result}
+        result = await run_in_threadpool(execute_sql, sql, bool(request.get("spill")))
+        return _json_response({"success": True, **result})
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 
 @router.get("/table_preview/{table_name}", summary="预览表数据")
-async def preview_table(table_name: str, limit: int = 50):
-    sql = f"SELECT * FROM {table_name} LIMIT {limit}"
+async def preview_table(table_name: str, limit: int = PREVIEW_SAMPLE_ROWS, sample: bool = True):
+    """随机抽样预览表数据（sample=false 时返回前 limit 行），附带估计的总行数"""
     try:
-        result = execute_sql(sql)
-        return {"success": True, **result}
+        result = await run_in_threadpool(DatabaseService.preview_table, table_name, limit, sample)
+        return _json_response({"success": True, **result})
+    except HTTPException as e:
+        return {"success": False, "error": e.detail}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 
+def _drop_table(table_name: str):
+    """经由数据库写线程删除表（汇总表由写线程的变更通知一并删除）"""
+    get_db_writer().execute(
+        f"删除 {table_name}",
+        lambda conn: conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(table_name)}"),
+        tables=(table_name,),
+        action="drop",
+    )
+
+
 @router.delete("/tables/{table_name}", summary="删除表")
 async def delete_table(table_name: str):
     """删除指定的数据库表"""
     from ..services.excel_service import ExcelImportService
-    from ..config import DB_PATH
-    import sqlite3
 
     try:
-        # 直接使用可写连接执行 DROP TABLE
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
-        try:
-            cursor.execute(f"DROP TABLE IF EXISTS `{table_name}`")
-            conn.commit()
-        finally:
-            conn.close()
+        await run_in_threadpool(_drop_table, table_name)
 
         # 自动更新配置文件并重载
         try:
-            ExcelImportService.update_config(mode="replace")
+            await run_in_threadpool(ExcelImportService.update_config, mode="replace")
             return {
                 "success": True,
                 "message": f"表 '{table_name}' 已成功删除，配置已更新"
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+落盘查询结果（结果句柄）相关的 API 路由
+"""
+import csv
+import io
+from typing import Iterator
+
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+
+from ..config.settings import RESULT_PAGE_MAX_ROWS, RESULT_PAGE_ROWS
+from ..services.result_store import SpilledResult, get_result_store
+from ..utils.fast_json import FastJSONResponse
+
+router = APIRouter(prefix="/results")
+
+
+@router.get("", summary="结果文件占用情况")
+async def result_store_stats():
+    """当前保留的结果文件数、正在写入的结果数、占用字节数、容量上限与保留时间"""
+    stats = await run_in_threadpool(get_result_store().stats)
+    return {"success": True, **stats}
+
+
+def _read_page(handle: str, offset: int, limit: int):
+    with get_result_store().open(handle) as spilled:
+        rows = spilled.read(offset, limit)
+        columns = spilled.columns
+        total_rows = spilled.total_rows
+    return {
+        "result_handle": handle,
+        "columns": columns,
+        "data": [dict(zip(columns, row)) for row in rows],
+        "offset": offset,
+        "total_rows": total_rows,
+    }
+
+
+@router.get("/{handle}", summary="分页读取落盘结果")
+async def read_result(handle: str, offset: int = 0, limit: int = RESULT_PAGE_ROWS):
+    """
+    读取结果句柄的 [offset, offset + limit) 行
+
+    - **offset**: 起始行号（从 0 开始）
+    - **limit**: 行数，不超过 RESULT_PAGE_MAX_ROWS
+    """
+    if offset < 0 or limit <= 0:
+        raise HTTPException(status_code=400, detail="offset 不能为负数，limit 必须大于 0")
+    page = await run_in_threadpool(_read_page, handle, offset, min(limit, RESULT_PAGE_MAX_ROWS))
+    return FastJSONResponse({"success": True, **page})
+
+
+def _csv_stream(spilled: SpilledResult) -> Iterator[bytes]:
+    """逐个行组生成 CSV（带 BOM，Excel 打开中文不乱码）"""
+    try:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(spilled.columns)
+        yield ("\ufeff" + buffer.getvalue()).encode("utf-8")
+        for rows in spilled.iter_blocks():
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(rows)
+            yield buffer.getvalue().encode("utf-8")
+    finally:
+        spilled.close()
+
+
+@router.get("/{handle}/csv", summary="下载落盘结果（CSV）")
+async def download_result(handle: str):
+    spilled = await run_in_threadpool(get_result_store().open, handle)
+    return StreamingResponse(
+        _csv_stream(spilled),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="result-{handle}.csv"'},
+    )
+
+
+@router.delete("/{handle}", summary="删除落盘结果")
+async def delete_result(handle: str):
+    if not await run_in_threadpool(get_result_store().delete, handle):
+        raise HTTPException(status_code=404, detail=f"结果 '{handle}' 不存在或已过期")
+    return {"success": True, "message": f"结果 '{handle}' 已删除"}
@@ -5,8 +5,21 @@ FastAPI 应用主入口
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from .config import load_db_config, load_model_config
-from .api import query_router, health_router, excel_router, chat_router, config_router
+from .config import load_db_config, load_model_config, LOG_STORE_ENABLED, PROMPT_TEMPLATE_FILE, CHAT_TEMPLATE_FILE
+from .config.settings import HOT_TIER_ENABLED
+from .api import (
+    query_router, health_router, excel_router, chat_router, config_router, log_router, materialization_router,
+    result_router,
+)
+from .services import (
+    connection_pool, get_db_writer, get_engine_router, get_hot_tier, get_query_log_store, get_health_checker,
+    get_result_store,
+)
+from .utils import get_query_log_writer
+from .utils.compression import CompressionMiddleware
+from .utils.metrics import MetricsMiddleware
+from .utils.template_loader import load_template
+from .services.http_client import get_http_session
 
 # 创建 FastAPI 应用
 app = FastAPI(
@@ -23,6 +36,12 @@ app.add_middleware(
     allow_headers=["*"],  # 允许所有头部
 )
 
+# 按 Accept-Encoding 压缩较大的响应（位于计时中间件之内，压缩耗时计入请求阶段）
+app.add_middleware(CompressionMiddleware)
+
+# 请求级阶段计时与 Prometheus 指标
+app.add_middleware(MetricsMiddleware)
+
 
 @app.on_event("startup")
 async def startup_event():
@@ -33,15 +52,60 @@ async def startup_event():
     if not load_model_config():
         raise RuntimeError("无法加载模型配置")
 
+    # 预热 Prompt 模板缓存与模型 HTTP 会话，避免由第一个请求承担初始化开销
+    for path in (PROMPT_TEMPLATE_FILE, CHAT_TEMPLATE_FILE):
+        try:
+            load_template(path)
+        except OSError as e:
+            print(f"[WARNING] 预加载模板失败 {path}: {e}")
+    get_http_session()
+
+    # 2. 启动查询日志后台写入线程，并同步写入日志索引库
+    writer = get_query_log_writer()
+    if LOG_STORE_ENABLED:
+        writer.add_sink(get_query_log_store().ingest)
+    writer.start()
+
+    # 3. 启动多副本模型的主动健康检查
+    get_health_checker().start()
+
+    # 4. 启动落盘结果的过期清理
+    get_result_store().start()
+
+    # 5. 启动数据库写线程，打开写连接并切换为 WAL 模式（查询读取快照，不被导入阻塞）
+    try:
+        get_db_writer().execute("打开写连接", lambda conn: None)
+    except Exception as e:
+        print(f"[WARNING] 打开数据库写连接失败: {e}")
+
+    # 6. 后台加载内存热表（小表与高频表），加载完成之前查询照常读取数据库文件
+    if HOT_TIER_ENABLED:
+        get_hot_tier().start()
+
     print("[INFO] ✅ Application startup completed successfully.")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时停止健康检查与结果清理、执行完已提交的写入，刷出未写入的查询日志，并关闭只读连接与执行引擎"""
+    get_health_checker().stop()
+    get_result_store().stop()
+    get_db_writer().stop()
+    get_engine_router().close()
+    get_query_log_writer().stop()
+    print("[INFO] 查询日志已刷盘")
+    connection_pool.close_all()
+
+
 # 注册路由
 app.include_router(health_router, tags=["健康检查"])
 app.include_router(query_router, tags=["查询"])
 app.include_router(chat_router, tags=["对话"])
 app.include_router(excel_router, tags=["Excel导入"])
 app.include_router(config_router, tags=["配置管理"])
+app.include_router(log_router, tags=["日志统计"])
+app.include_router(materialization_router, tags=["物化汇总表"])
+app.include_router(result_router, tags=["查询结果"])
 
 
 if __name__ == "__main__":
@@ -8,6 +8,14 @@ from .settings import (
     TEMPERATURE,
     REQUEST_TIMEOUT,
     LOG_FILE,
+    LOG_QUEUE_SIZE,
+    LOG_BATCH_SIZE,
+    LOG_FLUSH_INTERVAL,
+    LOG_ROTATE_BYTES,
+    LOG_ROTATE_DAILY,
+    LOG_COMPRESS,
+    LOG_STORE_PATH,
+    LOG_STORE_ENABLED,
 )
 from .config_loader import (
     load_db_config,
@@ -27,6 +35,14 @@ __all__ = [
     "TEMPERATURE",
     "REQUEST_TIMEOUT",
     "LOG_FILE",
+    "LOG_QUEUE_SIZE",
+    "LOG_BATCH_SIZE",
+    "LOG_FLUSH_INTERVAL",
+    "LOG_ROTATE_BYTES",
+    "LOG_ROTATE_DAILY",
+    "LOG_COMPRESS",
+    "LOG_STORE_PATH",
+    "LOG_STORE_ENABLED",
     "load_db_config",
     "load_model_config",
     "get_db_config",
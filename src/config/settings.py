@@ -1,15 +1,160 @@
 # -*- coding: utf-8 -*-
 """
 应用配置常量
+
+路径类配置可通过 TABLEQA_* 环境变量覆盖（如基准测试使用独立的数据库与配置）。
 """
+import os
 
 # --- NL2SQL 原始配置 ---
-DB_PATH = "./data/sqlite3.db"
-PROMPT_TEMPLATE_FILE = "./config/infer.template"
-CHAT_TEMPLATE_FILE = "./config/chat.template"
-DB_CONFIG_FILE = "./config/config.json"
-MODEL_CONFIG_FILE = "./config/model_config.json"
+DB_PATH = os.environ.get("TABLEQA_DB_PATH", "./data/sqlite3.db")
+PROMPT_TEMPLATE_FILE = os.environ.get("TABLEQA_PROMPT_TEMPLATE_FILE", "./config/infer.template")
+CHAT_TEMPLATE_FILE = os.environ.get("TABLEQA_CHAT_TEMPLATE_FILE", "./config/chat.template")
+DB_CONFIG_FILE = os.environ.get("TABLEQA_DB_CONFIG_FILE", "./config/config.json")
+MODEL_CONFIG_FILE = os.environ.get("TABLEQA_MODEL_CONFIG_FILE", "./config/model_config.json")
 
 TEMPERATURE = 0
 REQUEST_TIMEOUT = 30  # 统一请求超时时间
-LOG_FILE = "query_logs.jsonl"  # 日志文件路径
+LOG_FILE = os.environ.get("TABLEQA_LOG_FILE", "query_logs.jsonl")  # 日志文件路径
+
+# --- 查询日志异步写入配置 ---
+LOG_QUEUE_SIZE = 10000  # 日志队列容量，队列满时丢弃并计数
+LOG_BATCH_SIZE = 200  # 单批最多写入条数
+LOG_FLUSH_INTERVAL = 1.0  # 最长刷盘间隔（秒）
+LOG_ROTATE_BYTES = 50 * 1024 * 1024  # 按大小轮转阈值，0 表示不按大小轮转
+LOG_ROTATE_DAILY = True  # 是否按天轮转
+LOG_COMPRESS = True  # 轮转后的日志是否 gzip 压缩
+
+# --- 查询日志索引库配置 ---
+LOG_STORE_PATH = os.environ.get("TABLEQA_LOG_STORE_PATH", "./data/query_log_store.db")  # 查询日志索引库（SQLite）
+LOG_STORE_ENABLED = True  # 是否将查询日志同步写入索引库
+LOG_QUESTIONS_PER_DAY = 500  # 失败问题聚合表中每张表每天保留的问题数（按次数取前 N，长尾问题被淘汰）
+
+# --- 模型 HTTP 连接池配置 ---
+HTTP_POOL_CONNECTIONS = 10  # 缓存的主机连接池数量
+HTTP_POOL_MAXSIZE = 32  # 每个主机连接池的最大连接数
+
+# --- SQL 执行配置 ---
+SQL_STATEMENT_CACHE_SIZE = 512  # 每个只读连接的预编译语句缓存条数（sqlite3 cached_statements）
+
+# --- 模型并发控制（model_config.json 中按模型配置 max_concurrency / max_queue / queue_timeout）---
+LLM_DEFAULT_MAX_QUEUE = 32  # 配置了 max_concurrency 但未配置 max_queue 时的排队上限
+LLM_QUEUE_TIMEOUT = 30  # 默认排队等待上限（秒）
+
+# --- 模型多副本路由与健康检查 ---
+LLM_EWMA_DECAY = 0.8  # 响应耗时滑动平均的衰减系数（越大越平滑）
+LLM_EJECT_FAILURES = 3  # 连续失败多少次后摘除副本
+LLM_EJECT_BASE_SECONDS = 10  # 首次摘除时长（秒），再次摘除按次数倍增
+LLM_EJECT_MAX_SECONDS = 300  # 摘除时长上限（秒）
+LLM_SLOW_START = 30  # 副本重新加入后权重恢复到 100% 所需时间（秒）
+LLM_HEALTH_CHECK_INTERVAL = 10  # 主动健康检查间隔（秒），0 表示关闭
+LLM_HEALTH_CHECK_TIMEOUT = 2  # 健康检查请求超时（秒）
+
+# --- 模型调用重试、熔断与截止时间 ---
+LLM_REQUEST_DEADLINE = REQUEST_TIMEOUT  # 单次模型调用（含排队与重试）的总时限（秒），可按模型配置 deadline 覆盖
+LLM_CONNECT_TIMEOUT = 3  # 建立连接的超时（秒），后端宕机时尽快失败
+LLM_MAX_RETRIES = 2  # 暂时性错误的最大重试次数
+LLM_MIN_ATTEMPT_TIMEOUT = 0.5  # 剩余时间不足该值时不再重试（秒）
+LLM_BACKOFF_BASE = 0.2  # 重试退避基数（秒）
+LLM_BACKOFF_MAX = 2.0  # 重试退避上限（秒）
+LLM_BREAKER_FAILURES = 5  # 连续失败多少次后熔断副本
+LLM_BREAKER_RESET_SECONDS = 15  # 熔断冷却时间（秒），之后放行一个试探请求
+
+# --- 批量查询 ---
+BATCH_QUERY_CONCURRENCY = 8  # /query/batch 默认并发数
+BATCH_QUERY_MAX_CONCURRENCY = 32  # /query/batch 并发数上限
+BATCH_QUERY_MAX_ITEMS = 5000  # 单次批量查询的最大条数
+
+# --- /ask 一站式问答 ---
+ASK_PREVIEW_ROWS = 20  # 返回给前端展示的结果预览行数
+
+# --- 查询结果摘要 ---
+CHAT_RESULT_TOKEN_BUDGET = int(os.environ.get("TABLEQA_CHAT_RESULT_TOKENS", "2000"))  # 发给 Chat 模型的结果文本 token 上限
+DIGEST_TOP_VALUES = 5  # 文本列列出的高频值个数
+DIGEST_GROUP_MAX = 20  # 分组列允许的最大不同值个数
+DIGEST_MAX_NUMERIC_AGGS = 3  # 分组计数中汇总的数值列个数
+DIGEST_SAMPLE_ROWS = 50  # 抽样行数上限（实际行数还受剩余预算限制）
+DIGEST_SAMPLE_SEED = 0  # 分层抽样的随机种子，保证相同结果得到相同摘要
+DIGEST_PLAIN_MAX_ROWS = 200  # 不超过该行数时先直接格式化，在预算内则不加载 pandas
+
+# --- Prompt token 预算 ---
+LLM_DEFAULT_CONTEXT_WINDOW = 32768  # 模型未配置 context_window 时的上下文长度（tokens）
+LLM_COMPLETION_RESERVE = 1024  # 模型未配置 max_tokens 时为输出预留的 tokens
+# 各类请求的默认生成参数，可被 model_config.json 中模型的 max_tokens / stop / prefill 及 generation.{类别} 覆盖
+# NL2SQL 在 SQL 代码块的结束标记处停止生成，不再解码之后的解释文字
+LLM_GENERATION_DEFAULTS = {
+    "nl2sql": {"stop": ["\n```"]},
+}
+PROMPT_BUDGET_SAFETY = 0.9  # token 数为估算值，prompt 只使用可用空间的这一比例
+
+# --- Prompt 前缀缓存 ---
+SCHEMA_SAMPLE_SEED = 0  # 建表语句样例值的抽取种子，固定后重新扫描得到相同的建表语句
+
+# --- 响应压缩 ---
+RESPONSE_COMPRESS_MIN_BYTES = 1024  # 小于该大小的响应不压缩
+RESPONSE_COMPRESS_THREAD_BYTES = 1024 * 1024  # 超过该大小的响应放到线程池中压缩，避免阻塞事件循环
+RESPONSE_GZIP_LEVEL = 5
+RESPONSE_BROTLI_QUALITY = 4
+
+# --- 表抽样与行数估计 ---
+PREVIEW_SAMPLE_ROWS = 50  # /table_preview 默认返回的行数
+SCHEMA_SAMPLE_ROWS = 200  # 生成建表语句样例值时抽取的行数
+SAMPLE_OVERSAMPLE = 1.2  # 按 rowid 密度估算候选数时的放大系数，减少补抽轮数
+SAMPLE_MAX_ROUNDS = 4  # rowid 随机命中的最多轮数，之后改为向后探测补齐
+SAMPLE_MAX_CANDIDATES_PER_ROW = 8  # 每缺一行最多尝试的候选 rowid 数
+SAMPLE_ANALYSIS_LIMIT = 1000  # 为缺少统计信息的表执行 ANALYZE 时每个索引最多扫描的行数
+
+# --- 物化汇总表 ---
+MATERIALIZE_ENABLED = os.environ.get("TABLEQA_MATERIALIZE", "1") != "0"  # 是否把符合条件的聚合查询改写到汇总表
+MV_TABLE_PREFIX = "__mv_"  # 汇总表与登记表的表名前缀（扫描表结构时忽略）
+MV_MINE_DAYS = 7  # 从最近 N 天的查询日志中挖掘高频 GROUP BY 查询形态
+MV_MINE_FINGERPRINTS = 200  # 参与挖掘的高频指纹数
+MV_MIN_QUERIES = 5  # 查询形态至少执行过的次数
+MV_MAX_PER_TABLE = 3  # 每张基础表最多的汇总表数
+MV_MAX_ROW_RATIO = 0.2  # 汇总表行数超过基础表的该比例时收益不足，不保留
+
+# --- 大结果落盘 ---
+RESULT_SPILL_DIR = os.environ.get("TABLEQA_RESULT_SPILL_DIR", "./data/results")  # 落盘结果文件目录
+RESULT_SPILL_ROWS = 10000  # 请求开启 spill 且结果超过该行数时写入磁盘，返回结果句柄
+RESULT_SPILL_BLOCK_ROWS = 4096  # 结果文件每个行组的行数（按行组读取，内存占用与总行数无关）
+RESULT_PAGE_ROWS = 1000  # 落盘结果随查询返回的首页行数，也是分页接口的默认页大小
+RESULT_PAGE_MAX_ROWS = 10000  # 分页接口单页行数上限
+RESULT_SPILL_TTL = 3600  # 结果句柄自最后一次访问起的保留时间（秒）
+RESULT_SPILL_QUOTA_BYTES = 2 * 1024 * 1024 * 1024  # 结果文件占用磁盘的上限，超出时先淘汰最久未访问的结果
+RESULT_SPILL_CLEANUP_INTERVAL = 60  # 后台清理过期结果的间隔（秒），0 表示关闭
+RESULT_DIGEST_MAX_ROWS = 20000  # 由结果句柄生成 Chat 摘要时等间隔读取的最多行数
+
+# --- 数据库写线程 ---
+DB_WRITER_QUEUE_SIZE = 64  # 写命令队列容量，队列满时返回 503
+DB_WRITER_BUSY_TIMEOUT = 30  # 其他进程（多 worker）持有写锁时的等待上限（秒）
+
+# --- 查询执行引擎（可选安装 duckdb）---
+ENGINE_DEFAULT = os.environ.get("TABLEQA_ENGINE", "sqlite")  # 未命中以下路由规则的查询使用的引擎
+# 按表路由，如 "sales=duckdb,dim_region=sqlite"；查询引用的表路由到不同引擎时使用默认引擎
+ENGINE_TABLE_ROUTES = {
+    table.strip(): engine.strip()
+    for table, _, engine in (item.partition("=") for item in os.environ.get("TABLEQA_ENGINE_TABLES", "").split(","))
+    if table.strip() and engine.strip()
+}
+ENGINE_AGGREGATE = os.environ.get("TABLEQA_ENGINE_AGGREGATE", "")  # 聚合查询（GROUP BY / 聚合函数）使用的引擎，空为不按形态路由
+ENGINE_AGGREGATE_MIN_ROWS = 200000  # 按形态路由时，引用的表中最大行数（估计值）达到该值才改用聚合引擎
+DUCKDB_SOURCE = os.environ.get("TABLEQA_DUCKDB_SOURCE", "sqlite")  # sqlite：直接读业务库；parquet：读 Parquet 镜像
+DUCKDB_PARQUET_DIR = os.environ.get("TABLEQA_DUCKDB_PARQUET_DIR", "./data/parquet")  # Parquet 镜像目录
+DUCKDB_THREADS = 4  # DuckDB 执行单条查询的线程数
+DUCKDB_MEMORY_LIMIT = "1GB"  # DuckDB 的内存上限（超出时溢写临时文件）
+
+# --- 内存热表 ---
+HOT_TIER_ENABLED = os.environ.get("TABLEQA_HOT_TIER", "1") != "0"  # 是否把小表与高频表加载到共享内存库
+HOT_TIER_MEMORY_BYTES = 256 * 1024 * 1024  # 内存库的容量上限，按查询次数、表大小依次装入，超出的表不加载
+HOT_TIER_SMALL_TABLE_BYTES = 8 * 1024 * 1024  # 不超过该大小（含索引）的表都是候选
+HOT_TIER_TOP_TABLES = 10  # 查询日志中请求量最多的前 N 张表也是候选（大小不超过容量上限即可）
+HOT_TIER_MINE_DAYS = 7  # 统计最近 N 天的请求量
+HOT_TIER_MAX_ROWS = 1000000  # 估计行数超过该值的表不参与（不再统计其占用大小）
+HOT_TIER_REFRESH_INTERVAL = 300  # 按查询日志重新挑选常驻表的间隔（秒），0 表示只在启动与导入时刷新
+
+# --- 文件上传 ---
+UPLOAD_DIR = os.environ.get("TABLEQA_UPLOAD_DIR", "./uploads")  # 上传文件按内容哈希保存的目录
+UPLOAD_MAX_BYTES = 200 * 1024 * 1024  # 单个上传文件的大小上限，超出时返回 413
+UPLOAD_CHUNK_BYTES = 1024 * 1024  # 边接收边计算哈希、写入磁盘的块大小
+UPLOAD_QUOTA_BYTES = 5 * 1024 * 1024 * 1024  # 上传目录的总大小上限，超出时先删除最久未使用的文件
+UPLOAD_TTL = 30 * 86400  # 上传文件自最后一次上传或导入起的保留时间（秒）
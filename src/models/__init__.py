@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from .query_models import QueryRequest, QueryResponse, TablesResponse, ModelsResponse
+from .query_models import QueryRequest, BatchQueryRequest, QueryResponse, TablesResponse, ModelsResponse
 from .chat_models import ChatRequest, ChatResponse
 from .excel_models import (
     ExcelImportRequest,
@@ -16,6 +16,7 @@ from .excel_models import (
 
 __all__ = [
     "QueryRequest",
+    "BatchQueryRequest",
     "QueryResponse",
     "TablesResponse",
     "ModelsResponse",
@@ -8,7 +8,8 @@ from typing import Optional
 
 class ChatRequest(BaseModel):
     """Chat 对话请求"""
-    table_info: str = Field(..., description="表结构信息字符串")
+    table_info: Optional[str] = Field(None, description="表结构信息字符串")
+    result_handle: Optional[str] = Field(None, description="落盘查询结果的句柄，指定时由该结果生成表信息")
     question: str = Field(..., description="用户问题")
     model_name: Optional[str] = Field(None, description="使用的模型名称，不指定则使用默认模型")
 
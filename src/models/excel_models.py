@@ -12,6 +12,7 @@ class ExcelImportRequest(BaseModel):
     sheet_name: str = Field(..., description="Sheet 名称")
     table_name: str = Field(..., description="目标表名")
     if_exists: str = Field(default="replace", description="表存在时的处理方式: fail/replace/append")
+    force: bool = Field(default=False, description="以 replace 方式导入时，同一文件的同一 Sheet 已导入到该表仍重新导入")
 
 
 class ExcelImportResponse(BaseModel):
@@ -23,6 +24,7 @@ class ExcelImportResponse(BaseModel):
     original_columns: Optional[List[str]] = None
     normalized_columns: Optional[List[str]] = None
     create_statement: Optional[str] = None
+    unchanged: Optional[bool] = None
     error: Optional[str] = None
 
 
@@ -74,6 +76,7 @@ class BatchImportResult(BaseModel):
     table_name: str
     success: bool
     row_count: Optional[int] = None
+    unchanged: Optional[bool] = None
     error: Optional[str] = None
 
 
@@ -2,7 +2,7 @@
 """
 SQL 查询相关的请求/响应模型
 """
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any
 
 
@@ -11,6 +11,13 @@ class QueryRequest(BaseModel):
     table_name: Optional[str] = None
     table_names: Optional[List[str]] = None
     model_name: Optional[str] = None
+    spill: bool = Field(False, description="结果较大时写入结果文件，只返回首页与结果句柄")
+
+
+class BatchQueryRequest(BaseModel):
+    """批量查询请求"""
+    items: List[QueryRequest] = Field(..., description="查询列表")
+    concurrency: Optional[int] = Field(None, description="并发数，不指定则使用服务端默认值")
 
 
 class QueryResponse(BaseModel):
@@ -21,6 +28,7 @@ class QueryResponse(BaseModel):
     total_rows: Optional[int] = None
     error: Optional[str] = None
     model_response: Optional[str] = None
+    result_handle: Optional[str] = None
 
 
 class TablesResponse(BaseModel):
@@ -1,11 +1,50 @@
 # -*- coding: utf-8 -*-
-from .sql_service import call_model_api, execute_sql
-from .chat_service import call_chat_api
+from .sql_service import call_model_api, execute_sql, run_nl2sql, nl2sql_key, NO_SQL_ERROR
+from .chat_service import call_chat_api, chat_key, summarize_result, summarize_handle
 from .database_service import DatabaseService
+from .db_writer import DatabaseWriter, DataChange, get_db_writer
+from .log_store_service import QueryLogStore, get_query_log_store
+from .materialization_service import MaterializationManager, get_materialization_manager
+from .query_engine import EngineRouter, ExecutionEngine, get_engine_router
+from .hot_tier import HotTierEngine, get_hot_tier
+from .result_store import ResultStore, get_result_store
+from .upload_store import UploadStore, get_upload_store
+from .admission import AdmissionRejected, admission_stats, run_admitted
+from .model_router import get_health_checker, router_stats
+from .single_flight import get_single_flight, single_flight_stats
 
 __all__ = [
     "call_model_api",
     "execute_sql",
+    "run_nl2sql",
+    "nl2sql_key",
+    "NO_SQL_ERROR",
     "call_chat_api",
+    "chat_key",
+    "summarize_result",
+    "summarize_handle",
     "DatabaseService",
+    "DatabaseWriter",
+    "DataChange",
+    "get_db_writer",
+    "QueryLogStore",
+    "get_query_log_store",
+    "MaterializationManager",
+    "get_materialization_manager",
+    "EngineRouter",
+    "ExecutionEngine",
+    "get_engine_router",
+    "HotTierEngine",
+    "get_hot_tier",
+    "ResultStore",
+    "get_result_store",
+    "UploadStore",
+    "get_upload_store",
+    "AdmissionRejected",
+    "admission_stats",
+    "run_admitted",
+    "get_health_checker",
+    "router_stats",
+    "get_single_flight",
+    "single_flight_stats",
 ]
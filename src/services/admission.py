@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+模型并发控制（准入队列）
+
+model_config.json 中每个模型可配置：
+- max_concurrency: 同时发往该模型的最大请求数，不配置或 <= 0 表示不限制
+- max_queue:       并发已满时允许排队的请求数，队列满时立即返回 429
+- queue_timeout:   排队等待的最长时间（秒），超时返回 503
+
+排队按先来先服务：释放的名额直接移交给队首请求，后到的请求不会插队。
+
+路由层用 run_admitted() 在事件循环中排队，获得名额后才进入线程池：排队中的请求不占用线程池线程，
+不会挤占 SQL 执行、上传、导入等同步任务。线程池中的 admit() 直接使用该名额，不再重复排队。
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from ..config import get_model_config
+from ..config.settings import LLM_DEFAULT_MAX_QUEUE, LLM_QUEUE_TIMEOUT, LLM_REQUEST_DEADLINE
+from ..utils.metrics import REGISTRY, stage
+
+
+class AdmissionRejected(HTTPException):
+    """排队已满或排队超时；路由层应直接返回对应状态码，而不是包装成业务错误"""
+
+
+class _Waiter:
+    """排队中的请求：线程中等待 event，事件循环中等待 future"""
+    __slots__ = ("event", "loop", "future", "granted")
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+        self.granted = False
+
+    def wake(self):
+        # 调用方需持有 ModelAdmission._lock；释放名额的可能是线程池中的线程
+        self.granted = True
+        if self.future is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class ModelAdmission:
+    """单个模型的并发名额与等待队列"""
+
+    def __init__(self, model_name: str, max_concurrency: int = 0, max_queue: int = 0,
+                 queue_timeout: float = LLM_QUEUE_TIMEOUT):
+        self.model_name = model_name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._waiters: Deque[_Waiter] = deque()
+        self._lock = threading.Lock()
+
+    def configure(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        """更新限制（模型配置重新加载后调用），调大并发时立即放行排队中的请求"""
+        with self._lock:
+            self.max_concurrency = max_concurrency
+            self.max_queue = max_queue
+            self.queue_timeout = queue_timeout
+            self._grant_waiters()
+
+    @property
+    def limited(self) -> bool:
+        return self.max_concurrency > 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def _grant_waiters(self):
+        # 调用方需持有 _lock
+        while self._waiters and (not self.limited or self.active < self.max_concurrency):
+            waiter = self._waiters.popleft()
+            self.active += 1
+            waiter.wake()
+
+    def _enqueue(self, timeout: Optional[float],
+                 loop: Optional[asyncio.AbstractEventLoop] = None) -> Tuple[Optional[_Waiter], float]:
+        """有空闲名额时直接占用并返回 (None, 0)，否则排入队列并返回 (等待者, 排队时限)"""
+        with self._lock:
+            if not self.limited or (self.active < self.max_concurrency and not self._waiters):
+                self.active += 1
+                self.admitted += 1
+                return None, 0.0
+            if len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                ADMISSION_REJECTIONS.inc(model=self.model_name, result="rejected")
+                raise AdmissionRejected(
+                    status_code=429,
+                    detail=f"模型 {self.model_name} 请求过多，请稍后重试",
+                    headers={"Retry-After": "1"},
+                )
+            waiter = _Waiter(loop)
+            self._waiters.append(waiter)
+            return waiter, self.queue_timeout if timeout is None else timeout
+
+    def _settle(self, waiter: _Waiter, waited: float, wait_timeout: float) -> float:
+        """等待结束：未获得名额时移出队列并按超时拒绝"""
+        with self._lock:
+            if not waiter.granted:
+                self._waiters.remove(waiter)
+                self.timed_out += 1
+                ADMISSION_REJECTIONS.inc(model=self.model_name, result="timeout")
+                QUEUE_WAIT.observe(waited, model=self.model_name)
+                raise AdmissionRejected(
+                    status_code=503,
+                    detail=f"模型 {self.model_name} 排队超时（{wait_timeout:g}s），请稍后重试",
+                    headers={"Retry-After": "1"},
+                )
+            self.admitted += 1
+        QUEUE_WAIT.observe(waited, model=self.model_name)
+        return waited
+
+    def acquire(self, timeout: Optional[float] = None) -> float:
+        """
+        获取一个并发名额，返回排队等待的秒数
+
+        Raises:
+            AdmissionRejected: 队列已满（429）或排队超时（503）
+        """
+        waiter, wait_timeout = self._enqueue(timeout)
+        if waiter is None:
+            return 0.0
+        start = time.perf_counter()
+        waiter.event.wait(wait_timeout)
+        return self._settle(waiter, time.perf_counter() - start, wait_timeout)
+
+    async def acquire_async(self, timeout: Optional[float] = None) -> float:
+        """
+        同 acquire，但在事件循环中等待，不占用线程
+
+        Raises:
+            AdmissionRejected: 队列已满（429）或排队超时（503）
+        """
+        waiter, wait_timeout = self._enqueue(timeout, asyncio.get_running_loop())
+        if waiter is None:
+            return 0.0
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), wait_timeout)
+        except asyncio.TimeoutError:
+            pass
+        except BaseException:
+            # 请求被取消（客户端断开）：仍在队列中则移出，已获得名额则归还
+            with self._lock:
+                if waiter.granted:
+                    self.active -= 1
+                    self._grant_waiters()
+                else:
+                    self._waiters.remove(waiter)
+            raise
+        return self._settle(waiter, time.perf_counter() - start, wait_timeout)
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+            self._grant_waiters()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "queue_timeout": self.queue_timeout,
+                "active": self.active,
+                "queued": len(self._waiters),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+            }
+
+
+_admissions: Dict[str, ModelAdmission] = {}
+_admissions_lock = threading.Lock()
+
+
+def _limits(model_info: Dict[str, Any]):
+    max_concurrency = int(model_info.get("max_concurrency") or 0)
+    max_queue = model_info.get("max_queue")
+    max_queue = LLM_DEFAULT_MAX_QUEUE if max_queue is None else int(max_queue)
+    queue_timeout = float(model_info.get("queue_timeout") or LLM_QUEUE_TIMEOUT)
+    return max_concurrency, max_queue, queue_timeout
+
+
+def get_admission(model_name: str, model_info: Dict[str, Any]) -> ModelAdmission:
+    """获取模型的准入控制器，并按当前配置同步限制"""
+    limits = _limits(model_info)
+    admission = _admissions.get(model_name)
+    if admission is None:
+        with _admissions_lock:
+            admission = _admissions.get(model_name)
+            if admission is None:
+                admission = _admissions[model_name] = ModelAdmission(model_name, *limits)
+                return admission
+    if (admission.max_concurrency, admission.max_queue, admission.queue_timeout) != limits:
+        admission.configure(*limits)
+    return admission
+
+
+class _Ticket:
+    """run_admitted() 在事件循环中获得的名额，由线程池中该模型的第一次 admit() 使用并释放"""
+    __slots__ = ("model_name", "used")
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self.used = False
+
+
+_ticket: ContextVar[Optional[_Ticket]] = ContextVar("admission_ticket", default=None)
+
+
+@contextmanager
+def admit(model_name: str, model_info: Dict[str, Any], timeout: Optional[float] = None):
+    """
+    在模型的并发名额内执行调用；排队时间记录为 llm_queue 阶段
+
+    timeout 为调用方剩余的截止时间，排队时间取它与 queue_timeout 中较小者。
+    已由 run_admitted() 获得该模型的名额时直接使用，不再排队
+    """
+    admission = get_admission(model_name, model_info)
+    ticket = _ticket.get()
+    if ticket is not None and ticket.model_name == model_name and not ticket.used:
+        ticket.used = True
+    elif admission.limited:
+        if timeout is not None:
+            timeout = min(timeout, admission.queue_timeout)
+        with stage("llm_queue"):
+            admission.acquire(timeout)
+    else:
+        admission.acquire()
+    try:
+        yield admission
+    finally:
+        admission.release()
+
+
+def _resolve_model(model_name: Optional[str]) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """按与模型调用相同的规则确定模型；不存在或已禁用时返回 None，由模型调用本身报错"""
+    model_config = get_model_config() or {}
+    models = model_config.get("models") or {}
+    if not model_name:
+        model_name = model_config.get("default_model", "SFT-Qwen3-8B")
+    model_info = models.get(model_name)
+    if model_info is None or not model_info.get("enabled", True):
+        return None
+    return model_name, model_info
+
+
+async def run_admitted(model_name: Optional[str], func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    在事件循环中排队获取模型的并发名额，再到线程池中执行 func（其中的模型调用使用该名额）
+
+    func 没有调用该模型（参数错误、提前失败）时，名额在返回后归还
+
+    Raises:
+        AdmissionRejected: 队列已满（429）或排队超时（503）
+    """
+    resolved = _resolve_model(model_name)
+    admission = get_admission(*resolved) if resolved is not None else None
+    if admission is None or not admission.limited:
+        return await run_in_threadpool(func, *args, **kwargs)
+    model_name, model_info = resolved
+    timeout = min(float(model_info.get("deadline") or LLM_REQUEST_DEADLINE), admission.queue_timeout)
+    with stage("llm_queue"):
+        await admission.acquire_async(timeout)
+    ticket = _Ticket(model_name)
+    token = _ticket.set(ticket)
+    try:
+        return await run_in_threadpool(func, *args, **kwargs)
+    finally:
+        _ticket.reset(token)
+        if not ticket.used:
+            admission.release()
+
+
+def admission_stats() -> Dict[str, Dict[str, Any]]:
+    """各模型的并发与排队情况"""
+    with _admissions_lock:
+        admissions = list(_admissions.values())
+    return {a.model_name: a.stats() for a in admissions}
+
+
+QUEUE_WAIT = REGISTRY.histogram(
+    "tableqa_llm_queue_wait_seconds", "Time spent waiting for an LLM concurrency slot", ("model",)
+)
+ADMISSION_REJECTIONS = REGISTRY.counter(
+    "tableqa_llm_admission_rejections_total", "LLM requests rejected by admission control", ("model", "result")
+)
+REGISTRY.gauge(
+    "tableqa_llm_queue_depth",
+    "Requests waiting for an LLM concurrency slot",
+    ("model",),
+    callback=lambda: {(name,): float(a.queue_depth) for name, a in list(_admissions.items())},
+)
@@ -2,15 +2,78 @@
 """
 Chat 对话服务
 """
-import time
-import requests
-from typing import Optional
+from typing import Any, Dict, List, Optional
 from fastapi import HTTPException
 
-from ..config import TEMPERATURE, REQUEST_TIMEOUT, get_model_config
+from ..config import TEMPERATURE, CHAT_TEMPLATE_FILE, get_model_config
+from ..config.settings import CHAT_RESULT_TOKEN_BUDGET, RESULT_DIGEST_MAX_ROWS
+from ..utils.metrics import stage, REGISTRY
+from ..utils.result_digest import ResultDigest, digest_result, parse_result_table
+from ..utils.tokens import estimate_tokens
+from ..utils.template_loader import load_template, template_version
+from .llm_client import chat_completion
+from .result_store import get_result_store
+from .single_flight import make_key
 
+DIGESTS = REGISTRY.counter("tableqa_result_digest_total", "Result texts prepared for the chat model", ("mode",))
+DIGEST_TOKENS = REGISTRY.counter(
+    "tableqa_result_digest_tokens_total",
+    "Estimated tokens of the full result table (raw) vs the text actually sent (sent)",
+    ("kind",),
+)
 
-CHAT_TEMPLATE_FILE = "./config/chat.template"
+
+def summarize_result(columns: List[str], data: List[Dict[str, Any]],
+                     total_rows: Optional[int] = None) -> ResultDigest:
+    """
+    把查询结果整理成发给 Chat 模型的文本，超出 CHAT_RESULT_TOKEN_BUDGET 时改为统计摘要
+
+    Args:
+        total_rows: data 为抽样行时结果的总行数
+
+    Returns:
+        ResultDigest，其中 saved_tokens 为相对完整结果表节省的 token 数
+    """
+    with stage("result_digest"):
+        digest = digest_result(columns, data, CHAT_RESULT_TOKEN_BUDGET, total_rows=total_rows)
+    DIGESTS.inc(mode=digest.mode)
+    DIGEST_TOKENS.inc(digest.raw_tokens, kind="raw")
+    DIGEST_TOKENS.inc(digest.tokens, kind="sent")
+    if digest.mode == "digest":
+        print(
+            f"[INFO] 查询结果 {digest.total_rows} 行已压缩为摘要（抽样 {digest.sample_rows} 行）："
+            f"约 {digest.raw_tokens} -> {digest.tokens} tokens，节省 {digest.saved_tokens}"
+        )
+    return digest
+
+
+def summarize_handle(handle: str) -> ResultDigest:
+    """
+    由落盘结果的句柄生成发给 Chat 模型的文本 (同步)
+
+    结果超过 RESULT_DIGEST_MAX_ROWS 行时等间隔读取这么多行生成摘要，不把整个结果读入内存。
+
+    Raises:
+        HTTPException: 句柄不存在或已过期（404）
+    """
+    with stage("result_read"):
+        with get_result_store().open(handle) as spilled:
+            columns = spilled.columns
+            total_rows = spilled.total_rows
+            rows = spilled.sample(RESULT_DIGEST_MAX_ROWS)
+        data = [dict(zip(columns, row)) for row in rows]
+    return summarize_result(columns, data, total_rows=total_rows)
+
+
+def _fit_table_info(table_info: str) -> str:
+    """客户端直接提交的表格文本超出预算时，解析后改为统计摘要；无法解析则原样使用"""
+    if estimate_tokens(table_info) <= CHAT_RESULT_TOKEN_BUDGET:
+        return table_info
+    parsed = parse_result_table(table_info)
+    if parsed is None:
+        print(f"[WARNING] table_info 超出 {CHAT_RESULT_TOKEN_BUDGET} tokens 预算且不是表格格式，按原文发送")
+        return table_info
+    return summarize_result(*parsed).text
 
 
 def call_chat_api(table_info: str, question: str, model_name: Optional[str] = None) -> str:
@@ -28,29 +91,31 @@ def call_chat_api(table_info: str, question: str, model_name: Optional[str] = No
     Raises:
         HTTPException: 当模型不存在、已禁用或调用失败时
     """
-    model_config = get_model_config()
+    with stage("config_lookup"):
+        model_config = get_model_config()
+
+        if not model_name:
+            model_name = model_config.get("default_model", "SFT-Qwen3-8B")
 
-    if not model_name:
-        model_name = model_config.get("default_model", "SFT-Qwen3-8B")
+        if model_name not in model_config["models"]:
+            raise HTTPException(status_code=400, detail=f"模型 '{model_name}' 不存在")
 
-    if model_name not in model_config["models"]:
-        raise HTTPException(status_code=400, detail=f"模型 '{model_name}' 不存在")
+        model_info = model_config["models"][model_name]
 
-    model_info = model_config["models"][model_name]
+        if not model_info.get("enabled", True):
+            raise HTTPException(status_code=400, detail=f"模型 '{model_name}' 已禁用")
 
-    if not model_info.get("enabled", True):
-        raise HTTPException(status_code=400, detail=f"模型 '{model_name}' 已禁用")
+    table_info = _fit_table_info(table_info)
 
     # 读取 prompt 模板
-    try:
-        with open(CHAT_TEMPLATE_FILE, encoding="utf-8") as f:
-            prompt = f.read().format(table_info=table_info, question=question)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"读取 chat 模板失败: {e}")
+    with stage("prompt_build"):
+        try:
+            prompt = load_template(CHAT_TEMPLATE_FILE).format(table_info=table_info, question=question)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"读取 chat 模板失败: {e}")
 
     # 构造请求
     if model_info["type"] == "local":
-        api_url = f"{model_info['url']}/v1/chat/completions"
         headers = {"Content-Type": "application/json"}
         payload = {
             "model": "",
@@ -58,7 +123,6 @@ def call_chat_api(table_info: str, question: str, model_name: Optional[str] = No
             "temperature": TEMPERATURE,
         }
     else:
-        api_url = f"{model_info['url']}/v1/chat/completions"
         headers = {
             "Content-Type": "application/json",
             "Authorization": model_info["api_key"],
@@ -70,13 +134,11 @@ def call_chat_api(table_info: str, question: str, model_name: Optional[str] = No
         }
 
     # 调用模型 API
-    try:
-        start = time.time()
-        resp = requests.post(api_url, json=payload, headers=headers, timeout=REQUEST_TIMEOUT)
-        resp.raise_for_status()
-        data = resp.json()
-        latency = time.time() - start
-        print(f"[INFO] Chat 模型 {model_name} 响应耗时: {latency:.2f}s")
-        return data["choices"][0]["message"]["content"]
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"调用模型 {model_name} 失败: {e}")
+    return chat_completion(model_name, model_info, payload, headers, kind="chat")
+
+
+def chat_key(table_info: str, question: str, model_name: Optional[str] = None) -> str:
+    """Chat 请求的合并键：表信息、问题、模型与模板版本"""
+    model_config = get_model_config() or {}
+    model_name = model_name or model_config.get("default_model", "SFT-Qwen3-8B")
+    return make_key("chat", table_info, question, model_name, template_version(CHAT_TEMPLATE_FILE))
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite 只读连接池
+
+每个线程复用一个只读连接，避免每次查询都重新打开数据库文件，
+并让 sqlite3 的预编译语句缓存（cached_statements）在请求之间生效。
+"""
+import sqlite3
+import threading
+from typing import Dict
+
+from ..config.settings import DB_PATH, SQL_STATEMENT_CACHE_SIZE
+from ..utils.metrics import REGISTRY
+
+_local = threading.local()
+_connections: Dict[int, sqlite3.Connection] = {}
+_lock = threading.Lock()
+_generation = 0  # 调用 reset() 后递增，各线程据此重建连接
+
+
+def get_read_connection() -> sqlite3.Connection:
+    """获取当前线程的只读连接"""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and getattr(_local, "generation", -1) == _generation:
+        return conn
+    if conn is not None:
+        _discard(conn)
+
+    conn = sqlite3.connect(
+        f"file:{DB_PATH}?mode=ro",
+        uri=True,
+        check_same_thread=False,
+        cached_statements=SQL_STATEMENT_CACHE_SIZE,
+    )
+    _local.conn = conn
+    _local.generation = _generation
+    with _lock:
+        _connections[id(conn)] = conn
+    return conn
+
+
+def discard_read_connection():
+    """丢弃当前线程的连接（执行出错后连接状态不确定时调用）"""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        _local.conn = None
+        _discard(conn)
+
+
+def _discard(conn: sqlite3.Connection):
+    with _lock:
+        _connections.pop(id(conn), None)
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+def reset():
+    """使所有线程的连接失效（如数据库文件被替换后），各线程下次使用时重建"""
+    global _generation
+    with _lock:
+        _generation += 1
+
+
+def close_all():
+    """关闭所有连接（应用关闭时调用）"""
+    with _lock:
+        conns = list(_connections.values())
+        _connections.clear()
+    for conn in conns:
+        try:
+            conn.close()
+        except Exception:
+            pass
+    reset()
+
+
+REGISTRY.gauge(
+    "tableqa_sqlite_read_connections",
+    "Open per-thread read-only SQLite connections",
+    callback=lambda: {(): float(len(_connections))},
+)
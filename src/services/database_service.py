@@ -3,7 +3,14 @@
 数据库服务
 """
 from typing import List, Dict, Any, Optional
+
+from fastapi import HTTPException
+
 from ..config import get_db_config
+from ..config.settings import PREVIEW_SAMPLE_ROWS
+from ..utils.metrics import stage
+from ..utils.table_sampler import estimate_row_count, quote_identifier, sample_rows, table_exists
+from .connection_pool import get_read_connection
 
 
 class DatabaseService:
@@ -35,3 +42,32 @@ class DatabaseService:
         if not db_config:
             return False
         return table_name in db_config
+
+    @staticmethod
+    def preview_table(table_name: str, limit: int = PREVIEW_SAMPLE_ROWS, sample: bool = True) -> Dict[str, Any]:
+        """
+        预览表数据 (同步)
+
+        sample=True 时在整张表上均匀随机抽取 limit 行，否则返回前 limit 行；
+        行数为估计值（ANALYZE 统计或 rowid 范围），不执行 COUNT(*)。
+        """
+        conn = get_read_connection()
+        if not table_exists(conn, table_name):
+            raise HTTPException(status_code=404, detail=f"表 '{table_name}' 不存在")
+        with stage("table_sample"):
+            if sample:
+                result = sample_rows(conn, table_name, limit)
+                columns, rows, sampled = result.columns, result.rows, result.sampled
+            else:
+                cur = conn.execute(f"SELECT * FROM {quote_identifier(table_name)} LIMIT ?", (limit,))
+                columns, rows, sampled = [c[0] for c in cur.description], cur.fetchall(), False
+            estimate = estimate_row_count(conn, table_name)
+        data = [dict(zip(columns, row)) for row in rows]
+        return {
+            "data": data,
+            "columns": columns,
+            "total_rows": len(data),
+            "sampled": sampled,
+            "estimated_rows": estimate.rows if estimate else None,
+            "row_count_source": estimate.source if estimate else None,
+        }
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+业务库单写线程
+
+对 DB_PATH 的所有修改（导入 Excel、扫描表结构时的 ANALYZE、删除表、构建汇总表）都以命令的形式
+提交到同一个写线程，按提交顺序在同一个可写连接上执行，不再因多个连接同时写入而报 "database is locked"。
+
+- 写连接把数据库切换为 WAL 模式：查询使用的只读连接读取已提交的快照，长时间的导入不阻塞查询
+- 命令执行结束时提交，抛出异常时回滚；命令声明了修改的表时数据版本号加一，
+  并在命令返回之前通知订阅者（汇总表等依赖表数据的缓存据此重建或失效）
+- 在写线程中提交的命令（如订阅者在通知中重建汇总表）直接在当前线程执行，不会互相等待
+
+多个 worker 进程各有一个写线程，进程之间仍由 SQLite 的文件锁串行化（等待 DB_WRITER_BUSY_TIMEOUT 秒）。
+"""
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException
+
+from ..config.settings import DB_PATH, DB_WRITER_BUSY_TIMEOUT, DB_WRITER_QUEUE_SIZE
+from ..utils.metrics import REGISTRY
+from . import connection_pool
+
+WRITE_COMMANDS = REGISTRY.counter(
+    "tableqa_db_write_commands_total", "Database write commands executed by the writer thread", ("action", "outcome")
+)
+WRITE_DURATION = REGISTRY.histogram(
+    "tableqa_db_write_seconds", "Execution time of database write commands", ("action",)
+)
+WRITE_WAIT = REGISTRY.histogram(
+    "tableqa_db_write_queue_seconds", "Time database write commands wait for the writer thread", ("action",)
+)
+
+
+class DataChange(NamedTuple):
+    """一次提交后的数据变更通知"""
+    version: int
+    tables: Tuple[str, ...]
+    action: str  # import（导入/替换）/ drop（删除）等，由提交方指定
+
+
+class _Command(NamedTuple):
+    label: str
+    fn: Callable[[sqlite3.Connection], Any]
+    tables: Tuple[str, ...]
+    action: str
+    future: Future
+    submitted: float
+
+
+class DatabaseWriter:
+    """串行执行写命令的后台线程"""
+
+    def __init__(self, db_path: str = DB_PATH, queue_size: int = DB_WRITER_QUEUE_SIZE):
+        self.db_path = db_path
+        self._queue: "queue.Queue[Optional[_Command]]" = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._subscribers: List[Callable[[DataChange], None]] = []
+        self._version = 0
+        self.executed = 0
+        self.failed = 0
+
+    @property
+    def version(self) -> int:
+        """数据版本号：本进程内每次修改表数据的提交加一"""
+        return self._version
+
+    def subscribe(self, callback: Callable[[DataChange], None]):
+        """订阅数据变更；回调在写线程中、提交之后执行，异常只记录日志"""
+        with self._lock:
+            self._subscribers.append(callback)
+
+    # ---------- 提交命令 ----------
+    def submit(self, label: str, fn: Callable[[sqlite3.Connection], Any], tables: Iterable[str] = (),
+               action: str = "write") -> Future:
+        """
+        提交写命令
+
+        Args:
+            label: 命令说明（用于日志）
+            fn: 以可写连接为参数执行修改的函数；不要在其中提交其他命令
+            tables: 修改了数据的表，非空时提交后数据版本号加一并通知订阅者
+            action: 变更类型，随通知传给订阅者
+
+        Raises:
+            HTTPException: 写命令队列已满（503）
+        """
+        command = _Command(label, fn, tuple(tables), action, Future(), time.perf_counter())
+        if threading.current_thread() is self._thread:
+            self._execute(command)
+            return command.future
+        self.start()
+        try:
+            self._queue.put_nowait(command)
+        except queue.Full:
+            raise HTTPException(status_code=503, detail="数据库写入排队已满，请稍后重试")
+        return command.future
+
+    def execute(self, label: str, fn: Callable[[sqlite3.Connection], Any], tables: Iterable[str] = (),
+                action: str = "write") -> Any:
+        """提交写命令并等待执行完成，返回 fn 的返回值；fn 抛出的异常原样抛出 (同步)"""
+        return self.submit(label, fn, tables, action).result()
+
+    # ---------- 写线程 ----------
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """执行完已提交的命令后停止写线程并关闭写连接"""
+        with self._lock:
+            thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        self._queue.put(None)
+        thread.join(timeout)
+
+    def _run(self):
+        while True:
+            command = self._queue.get()
+            if command is None:
+                break
+            self._execute(command)
+        self._close()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=DB_WRITER_BUSY_TIMEOUT)
+            previous = conn.execute("PRAGMA journal_mode").fetchone()[0]
+            mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if mode != "wal":
+                print(f"[WARNING] 数据库未能切换为 WAL 模式（当前 {mode}），写入期间查询可能被阻塞")
+            elif previous != "wal":
+                # 切换日志模式之前打开的只读连接重新打开
+                connection_pool.reset()
+                print("[INFO] 数据库已切换为 WAL 模式")
+            self._conn = conn
+        return self._conn
+
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except sqlite3.Error:
+                pass
+            self._conn = None
+
+    def _execute(self, command: _Command):
+        if not command.future.set_running_or_notify_cancel():
+            return
+        start = time.perf_counter()
+        WRITE_WAIT.observe(start - command.submitted, action=command.action)
+        try:
+            conn = self._connection()
+            try:
+                result = command.fn(conn)
+                if conn.in_transaction:
+                    conn.commit()
+            except BaseException:
+                if conn.in_transaction:
+                    conn.rollback()
+                raise
+        except BaseException as e:
+            self.failed += 1
+            WRITE_COMMANDS.inc(action=command.action, outcome="error")
+            if isinstance(e, sqlite3.DatabaseError) and not isinstance(e, sqlite3.OperationalError):
+                self._close()  # 数据库文件损坏或被替换，下次重新打开
+            print(f"[WARNING] 数据库写入失败 {command.label}: {e}")
+            command.future.set_exception(e)
+            return
+
+        self.executed += 1
+        WRITE_COMMANDS.inc(action=command.action, outcome="ok")
+        WRITE_DURATION.observe(time.perf_counter() - start, action=command.action)
+        if command.tables:
+            with self._lock:
+                self._version += 1
+                change = DataChange(self._version, command.tables, command.action)
+                subscribers = list(self._subscribers)
+            for callback in subscribers:
+                try:
+                    callback(change)
+                except Exception as e:
+                    print(f"[WARNING] 数据变更通知处理失败 {command.label}: {e}")
+        command.future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "version": self._version,
+            "queue": self._queue.qsize(),
+            "executed": self.executed,
+            "failed": self.failed,
+            "running": self._thread is not None and self._thread.is_alive(),
+        }
+
+
+_writer = DatabaseWriter()
+
+
+def get_db_writer() -> DatabaseWriter:
+    """获取业务库的全局写线程"""
+    return _writer
+
+
+REGISTRY.gauge(
+    "tableqa_db_writer",
+    "Database writer queue depth, data version and command counters",
+    ("state",),
+    callback=lambda: {(k,): float(v) for k, v in _writer.stats().items()},
+)
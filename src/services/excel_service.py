@@ -1,15 +1,126 @@
 # -*- coding: utf-8 -*-
 """
 Excel 导入服务模块
+
+每次导入在业务库的登记表 __mv_imports 中记录目标表对应的文件内容哈希与 Sheet。同一份文件的同一 Sheet
+再次导入到同一张表（且表仍存在）时不再读取 Excel、不写库，直接返回上次的导入结果（unchanged 为 true）；
+force=True 时强制重新导入。表被删除或由其他方式修改后登记随之删除。
 """
-from typing import Dict, Any, List
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, Any, List, Optional
 from ..utils.excel_importer import (
-    inject_excel_to_db,
+    excel_import_result,
+    read_excel_frame,
     update_db_config,
-    get_excel_sheets
+    get_excel_sheets,
+    write_excel_frame,
 )
-from ..config.settings import DB_PATH, DB_CONFIG_FILE
+from ..config.settings import DB_PATH, DB_CONFIG_FILE, MV_TABLE_PREFIX
 from ..config.config_loader import reload_db_config
+from ..utils.aggregate_rewriter import quote_identifier
+from ..utils.metrics import REGISTRY
+from .connection_pool import get_read_connection
+from .db_writer import DataChange, get_db_writer
+from .upload_store import get_upload_store
+
+IMPORTS_TABLE = f"{MV_TABLE_PREFIX}imports"
+
+_IMPORTS_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {quote_identifier(IMPORTS_TABLE)} (
+    table_name TEXT PRIMARY KEY COLLATE NOCASE,
+    content_hash TEXT NOT NULL,
+    sheet_name TEXT NOT NULL,
+    if_exists TEXT NOT NULL,
+    result TEXT NOT NULL,
+    imported_at REAL NOT NULL
+)
+"""
+
+IMPORTS_UNCHANGED = REGISTRY.counter("tableqa_imports_unchanged_total", "Excel imports skipped because the same file was already imported")
+
+
+def _previous_import(table_name: str, content_hash: str, sheet_name: str) -> Optional[Dict[str, Any]]:
+    """同一文件内容与 Sheet 上次以 replace 方式导入到该表的结果（表已不存在时视为没有）"""
+    try:
+        row = get_read_connection().execute(
+            f"SELECT i.result FROM {quote_identifier(IMPORTS_TABLE)} i "
+            f"JOIN sqlite_master m ON m.type = 'table' AND m.name = i.table_name COLLATE NOCASE "
+            f"WHERE i.table_name = ? AND i.content_hash = ? AND i.sheet_name = ? AND i.if_exists = 'replace'",
+            (table_name, content_hash, sheet_name),
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return None  # 登记表尚未创建
+    return json.loads(row[0]) if row else None
+
+
+def _record_import(conn: sqlite3.Connection, table_name: str, content_hash: str, sheet_name: str, if_exists: str,
+                   result: Dict[str, Any]):
+    conn.execute(_IMPORTS_SCHEMA)
+    conn.execute(
+        f"INSERT OR REPLACE INTO {quote_identifier(IMPORTS_TABLE)} "
+        f"(table_name, content_hash, sheet_name, if_exists, result, imported_at) VALUES (?, ?, ?, ?, ?, ?)",
+        (table_name, content_hash, sheet_name, if_exists, json.dumps(result, ensure_ascii=False), time.time()),
+    )
+
+
+def _forget_imports(change: DataChange):
+    """数据库写线程的变更通知：表被删除或由导入以外的方式修改后，删除其导入登记"""
+    if change.action == "import":
+        return
+    tables = [t for t in change.tables if not t.startswith(MV_TABLE_PREFIX)]
+    if not tables:
+        return
+
+    def apply(conn: sqlite3.Connection):
+        conn.execute(_IMPORTS_SCHEMA)
+        conn.executemany(f"DELETE FROM {quote_identifier(IMPORTS_TABLE)} WHERE table_name = ?", [(t,) for t in tables])
+
+    get_db_writer().execute("删除导入登记", apply)
+
+
+get_db_writer().subscribe(_forget_imports)
+
+
+def _import_sheet(excel_path: str, sheet_name: str, table_name: str, if_exists: str,
+                  force: bool = False) -> Dict[str, Any]:
+    """
+    在请求线程中读取 Excel，只把写入表的部分交给数据库写线程
+
+    以 replace 方式导入、且同一文件内容的同一 Sheet 上次也以 replace 方式导入到该表时直接返回上次的结果
+    （force=True 时重新导入）；append 与 fail 每次都照常执行
+    """
+    # 文件不存在时由 read_excel_frame 抛出 FileNotFoundError
+    store = get_upload_store()
+    content_hash = store.sha256(excel_path) if os.path.exists(excel_path) else None
+    store.touch(excel_path)
+    if content_hash and if_exists == "replace" and not force:
+        previous = _previous_import(table_name, content_hash, sheet_name)
+        if previous is not None:
+            IMPORTS_UNCHANGED.inc()
+            print(f"[INFO] {excel_path} 的 {sheet_name} 已导入到 {table_name} 且内容未变化，跳过导入")
+            return {**previous, "unchanged": True}
+
+    frame = read_excel_frame(excel_path, sheet_name)
+    result = excel_import_result(frame, table_name)
+
+    def write(conn: sqlite3.Connection):
+        write_excel_frame(conn, frame, table_name, if_exists)
+        if content_hash:
+            _record_import(conn, table_name, content_hash, sheet_name, if_exists, result)
+
+    get_db_writer().execute(f"导入 {table_name}", write, tables=(table_name,), action="import")
+    return {**result, "unchanged": False}
+
+
+def _scan_db_config(mode: str) -> Dict[str, Any]:
+    """在数据库写线程中扫描表结构（与导入串行，配置文件反映某一时刻的完整状态）"""
+    return get_db_writer().execute(
+        "更新数据库配置",
+        lambda conn: update_db_config(db_path=DB_PATH, output_path=DB_CONFIG_FILE, mode=mode, conn=conn),
+    )
 
 
 class ExcelImportService:
@@ -20,7 +131,8 @@ class ExcelImportService:
         excel_path: str,
         sheet_name: str,
         table_name: str,
-        if_exists: str = "replace"
+        if_exists: str = "replace",
+        force: bool = False
     ) -> Dict[str, Any]:
         """
         导入 Excel 文件到数据库
@@ -30,17 +142,12 @@ class ExcelImportService:
             sheet_name: Sheet 名称
             table_name: 目标表名
             if_exists: 表存在时的处理方式
+            force: 同一文件已导入到该表时仍重新导入
 
         Returns:
-            导入结果字典
+            导入结果字典（unchanged 为 true 表示内容未变化、未重新导入）
         """
-        return inject_excel_to_db(
-            excel_path=excel_path,
-            sheet_name=sheet_name,
-            table_name=table_name,
-            db_path=DB_PATH,
-            if_exists=if_exists
-        )
+        return _import_sheet(excel_path, sheet_name, table_name, if_exists, force)
 
     @staticmethod
     def get_sheets(excel_path: str) -> List[str]:
@@ -66,11 +173,7 @@ class ExcelImportService:
         Returns:
             更新结果字典
         """
-        result = update_db_config(
-            db_path=DB_PATH,
-            output_path=DB_CONFIG_FILE,
-            mode=mode
-        )
+        result = _scan_db_config(mode)
 
         # 自动重载内存中的配置
         if reload_db_config():
@@ -103,17 +206,12 @@ class ExcelImportService:
 
         for cfg in configs:
             try:
-                result = inject_excel_to_db(
-                    excel_path=cfg["excel_path"],
-                    sheet_name=cfg["sheet_name"],
-                    table_name=cfg["table_name"],
-                    db_path=DB_PATH,
-                    if_exists=if_exists
-                )
+                result = _import_sheet(cfg["excel_path"], cfg["sheet_name"], cfg["table_name"], if_exists)
                 results.append({
                     "table_name": cfg["table_name"],
                     "success": True,
                     "row_count": result["row_count"],
+                    "unchanged": result["unchanged"],
                     "error": None
                 })
                 succeeded += 1
@@ -130,7 +228,7 @@ class ExcelImportService:
         config_updated = False
         if auto_update_config and succeeded > 0:
             try:
-                update_db_config(DB_PATH, DB_CONFIG_FILE, mode="add")
+                _scan_db_config(mode="add")
                 config_updated = True
                 # 自动重载内存中的配置
                 if reload_db_config():
@@ -0,0 +1,506 @@
+# -*- coding: utf-8 -*-
+"""
+内存热表
+
+把业务库中的小表（含索引不超过 HOT_TIER_SMALL_TABLE_BYTES）以及查询日志中请求量最多的表，
+连同索引一起复制到进程内的共享内存 SQLite 库（file:...?mode=memory&cache=shared）。
+路由到 SQLite 的查询如果引用的表都已常驻内存，改由内存库执行：方言与业务库完全相同，
+省去每次查询读取数据库文件页（页缓存未命中、WAL 检查等）的开销。
+
+- 常驻哪些表由容量上限 HOT_TIER_MEMORY_BYTES 决定：候选表按请求量从高到低、其次按大小从小到大依次装入，
+  装不下的跳过；已常驻但不再入选的表被移出
+- 导入或删除表时（数据库写线程的变更通知）该表立即不再路由到内存库，后台线程随即重新加载或移出；
+  另每隔 HOT_TIER_REFRESH_INTERVAL 秒按最新的查询日志重新挑选
+- 其他进程（另一个 worker、命令行导入）的修改没有变更通知：每次路由前检查业务库的 PRAGMA data_version，
+  与上次刷新时不同（业务库被其他连接提交）就停止路由全部常驻表，由后台线程重新加载（常驻表都不大）。
+  刷新时另比较表的签名（建表语句、最大 rowid、估计行数、导入登记），签名变化的表同样重新加载；
+  业务库文件被替换（inode 变化）时重新 ATTACH 并全部重新加载
+- 候选表的大小按估计行数与前 100 行的平均长度估算（含索引），按签名缓存；常驻表使用加载时的实际占用
+- 加载由后台线程在唯一的写连接上完成，加载期间该表不参与路由；查询连接以 query_only 打开
+"""
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from ..config.settings import (
+    DB_PATH,
+    HOT_TIER_ENABLED,
+    HOT_TIER_MAX_ROWS,
+    HOT_TIER_MEMORY_BYTES,
+    HOT_TIER_MINE_DAYS,
+    HOT_TIER_REFRESH_INTERVAL,
+    HOT_TIER_SMALL_TABLE_BYTES,
+    HOT_TIER_TOP_TABLES,
+    SQL_STATEMENT_CACHE_SIZE,
+)
+from ..utils.metrics import REGISTRY
+from ..utils.query_shape import QueryShape
+from ..utils.table_sampler import estimate_row_count, quote_identifier
+from .db_writer import DataChange
+from .excel_service import IMPORTS_TABLE
+from .log_store_service import QueryLogStore, get_query_log_store
+from .materialization_service import is_internal_table
+from .query_engine import SQLiteEngine, get_engine_router
+
+HOT_LOADS = REGISTRY.counter("tableqa_hot_tier_loads_total", "Tables loaded into or evicted from the in-memory tier",
+                             ("outcome",))
+
+_DROP_RETRIES = 20  # 移出表时仍有查询在读取（共享缓存的表锁）的重试次数
+_instance_ids = itertools.count()
+
+
+# (建表语句, 最大 rowid, 估计行数, 导入登记 (content_hash, imported_at))
+Signature = Tuple[Optional[str], Optional[int], Optional[int], Optional[Tuple[str, float]]]
+
+
+class HotCandidate(NamedTuple):
+    table: str
+    bytes: int
+    queries: int
+    signature: Signature
+
+
+class ResidentTable(NamedTuple):
+    table: str
+    bytes: int  # 在内存库中占用的字节数（含索引）
+    rows: int
+    queries: int
+    loaded_at: float
+    signature: Signature  # 加载前业务库中表的签名
+
+
+def table_signature(conn: sqlite3.Connection, table: str) -> Signature:
+    """
+    表的签名：建表语句、最大 rowid、估计行数与导入登记（都只需查找，不扫描表）
+
+    任何 worker 经由应用导入时，导入登记与表数据在同一事务中写入，重新导入行数相同的表也会改变签名
+    """
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    try:
+        max_rowid = conn.execute(f"SELECT MAX(rowid) FROM {quote_identifier(table)}").fetchone()[0]
+    except sqlite3.OperationalError:
+        max_rowid = None  # WITHOUT ROWID 表
+    estimate = estimate_row_count(conn, table)
+    try:
+        imported = conn.execute(
+            f"SELECT content_hash, imported_at FROM {quote_identifier(IMPORTS_TABLE)} WHERE table_name = ?", (table,)
+        ).fetchone()
+    except sqlite3.OperationalError:
+        imported = None  # 登记表尚未创建
+    return (row[0] if row else None, max_rowid, estimate.rows if estimate is not None else None,
+            tuple(imported) if imported else None)
+
+
+def _value_bytes(value: Any) -> int:
+    if value is None:
+        return 1
+    if isinstance(value, (int, float)):
+        return 8
+    if isinstance(value, str):
+        return len(value.encode("utf-8")) + 2
+    return len(value) + 2
+
+
+def table_bytes(conn: sqlite3.Connection, table: str, rows: Optional[int]) -> Optional[int]:
+    """
+    表及其索引占用字节数的估算：估计行数 ×（前 100 行的平均行长 + 各索引列的平均长度）
+
+    没有估计行数（WITHOUT ROWID 且未 ANALYZE 的表）时用 dbstat 统计页大小（需遍历表的全部页），不可用时返回 None
+    """
+    name = quote_identifier(table)
+    if rows is None:
+        try:
+            row = conn.execute(
+                "SELECT SUM(pgsize) FROM dbstat WHERE name IN "
+                "(SELECT name FROM sqlite_master WHERE tbl_name = ? AND type IN ('table', 'index'))",
+                (table,),
+            ).fetchone()
+            return int(row[0]) if row and row[0] is not None else None
+        except sqlite3.OperationalError:
+            return None  # SQLite 编译时未启用 dbstat
+    cur = conn.execute(f"SELECT * FROM {name} LIMIT 100")
+    sample = cur.fetchall()
+    if not sample:
+        return 0
+    columns = [d[0] for d in cur.description]
+    width = {c: sum(_value_bytes(r[i]) for r in sample) / len(sample) for i, c in enumerate(columns)}
+    per_row = sum(width.values()) + 8  # 另加 rowid 与记录头
+    for index in conn.execute(f"PRAGMA index_list({name})").fetchall():
+        indexed = [info[2] for info in conn.execute(f"PRAGMA index_info({quote_identifier(index[1])})")]
+        per_row += sum(width.get(c, 8) for c in indexed) + 8
+    return int(per_row * rows)
+
+
+class HotTierEngine(SQLiteEngine):
+    """共享内存 SQLite 库中的常驻表"""
+    name = "memory"
+
+    def __init__(self, db_path: str = DB_PATH, budget_bytes: int = HOT_TIER_MEMORY_BYTES,
+                 store: Optional[QueryLogStore] = None, refresh_interval: float = HOT_TIER_REFRESH_INTERVAL):
+        self.db_path = db_path
+        self.budget_bytes = budget_bytes
+        self.store = store
+        self.refresh_interval = refresh_interval
+        self.uri = f"file:tableqa_hot_{next(_instance_ids)}?mode=memory&cache=shared"
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None  # 写连接，同时保持内存库存活
+        self._local = threading.local()
+        self._readers: Dict[int, sqlite3.Connection] = {}
+        self._generation = 0  # 关闭后递增，各线程的查询连接据此重建
+        self._resident: Dict[str, ResidentTable] = {}  # 表名（小写）-> 常驻表，可以路由
+        self._changes: Dict[str, int] = {}  # 表名（小写）-> 变更次数，加载期间表被修改时结果作废
+        self._stale = set()  # 数据已变更、等待重新加载的表（小写）
+        self._sizes: Dict[str, Tuple[Signature, int]] = {}  # 表名（小写）-> (签名, 估算字节数)
+        self._source: Optional[Tuple[int, int]] = None  # ATTACH 时业务库文件的 (st_dev, st_ino)
+        self._probe: Optional[sqlite3.Connection] = None  # 读取业务库 data_version 的连接（持续打开）
+        self._probe_lock = threading.Lock()
+        self._version: Optional[int] = None  # 常驻表加载前业务库的 data_version
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.refreshed_at: Optional[float] = None
+
+    # ---------- 查询 ----------
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and getattr(self._local, "generation", -1) == self._generation:
+            return conn
+        conn = sqlite3.connect(self.uri, uri=True, check_same_thread=False, cached_statements=SQL_STATEMENT_CACHE_SIZE)
+        conn.execute("PRAGMA query_only = ON")
+        # 不对读取的表加共享缓存表锁：加载中的表不参与路由，读到的都是已提交的常驻表
+        conn.execute("PRAGMA read_uncommitted = ON")
+        self._local.conn = conn
+        self._local.generation = self._generation
+        with self._lock:
+            self._readers[id(conn)] = conn
+        return conn
+
+    def accepts(self, shape: QueryShape) -> bool:
+        if not shape.tables or shape.foreign_sources:
+            return False
+        with self._lock:
+            if not all(t.lower() in self._resident for t in shape.tables):
+                return False
+        if self._data_version() != self._version:
+            self._invalidate()
+            return False
+        return True
+
+    def resident_tables(self) -> List[str]:
+        with self._lock:
+            return sorted(r.table for r in self._resident.values())
+
+    # ---------- 加载与移出 ----------
+    def _writer(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.uri, uri=True, isolation_level=None, check_same_thread=False)
+            self._attach(conn)
+            self._conn = conn
+        return self._conn
+
+    def _attach(self, conn: sqlite3.Connection):
+        conn.execute("ATTACH DATABASE ? AS src", (f"file:{self.db_path}?mode=ro",))
+        st = os.stat(self.db_path)
+        self._source = (st.st_dev, st.st_ino)
+
+    def _check_source(self) -> bool:
+        """业务库文件被替换（如复制覆盖）时重新 ATTACH，并把全部常驻表标记为待重新加载；返回是否被替换"""
+        if self._conn is None:
+            return False
+        try:
+            st = os.stat(self.db_path)
+        except FileNotFoundError:
+            return False
+        if (st.st_dev, st.st_ino) == self._source:
+            return False
+        self._conn.execute("DETACH DATABASE src")
+        self._attach(self._conn)
+        with self._probe_lock:
+            self._close_probe()
+        with self._lock:
+            self._stale.update(self._resident)
+            self._resident.clear()
+            self._sizes.clear()
+        print(f"[WARNING] 业务库文件已被替换，内存热表将全部重新加载: {self.db_path}")
+        return True
+
+    def _data_version(self) -> Optional[int]:
+        """业务库的 PRAGMA data_version（同一连接上比较；其他连接提交后变化）"""
+        with self._probe_lock:
+            try:
+                if self._probe is None:
+                    self._probe = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+                return self._probe.execute("PRAGMA data_version").fetchone()[0]
+            except sqlite3.Error:
+                self._close_probe()
+                return None
+
+    def _close_probe(self):
+        if self._probe is not None:
+            self._probe.close()
+            self._probe = None
+
+    def _invalidate(self):
+        """业务库被其他连接修改：停止路由全部常驻表，由后台线程重新加载"""
+        with self._lock:
+            for key in self._resident:
+                self._changes[key] = self._changes.get(key, 0) + 1
+            self._stale.update(self._resident)
+            self._resident.clear()
+        self._wake.set()
+
+    def _used_bytes(self, conn: sqlite3.Connection) -> int:
+        page_size = conn.execute("PRAGMA main.page_size").fetchone()[0]
+        pages = conn.execute("PRAGMA main.page_count").fetchone()[0]
+        free = conn.execute("PRAGMA main.freelist_count").fetchone()[0]
+        return (pages - free) * page_size
+
+    def _drop(self, conn: sqlite3.Connection, table: str):
+        """删除内存库中的表（索引随之删除）；仍有查询在读取时稍后重试"""
+        for attempt in range(_DROP_RETRIES):
+            try:
+                conn.execute(f"DROP TABLE IF EXISTS main.{quote_identifier(table)}")
+                return
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) or attempt == _DROP_RETRIES - 1:
+                    raise
+                time.sleep(0.05)
+
+    def _load(self, candidate: HotCandidate) -> Optional[ResidentTable]:
+        """把表连同索引复制到内存库，超出容量上限时放弃；返回常驻表，未能加载时返回 None"""
+        conn = self._writer()
+        table = candidate.table
+        key = table.lower()
+        with self._lock:
+            change = self._changes.get(key, 0)
+        name = quote_identifier(table)
+        create = conn.execute("SELECT sql FROM src.sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+        if create is None or not create[0]:
+            return None
+        indexes = [row[0] for row in conn.execute(
+            "SELECT sql FROM src.sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,)
+        )]
+
+        self._drop(conn, table)
+        before = self._used_bytes(conn)
+        try:
+            conn.execute(create[0])  # 未指定库名的 CREATE 语句建在 main（内存库）中
+            conn.execute("BEGIN")
+            conn.execute(f"INSERT INTO main.{name} SELECT * FROM src.{name}")
+            conn.execute("COMMIT")
+            for sql in indexes:
+                conn.execute(sql)
+            conn.execute(f"ANALYZE main.{name}")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            self._drop(conn, table)
+            raise
+        used = self._used_bytes(conn)
+        size = used - before
+        if used > self.budget_bytes:
+            self._drop(conn, table)
+            HOT_LOADS.inc(outcome="over_budget")
+            print(f"[WARNING] 表 {table} 加载后占用 {size} 字节，超出内存热表容量，已移出")
+            return None
+        rows = conn.execute(f"SELECT COUNT(*) FROM main.{name}").fetchone()[0]
+        resident = ResidentTable(table, size, rows, candidate.queries, time.time(), candidate.signature)
+        with self._lock:
+            if self._changes.get(key, 0) != change:
+                return None  # 加载期间表被修改，等待下一次刷新重新加载
+            self._resident[key] = resident
+            self._stale.discard(key)
+        HOT_LOADS.inc(outcome="loaded")
+        return resident
+
+    def _evict(self, table: str):
+        with self._lock:
+            self._resident.pop(table.lower(), None)
+        if self._conn is not None:
+            self._drop(self._conn, table)
+        HOT_LOADS.inc(outcome="evicted")
+
+    # ---------- 挑选常驻表 ----------
+    def _table_bytes(self, conn: sqlite3.Connection, table: str, signature: Signature) -> Optional[int]:
+        """候选表的大小：常驻且签名未变时用实际占用，其次是按签名缓存的估算值"""
+        key = table.lower()
+        with self._lock:
+            resident = self._resident.get(key)
+            cached = self._sizes.get(key)
+        if resident is not None and resident.signature == signature:
+            return resident.bytes
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        size = table_bytes(conn, table, signature[2])
+        if size is not None:
+            with self._lock:
+                self._sizes[key] = (signature, size)
+        return size
+
+    def candidates(self) -> List[HotCandidate]:
+        """按请求量从高到低、其次按大小从小到大排列的候选表（不考虑容量上限）"""
+        store = self.store or get_query_log_store()
+        try:
+            top = store.top_tables(since=time.time() - HOT_TIER_MINE_DAYS * 86400, limit=HOT_TIER_TOP_TABLES)
+        except sqlite3.Error as e:
+            print(f"[WARNING] 读取查询日志失败，内存热表只按表大小挑选: {e}")
+            top = []
+        queries = {row["table_name"].lower(): row["queries"] for row in top if row["table_name"]}
+
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        try:
+            tables = [row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+            )]
+            result = []
+            for table in tables:
+                if is_internal_table(table):
+                    continue
+                signature = table_signature(conn, table)
+                if signature[2] is not None and signature[2] > HOT_TIER_MAX_ROWS:
+                    continue
+                size = self._table_bytes(conn, table, signature)
+                if size is None or size > self.budget_bytes:
+                    continue
+                count = queries.get(table.lower(), 0)
+                if size <= HOT_TIER_SMALL_TABLE_BYTES or count > 0:
+                    result.append(HotCandidate(table, size, count, signature))
+        finally:
+            conn.close()
+        result.sort(key=lambda c: (-c.queries, c.bytes))
+        return result
+
+    def refresh(self) -> Dict[str, Any]:
+        """重新挑选常驻表：移出不再入选的表，加载新入选、数据已变更与签名变化的表"""
+        with self._refresh_lock:
+            self._check_source()
+            # 先取业务库的版本再复制数据：复制期间的提交使版本与此不同，下一次路由时重新加载
+            version = self._data_version()
+            if version != self._version:
+                self._invalidate()
+            selected, total = [], 0
+            for candidate in self.candidates():
+                if total + candidate.bytes <= self.budget_bytes:
+                    selected.append(candidate)
+                    total += candidate.bytes
+            wanted = {c.table.lower() for c in selected}
+            with self._lock:
+                resident = dict(self._resident)
+                stale = set(self._stale)
+            evicted = [r.table for key, r in resident.items() if key not in wanted]
+            for table in evicted:
+                self._evict(table)
+            # 数据变更后已不在常驻表中、又未入选的表，其旧数据也要删除
+            for key in stale - wanted:
+                with self._lock:
+                    self._stale.discard(key)
+                if self._conn is not None:
+                    self._drop(self._conn, key)
+
+            loaded, failed = [], {}
+            for candidate in selected:
+                key = candidate.table.lower()
+                if key in resident and key not in stale and resident[key].signature == candidate.signature:
+                    continue
+                try:
+                    if self._load(candidate) is not None:
+                        loaded.append(candidate.table)
+                except sqlite3.Error as e:
+                    HOT_LOADS.inc(outcome="failed")
+                    failed[candidate.table] = str(e)
+                    print(f"[WARNING] 加载内存热表 {candidate.table} 失败: {e}")
+            self._version = version
+            self.refreshed_at = time.time()
+        if loaded or evicted or failed:
+            print(f"[INFO] 内存热表已刷新：加载 {loaded}，移出 {evicted}，常驻 {len(self.resident_tables())} 张")
+        return {"loaded": loaded, "evicted": evicted, "failed": failed, "resident": self.resident_tables()}
+
+    def on_data_change(self, change: DataChange):
+        """表被导入或删除：立即停止路由到内存库，由后台线程重新加载或移出"""
+        with self._lock:
+            for table in change.tables:
+                key = table.lower()
+                self._changes[key] = self._changes.get(key, 0) + 1
+                self._sizes.pop(key, None)
+                if self._resident.pop(key, None) is not None:
+                    self._stale.add(key)
+        self._wake.set()
+
+    # ---------- 后台线程 ----------
+    def start(self):
+        """启动后台线程：立即挑选并加载常驻表，之后按间隔或数据变更时刷新"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="hot-tier-refresh", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"[WARNING] 刷新内存热表失败: {e}")
+            self._wake.wait(self.refresh_interval if self.refresh_interval > 0 else None)
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        with self._lock:
+            self._resident.clear()
+            self._stale.clear()
+            self._sizes.clear()
+            readers = list(self._readers.values())
+            self._readers.clear()
+            self._generation += 1
+        for conn in readers:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        with self._probe_lock:
+            self._close_probe()
+        self._version = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            resident = sorted(self._resident.values(), key=lambda r: r.table)
+            stale = len(self._stale)
+        return {
+            "budget_bytes": self.budget_bytes,
+            "used_bytes": sum(r.bytes for r in resident),
+            "tables": {r.table: {"bytes": r.bytes, "rows": r.rows, "queries": r.queries, "loaded_at": r.loaded_at}
+                       for r in resident},
+            "stale": stale,
+            "refreshed_at": self.refreshed_at,
+        }
+
+
+_hot_tier = HotTierEngine()
+if HOT_TIER_ENABLED:
+    get_engine_router().register(_hot_tier, hot=True)
+
+
+def get_hot_tier() -> HotTierEngine:
+    """获取全局内存热表"""
+    return _hot_tier
+
+
+def _gauge() -> Dict[Tuple[str, ...], float]:
+    stats = _hot_tier.stats()
+    return {("tables",): float(len(stats["tables"])), ("used_bytes",): float(stats["used_bytes"]),
+            ("budget_bytes",): float(stats["budget_bytes"])}
+
+
+REGISTRY.gauge("tableqa_hot_tier", "In-memory tier resident tables and bytes", ("state",), callback=_gauge)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+模型调用共享 HTTP 客户端
+
+所有模型请求复用同一个 requests.Session，保持与后端的长连接，
+并提供连接池使用情况用于指标采集。
+"""
+import threading
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ..config.settings import HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE
+from ..utils.metrics import REGISTRY
+
+_session: Optional[requests.Session] = None
+_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """获取共享 Session（懒加载）"""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def pool_stats() -> Dict[str, Dict[str, int]]:
+    """各后端主机连接池的使用情况"""
+    stats: Dict[str, Dict[str, int]] = {}
+    if _session is None:
+        return stats
+    for adapter in set(_session.adapters.values()):
+        manager = getattr(adapter, "poolmanager", None)
+        if manager is None:
+            continue
+        for key in list(manager.pools.keys()):
+            pool = manager.pools.get(key)
+            if pool is None:
+                continue
+            maxsize = pool.pool.maxsize if pool.pool is not None else 0
+            # 队列中的元素（空闲连接或占位 None）即可借出的槽位
+            available = pool.pool.qsize() if pool.pool is not None else 0
+            stats[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                "maxsize": maxsize,
+                "in_use": max(0, maxsize - available),
+                "opened": pool.num_connections,
+                "requests": pool.num_requests,
+            }
+    return stats
+
+
+def _pool_gauge() -> Dict[Tuple[str, ...], float]:
+    values: Dict[Tuple[str, ...], float] = {}
+    for host, s in pool_stats().items():
+        values[(host, "maxsize")] = s["maxsize"]
+        values[(host, "in_use")] = s["in_use"]
+        values[(host, "opened")] = s["opened"]
+    return values
+
+
+REGISTRY.gauge(
+    "tableqa_http_pool_connections", "Model backend HTTP connection pool usage", ("host", "state"), callback=_pool_gauge
+)
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+模型调用客户端
+
+NL2SQL 与 Chat 共用的 OpenAI 兼容 /v1/chat/completions 调用：
+并发准入 -> 选择副本 -> 发送请求 -> 回写副本的耗时与健康状态，
+暂时性错误在截止时间内换副本重试（见 resilience）。
+"""
+import time
+from typing import Any, Dict, List, Optional
+
+import requests
+from fastapi import HTTPException
+
+from ..config.settings import (
+    LLM_COMPLETION_RESERVE,
+    LLM_CONNECT_TIMEOUT,
+    LLM_DEFAULT_CONTEXT_WINDOW,
+    LLM_GENERATION_DEFAULTS,
+    LLM_MAX_RETRIES,
+    LLM_MIN_ATTEMPT_TIMEOUT,
+    LLM_REQUEST_DEADLINE,
+    PROMPT_BUDGET_SAFETY,
+    REQUEST_TIMEOUT,
+)
+from ..utils.metrics import stage, current_timer, REGISTRY, LLM_INFLIGHT, LLM_PROMPT_TOKENS, LLM_REQUESTS, LLM_TOKENS
+from ..utils.tokens import estimate_tokens
+from .admission import AdmissionRejected, admit
+from .http_client import get_http_session
+from .model_router import NoEndpointAvailable, get_model_router
+from .resilience import Deadline, backoff_delay, is_transient
+
+CHAT_COMPLETIONS_PATH = "/v1/chat/completions"
+GENERATION_KEYS = ("max_tokens", "stop", "prefill")
+
+LLM_RETRIES = REGISTRY.counter("tableqa_llm_retries_total", "Model call retries by reason", ("model", "reason"))
+
+
+def generation_options(model_info: Dict[str, Any], kind: Optional[str] = None) -> Dict[str, Any]:
+    """
+    合并生成参数（max_tokens / stop / prefill），后者覆盖前者：
+    内置默认（LLM_GENERATION_DEFAULTS[kind]）< 模型级配置 < 模型 generation.{kind} 配置。
+    配置为空值（如 "stop": []）表示关闭该项。
+    """
+    options = dict(LLM_GENERATION_DEFAULTS.get(kind, {}))
+    options.update({key: model_info[key] for key in GENERATION_KEYS if key in model_info})
+    options.update(((model_info.get("generation") or {}).get(kind)) or {})
+    return {key: value for key, value in options.items() if value not in (None, "", [])}
+
+
+def apply_generation(payload: Dict[str, Any], model_info: Dict[str, Any], options: Dict[str, Any]) -> Dict[str, Any]:
+    """把生成参数加入请求体（不修改传入的 payload）"""
+    payload = dict(payload)
+    if options.get("max_tokens"):
+        payload["max_tokens"] = int(options["max_tokens"])
+    stop = options.get("stop")
+    if stop:
+        payload["stop"] = [stop] if isinstance(stop, str) else list(stop)
+    prefill = options.get("prefill")
+    if prefill:
+        # 以 assistant 消息预填回复开头，模型从预填内容之后继续生成
+        payload["messages"] = list(payload["messages"]) + [{"role": "assistant", "content": prefill}]
+        if model_info.get("type") == "local":
+            # vLLM：续写最后一条消息，而不是另起一条回复
+            payload["continue_final_message"] = True
+            payload["add_generation_prompt"] = False
+    return payload
+
+
+def context_window(model_info: Dict[str, Any]) -> int:
+    """模型的上下文长度（tokens），在 model_config.json 中以 context_window 配置"""
+    return int(model_info.get("context_window") or LLM_DEFAULT_CONTEXT_WINDOW)
+
+
+def prompt_token_budget(model_info: Dict[str, Any], kind: Optional[str] = None) -> int:
+    """prompt 可用的估算 token 数：上下文长度扣除输出预留（max_tokens），再留出估算误差"""
+    reserve = int(generation_options(model_info, kind).get("max_tokens") or LLM_COMPLETION_RESERVE)
+    return int((context_window(model_info) - reserve) * PROMPT_BUDGET_SAFETY)
+
+
+def estimate_prompt_tokens(payload: Dict[str, Any]) -> int:
+    return sum(estimate_tokens(message.get("content") or "") for message in payload.get("messages", []))
+
+
+def _record_usage(model_name: str, data: Dict[str, Any], prompt_estimate: int):
+    """记录模型返回的 usage；后端未返回时以估算值计 prompt tokens"""
+    usage = data.get("usage") or {}
+    prompt_tokens = usage.get("prompt_tokens")
+    completion_tokens = usage.get("completion_tokens")
+    LLM_PROMPT_TOKENS.observe(prompt_tokens if prompt_tokens is not None else prompt_estimate, model=model_name)
+    if prompt_tokens is not None:
+        LLM_TOKENS.inc(prompt_tokens, model=model_name, kind="prompt")
+    if completion_tokens is not None:
+        LLM_TOKENS.inc(completion_tokens, model=model_name, kind="completion")
+    timer = current_timer()
+    if timer is not None:
+        timer.record_usage(
+            prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, prompt_tokens_est=prompt_estimate
+        )
+    return prompt_tokens, completion_tokens
+
+
+def _is_backend_failure(e: Exception) -> bool:
+    """连接失败、超时与 5xx 记为副本故障；4xx 是请求本身的问题，不影响副本健康状态"""
+    if isinstance(e, requests.HTTPError) and e.response is not None:
+        return e.response.status_code >= 500
+    return isinstance(e, requests.RequestException)
+
+
+def _retry_reason(e: Exception) -> str:
+    if isinstance(e, requests.HTTPError) and e.response is not None:
+        return str(e.response.status_code)
+    if isinstance(e, requests.Timeout):
+        return "timeout"
+    return "connection"
+
+
+def chat_completion(model_name: str, model_info: Dict[str, Any], payload: Dict[str, Any],
+                    headers: Dict[str, str], kind: Optional[str] = None) -> str:
+    """
+    在模型的并发名额内调用副本，返回模型回复内容
+
+    kind（nl2sql / chat）决定使用的生成参数（见 generation_options）；配置了预填时，
+    返回的内容包含预填部分。
+
+    Raises:
+        AdmissionRejected: 排队已满/超时（429/503），或所有副本熔断中（503）
+        HTTPException: prompt 超出模型上下文（400）、调用失败（500）或超过截止时间（504）
+    """
+    # 发送前检查 prompt 长度，避免一次必然失败的往返
+    prompt_estimate = estimate_prompt_tokens(payload)
+    budget = prompt_token_budget(model_info, kind)
+    if prompt_estimate > budget:
+        LLM_REQUESTS.inc(model=model_name, outcome="too_long")
+        raise HTTPException(
+            status_code=400,
+            detail=f"prompt 约 {prompt_estimate} tokens，超出模型 {model_name} 的可用长度 {budget} tokens",
+        )
+    options = generation_options(model_info, kind)
+    payload = apply_generation(payload, model_info, options)
+    prefill = options.get("prefill") or ""
+
+    deadline = Deadline(float(model_info.get("deadline") or LLM_REQUEST_DEADLINE))
+    with admit(model_name, model_info, timeout=deadline.remaining()):
+        router = get_model_router(model_name, model_info)
+        tried: List[str] = []
+        last_error: Exception = None
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            remaining = deadline.remaining()
+            if attempt and remaining < LLM_MIN_ATTEMPT_TIMEOUT:
+                break
+            try:
+                endpoint = router.choose(tuple(tried))
+            except NoEndpointAvailable as e:
+                LLM_REQUESTS.inc(model=model_name, outcome="breaker_open")
+                raise AdmissionRejected(
+                    status_code=503,
+                    detail=f"{e}，请稍后重试",
+                    headers={"Retry-After": str(max(1, int(e.retry_after + 0.5)))},
+                )
+            tried.append(endpoint.url)
+
+            latency = None
+            healthy = False
+            LLM_INFLIGHT.inc(model=model_name)
+            try:
+                with stage("llm_call"):
+                    start = time.time()
+                    # 每次尝试的超时不超过请求剩余时间
+                    read_timeout = min(REQUEST_TIMEOUT, remaining)
+                    resp = get_http_session().post(
+                        endpoint.url + CHAT_COMPLETIONS_PATH, json=payload, headers=headers,
+                        timeout=(min(LLM_CONNECT_TIMEOUT, read_timeout), read_timeout),
+                    )
+                    resp.raise_for_status()
+                    data = resp.json()
+                    latency = time.time() - start
+                healthy = True
+                prompt_tokens, completion_tokens = _record_usage(model_name, data, prompt_estimate)
+                print(
+                    f"[INFO] 模型 {model_name} 响应耗时: {latency:.2f}s（{endpoint.url}），"
+                    f"tokens: prompt={prompt_tokens if prompt_tokens is not None else f'~{prompt_estimate}'} "
+                    f"completion={completion_tokens}"
+                )
+                LLM_REQUESTS.inc(model=model_name, outcome="success")
+                content = data["choices"][0]["message"]["content"] or ""
+                # 部分后端会连同预填内容一起返回
+                return content if content.startswith(prefill) else prefill + content
+            except Exception as e:
+                healthy = not _is_backend_failure(e)
+                last_error = e
+                if not is_transient(e):
+                    break
+            finally:
+                LLM_INFLIGHT.dec(model=model_name)
+                router.release(endpoint, latency, healthy)
+
+            if attempt < LLM_MAX_RETRIES:
+                delay = backoff_delay(attempt, deadline.remaining() - LLM_MIN_ATTEMPT_TIMEOUT)
+                LLM_RETRIES.inc(model=model_name, reason=_retry_reason(last_error))
+                print(f"[WARNING] 模型 {model_name} 调用失败（{endpoint.url}）: {last_error}，{delay:.2f}s 后重试")
+                with stage("llm_backoff"):
+                    time.sleep(delay)
+
+    if deadline.expired() or isinstance(last_error, requests.Timeout):
+        LLM_REQUESTS.inc(model=model_name, outcome="timeout")
+        raise HTTPException(status_code=504, detail=f"调用模型 {model_name} 超时: {last_error}")
+    LLM_REQUESTS.inc(model=model_name, outcome="error")
+    raise HTTPException(status_code=500, detail=f"调用模型 {model_name} 失败: {last_error}")
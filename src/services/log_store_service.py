@@ -0,0 +1,511 @@
+# -*- coding: utf-8 -*-
+"""
+查询日志索引库服务
+
+把 query_logs.jsonl 中的查询日志写入本地 SQLite 索引库，按时间、表、模型和
+type 建索引，并在写入时维护按小时/按天的预聚合表，使统计类查询只扫描聚合结果，
+扫描量只与时间范围有关、不随日志条数增长。分类统计按小时粒度，耗时分位数与失败问题按天粒度。
+失败问题按规范化后的问题哈希聚合（忽略大小写、空白与结尾标点），每张表每天只保留次数最多的
+LOG_QUESTIONS_PER_DAY 个问题，被淘汰的长尾问题再次出现时重新计数，因此其计数为近似值。
+
+type 含义：0 未提取到 SQL，1 SQL 执行失败，2 查询结果为空，3 查询有结果
+"""
+import glob
+import gzip
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ..config.settings import LOG_FILE, LOG_QUESTIONS_PER_DAY, LOG_STORE_PATH
+
+LOG_TYPE_LABELS = {0: "no_sql", 1: "sql_error", 2: "empty_result", 3: "success"}
+FAILED_TYPES = (0, 1)
+QUESTION_TYPES = (0, 1, 2)  # 失败问题聚合表只记录未提取到 SQL、执行失败与结果为空的问题
+
+ALL_TABLES = "*"  # 聚合表中代表"全部表"的汇总行
+LATENCY_BUCKET_RATIO = 1.1  # 延迟直方图的对数分桶比例，误差约 ±5%
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS query_logs (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    tables TEXT,
+    model TEXT,
+    type INTEGER,
+    query TEXT,
+    sql TEXT,
+    total_rows INTEGER,
+    total_ms REAL,
+    llm_ms REAL,
+    sql_ms REAL
+);
+CREATE INDEX IF NOT EXISTS idx_query_logs_ts ON query_logs(ts);
+CREATE INDEX IF NOT EXISTS idx_query_logs_type_ts ON query_logs(type, ts);
+CREATE INDEX IF NOT EXISTS idx_query_logs_model_ts ON query_logs(model, ts);
+
+CREATE TABLE IF NOT EXISTS query_log_hourly (
+    hour INTEGER NOT NULL,
+    table_name TEXT NOT NULL,
+    model TEXT NOT NULL,
+    type INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    sum_total_ms REAL NOT NULL,
+    sum_llm_ms REAL NOT NULL,
+    sum_sql_ms REAL NOT NULL,
+    PRIMARY KEY (table_name, hour, model, type)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS query_log_latency (
+    day INTEGER NOT NULL,
+    table_name TEXT NOT NULL,
+    model TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (table_name, day, model, bucket)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS query_log_fingerprints (
+    day INTEGER NOT NULL,
+    table_name TEXT NOT NULL,
+    fingerprint_id TEXT NOT NULL,
+    fingerprint TEXT,
+    sample_sql TEXT,
+    count INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    sum_sql_ms REAL NOT NULL DEFAULT 0,
+    last_ts REAL,
+    PRIMARY KEY (table_name, day, fingerprint_id)
+);
+
+CREATE TABLE IF NOT EXISTS query_log_questions (
+    day INTEGER NOT NULL,
+    table_name TEXT NOT NULL,
+    model TEXT NOT NULL,
+    type INTEGER NOT NULL,
+    question_id TEXT NOT NULL,
+    query TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    last_ts REAL NOT NULL,
+    PRIMARY KEY (table_name, day, type, model, question_id)
+) WITHOUT ROWID;
+"""
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = "?？。.!！~～ "
+
+
+def question_id(query: str) -> str:
+    """问题的聚合键：忽略大小写、多余空白与结尾标点后的哈希"""
+    normalized = _WHITESPACE.sub(" ", query).strip().rstrip(_TRAILING_PUNCTUATION).lower()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+def _latency_bucket(ms: Optional[float]) -> int:
+    """延迟分桶：桶 b 覆盖 (RATIO^(b-1), RATIO^b] 毫秒，缺失延迟记为 -1"""
+    if ms is None:
+        return -1
+    return max(0, math.ceil(math.log(max(float(ms), 1.0)) / math.log(LATENCY_BUCKET_RATIO)))
+
+
+def _as_float(value: Any) -> Optional[float]:
+    try:
+        return None if value is None else float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class QueryLogStore:
+    """查询日志索引库"""
+
+    def __init__(self, db_path: str = LOG_STORE_PATH, log_file: str = LOG_FILE):
+        self.db_path = db_path
+        self.log_file = log_file
+        self._init_lock = threading.Lock()
+        self._write_lock = threading.RLock()  # 写入批次与重建互斥
+        self._initialized = False
+
+    # ---------- 连接与建表 ----------
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+                    conn = sqlite3.connect(self.db_path, timeout=30)
+                    try:
+                        conn.execute("PRAGMA journal_mode=WAL")
+                        columns = [r[1] for r in conn.execute("PRAGMA table_info(query_log_questions)")]
+                        if columns and "question_id" not in columns:
+                            # 旧版本按问题原文聚合，结构不兼容，删除后由后续写入或 /logs/rebuild 重新生成
+                            conn.execute("DROP TABLE query_log_questions")
+                            print("[WARNING] 失败问题聚合表结构已更新，历史数据需调用 /logs/rebuild 重新导入")
+                        conn.executescript(_SCHEMA)
+                        conn.commit()
+                    finally:
+                        conn.close()
+                    self._initialized = True
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # ---------- 写入 ----------
+    def ingest(self, records: Iterable[Dict[str, Any]], default_ts: Optional[float] = None) -> int:
+        """写入一批日志记录，同时更新聚合表，返回写入条数"""
+        rows = []
+        hourly: Dict[Tuple, List[float]] = {}
+        latency: Dict[Tuple, int] = {}
+        questions: Dict[Tuple, List[float]] = {}
+        fingerprints: Dict[Tuple, List[Any]] = {}
+
+        for record in records:
+            ts = _as_float(record.get("timestamp")) or default_ts or time.time()
+            tables = record.get("tables") or []
+            if isinstance(tables, str):
+                tables = [tables]
+            model = record.get("model") or ""
+            log_type = int(record.get("type", 0) or 0)
+            query = record.get("query") or ""
+            total_ms = _as_float(record.get("total_ms"))
+            llm_ms = _as_float(record.get("llm_ms"))
+            sql_ms = _as_float(record.get("sql_ms"))
+            sql = record.get("sql") or ""
+            fingerprint_id = record.get("fingerprint_id") or ""
+            rows.append((
+                ts, json.dumps(tables, ensure_ascii=False), model, log_type, query,
+                sql, record.get("total_rows"), total_ms, llm_ms, sql_ms,
+            ))
+
+            hour = int(ts // 3600)
+            day = int(ts // 86400)
+            bucket = _latency_bucket(total_ms)
+            for table_name in list(dict.fromkeys(tables)) + [ALL_TABLES]:
+                agg = hourly.setdefault((hour, table_name, model, log_type), [0, 0.0, 0.0, 0.0])
+                agg[0] += 1
+                agg[1] += total_ms or 0.0
+                agg[2] += llm_ms or 0.0
+                agg[3] += sql_ms or 0.0
+                if bucket >= 0:
+                    key = (day, table_name, model, bucket)
+                    latency[key] = latency.get(key, 0) + 1
+                if log_type in QUESTION_TYPES:
+                    q = questions.setdefault((day, table_name, model, log_type, question_id(query)), [query, 0, 0.0])
+                    q[0] = query
+                    q[1] += 1
+                    q[2] = max(q[2], ts)
+                if fingerprint_id:
+                    f = fingerprints.setdefault(
+                        (day, table_name, fingerprint_id), [record.get("fingerprint") or "", sql, 0, 0, 0.0, 0.0]
+                    )
+                    f[2] += 1
+                    f[3] += 1 if log_type == 1 else 0
+                    f[4] += sql_ms or 0.0
+                    f[5] = max(f[5], ts)
+
+        if not rows:
+            return 0
+
+        with self._write_lock:
+            self._write(rows, hourly, latency, questions, fingerprints)
+        return len(rows)
+
+    def _write(self, rows: List[Tuple], hourly: Dict[Tuple, List[float]], latency: Dict[Tuple, int],
+               questions: Dict[Tuple, List[Any]], fingerprints: Dict[Tuple, List[Any]]):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO query_logs (ts, tables, model, type, query, sql, total_rows, total_ms, llm_ms, sql_ms) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                conn.executemany(
+                    "INSERT INTO query_log_hourly "
+                    "(hour, table_name, model, type, count, sum_total_ms, sum_llm_ms, sum_sql_ms) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(table_name, hour, model, type) DO UPDATE SET "
+                    "count = count + excluded.count, "
+                    "sum_total_ms = sum_total_ms + excluded.sum_total_ms, "
+                    "sum_llm_ms = sum_llm_ms + excluded.sum_llm_ms, "
+                    "sum_sql_ms = sum_sql_ms + excluded.sum_sql_ms",
+                    [key + tuple(agg) for key, agg in hourly.items()],
+                )
+                conn.executemany(
+                    "INSERT INTO query_log_latency (day, table_name, model, bucket, count) "
+                    "VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(table_name, day, model, bucket) DO UPDATE SET count = count + excluded.count",
+                    [key + (count,) for key, count in latency.items()],
+                )
+                conn.executemany(
+                    "INSERT INTO query_log_questions (day, table_name, model, type, question_id, query, count, last_ts) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(table_name, day, type, model, question_id) DO UPDATE SET "
+                    "query = excluded.query, count = count + excluded.count, last_ts = MAX(last_ts, excluded.last_ts)",
+                    [key + tuple(agg) for key, agg in questions.items()],
+                )
+                self._trim_questions(conn, {(table_name, day) for day, table_name, *_ in questions})
+                conn.executemany(
+                    "INSERT INTO query_log_fingerprints "
+                    "(day, table_name, fingerprint_id, fingerprint, sample_sql, count, failures, sum_sql_ms, last_ts) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(table_name, day, fingerprint_id) DO UPDATE SET "
+                    "count = count + excluded.count, failures = failures + excluded.failures, "
+                    "sum_sql_ms = sum_sql_ms + excluded.sum_sql_ms, "
+                    "sample_sql = excluded.sample_sql, last_ts = MAX(last_ts, excluded.last_ts)",
+                    [key + tuple(agg) for key, agg in fingerprints.items()],
+                )
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _trim_questions(conn: sqlite3.Connection, keys: Iterable[Tuple[str, int]]):
+        """每张表每天只保留次数最多的 LOG_QUESTIONS_PER_DAY 个问题"""
+        for table_name, day in keys:
+            count = conn.execute(
+                "SELECT COUNT(*) FROM query_log_questions WHERE table_name = ? AND day = ?", (table_name, day)
+            ).fetchone()[0]
+            if count <= LOG_QUESTIONS_PER_DAY:
+                continue
+            conn.execute(
+                "DELETE FROM query_log_questions WHERE table_name = ? AND day = ? AND (type, model, question_id) IN ("
+                "SELECT type, model, question_id FROM query_log_questions WHERE table_name = ? AND day = ? "
+                "ORDER BY count ASC, last_ts ASC LIMIT ?)",
+                (table_name, day, table_name, day, count - LOG_QUESTIONS_PER_DAY),
+            )
+
+    def rebuild(self) -> Dict[str, Any]:
+        """
+        清空索引库，并从当前及已轮转的 JSONL 日志文件重新导入
+
+        清空与重新导入期间持有写锁，其他写入批次等待重建完成。调用方应先暂停查询日志写入器
+        （见 QueryLogWriter.paused），否则重建期间写入日志文件、随后又交给 sink 的批次会被重复计入
+        """
+        with self._write_lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    for table in ("query_logs", "query_log_hourly", "query_log_latency", "query_log_questions",
+                                  "query_log_fingerprints"):
+                        conn.execute(f"DELETE FROM {table}")
+            finally:
+                conn.close()
+
+            files = self._log_files()
+            total = 0
+            for path in files:
+                batch: List[Dict[str, Any]] = []
+                mtime = os.path.getmtime(path)
+                opener = gzip.open if path.endswith(".gz") else open
+                with opener(path, "rt", encoding="utf-8") as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            batch.append(json.loads(line))
+                        except json.JSONDecodeError:
+                            continue
+                        if len(batch) >= 5000:
+                            total += self.ingest(batch, default_ts=mtime)
+                            batch = []
+                total += self.ingest(batch, default_ts=mtime)
+        return {"files": files, "ingested": total}
+
+    def _log_files(self) -> List[str]:
+        """已轮转的日志（按时间先后）加当前日志文件"""
+        base, ext = os.path.splitext(self.log_file)
+        rotated = glob.glob(f"{base}.*{ext}") + glob.glob(f"{base}.*{ext}.gz")
+        rotated = sorted(p for p in rotated if not p.endswith(".lock"))
+        if os.path.exists(self.log_file):
+            rotated.append(self.log_file)
+        return rotated
+
+    # ---------- 统计查询 ----------
+    @staticmethod
+    def _filters(
+        table: Optional[str],
+        model: Optional[str],
+        since: Optional[float],
+        until: Optional[float],
+        time_col: str,
+        unit: int,
+    ) -> Tuple[str, List[Any]]:
+        clauses = ["table_name = ?"]
+        params: List[Any] = [table or ALL_TABLES]
+        if model is not None:
+            clauses.append("model = ?")
+            params.append(model)
+        if since is not None:
+            clauses.append(f"{time_col} >= ?")
+            params.append(int(since // unit))
+        if until is not None:
+            clauses.append(f"{time_col} <= ?")
+            params.append(int(until // unit))
+        return " AND ".join(clauses), params
+
+    def type_breakdown(
+        self,
+        table: Optional[str] = None,
+        model: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """按 type 统计请求数及占比"""
+        where, params = self._filters(table, model, since, until, "hour", 3600)
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT type, SUM(count) FROM query_log_hourly WHERE {where} GROUP BY type",
+                params,
+            ).fetchall()
+        finally:
+            conn.close()
+
+        total = sum(c for _, c in rows)
+        types = {
+            LOG_TYPE_LABELS.get(t, str(t)): {
+                "type": t,
+                "count": c,
+                "ratio": round(c / total, 4) if total else 0.0,
+            }
+            for t, c in sorted(rows)
+        }
+        return {"total": total, "types": types}
+
+    def latency_percentiles(
+        self,
+        table: Optional[str] = None,
+        model: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        percentiles: Iterable[float] = (50, 90, 95, 99),
+    ) -> Dict[str, Any]:
+        """基于对数直方图估算总耗时分位数（毫秒），并给出各阶段平均耗时"""
+        where, params = self._filters(table, model, since, until, "day", 86400)
+        hour_where, hour_params = self._filters(table, model, since, until, "hour", 3600)
+        conn = self._connect()
+        try:
+            buckets = conn.execute(
+                f"SELECT bucket, SUM(count) FROM query_log_latency WHERE {where} "
+                f"GROUP BY bucket ORDER BY bucket",
+                params,
+            ).fetchall()
+            sums = conn.execute(
+                f"SELECT SUM(sum_total_ms), SUM(sum_llm_ms), SUM(sum_sql_ms) "
+                f"FROM query_log_hourly WHERE {hour_where}",
+                hour_params,
+            ).fetchone()
+        finally:
+            conn.close()
+
+        count = sum(c for _, c in buckets)
+        result: Dict[str, Any] = {"count": count, "percentiles_ms": {}}
+        if not count:
+            return result
+
+        for p in sorted(percentiles):
+            target = count * p / 100.0
+            seen = 0
+            for bucket, c in buckets:
+                seen += c
+                if seen >= target:
+                    result["percentiles_ms"][f"p{p:g}"] = round(LATENCY_BUCKET_RATIO ** bucket, 1)
+                    break
+        result["avg_total_ms"] = round((sums[0] or 0) / count, 1)
+        result["avg_llm_ms"] = round((sums[1] or 0) / count, 1)
+        result["avg_sql_ms"] = round((sums[2] or 0) / count, 1)
+        return result
+
+    def top_failing_questions(
+        self,
+        table: Optional[str] = None,
+        model: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: int = 20,
+        types: Iterable[int] = FAILED_TYPES,
+    ) -> List[Dict[str, Any]]:
+        """失败次数最多的问题（规范化后相同的问题合并计数，query 为其中一种写法）"""
+        types = list(types)
+        where, params = self._filters(table, model, since, until, "day", 86400)
+        where += f" AND type IN ({', '.join('?' for _ in types)})"
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT MAX(query), SUM(count) AS n, MAX(last_ts) FROM query_log_questions "
+                f"WHERE {where} GROUP BY question_id ORDER BY n DESC LIMIT ?",
+                params + types + [limit],
+            ).fetchall()
+        finally:
+            conn.close()
+        return [{"query": q, "failures": n, "last_seen": ts} for q, n, ts in rows]
+
+    def top_fingerprints(
+        self,
+        table: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: int = 20,
+    ) -> List[Dict[str, Any]]:
+        """执行次数最多的 SQL 形态（按指纹分组，字面量不同的 SQL 归为一类）"""
+        where, params = self._filters(table, None, since, until, "day", 86400)
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT fingerprint_id, MAX(fingerprint), MAX(sample_sql), SUM(count) AS n, SUM(failures), "
+                f"SUM(sum_sql_ms), MAX(last_ts) FROM query_log_fingerprints "
+                f"WHERE {where} GROUP BY fingerprint_id ORDER BY n DESC LIMIT ?",
+                params + [limit],
+            ).fetchall()
+        finally:
+            conn.close()
+        return [
+            {
+                "fingerprint_id": fid,
+                "fingerprint": fp,
+                "sample_sql": sample,
+                "count": n,
+                "failures": failures,
+                "avg_sql_ms": round((sql_ms or 0) / n, 2) if n else 0.0,
+                "last_seen": ts,
+            }
+            for fid, fp, sample, n, failures, sql_ms, ts in rows
+        ]
+
+    def top_tables(
+        self,
+        model: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: int = 20,
+    ) -> List[Dict[str, Any]]:
+        """请求量最多的表，附带各 type 的计数"""
+        where, params = self._filters(None, model, since, until, "hour", 3600)
+        where = where.replace("table_name = ?", "table_name != ?", 1)
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT table_name, SUM(count) AS n, "
+                f"SUM(CASE WHEN type IN (0, 1) THEN count ELSE 0 END), "
+                f"SUM(CASE WHEN type = 2 THEN count ELSE 0 END) "
+                f"FROM query_log_hourly WHERE {where} GROUP BY table_name ORDER BY n DESC LIMIT ?",
+                params + [limit],
+            ).fetchall()
+        finally:
+            conn.close()
+        return [
+            {"table_name": t, "queries": n, "failed": failed, "empty_result": empty}
+            for t, n, failed, empty in rows
+        ]
+
+
+_store = QueryLogStore()
+
+
+def get_query_log_store() -> QueryLogStore:
+    """获取全局查询日志索引库"""
+    return _store
@@ -0,0 +1,390 @@
+# -*- coding: utf-8 -*-
+"""
+物化汇总表服务
+
+从查询日志索引库中挖掘高频的单表 GROUP BY 查询形态（按 SQL 指纹），为每种
+（基础表，维度）组合建立汇总表 __mv_*：按维度分组，保存行数与度量列的 SUM / COUNT / MIN / MAX。
+执行 SQL 时，汇总表能还原结果的聚合查询被改写为读取汇总表（见 utils.aggregate_rewriter），
+不再扫描整张基础表；改写后的查询执行失败时退回原 SQL。
+
+汇总表与登记表保存在业务库中，重启后仍然有效。构建与删除都在数据库写线程中执行；
+管理器订阅写线程的数据变更通知，基础表重新导入后按原定义重建，删除后一并删除。
+节省的耗时按 "建表时扫描基础表的耗时 - 改写后查询的耗时" 估算。
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from ..config.settings import (
+    DB_PATH,
+    MATERIALIZE_ENABLED,
+    MV_MAX_PER_TABLE,
+    MV_MAX_ROW_RATIO,
+    MV_MIN_QUERIES,
+    MV_MINE_DAYS,
+    MV_MINE_FINGERPRINTS,
+    MV_TABLE_PREFIX,
+)
+from ..utils.aggregate_rewriter import build_view_sql, covers, parse_aggregate, quote_identifier, rewrite_aggregate
+from ..utils.metrics import REGISTRY
+from ..utils.table_sampler import estimate_row_count
+from .db_writer import DatabaseWriter, DataChange, get_db_writer
+from .log_store_service import QueryLogStore, get_query_log_store
+
+REGISTRY_TABLE = f"{MV_TABLE_PREFIX}registry"
+
+_REGISTRY_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {quote_identifier(REGISTRY_TABLE)} (
+    name TEXT PRIMARY KEY,
+    base_table TEXT NOT NULL,
+    dimensions TEXT NOT NULL,
+    measures TEXT NOT NULL,
+    base_columns TEXT NOT NULL,
+    row_count INTEGER NOT NULL,
+    base_rows INTEGER,
+    base_ms REAL NOT NULL,
+    queries INTEGER NOT NULL DEFAULT 0,
+    fingerprints TEXT NOT NULL DEFAULT '[]',
+    built_at REAL NOT NULL
+)
+"""
+
+MV_QUERIES = REGISTRY.counter(
+    "tableqa_materialized_queries_total", "Aggregate queries served from materialized summary tables", ("view",)
+)
+MV_SAVED = REGISTRY.counter(
+    "tableqa_materialized_saved_seconds_total", "Estimated SQL time saved by materialized summary tables", ("view",)
+)
+
+
+class ViewDefinition(NamedTuple):
+    base_table: str
+    dimensions: Tuple[str, ...]
+    measures: Tuple[str, ...]
+    queries: int = 0
+    fingerprints: Tuple[str, ...] = ()
+
+
+class MaterializedView(NamedTuple):
+    name: str
+    base_table: str
+    dimensions: Tuple[str, ...]
+    measures: Tuple[str, ...]
+    base_columns: Tuple[str, ...]
+    rows: int
+    base_rows: Optional[int]
+    base_ms: float
+    queries: int
+    fingerprints: Tuple[str, ...]
+    built_at: float
+
+    @property
+    def definition(self) -> ViewDefinition:
+        return ViewDefinition(self.base_table, self.dimensions, self.measures, self.queries, self.fingerprints)
+
+
+def view_name(base_table: str, dimensions: Tuple[str, ...]) -> str:
+    key = json.dumps([base_table.lower(), sorted(d.lower() for d in dimensions)], ensure_ascii=False)
+    return MV_TABLE_PREFIX + hashlib.sha1(key.encode("utf-8")).hexdigest()[:10]
+
+
+def is_internal_table(name: str) -> bool:
+    """汇总表与登记表（不对外展示、不生成建表语句）"""
+    return name.startswith(MV_TABLE_PREFIX)
+
+
+class MaterializationManager:
+    """汇总表的挖掘、构建与查询改写"""
+
+    def __init__(self, db_path: str = DB_PATH, writer: Optional[DatabaseWriter] = None):
+        self.db_path = db_path
+        # 业务库使用全局写线程；其他数据库（如基准测试）使用自己的写线程
+        self.writer = writer or (get_db_writer() if db_path == DB_PATH else DatabaseWriter(db_path))
+        self._lock = threading.Lock()
+        self._views: Optional[Dict[str, List[MaterializedView]]] = None  # 基础表名（小写）-> 汇总表
+        self._served: Dict[str, int] = {}
+        self._saved_ms: Dict[str, float] = {}
+
+    # ---------- 登记表 ----------
+    def _write(self, label: str, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """在数据库写线程中执行构建或删除（与导入等其他写入串行）"""
+        def run(conn: sqlite3.Connection):
+            conn.execute(_REGISTRY_SCHEMA)
+            return fn(conn)
+        return self.writer.execute(label, run, action="materialize")
+
+    def _read_registry(self, conn: sqlite3.Connection) -> List[MaterializedView]:
+        rows = conn.execute(
+            f"SELECT name, base_table, dimensions, measures, base_columns, row_count, base_rows, base_ms, queries, "
+            f"fingerprints, built_at FROM {quote_identifier(REGISTRY_TABLE)}"
+        ).fetchall()
+        views = []
+        for name, base, dims, measures, columns, count, base_rows, base_ms, queries, fps, built_at in rows:
+            views.append(MaterializedView(
+                name, base, tuple(json.loads(dims)), tuple(json.loads(measures)), tuple(json.loads(columns)),
+                count, base_rows, base_ms, queries, tuple(json.loads(fps)), built_at,
+            ))
+        return views
+
+    def _set_views(self, views: List[MaterializedView]):
+        grouped: Dict[str, List[MaterializedView]] = {}
+        for view in views:
+            grouped.setdefault(view.base_table.lower(), []).append(view)
+        with self._lock:
+            self._views = grouped
+
+    def _loaded_views(self) -> Dict[str, List[MaterializedView]]:
+        views = self._views
+        if views is not None:
+            return views
+        try:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+            try:
+                loaded = self._read_registry(conn)
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            loaded = []  # 业务库不存在或从未建立汇总表
+        self._set_views(loaded)
+        return self._views
+
+    def views(self) -> List[MaterializedView]:
+        return [v for views in self._loaded_views().values() for v in views]
+
+    # ---------- 查询改写 ----------
+    def rewrite(self, sql: str) -> Optional[Tuple[str, MaterializedView]]:
+        """返回改写为读取汇总表的 SQL 与所用汇总表；没有可用的汇总表时返回 None"""
+        if not MATERIALIZE_ENABLED:
+            return None
+        views = self._loaded_views()
+        if not views:
+            return None
+        query = parse_aggregate(sql)
+        if query is None:
+            return None
+        candidates = [
+            v for v in views.get(query.table.lower(), [])
+            if covers(query, v.dimensions, v.measures, v.base_columns)
+        ]
+        if not candidates:
+            return None
+        view = min(candidates, key=lambda v: v.rows)
+        return rewrite_aggregate(query, view.name, view.measures), view
+
+    def record_hit(self, view: MaterializedView, elapsed: float):
+        saved_ms = max(0.0, view.base_ms - elapsed * 1000)
+        with self._lock:
+            self._served[view.name] = self._served.get(view.name, 0) + 1
+            self._saved_ms[view.name] = self._saved_ms.get(view.name, 0.0) + saved_ms
+        MV_QUERIES.inc(view=view.name)
+        MV_SAVED.inc(saved_ms / 1000, view=view.name)
+
+    # ---------- 挖掘 ----------
+    def mine(self, days: float = MV_MINE_DAYS, store: Optional[QueryLogStore] = None) -> List[ViewDefinition]:
+        """从最近 days 天的查询日志中挖掘汇总表定义（每张基础表按查询次数取前 MV_MAX_PER_TABLE 个）"""
+        fingerprints = (store or get_query_log_store()).top_fingerprints(
+            since=time.time() - days * 86400, limit=MV_MINE_FINGERPRINTS
+        )
+        merged: Dict[Tuple[str, frozenset], Dict[str, Any]] = {}
+        for fp in fingerprints:
+            if fp["count"] < MV_MIN_QUERIES:
+                continue
+            query = parse_aggregate(fp["sample_sql"] or "")
+            if query is None or not query.group_by:
+                continue
+            key = (query.table.lower(), frozenset(d.lower() for d in query.dimensions))
+            entry = merged.setdefault(key, {
+                "base_table": query.table, "dimensions": query.dimensions,
+                "measures": {}, "queries": 0, "fingerprints": [],
+            })
+            for measure in query.measures:
+                entry["measures"].setdefault(measure.lower(), measure)
+            entry["queries"] += fp["count"]
+            entry["fingerprints"].append(fp["fingerprint_id"])
+
+        per_table: Dict[str, List[ViewDefinition]] = {}
+        for (table_key, _), entry in sorted(merged.items(), key=lambda item: -item[1]["queries"]):
+            defs = per_table.setdefault(table_key, [])
+            if len(defs) < MV_MAX_PER_TABLE:
+                defs.append(ViewDefinition(
+                    entry["base_table"], tuple(entry["dimensions"]), tuple(entry["measures"].values()),
+                    entry["queries"], tuple(entry["fingerprints"]),
+                ))
+        return [d for defs in per_table.values() for d in defs]
+
+    # ---------- 构建 ----------
+    def _build(self, conn: sqlite3.Connection, definition: ViewDefinition) -> Optional[MaterializedView]:
+        table = definition.base_table
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({quote_identifier(table)})")]
+        canonical = {c.lower(): c for c in columns}
+        try:
+            dimensions = tuple(canonical[d.lower()] for d in definition.dimensions)
+            measures = tuple(canonical[m.lower()] for m in definition.measures)
+        except KeyError:
+            print(f"[INFO] 表 {table} 的结构已变化，不再维护汇总表 {definition.dimensions}")
+            return None
+
+        name = view_name(table, dimensions)
+        staging = name + "__new"
+        conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(staging)}")
+        start = time.perf_counter()
+        conn.execute(build_view_sql(table, staging, dimensions, measures))
+        base_ms = (time.perf_counter() - start) * 1000
+        rows = conn.execute(f"SELECT COUNT(*) FROM {quote_identifier(staging)}").fetchone()[0]
+        estimate = estimate_row_count(conn, table)
+        base_rows = estimate.rows if estimate else None
+        if base_rows and rows > base_rows * MV_MAX_ROW_RATIO:
+            conn.execute(f"DROP TABLE {quote_identifier(staging)}")
+            print(f"[INFO] 汇总表 {table}{list(dimensions)} 有 {rows} 行（基础表约 {base_rows} 行），收益不足，跳过")
+            return None
+
+        view = MaterializedView(
+            name, table, dimensions, measures, tuple(columns), rows, base_rows, round(base_ms, 3),
+            definition.queries, definition.fingerprints, time.time(),
+        )
+        # 替换与登记在同一事务中完成，读取方不会看到缺失的汇总表
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(name)}")
+            conn.execute(f"ALTER TABLE {quote_identifier(staging)} RENAME TO {quote_identifier(name)}")
+            conn.execute(
+                f"INSERT OR REPLACE INTO {quote_identifier(REGISTRY_TABLE)} (name, base_table, dimensions, measures, "
+                f"base_columns, row_count, base_rows, base_ms, queries, fingerprints, built_at) "
+                f"VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (view.name, view.base_table, json.dumps(view.dimensions, ensure_ascii=False),
+                 json.dumps(view.measures, ensure_ascii=False), json.dumps(view.base_columns, ensure_ascii=False),
+                 view.rows, view.base_rows, view.base_ms, view.queries, json.dumps(view.fingerprints),
+                 view.built_at),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return view
+
+    def _drop(self, conn: sqlite3.Connection, names: List[str]):
+        if not names:
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for name in names:
+                conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(name)}")
+                conn.execute(f"DELETE FROM {quote_identifier(REGISTRY_TABLE)} WHERE name = ?", (name,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def refresh(self, store: Optional[QueryLogStore] = None) -> Dict[str, Any]:
+        """重新挖掘查询日志并重建全部汇总表，删除不再高频的汇总表"""
+        definitions = self.mine(store=store)
+
+        def apply(conn: sqlite3.Connection):
+            existing = {v.name for v in self._read_registry(conn)}
+            built, skipped = [], []
+            for definition in definitions:
+                try:
+                    view = self._build(conn, definition)
+                except sqlite3.Error as e:
+                    print(f"[WARNING] 构建汇总表失败 {definition.base_table}{list(definition.dimensions)}: {e}")
+                    view = None
+                if view is None:
+                    skipped.append({"base_table": definition.base_table, "dimensions": list(definition.dimensions)})
+                else:
+                    built.append(view)
+            dropped = sorted(existing - {v.name for v in built})
+            self._drop(conn, dropped)
+            self._set_views(self._read_registry(conn))
+            return built, skipped, dropped
+
+        built, skipped, dropped = self._write("刷新汇总表", apply)
+        print(f"[INFO] 汇总表已刷新：构建 {len(built)} 个，跳过 {len(skipped)} 个，删除 {len(dropped)} 个")
+        return {"built": [v.name for v in built], "skipped": skipped, "dropped": dropped}
+
+    def rebuild_table(self, table: str) -> List[str]:
+        """基础表重新导入后，按原定义重建其汇总表，返回重建成功的汇总表"""
+        views = [v for v in self.views() if v.base_table.lower() == table.lower()]
+        if not views:
+            return []
+
+        def apply(conn: sqlite3.Connection):
+            rebuilt = []
+            for old in views:
+                try:
+                    view = self._build(conn, old.definition)
+                except sqlite3.Error as e:
+                    print(f"[WARNING] 重建汇总表 {old.name} 失败: {e}")
+                    view = None
+                if view is None:
+                    self._drop(conn, [old.name])
+                else:
+                    rebuilt.append(view.name)
+            self._set_views(self._read_registry(conn))
+            return rebuilt
+
+        rebuilt = self._write(f"重建 {table} 的汇总表", apply)
+        print(f"[INFO] 表 {table} 的汇总表已重建: {rebuilt}")
+        return rebuilt
+
+    def drop_table(self, table: str) -> List[str]:
+        """基础表删除后删除其汇总表"""
+        names = [v.name for v in self.views() if v.base_table.lower() == table.lower()]
+        if not names:
+            return []
+
+        def apply(conn: sqlite3.Connection):
+            self._drop(conn, names)
+            self._set_views(self._read_registry(conn))
+
+        self._write(f"删除 {table} 的汇总表", apply)
+        return names
+
+    def on_data_change(self, change: DataChange):
+        """数据库写线程的变更通知：基础表重新导入时重建汇总表，删除时一并删除"""
+        for table in change.tables:
+            if is_internal_table(table):
+                continue
+            if change.action == "import":
+                self.rebuild_table(table)
+            elif change.action == "drop":
+                self.drop_table(table)
+
+    # ---------- 报告 ----------
+    def report(self) -> Dict[str, Any]:
+        """各汇总表的定义与命中情况（命中次数与节省耗时自进程启动起累计）"""
+        with self._lock:
+            served = dict(self._served)
+            saved = dict(self._saved_ms)
+        views = []
+        for v in sorted(self.views(), key=lambda v: (v.base_table, v.name)):
+            views.append({
+                "name": v.name,
+                "base_table": v.base_table,
+                "dimensions": list(v.dimensions),
+                "measures": list(v.measures),
+                "rows": v.rows,
+                "base_rows": v.base_rows,
+                "base_scan_ms": v.base_ms,
+                "mined_queries": v.queries,
+                "built_at": v.built_at,
+                "served": served.get(v.name, 0),
+                "saved_ms": round(saved.get(v.name, 0.0), 2),
+            })
+        return {
+            "enabled": MATERIALIZE_ENABLED,
+            "views": views,
+            "served_total": sum(served.values()),
+            "saved_ms_total": round(sum(saved.values()), 2),
+        }
+
+
+_manager = MaterializationManager()
+get_db_writer().subscribe(_manager.on_data_change)
+
+
+def get_materialization_manager() -> MaterializationManager:
+    """获取全局汇总表管理器"""
+    return _manager
@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+"""
+模型多副本路由
+
+model_config.json 中的模型除了单个 url，也可以配置多个副本：
+
+    "endpoints": [
+        {"url": "http://10.0.0.1:8000", "weight": 2},
+        {"url": "http://10.0.0.2:8000"}
+    ],
+    "routing": "least_outstanding"   # 或 "ewma"
+
+- least_outstanding: 选择 (在途请求数 + 1) / 权重 最小的副本
+- ewma:              在此基础上再乘以该副本响应耗时的指数滑动平均，优先选择又闲又快的副本
+
+健康检查：
+- 被动：连续失败 LLM_EJECT_FAILURES 次的副本被摘除一段时间，多次被摘除时摘除时间按倍数增长
+- 主动：后台线程定期探测多副本模型的各副本（默认 GET {url}/v1/models），
+  探测失败计为一次失败，被摘除的副本探测成功后重新加入
+- 重新加入的副本在 LLM_SLOW_START 秒内权重从 10% 逐步恢复，避免瞬间涌入大量请求
+所有副本都被摘除时仍会选择最早到期的副本，不会直接拒绝请求；
+只有所有副本的熔断器都处于打开状态时才直接失败（见 resilience.CircuitBreaker）。
+"""
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..config import get_model_config
+from ..config.settings import (
+    LLM_EJECT_FAILURES,
+    LLM_EJECT_BASE_SECONDS,
+    LLM_EJECT_MAX_SECONDS,
+    LLM_EWMA_DECAY,
+    LLM_HEALTH_CHECK_INTERVAL,
+    LLM_HEALTH_CHECK_TIMEOUT,
+    LLM_SLOW_START,
+)
+from ..utils.metrics import REGISTRY
+from .http_client import get_http_session
+from .resilience import BREAKER_STATE_VALUES, CircuitBreaker
+
+ROUTING_POLICIES = ("least_outstanding", "ewma")
+DEFAULT_HEALTH_PATH = "/v1/models"
+
+
+class NoEndpointAvailable(Exception):
+    """模型的所有副本都处于熔断状态"""
+
+    def __init__(self, model_name: str, retry_after: float):
+        super().__init__(f"模型 {model_name} 的所有副本均处于熔断状态")
+        self.retry_after = retry_after
+
+
+class Endpoint:
+    """单个模型副本的路由状态"""
+
+    def __init__(self, model_name: str, url: str, weight: float = 1.0):
+        self.model_name = model_name
+        self.url = url.rstrip("/")
+        self.weight = max(float(weight), 0.01)
+        self.outstanding = 0
+        self.ewma_ms: Optional[float] = None
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.reintroduced_at = 0.0
+        self.breaker = CircuitBreaker()
+
+    def is_ejected(self, now: float) -> bool:
+        return self.ejected_until > now
+
+    def effective_weight(self, now: float) -> float:
+        """慢启动：重新加入后的权重随时间线性恢复"""
+        if self.reintroduced_at and LLM_SLOW_START > 0:
+            progress = (now - self.reintroduced_at) / LLM_SLOW_START
+            if progress < 1:
+                return self.weight * max(0.1, progress)
+        return self.weight
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "weight": self.weight,
+            "effective_weight": round(self.effective_weight(now), 3),
+            "healthy": not self.is_ejected(now),
+            "outstanding": self.outstanding,
+            "ewma_ms": round(self.ewma_ms, 1) if self.ewma_ms is not None else None,
+            "requests": self.requests,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "ejections": self.ejections,
+            "ejected_for_s": round(max(0.0, self.ejected_until - now), 1),
+            "breaker": self.breaker.stats(now),
+        }
+
+
+class ModelRouter:
+    """单个模型的副本选择与健康状态"""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self.policy = ROUTING_POLICIES[0]
+        self.health_path = DEFAULT_HEALTH_PATH
+        self.health_check = True
+        self.headers: Dict[str, str] = {}
+        self.endpoints: List[Endpoint] = []
+        self._signature: Optional[Tuple] = None
+        self._lock = threading.Lock()
+
+    def configure(self, model_info: Dict[str, Any]):
+        """按模型配置同步副本列表；url 未变化的副本保留其状态"""
+        specs = model_info.get("endpoints") or [{"url": model_info.get("url", "")}]
+        specs = [{"url": s} if isinstance(s, str) else s for s in specs]
+        policy = model_info.get("routing", ROUTING_POLICIES[0])
+        signature = (
+            tuple((s.get("url", ""), float(s.get("weight", 1))) for s in specs),
+            policy,
+            model_info.get("health_path"),
+            model_info.get("health_check", True),
+            model_info.get("api_key"),
+        )
+        if signature == self._signature:
+            return
+        with self._lock:
+            existing = {e.url: e for e in self.endpoints}
+            endpoints = []
+            for spec in specs:
+                url = spec.get("url", "").rstrip("/")
+                endpoint = existing.get(url) or Endpoint(self.model_name, url)
+                endpoint.weight = max(float(spec.get("weight", 1)), 0.01)
+                endpoints.append(endpoint)
+            self.endpoints = endpoints
+            self.policy = policy if policy in ROUTING_POLICIES else ROUTING_POLICIES[0]
+            self.health_path = model_info.get("health_path") or DEFAULT_HEALTH_PATH
+            self.health_check = bool(model_info.get("health_check", True))
+            self.headers = {"Authorization": model_info["api_key"]} if model_info.get("api_key") else {}
+            self._signature = signature
+
+    def _score(self, endpoint: Endpoint, now: float, default_ms: float) -> float:
+        score = (endpoint.outstanding + 1) / endpoint.effective_weight(now)
+        if self.policy == "ewma":
+            score *= endpoint.ewma_ms if endpoint.ewma_ms is not None else default_ms
+        return score
+
+    def choose(self, exclude: Tuple[str, ...] = ()) -> Endpoint:
+        """
+        选择一个副本并计入在途请求；exclude 中的副本（如本次请求已失败过的）仅在没有其他选择时使用
+
+        Raises:
+            NoEndpointAvailable: 所有副本都处于熔断状态
+        """
+        now = time.time()
+        with self._lock:
+            available = [e for e in self.endpoints if e.breaker.available(now)]
+            if not available:
+                raise NoEndpointAvailable(
+                    self.model_name, min(e.breaker.retry_after(now) for e in self.endpoints)
+                )
+            candidates = [e for e in available if not e.is_ejected(now) and e.url not in exclude]
+            if not candidates:
+                candidates = [e for e in available if not e.is_ejected(now)]
+            if not candidates:
+                # 全部被摘除：选择最早到期的副本，而不是直接失败
+                candidates = [min(available, key=lambda e: e.ejected_until)]
+            # 尚无耗时数据的副本按已知副本的平均耗时估计，既能被选到，也不会一下涌入所有请求
+            known = [e.ewma_ms for e in self.endpoints if e.ewma_ms is not None]
+            default_ms = sum(known) / len(known) if known else 1.0
+            scores = [(self._score(e, now, default_ms), e) for e in candidates]
+            best = min(score for score, _ in scores)
+            endpoint = random.choice([e for score, e in scores if score <= best])
+            endpoint.breaker.on_attempt(now)
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def release(self, endpoint: Endpoint, latency: Optional[float], ok: bool):
+        """请求结束：更新在途数、耗时滑动平均与被动健康状态"""
+        with self._lock:
+            endpoint.outstanding -= 1
+            if ok:
+                if latency is not None:
+                    ms = latency * 1000
+                    endpoint.ewma_ms = ms if endpoint.ewma_ms is None else (
+                        LLM_EWMA_DECAY * endpoint.ewma_ms + (1 - LLM_EWMA_DECAY) * ms
+                    )
+                endpoint.consecutive_failures = 0
+                endpoint.breaker.on_success()
+            else:
+                self._record_failure(endpoint)
+                if endpoint.breaker.on_failure(time.time()):
+                    BREAKER_OPENS.inc(model=self.model_name, endpoint=endpoint.url)
+                    print(f"[WARNING] 模型 {self.model_name} 副本 {endpoint.url} 熔断 "
+                          f"{endpoint.breaker.reset_seconds:g}s")
+
+    def _record_failure(self, endpoint: Endpoint):
+        # 调用方需持有 _lock
+        endpoint.failures += 1
+        endpoint.consecutive_failures += 1
+        now = time.time()
+        if endpoint.consecutive_failures >= LLM_EJECT_FAILURES and not endpoint.is_ejected(now):
+            endpoint.ejections += 1
+            duration = min(LLM_EJECT_BASE_SECONDS * endpoint.ejections, LLM_EJECT_MAX_SECONDS)
+            endpoint.ejected_until = now + duration
+            # 摘除到期后自动重新加入，同样走慢启动
+            endpoint.reintroduced_at = endpoint.ejected_until
+            ENDPOINT_EJECTIONS.inc(model=self.model_name, endpoint=endpoint.url)
+            print(f"[WARNING] 模型 {self.model_name} 副本 {endpoint.url} 连续失败 "
+                  f"{endpoint.consecutive_failures} 次，摘除 {duration:g}s")
+
+    def probe(self):
+        """主动健康检查：探测所有副本"""
+        session = get_http_session()
+        for endpoint in list(self.endpoints):
+            try:
+                resp = session.get(endpoint.url + self.health_path, headers=self.headers,
+                                   timeout=LLM_HEALTH_CHECK_TIMEOUT)
+                ok = resp.status_code < 500
+            except Exception:
+                ok = False
+            with self._lock:
+                if not ok:
+                    self._record_failure(endpoint)
+                    continue
+                endpoint.consecutive_failures = 0
+                now = time.time()
+                if endpoint.is_ejected(now):
+                    endpoint.ejected_until = 0.0
+                    endpoint.reintroduced_at = now
+                    print(f"[INFO] 模型 {self.model_name} 副本 {endpoint.url} 探测恢复，重新加入（慢启动）")
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            return {"policy": self.policy, "endpoints": [e.stats(now) for e in self.endpoints]}
+
+
+_routers: Dict[str, ModelRouter] = {}
+_routers_lock = threading.Lock()
+
+
+def get_model_router(model_name: str, model_info: Dict[str, Any]) -> ModelRouter:
+    """获取模型的路由器，并按当前配置同步副本列表"""
+    router = _routers.get(model_name)
+    if router is None:
+        with _routers_lock:
+            router = _routers.get(model_name)
+            if router is None:
+                router = _routers[model_name] = ModelRouter(model_name)
+    router.configure(model_info)
+    return router
+
+
+def router_stats() -> Dict[str, Any]:
+    """各模型副本的路由与健康状态"""
+    with _routers_lock:
+        routers = list(_routers.values())
+    return {r.model_name: r.stats() for r in routers}
+
+
+class HealthChecker:
+    """后台主动健康检查线程"""
+
+    def __init__(self, interval: float = LLM_HEALTH_CHECK_INTERVAL):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self.interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="llm-health-check", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=LLM_HEALTH_CHECK_TIMEOUT + 1)
+            self._thread = None
+
+    def run_once(self):
+        model_config = get_model_config() or {}
+        for model_name, model_info in model_config.get("models", {}).items():
+            # 只探测启用中、配置了多个副本的模型；单副本模型摘除与否都只能发往同一地址
+            if not model_info.get("enabled", True) or len(model_info.get("endpoints") or []) < 2:
+                continue
+            router = get_model_router(model_name, model_info)
+            if router.health_check:
+                router.probe()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"[ERROR] 模型健康检查失败: {e}")
+
+
+_health_checker = HealthChecker()
+
+
+def get_health_checker() -> HealthChecker:
+    return _health_checker
+
+
+def _endpoint_gauge() -> Dict[Tuple[str, ...], float]:
+    values: Dict[Tuple[str, ...], float] = {}
+    now = time.time()
+    for model_name, router in list(_routers.items()):
+        for e in list(router.endpoints):
+            values[(model_name, e.url, "outstanding")] = e.outstanding
+            values[(model_name, e.url, "healthy")] = 0.0 if e.is_ejected(now) else 1.0
+            values[(model_name, e.url, "breaker")] = BREAKER_STATE_VALUES[e.breaker.state]
+            if e.ewma_ms is not None:
+                values[(model_name, e.url, "ewma_ms")] = e.ewma_ms
+    return values
+
+
+ENDPOINT_EJECTIONS = REGISTRY.counter(
+    "tableqa_llm_endpoint_ejections_total", "Model replicas ejected after consecutive failures", ("model", "endpoint")
+)
+BREAKER_OPENS = REGISTRY.counter(
+    "tableqa_llm_breaker_opens_total", "Circuit breaker trips per model replica", ("model", "endpoint")
+)
+REGISTRY.gauge(
+    "tableqa_llm_endpoint", "Model replica routing state (breaker: 0 closed, 1 half-open, 2 open)", ("model", "endpoint", "state"), callback=_endpoint_gauge
+)
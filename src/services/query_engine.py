@@ -0,0 +1,524 @@
+# -*- coding: utf-8 -*-
+"""
+查询执行引擎
+
+execute_sql 完成只读校验与汇总表改写之后，由路由器选择执行引擎：
+- sqlite（默认）：每个线程复用一个只读连接（见 connection_pool）
+- duckdb（安装了 duckdb 且路由规则用到时才导入与创建）：嵌入式列式引擎，为每张表建立视图，直接读取业务库（sqlite_scan），
+  或读取由业务库导出的 Parquet 镜像（DUCKDB_SOURCE=parquet）；大表上的 GROUP BY / 聚合明显快于 SQLite。
+  sqlite_scan 需要 DuckDB 的 sqlite 扩展（首次使用时联网下载），离线环境无法加载时改为把表分批复制到 DuckDB
+
+路由顺序：按表（ENGINE_TABLE_ROUTES）→ 按查询形态（聚合查询且表的估计行数达到 ENGINE_AGGREGATE_MIN_ROWS
+时使用 ENGINE_AGGREGATE）→ 默认引擎（ENGINE_DEFAULT）。路由到 DuckDB 的查询还需满足：引用的表都已准备好视图，
+FROM 之后没有表函数或文件路径，也不调用读取文件、环境变量的函数；否则以及 DuckDB 执行失败时都由 SQLite 执行。
+
+DuckDB 的视图（或 Parquet 镜像）在后台线程中按需准备，准备完成之前查询仍由 SQLite 执行；
+表被重新导入或删除时（数据库写线程的变更通知）立即失效，之后重新准备。
+两种引擎的方言有差异：整数相除、NULL 排序由会话设置对齐，LIKE 改写为 ILIKE（见 utils.query_shape），
+SQLite 特有的函数写法在 DuckDB 中执行失败后退回 SQLite。默认配置下所有查询都由 SQLite 执行；
+benchmarks.bench_engines --check 经由路由器执行一批查询并与 SQLite 的结果比较。
+"""
+import hashlib
+import os
+import queue
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, Optional, Tuple, Type
+
+from ..config.settings import (
+    DB_PATH,
+    DUCKDB_MEMORY_LIMIT,
+    DUCKDB_PARQUET_DIR,
+    DUCKDB_SOURCE,
+    DUCKDB_THREADS,
+    ENGINE_AGGREGATE,
+    ENGINE_AGGREGATE_MIN_ROWS,
+    ENGINE_DEFAULT,
+    ENGINE_TABLE_ROUTES,
+)
+from ..utils.metrics import REGISTRY
+from ..utils.query_shape import QueryShape, analyze_query, to_duckdb_dialect
+from ..utils.sql_lexer import COMMENT, PUNCT, WS, iter_tokens
+from ..utils.sql_normalizer import NormalizedSQL
+from ..utils.table_sampler import estimate_row_count, quote_identifier
+from .connection_pool import get_read_connection
+from .db_writer import DataChange, get_db_writer
+
+ENGINE_QUERIES = REGISTRY.counter(
+    "tableqa_engine_queries_total",
+    "Queries executed by each engine (fallback: the routed engine failed and SQLite ran the query)",
+    ("engine", "outcome"),
+)
+
+# DuckDB 中可以读取文件、其他数据库或环境信息的函数，出现时不路由到 DuckDB
+_DENIED_FUNCTION_PREFIXES = ("read_", "parquet_", "sqlite_", "duckdb_", "pragma_", "json_execute", "iceberg_",
+                             "delta_", "postgres_", "mysql_")
+_DENIED_FUNCTIONS = frozenset({"glob", "getenv", "current_setting", "query", "query_table", "which_secret"})
+_FAILED_LIMIT = 1000  # 记录的准备失败的表数上限（表名来自查询，避免无限增长）
+_COPY_BATCH_ROWS = 100000  # 无法加载 sqlite 扩展时，从业务库分批复制到 DuckDB 的行数
+# 与 SQLite 对齐的设置（连接级，对每次查询的 cursor 都生效）：整数相除得到整数；NULL 在升序中最先、降序中最后
+_SQLITE_COMPAT_CONFIG = {"integer_division": True, "default_null_order": "nulls_first_on_asc_last_on_desc"}
+
+
+def _sql_literal(text: str) -> str:
+    return "'" + text.replace("'", "''") + "'"
+
+
+def _denied(function: str) -> bool:
+    return function in _DENIED_FUNCTIONS or function.startswith(_DENIED_FUNCTION_PREFIXES)
+
+
+def _statement_body(sql: str) -> str:
+    """去掉语句末尾的分号与注释：嵌入子查询时，行尾的 -- 注释会吞掉其后的文本"""
+    end = 0
+    for t in iter_tokens(sql):
+        if t.kind != WS and t.kind != COMMENT and not (t.kind == PUNCT and t.text == ";"):
+            end = t.pos + len(t.text)
+    return sql[:end]
+
+
+def _duckdb_type(declared: str) -> str:
+    """SQLite 列的声明类型对应的 DuckDB 类型（按 SQLite 的类型亲和规则；日期时间列按文本保存与比较）"""
+    declared = (declared or "").upper()
+    if "INT" in declared or "BOOL" in declared:
+        return "BIGINT"
+    if any(word in declared for word in ("REAL", "FLOA", "DOUB", "NUMERIC", "DECIMAL")):
+        return "DOUBLE"
+    return "VARCHAR"
+
+
+class ExecutionEngine:
+    """
+    执行引擎接口
+
+    execute 执行已通过只读校验的 SQL，返回 DB-API 风格的游标（description / fetchmany / fetchall / close），
+    由调用方读取结果并关闭；执行失败时抛出 errors 中的异常。
+    """
+    name = ""
+    errors: Tuple[Type[BaseException], ...] = ()
+
+    def execute(self, sql: str, norm: NormalizedSQL):
+        raise NotImplementedError
+
+    def accepts(self, shape: QueryShape) -> bool:
+        """能否执行该形态的查询（路由到该引擎之前检查）"""
+        return True
+
+    def on_data_change(self, change: DataChange):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+    def close(self):
+        pass
+
+
+class SQLiteEngine(ExecutionEngine):
+    """业务库 SQLite（每线程只读连接）"""
+    name = "sqlite"
+    errors = (sqlite3.Error, OverflowError)
+
+    def connection(self) -> sqlite3.Connection:
+        return get_read_connection()
+
+    def execute(self, sql: str, norm: NormalizedSQL) -> sqlite3.Cursor:
+        cur = self.connection().cursor()
+        try:
+            try:
+                # 参数化后只差在字面量上的 SQL 共用同一条预编译语句
+                cur.execute(norm.text, norm.params)
+            except (sqlite3.InterfaceError, OverflowError):
+                # 参数无法绑定（如超出 64 位的整数）时按原文执行
+                cur.execute(sql)
+        except BaseException:
+            cur.close()
+            raise
+        return cur
+
+
+class _RenamedCursor:
+    """结果列名替换为 SQLite 的列名（未起别名的表达式两者命名不同，如 COUNT(*) 与 count_star()）"""
+
+    def __init__(self, cursor, columns):
+        self._cursor = cursor
+        self.description = [(name,) + tuple(d[1:]) for name, d in zip(columns, cursor.description)]
+
+    def fetchmany(self, size: int):
+        return self._cursor.fetchmany(size)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def close(self):
+        self._cursor.close()
+
+
+class DuckDBEngine(ExecutionEngine):
+    """DuckDB：内存数据库中为业务库的每张表建立视图（读取业务库或 Parquet 镜像）"""
+    name = "duckdb"
+
+    def __init__(self, db_path: str = DB_PATH, source: str = DUCKDB_SOURCE, parquet_dir: str = DUCKDB_PARQUET_DIR):
+        try:
+            import duckdb  # 可选依赖，只在创建引擎时导入，不拖慢启动
+        except ImportError:
+            raise RuntimeError("未安装 duckdb")
+        if source not in ("sqlite", "parquet"):
+            raise ValueError(f"不支持的 DuckDB 数据源: {source}")
+        self.db_path = db_path
+        self.source = source
+        self.parquet_dir = parquet_dir
+        self._duckdb = duckdb
+        self.errors = (duckdb.Error,)
+        self._db = None
+        self._scanner = True  # sqlite 扩展可用；否则把表复制到 DuckDB
+        self._lock = threading.Lock()
+        self._ready: Dict[str, str] = {}  # 表名（小写）-> 表名，视图已可查询
+        self._pending = set()
+        self._failed: Dict[str, str] = {}  # 表名（小写）-> 失败原因，数据变更之前不再重试
+        self._generations: Dict[str, int] = {}  # 表名（小写）-> 失效次数，准备期间表被修改时结果作废
+        self._queue: "queue.Queue[Optional[Tuple[str, str]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._local = threading.local()
+
+    def _database(self):
+        with self._lock:
+            if self._db is None:
+                duckdb = self._duckdb
+                db = duckdb.connect(":memory:", config={"threads": DUCKDB_THREADS, "memory_limit": DUCKDB_MEMORY_LIMIT,
+                                                        **_SQLITE_COMPAT_CONFIG})
+                try:
+                    db.execute("LOAD sqlite")
+                except duckdb.Error:
+                    try:
+                        db.execute("INSTALL sqlite")
+                        db.execute("LOAD sqlite")
+                    except duckdb.Error as e:
+                        self._scanner = False
+                        print(f"[WARNING] DuckDB sqlite 扩展不可用，改为把表复制到 DuckDB: {e}")
+                self._db = db
+            return self._db
+
+    # ---------- 查询 ----------
+    def execute(self, sql: str, norm: NormalizedSQL):
+        cur = self._database().cursor()  # 每次查询一个连接（同一数据库），线程之间互不影响
+        try:
+            cur.execute(to_duckdb_dialect(norm.text), list(norm.params))
+            columns = self._sqlite_columns(norm)
+        except BaseException:
+            cur.close()
+            raise
+        return _RenamedCursor(cur, columns) if columns else cur
+
+    def _sqlite_columns(self, norm: NormalizedSQL):
+        """SQLite 执行同一查询时的列名：只编译、不读取数据（LIMIT 0），无法编译时返回 None"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+        try:
+            probe = conn.execute(f"SELECT * FROM ({_statement_body(norm.text)}\n) LIMIT 0", norm.params)
+        except (sqlite3.Error, OverflowError):
+            return None
+        columns = [d[0] for d in probe.description]
+        probe.close()
+        return columns
+
+    def accepts(self, shape: QueryShape) -> bool:
+        if not shape.tables or shape.foreign_sources or any(_denied(f) for f in shape.functions):
+            return False
+        with self._lock:
+            missing = [t for t in shape.tables if t.lower() not in self._ready]
+        if missing:
+            self.prepare(missing)
+            return False
+        return True
+
+    # ---------- 视图准备 ----------
+    def mirror_path(self, table: str) -> str:
+        return os.path.join(self.parquet_dir, f"{self._digest(table)}.parquet")
+
+    @staticmethod
+    def _digest(table: str) -> str:
+        return hashlib.sha1(table.lower().encode("utf-8")).hexdigest()[:16]
+
+    def copy_name(self, table: str) -> str:
+        """无法加载 sqlite 扩展时，表复制到 DuckDB 中的表名"""
+        return f"__tableqa_copy_{self._digest(table)}"
+
+    def _copy_table(self, cur, table: str) -> str:
+        """把业务库的表分批复制到 DuckDB（同一读事务内读取，得到一致的快照），返回复制表名"""
+        import pandas as pd
+
+        target = quote_identifier(self.copy_name(table))
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        try:
+            columns = conn.execute(f"PRAGMA table_info({quote_identifier(table)})").fetchall()
+            if not columns:
+                raise sqlite3.OperationalError(f"no such table: {table}")
+            definition = ", ".join(f"{quote_identifier(c[1])} {_duckdb_type(c[2])}" for c in columns)
+            cur.execute(f"CREATE OR REPLACE TABLE {target} ({definition})")
+            for chunk in pd.read_sql_query(f"SELECT * FROM {quote_identifier(table)}", conn,
+                                           chunksize=_COPY_BATCH_ROWS, coerce_float=False):
+                cur.register("__tableqa_chunk", chunk)
+                try:
+                    cur.execute(f"INSERT INTO {target} SELECT * FROM __tableqa_chunk")
+                finally:
+                    cur.unregister("__tableqa_chunk")
+        finally:
+            conn.close()
+        return target
+
+    def prepare(self, tables: Iterable[str]):
+        """在后台准备表的视图（已准备、排队中或失败过的表跳过）"""
+        queued = False
+        with self._lock:
+            for table in tables:
+                key = table.lower()
+                if key in self._ready or key in self._pending or key in self._failed or "." in table:
+                    continue
+                self._pending.add(key)
+                self._queue.put(("prepare", table))
+                queued = True
+        if queued:
+            self._start()
+
+    def prepare_table(self, table: str) -> bool:
+        """准备表的视图 (同步)：parquet 模式先把表导出为镜像文件"""
+        key = table.lower()
+        with self._lock:
+            generation = self._generations.get(key, 0)
+        cur = self._database().cursor()
+        try:
+            if self._scanner:
+                source = f"sqlite_scan({_sql_literal(self.db_path)}, {_sql_literal(table)})"
+            else:
+                source = self._copy_table(cur, table)
+            if self.source == "parquet":
+                path = self.mirror_path(table)
+                os.makedirs(self.parquet_dir, exist_ok=True)
+                cur.execute(f"COPY (SELECT * FROM {source}) TO {_sql_literal(path + '.part')} (FORMAT PARQUET)")
+                os.replace(path + ".part", path)
+                if not self._scanner:
+                    cur.execute(f"DROP TABLE IF EXISTS {source}")
+                source = f"read_parquet({_sql_literal(path)})"
+            cur.execute(f"CREATE OR REPLACE VIEW {quote_identifier(table)} AS SELECT * FROM {source}")
+        finally:
+            cur.close()
+        with self._lock:
+            if self._generations.get(key, 0) != generation:
+                return False  # 准备期间表被修改，等待重新准备
+            self._ready[key] = table
+        return True
+
+    def drop_table(self, table: str):
+        cur = self._database().cursor()
+        try:
+            cur.execute(f"DROP VIEW IF EXISTS {quote_identifier(table)}")
+            cur.execute(f"DROP TABLE IF EXISTS {quote_identifier(self.copy_name(table))}")
+        finally:
+            cur.close()
+        if self.source == "parquet":
+            try:
+                os.remove(self.mirror_path(table))
+            except FileNotFoundError:
+                pass
+
+    def on_data_change(self, change: DataChange):
+        """表被重新导入或删除：视图立即失效；导入的表若之前已准备过则重新准备"""
+        reprepare = []
+        dropped = False
+        with self._lock:
+            for table in change.tables:
+                key = table.lower()
+                self._generations[key] = self._generations.get(key, 0) + 1
+                self._failed.pop(key, None)
+                if self._ready.pop(key, None) is None:
+                    continue  # 未准备过（排队中的准备会因版本变化作废并重新排队）
+                if change.action == "drop":
+                    self._queue.put(("drop", table))
+                    dropped = True
+                else:
+                    reprepare.append(table)
+        if dropped:
+            self._start()
+        self.prepare(reprepare)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="duckdb-prepare", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            action, table = item
+            key = table.lower()
+            try:
+                if action == "drop":
+                    self.drop_table(table)
+                    continue
+                prepared = self.prepare_table(table)
+                with self._lock:
+                    self._pending.discard(key)
+                if prepared:
+                    print(f"[INFO] DuckDB 已准备表 {table}（{self.source}）")
+                else:
+                    self.prepare([table])
+            except Exception as e:
+                with self._lock:
+                    self._pending.discard(key)
+                    if len(self._failed) >= _FAILED_LIMIT:
+                        self._failed.clear()
+                    self._failed[key] = str(e)
+                print(f"[WARNING] DuckDB 准备表 {table} 失败，相关查询由 SQLite 执行: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "source": self.source,
+                "sqlite_scan": self._scanner,
+                "ready": sorted(self._ready.values()),
+                "pending": len(self._pending),
+                "failed": dict(self._failed),
+            }
+
+    def close(self):
+        with self._lock:
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(5)
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+            self._ready.clear()
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class EngineRouter:
+    """按表与查询形态选择执行引擎，路由到的引擎不能执行或执行失败时由 SQLite 执行"""
+
+    def __init__(self, engines: Dict[str, ExecutionEngine], default: str = ENGINE_DEFAULT,
+                 table_routes: Optional[Dict[str, str]] = None, aggregate: str = ENGINE_AGGREGATE,
+                 aggregate_min_rows: int = ENGINE_AGGREGATE_MIN_ROWS):
+        self.engines = engines
+        self.sqlite = engines["sqlite"]
+        self.hot: Optional[ExecutionEngine] = None
+        self.default = default
+        routes = ENGINE_TABLE_ROUTES if table_routes is None else table_routes
+        self.table_routes = {table.lower(): engine for table, engine in routes.items()}
+        self.aggregate = aggregate
+        self.aggregate_min_rows = aggregate_min_rows
+        self._rows: Dict[str, Optional[int]] = {}  # 表名（小写）-> 估计行数，表数据变更时清除
+        self._lock = threading.Lock()
+        unavailable = sorted({default, aggregate, *self.table_routes.values()} - set(engines) - {""})
+        if unavailable:
+            print(f"[WARNING] 执行引擎 {unavailable} 不可用（未安装或名称错误），相关查询由 SQLite 执行")
+
+    def register(self, engine: ExecutionEngine, hot: bool = False):
+        """
+        注册执行引擎（同名替换）
+
+        hot 为 True 时作为 SQLite 的内存热表：路由到 SQLite 的查询，引用的表都在热表中常驻时改用该引擎
+        """
+        self.engines[engine.name] = engine
+        if hot:
+            self.hot = engine
+
+    def _estimated_rows(self, table: str) -> int:
+        key = table.lower()
+        with self._lock:
+            if key in self._rows:
+                return self._rows[key] or 0
+        try:
+            estimate = estimate_row_count(get_read_connection(), table)
+        except sqlite3.Error:
+            estimate = None
+        rows = estimate.rows if estimate is not None else None
+        with self._lock:
+            self._rows[key] = rows
+        return rows or 0
+
+    def choose(self, shape: QueryShape) -> str:
+        """按路由规则选择的引擎名（不检查引擎能否执行）"""
+        routed = {self.table_routes[t.lower()] for t in shape.tables if t.lower() in self.table_routes}
+        if routed:
+            # 引用的表被路由到不同引擎时使用默认引擎
+            return routed.pop() if len(routed) == 1 else self.default
+        if (self.aggregate and shape.aggregate and shape.tables
+                and max(self._estimated_rows(t) for t in shape.tables) >= self.aggregate_min_rows):
+            return self.aggregate
+        return self.default
+
+    def route(self, sql: str) -> ExecutionEngine:
+        shape = analyze_query(sql)
+        engine = self.engines.get(self.choose(shape), self.sqlite)
+        if engine is not self.sqlite and not engine.accepts(shape):
+            engine = self.sqlite
+        if engine is self.sqlite and self.hot is not None and self.hot.accepts(shape):
+            return self.hot
+        return engine
+
+    def execute(self, engine: ExecutionEngine, sql: str, norm: NormalizedSQL) -> Tuple[Any, ExecutionEngine]:
+        """用选定的引擎执行，返回 (游标, 实际执行的引擎)；非 SQLite 引擎执行失败时改由 SQLite 执行"""
+        if engine is not self.sqlite:
+            try:
+                cur = engine.execute(sql, norm)
+                ENGINE_QUERIES.inc(engine=engine.name, outcome="ok")
+                return cur, engine
+            except engine.errors as e:
+                ENGINE_QUERIES.inc(engine=engine.name, outcome="fallback")
+                print(f"[WARNING] {engine.name} 执行失败，改由 SQLite 执行: {e}")
+        cur = self.sqlite.execute(sql, norm)
+        ENGINE_QUERIES.inc(engine=self.sqlite.name, outcome="ok")
+        return cur, self.sqlite
+
+    def on_data_change(self, change: DataChange):
+        with self._lock:
+            for table in change.tables:
+                self._rows.pop(table.lower(), None)
+        for engine in self.engines.values():
+            engine.on_data_change(change)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "available": sorted(self.engines),
+            "default": self.default,
+            "table_routes": dict(self.table_routes),
+            "aggregate": self.aggregate or None,
+            "aggregate_min_rows": self.aggregate_min_rows,
+            "hot": self.hot.name if self.hot is not None else None,
+            "engines": {name: engine.stats() for name, engine in self.engines.items() if engine is not self.sqlite},
+        }
+
+    def close(self):
+        for engine in self.engines.values():
+            engine.close()
+
+
+def _create_router() -> EngineRouter:
+    engines: Dict[str, ExecutionEngine] = {"sqlite": SQLiteEngine()}
+    # 只在路由规则用到 DuckDB 时导入（导入 duckdb 约 70ms）；未安装时由 EngineRouter 提示并改由 SQLite 执行
+    if "duckdb" in {ENGINE_DEFAULT, ENGINE_AGGREGATE, *ENGINE_TABLE_ROUTES.values()}:
+        try:
+            engines["duckdb"] = DuckDBEngine()
+        except RuntimeError:
+            pass
+    return EngineRouter(engines)
+
+
+_router = _create_router()
+get_db_writer().subscribe(_router.on_data_change)
+
+
+def get_engine_router() -> EngineRouter:
+    """获取全局执行引擎路由器"""
+    return _router
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+模型调用容错
+
+- 重试：连接失败、超时、429 与 5xx 视为暂时性错误，最多重试 LLM_MAX_RETRIES 次，
+  退避时间为 [0, min(上限, 基数 * 2^n)] 内的随机值（full jitter），避免重试同时涌向后端
+- 截止时间：每个请求有一个总的截止时间，排队、每次尝试的超时与退避都从剩余时间中扣除
+- 熔断：每个副本一个熔断器，连续失败达到阈值后熔断，期间直接拒绝；
+  冷却期结束后放行一个试探请求（半开），成功则恢复，失败则继续熔断
+"""
+import random
+import time
+from typing import Any, Dict, Optional
+
+import requests
+
+from ..config.settings import (
+    LLM_BACKOFF_BASE,
+    LLM_BACKOFF_MAX,
+    LLM_BREAKER_FAILURES,
+    LLM_BREAKER_RESET_SECONDS,
+)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+BREAKER_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    """
+    单个副本的熔断器
+
+    不自带锁：由所属的 ModelRouter 在持有其锁时调用。
+    """
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURES,
+                 reset_seconds: float = LLM_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.open_count = 0
+
+    def available(self, now: float) -> bool:
+        """当前是否可以向该副本发送请求"""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            return now - self.opened_at >= self.reset_seconds
+        return not self.trial_in_flight
+
+    def on_attempt(self, now: float):
+        """请求发出前调用：冷却期已过的熔断器进入半开状态，只放行这一个试探请求"""
+        if self.state == OPEN and now - self.opened_at >= self.reset_seconds:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            self.trial_in_flight = True
+
+    def on_success(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.trial_in_flight = False
+
+    def on_failure(self, now: float) -> bool:
+        """记录一次失败，返回是否因此进入熔断"""
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+            self.state = OPEN
+            self.opened_at = now
+            self.open_count += 1
+            return True
+        return False
+
+    def retry_after(self, now: float) -> float:
+        """距离允许试探请求还有多少秒"""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.reset_seconds - (now - self.opened_at))
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "open_count": self.open_count,
+            "retry_after_s": round(self.retry_after(now), 1),
+        }
+
+
+def is_transient(e: Exception) -> bool:
+    """是否为值得重试的暂时性错误"""
+    if isinstance(e, requests.HTTPError) and e.response is not None:
+        return e.response.status_code == 429 or e.response.status_code >= 500
+    return isinstance(e, (requests.ConnectionError, requests.Timeout))
+
+
+def backoff_delay(attempt: int, remaining: Optional[float] = None) -> float:
+    """第 attempt 次重试前的等待时间（full jitter），不超过剩余时间"""
+    delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)))
+    if remaining is not None:
+        delay = min(delay, max(0.0, remaining))
+    return delay
+
+
+class Deadline:
+    """请求级截止时间"""
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
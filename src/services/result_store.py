@@ -0,0 +1,378 @@
+# -*- coding: utf-8 -*-
+"""
+大查询结果落盘与结果句柄
+
+结果超过 RESULT_SPILL_ROWS 行时，边从游标读取边按行组写入列式结果文件，内存中最多保留一个行组，
+返回结果句柄；之后可按句柄分页读取、导出 CSV 或生成发给 Chat 模型的摘要。
+
+文件格式（<句柄>.tqr，写入过程中为 .tqr.part）：
+    b"TQR1" | 行组 0 的各列 | 行组 1 的各列 | ... | 元数据 JSON | 元数据长度（8 字节小端）| b"TQR1"
+每个行组中每一列是一段 JSON 数组；元数据记录列名、总行数，以及各行组的起始行号和各列的偏移与长度。
+读取时只读 mmap 整个文件，按偏移切出 memoryview 直接交给 JSON 解析（不复制），只解码目标行所在的行组。
+
+结果文件自最后一次访问起保留 RESULT_SPILL_TTL 秒；目录总大小超过 RESULT_SPILL_QUOTA_BYTES 时
+先淘汰最久未访问的结果，仍然不足则本次落盘失败（507）。多个 worker 进程共用同一目录。
+"""
+import bisect
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+
+from ..config.settings import (
+    RESULT_SPILL_BLOCK_ROWS,
+    RESULT_SPILL_CLEANUP_INTERVAL,
+    RESULT_SPILL_DIR,
+    RESULT_SPILL_QUOTA_BYTES,
+    RESULT_SPILL_TTL,
+)
+from ..utils.fast_json import dumps, loads
+from ..utils.metrics import REGISTRY
+
+MAGIC = b"TQR1"
+SUFFIX = ".tqr"
+PARTIAL_SUFFIX = ".tqr.part"
+_LENGTH = struct.Struct("<Q")
+_HANDLE_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+SPILLS = REGISTRY.counter("tableqa_result_spills_total", "Query results written to disk", ("outcome",))
+SPILL_EVICTIONS = REGISTRY.counter("tableqa_result_evictions_total", "Spilled results removed", ("reason",))
+
+
+class SpillSummary(NamedTuple):
+    handle: str
+    total_rows: int
+    bytes: int
+
+
+class _Block(NamedTuple):
+    start: int  # 行组第一行的行号
+    rows: int
+    spans: List[Tuple[int, int]]  # 各列 JSON 数组在文件中的 (偏移, 长度)
+
+
+def _not_found(handle: str) -> HTTPException:
+    return HTTPException(status_code=404, detail=f"结果 '{handle}' 不存在或已过期")
+
+
+class SpillWriter:
+    """按行组写入 .part 文件，close() 写入元数据后改名为正式的结果文件"""
+
+    def __init__(self, store: "ResultStore", handle: str, columns: List[str]):
+        self.store = store
+        self.handle = handle
+        self.columns = list(columns)
+        self.path = store.path(handle) + ".part"
+        self.total_rows = 0
+        self._buffer: List[Sequence[Any]] = []
+        self._blocks: List[list] = []
+        self._fp = open(self.path, "wb")
+        self._fp.write(MAGIC)
+
+    def write(self, rows: List[Sequence[Any]]):
+        self._buffer.extend(rows)
+        block_rows = self.store.block_rows
+        if len(self._buffer) < block_rows:
+            return
+        full = len(self._buffer) - len(self._buffer) % block_rows
+        for start in range(0, full, block_rows):
+            self._flush(self._buffer[start:start + block_rows])
+        del self._buffer[:full]
+
+    def _flush(self, rows: List[Sequence[Any]]):
+        offset = self._fp.tell()
+        spans = []
+        for values in zip(*rows):  # 行转列，每列序列化为一段 JSON 数组
+            data = dumps(values)
+            self._fp.write(data)
+            spans.append((offset, len(data)))
+            offset += len(data)
+        self._blocks.append([self.total_rows, len(rows), spans])
+        self.total_rows += len(rows)
+        self.store.ensure_quota(offset)
+
+    def close(self) -> SpillSummary:
+        if self._buffer:
+            self._flush(self._buffer)
+            self._buffer = []
+        meta = dumps({"columns": self.columns, "total_rows": self.total_rows, "blocks": self._blocks})
+        self._fp.write(meta)
+        self._fp.write(_LENGTH.pack(len(meta)))
+        self._fp.write(MAGIC)
+        size = self._fp.tell()
+        self._fp.close()
+        os.replace(self.path, self.store.path(self.handle))
+        return SpillSummary(self.handle, self.total_rows, size)
+
+    def abort(self):
+        self._buffer = []
+        try:
+            self._fp.close()
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class SpilledResult:
+    """只读打开的结果文件（mmap），按行组解码"""
+
+    def __init__(self, path: str):
+        self._fp = open(path, "rb")
+        try:
+            self._mm = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # 空文件
+            self._fp.close()
+            raise ValueError("结果文件为空")
+        self._view = memoryview(self._mm)
+        try:
+            tail = _LENGTH.size + len(MAGIC)
+            if len(self._view) < len(MAGIC) + tail or self._view[:4] != MAGIC or self._view[-4:] != MAGIC:
+                raise ValueError("结果文件格式错误")
+            (length,) = _LENGTH.unpack(self._view[-tail:-len(MAGIC)])
+            meta = loads(self._view[-tail - length:-tail])
+        except Exception:
+            self.close()
+            raise
+        self.columns: List[str] = meta["columns"]
+        self.total_rows: int = meta["total_rows"]
+        self._blocks = [_Block(start, rows, [tuple(s) for s in spans]) for start, rows, spans in meta["blocks"]]
+        self._starts = [b.start for b in self._blocks]
+
+    def __enter__(self) -> "SpilledResult":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+            self._mm.close()
+            self._fp.close()
+
+    def _decode(self, block: _Block) -> List[tuple]:
+        columns = [loads(self._view[offset:offset + length]) for offset, length in block.spans]
+        return list(zip(*columns))
+
+    def read(self, offset: int, limit: int) -> List[tuple]:
+        """读取 [offset, offset + limit) 行"""
+        end = min(self.total_rows, offset + limit)
+        if offset < 0 or offset >= end:
+            return []
+        rows: List[tuple] = []
+        i = bisect.bisect_right(self._starts, offset) - 1
+        while i < len(self._blocks) and self._blocks[i].start < end:
+            block = self._blocks[i]
+            rows.extend(self._decode(block)[max(0, offset - block.start):end - block.start])
+            i += 1
+        return rows
+
+    def iter_blocks(self) -> Iterator[List[tuple]]:
+        """按行组依次返回全部行"""
+        for block in self._blocks:
+            yield self._decode(block)
+
+    def sample(self, n: int) -> List[tuple]:
+        """等间隔抽取 n 行（n 不小于总行数时返回全部行）"""
+        if n >= self.total_rows:
+            return [row for rows in self.iter_blocks() for row in rows]
+        step = self.total_rows / n
+        positions = [int(i * step) for i in range(n)]
+        rows: List[tuple] = []
+        k = 0
+        for block in self._blocks:
+            end = block.start + block.rows
+            if k >= len(positions):
+                break
+            if positions[k] >= end:
+                continue
+            decoded = self._decode(block)
+            while k < len(positions) and positions[k] < end:
+                rows.append(decoded[positions[k] - block.start])
+                k += 1
+        return rows
+
+
+class ResultStore:
+    """结果文件目录：创建、按句柄打开、过期清理与容量淘汰"""
+
+    def __init__(self, directory: str = RESULT_SPILL_DIR, ttl: float = RESULT_SPILL_TTL,
+                 quota_bytes: int = RESULT_SPILL_QUOTA_BYTES, block_rows: int = RESULT_SPILL_BLOCK_ROWS,
+                 cleanup_interval: float = RESULT_SPILL_CLEANUP_INTERVAL):
+        self.directory = directory
+        self.ttl = ttl
+        self.quota_bytes = quota_bytes
+        self.block_rows = block_rows
+        self.cleanup_interval = cleanup_interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def path(self, handle: str) -> str:
+        return os.path.join(self.directory, handle + SUFFIX)
+
+    def create(self, columns: List[str]) -> SpillWriter:
+        os.makedirs(self.directory, exist_ok=True)
+        return SpillWriter(self, uuid.uuid4().hex, columns)
+
+    def spill(self, cursor, head: List[Sequence[Any]]) -> SpillSummary:
+        """
+        把已读取的 head 行与游标中剩余的行写入结果文件
+
+        剩余的行每次读取一个行组并立即写出，内存占用不随结果行数增长。
+        """
+        writer = self.create([c[0] for c in cursor.description])
+        try:
+            writer.write(head)
+            while True:
+                rows = cursor.fetchmany(self.block_rows)
+                if not rows:
+                    break
+                writer.write(rows)
+            summary = writer.close()
+        except BaseException:
+            writer.abort()
+            SPILLS.inc(outcome="failed")
+            raise
+        SPILLS.inc(outcome="ok")
+        print(f"[INFO] 查询结果 {summary.total_rows} 行已写入结果文件 {summary.handle}（{summary.bytes} 字节）")
+        return summary
+
+    def open(self, handle: str) -> SpilledResult:
+        """
+        按句柄打开结果（调用方负责 close，或用 with 语句），并刷新最后访问时间
+
+        Raises:
+            HTTPException: 句柄不存在或已过期（404）、文件损坏（500）
+        """
+        if not _HANDLE_PATTERN.match(handle or ""):
+            raise _not_found(handle)
+        path = self.path(handle)
+        try:
+            if os.stat(path).st_mtime + self.ttl < time.time():
+                self._remove(path, "expired")
+                raise _not_found(handle)
+            result = SpilledResult(path)
+        except FileNotFoundError:
+            raise _not_found(handle)
+        except (OSError, ValueError) as e:
+            raise HTTPException(status_code=500, detail=f"读取结果 '{handle}' 失败: {e}")
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return result
+
+    def delete(self, handle: str) -> bool:
+        if not _HANDLE_PATTERN.match(handle or ""):
+            return False
+        return self._remove(self.path(handle), "deleted")
+
+    def _remove(self, path: str, reason: str) -> bool:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        SPILL_EVICTIONS.inc(reason=reason)
+        return True
+
+    def _entries(self) -> List[Tuple[str, float, int]]:
+        """目录中的结果文件与未完成的写入：(路径, 最后访问时间, 大小)"""
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith(SUFFIX) or entry.name.endswith(PARTIAL_SUFFIX):
+                        try:
+                            stat = entry.stat()
+                        except FileNotFoundError:
+                            continue
+                        entries.append((entry.path, stat.st_mtime, stat.st_size))
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def ensure_quota(self, writing_bytes: int):
+        """
+        写入过程中检查容量：总大小超出上限时从最久未访问的结果开始淘汰
+
+        Raises:
+            HTTPException: 单个结果已超过上限，或淘汰全部已完成的结果后仍然不足（507）
+        """
+        if writing_bytes > self.quota_bytes:
+            raise HTTPException(status_code=507, detail=f"查询结果超过结果缓存上限 {self.quota_bytes} 字节")
+        with self._lock:
+            entries = self._entries()
+            used = sum(size for _, _, size in entries)
+            if used <= self.quota_bytes:
+                return
+            for path, _, size in sorted((e for e in entries if e[0].endswith(SUFFIX)), key=lambda e: e[1]):
+                if self._remove(path, "quota"):
+                    used -= size
+                if used <= self.quota_bytes:
+                    return
+        raise HTTPException(status_code=507, detail=f"结果缓存空间不足（上限 {self.quota_bytes} 字节）")
+
+    def cleanup(self, now: Optional[float] = None) -> int:
+        """删除超过 TTL 未访问的结果，以及超过 TTL 仍未完成的写入（进程异常退出遗留），返回删除的文件数"""
+        now = time.time() if now is None else now
+        removed = 0
+        for path, mtime, _ in self._entries():
+            if mtime + self.ttl < now and self._remove(path, "expired"):
+                removed += 1
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        entries = self._entries()
+        return {
+            "results": sum(1 for path, _, _ in entries if path.endswith(SUFFIX)),
+            "writing": sum(1 for path, _, _ in entries if path.endswith(PARTIAL_SUFFIX)),
+            "bytes": sum(size for _, _, size in entries),
+            "quota_bytes": self.quota_bytes,
+            "ttl": self.ttl,
+        }
+
+    def start(self):
+        """启动后台过期清理线程"""
+        if self.cleanup_interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="result-store-cleanup", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.cleanup_interval):
+            try:
+                removed = self.cleanup()
+                if removed:
+                    print(f"[INFO] 已清理过期结果文件 {removed} 个")
+            except Exception as e:
+                print(f"[ERROR] 清理结果文件失败: {e}")
+
+
+_store = ResultStore()
+
+
+def get_result_store() -> ResultStore:
+    return _store
+
+
+REGISTRY.gauge(
+    "tableqa_result_store",
+    "Spilled result files and bytes on disk",
+    ("state",),
+    callback=lambda: {(k,): float(v) for k, v in _store.stats().items() if k in ("results", "writing", "bytes")},
+)
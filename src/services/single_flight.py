@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+相同请求合并（single-flight）
+
+并发到达的相同请求（键相同）只执行一次，其余请求等待同一个结果。
+执行放在独立的 Task 中：发起请求的客户端断开不会取消执行，其他等待者仍能拿到结果。
+只合并同一时刻在途的请求，执行结束后立即移除，不做结果缓存。
+"""
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from ..utils.metrics import REGISTRY, stage
+
+
+def make_key(*parts: Any) -> str:
+    """把请求参数序列化为合并键"""
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """按键合并在途请求（仅在事件循环线程中使用）"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.executed = 0
+        self.coalesced = 0
+        self._inflight: Dict[Hashable, "asyncio.Task"] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        执行 fn 或等待相同键的在途执行
+
+        Returns:
+            (结果, 是否复用了其他请求的执行)
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            SINGLE_FLIGHT_CALLS.inc(kind=self.name, result="coalesced")
+            with stage("coalesced_wait"):
+                return await asyncio.shield(task), True
+
+        self.executed += 1
+        SINGLE_FLIGHT_CALLS.inc(kind=self.name, result="executed")
+        task = asyncio.ensure_future(fn())
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._done(key, t))
+        return await asyncio.shield(task), False
+
+    def _done(self, key: Hashable, task: "asyncio.Task"):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 所有等待者都已取消时，避免出现 "exception was never retrieved" 警告
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        return {"inflight": len(self._inflight), "executed": self.executed, "coalesced": self.coalesced}
+
+
+_flights: Dict[str, SingleFlight] = {}
+
+
+def get_single_flight(name: str) -> SingleFlight:
+    """获取指定类别（如 query / chat）的合并器"""
+    flight = _flights.get(name)
+    if flight is None:
+        flight = _flights[name] = SingleFlight(name)
+    return flight
+
+
+def single_flight_stats() -> Dict[str, Dict[str, int]]:
+    return {name: flight.stats() for name, flight in list(_flights.items())}
+
+
+SINGLE_FLIGHT_CALLS = REGISTRY.counter(
+    "tableqa_single_flight_calls_total",
+    "Requests executed vs coalesced onto an identical in-flight request",
+    ("kind", "result"),
+)
@@ -4,53 +4,79 @@ SQL 相关服务
 """
 import time
 import sqlite3
-import requests
-from typing import List, Dict, Any
+import threading
+from typing import List, Dict, Any, Optional, Set, Tuple
 from fastapi import HTTPException
 
 from ..config import (
-    DB_PATH,
     PROMPT_TEMPLATE_FILE,
     TEMPERATURE,
-    REQUEST_TIMEOUT,
     get_db_config,
     get_model_config,
 )
-from ..utils import validate_sql_readonly
+from ..config.settings import RESULT_PAGE_ROWS, RESULT_SPILL_ROWS
+from ..utils import validate_sql_readonly, extract_sql, fix_table_name
+from ..utils.metrics import stage, current_timer, REGISTRY
+from ..utils.schema_trimmer import fit_schema
+from ..utils.sql_normalizer import normalize_sql
+from ..utils.template_loader import load_template, template_version
+from ..utils.tokens import estimate_tokens
+from .admission import AdmissionRejected
+from .connection_pool import discard_read_connection
+from .llm_client import chat_completion, prompt_token_budget
+from .materialization_service import MaterializedView, get_materialization_manager
+from .query_engine import get_engine_router
+from .result_store import get_result_store
+from .single_flight import make_key
+
+NO_SQL_ERROR = "无法从模型响应中提取SQL语句"
+
+# 指标中按 SQL 指纹分组，种类数超过上限后归入 other，避免标签基数无限增长
+SQL_FINGERPRINT_LABEL_LIMIT = 200
+_fingerprint_labels: Set[str] = set()
+_fingerprint_lock = threading.Lock()
+
+SQL_DURATION = REGISTRY.histogram(
+    "tableqa_sql_duration_seconds", "SQL execution time by fingerprint", ("fingerprint",)
+)
+SQL_ERRORS = REGISTRY.counter("tableqa_sql_errors_total", "Failed SQL executions by fingerprint", ("fingerprint",))
 
 
 def call_model_api(query: str, table_names: List[str] = None, model_name: str = None) -> str:
     """调用大模型接口解析 SQL (同步)"""
-    model_config = get_model_config()
-    db_config = get_db_config()
+    with stage("config_lookup"):
+        model_config = get_model_config()
+        db_config = get_db_config()
 
-    if not model_name:
-        model_name = model_config.get("default_model", "SFT-Qwen3-8B")
+        if not model_name:
+            model_name = model_config.get("default_model", "SFT-Qwen3-8B")
 
-    if model_name not in model_config["models"]:
-        raise HTTPException(status_code=400, detail=f"模型 '{model_name}' 不存在")
+        if model_name not in model_config["models"]:
+            raise HTTPException(status_code=400, detail=f"模型 '{model_name}' 不存在")
 
-    model_info = model_config["models"][model_name]
+        model_info = model_config["models"][model_name]
 
-    if not model_info.get("enabled", True):
-        raise HTTPException(status_code=400, detail=f"模型 '{model_name}' 已禁用")
+        if not model_info.get("enabled", True):
+            raise HTTPException(status_code=400, detail=f"模型 '{model_name}' 已禁用")
 
-    build_statement = ""
-    if table_names and db_config:
-        table_builds = []
-        for table_name in table_names:
-            if table_name in db_config:
-                table_builds.append(f"【{table_name}】\n{db_config[table_name]['build']}")
-        build_statement = "\n\n".join(table_builds)
+    with stage("prompt_build"):
+        tables = []
+        if table_names and db_config:
+            # 按表名排序：同一组表无论请求中的顺序如何，prompt 前缀都相同
+            tables = [(t, db_config[t]["build"]) for t in sorted(set(table_names)) if t in db_config]
 
-    try:
-        with open(PROMPT_TEMPLATE_FILE, encoding="utf-8") as f:
-            prompt = f.read().format(query=query, build=build_statement)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"读取prompt模板失败: {e}")
+        try:
+            template = load_template(PROMPT_TEMPLATE_FILE)
+            # 建表语句可用的 token 数 = prompt 预算 - 模板与问题本身
+            budget = prompt_token_budget(model_info, "nl2sql") - estimate_tokens(template.format(query=query, build=""))
+            build_statement, trimmed = fit_schema(query, tables, budget)
+            prompt = template.format(query=query, build=build_statement)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"读取prompt模板失败: {e}")
+        if trimmed:
+            print(f"[INFO] 建表语句超出模型 {model_name} 的 token 预算，已裁剪：{'；'.join(trimmed)}")
 
     if model_info["type"] == "local":
-        api_url = f"{model_info['url']}/v1/chat/completions"
         headers = {"Content-Type": "application/json"}
         payload = {
             "model": "",
@@ -58,7 +84,6 @@ def call_model_api(query: str, table_names: List[str] = None, model_name: str =
             "temperature": TEMPERATURE,
         }
     else:
-        api_url = f"{model_info['url']}/v1/chat/completions"
         headers = {
             "Content-Type": "application/json",
             "Authorization": model_info["api_key"],
@@ -69,38 +94,158 @@ def call_model_api(query: str, table_names: List[str] = None, model_name: str =
             "temperature": TEMPERATURE,
         }
 
+    return chat_completion(model_name, model_info, payload, headers, kind="nl2sql")
+
+
+def _fingerprint_label(fingerprint_id: str) -> str:
+    """限制指标中的指纹种类，超过上限的归入 other"""
+    with _fingerprint_lock:
+        if fingerprint_id in _fingerprint_labels:
+            return fingerprint_id
+        if len(_fingerprint_labels) < SQL_FINGERPRINT_LABEL_LIMIT:
+            _fingerprint_labels.add(fingerprint_id)
+            return fingerprint_id
+    return "other"
+
+
+def _execute_materialized(materialized: Tuple[str, MaterializedView]):
+    """执行改写为读取汇总表的 SQL，返回 (游标, 所用汇总表)；失败时返回 (None, None)，由调用方执行原 SQL"""
+    rewritten, view = materialized
     try:
-        start = time.time()
-        resp = requests.post(api_url, json=payload, headers=headers, timeout=REQUEST_TIMEOUT)
-        resp.raise_for_status()
-        data = resp.json()
-        latency = time.time() - start
-        print(f"[INFO] 模型 {model_name} 响应耗时: {latency:.2f}s")
-        return data["choices"][0]["message"]["content"]
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"调用模型 {model_name} 失败: {e}")
+        # 汇总表只在业务库中，由 SQLite 执行
+        return get_engine_router().sqlite.execute(rewritten, normalize_sql(rewritten)), view
+    except (sqlite3.Error, OverflowError) as e:
+        print(f"[WARNING] 汇总表 {view.name} 查询失败，改为查询原表: {e}")
+        return None, None
+
 
+def execute_sql(sql: str, spill: bool = False) -> Dict[str, Any]:
+    """
+    执行SQL并返回结果 (同步)
 
-def execute_sql(sql: str) -> Dict[str, Any]:
-    """执行SQL并返回结果 (同步)"""
+    spill 为 True 且结果超过 RESULT_SPILL_ROWS 行时，结果写入结果文件而不在内存中保留：
+    data 只包含前 RESULT_PAGE_ROWS 行，total_rows 为总行数，result_handle 为结果句柄。
+    查询由 SQLite 以外的引擎执行时，结果中带 engine 字段。
+    """
     if not sql:
         raise HTTPException(status_code=400, detail="SQL语句为空")
-    if not validate_sql_readonly(sql):
-        raise HTTPException(status_code=400, detail="SQL语句不是只读操作")
+    with stage("validate_sql"):
+        if not validate_sql_readonly(sql):
+            raise HTTPException(status_code=400, detail="SQL语句不是只读操作")
+        norm = normalize_sql(sql)
 
-    conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)
-    cur = conn.cursor()
+    with stage("mv_rewrite"):
+        materialized = get_materialization_manager().rewrite(sql)
+    router = get_engine_router()
+    with stage("engine_route"):
+        engine = router.sqlite if materialized else router.route(sql)
+
+    cur = None
+    start = time.perf_counter()
     try:
-        cur.execute(sql)
-        if sql.strip().upper().startswith("SELECT"):
-            rows = cur.fetchall()
-            columns = [c[0] for c in cur.description]
-            data = [{columns[i]: row[i] for i in range(len(columns))} for row in rows]
-            return {"data": data, "columns": columns, "total_rows": len(data)}
+        with stage("sql_execute"):
+            view = None
+            if materialized:
+                cur, view = _execute_materialized(materialized)
+            if cur is None:
+                cur, engine = router.execute(engine, sql, norm)
+            is_select = sql.strip().upper().startswith("SELECT")
+            if not is_select:
+                rows = []
+            elif spill:
+                # 最多多读一行，用于判断是否超过落盘阈值
+                rows = cur.fetchmany(RESULT_SPILL_ROWS + 1)
+            else:
+                rows = cur.fetchall()
+        spilled = None
+        if spill and len(rows) > RESULT_SPILL_ROWS:
+            with stage("result_spill"):
+                spilled = get_result_store().spill(cur, rows)
+                rows = rows[:RESULT_PAGE_ROWS]
+        elapsed = time.perf_counter() - start
+        SQL_DURATION.observe(elapsed, fingerprint=_fingerprint_label(norm.fingerprint_id))
+        if view is not None:
+            get_materialization_manager().record_hit(view, elapsed)
+        if is_select:
+            with stage("row_convert"):
+                columns = [c[0] for c in cur.description]
+                data = [{columns[i]: row[i] for i in range(len(columns))} for row in rows]
+            result = {
+                "data": data,
+                "columns": columns,
+                "total_rows": spilled.total_rows if spilled else len(data),
+                "fingerprint": norm.fingerprint,
+                "fingerprint_id": norm.fingerprint_id,
+            }
+            if view is not None:
+                result["materialized"] = view.name
+            if engine is not router.sqlite:
+                result["engine"] = engine.name
+            if spilled is not None:
+                result["result_handle"] = spilled.handle
+            return result
         else:
-            conn.commit()
-            return {"data": [], "columns": [], "total_rows": 0}
+            return {"data": [], "columns": [], "total_rows": 0,
+                    "fingerprint": norm.fingerprint, "fingerprint_id": norm.fingerprint_id}
     except Exception as e:
+        SQL_ERRORS.inc(fingerprint=_fingerprint_label(norm.fingerprint_id))
+        if isinstance(e, sqlite3.DatabaseError) and not isinstance(e, sqlite3.OperationalError):
+            # 数据库文件被替换或损坏时丢弃当前连接，下次重新打开
+            discard_read_connection()
+        if isinstance(e, HTTPException):
+            raise  # 结果落盘失败（如超出结果缓存容量）
         raise HTTPException(status_code=500, detail=f"SQL执行失败: {e}")
     finally:
-        conn.close()
+        if cur is not None:
+            cur.close()
+
+
+def nl2sql_key(query: str, table_names: List[str], model_name: Optional[str] = None, spill: bool = False) -> str:
+    """NL2SQL 请求的合并键：与 prompt 的输入一致（问题、表、模型、模板版本与表结构），以及结果是否落盘"""
+    model_config = get_model_config() or {}
+    db_config = get_db_config() or {}
+    model_name = model_name or model_config.get("default_model", "SFT-Qwen3-8B")
+    tables = sorted(set(table_names or []))
+    builds = [db_config.get(t, {}).get("build") for t in tables]
+    return make_key("nl2sql", query, tables, model_name, template_version(PROMPT_TEMPLATE_FILE), builds, spill)
+
+
+def run_nl2sql(query: str, table_names: List[str], model_name: Optional[str] = None,
+               spill: bool = False) -> Dict[str, Any]:
+    """
+    生成并执行 SQL (同步)
+
+    spill 为 True 时大结果写入结果文件（见 execute_sql），result 中带 result_handle
+
+    Returns:
+        model_response / sql / result / type / error / usage：
+        type 与查询日志一致（0 未提取到 SQL，1 SQL 执行失败，2 结果为空，3 有结果），
+        失败时 result 为 None、error 为错误信息；usage 为模型调用的 token 数
+
+    Raises:
+        AdmissionRejected: 模型排队已满、排队超时或熔断中
+    """
+    outcome = {"model_response": "", "sql": "", "result": None, "type": 0, "error": None, "usage": {}}
+    try:
+        outcome["model_response"] = model_response = call_model_api(query, table_names, model_name)
+        timer = current_timer()
+        if timer is not None:
+            outcome["usage"] = dict(timer.usage)
+        print(f"[INFO] 模型请求成功 {model_response}")
+        with stage("extract_sql"):
+            sql = extract_sql(model_response)
+        print(f"[INFO] 提取SQL成功 {sql}")
+        if sql == model_response.strip():
+            outcome["error"] = NO_SQL_ERROR
+            return outcome
+
+        outcome["sql"] = sql = fix_table_name(sql, table_names)
+        result = execute_sql(sql, spill=spill)
+        outcome["result"] = result
+        outcome["type"] = 3 if result.get("total_rows", 0) > 0 else 2
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        outcome["type"] = 1 if outcome["sql"] else 0
+        outcome["error"] = str(e.detail) if isinstance(e, HTTPException) else str(e)
+    return outcome
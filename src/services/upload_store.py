@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+上传文件存储
+
+上传的 Excel 边接收边计算 SHA-256 并写入临时文件（每块 UPLOAD_CHUNK_BYTES），完成后以
+<哈希><扩展名> 保存在 UPLOAD_DIR 中：同一份文件无论上传多少次、原文件名是什么，都只保存一份，
+重复上传时直接返回已有文件。超过 UPLOAD_MAX_BYTES 的上传在接收过程中中止（413），不会先落盘再检查。
+
+文件的修改时间记录最后一次上传或导入的时间：超过 UPLOAD_TTL 未使用的文件在下次上传时删除，
+目录总大小超过 UPLOAD_QUOTA_BYTES 时从最久未使用的文件开始删除。只淘汰存储自己写入的文件
+（<哈希><扩展名> 与未完成上传的临时文件），旧版本以时间戳命名的文件与手动放入的文件不会被删除。
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from ..config.settings import UPLOAD_DIR, UPLOAD_MAX_BYTES, UPLOAD_QUOTA_BYTES, UPLOAD_TTL
+from ..utils.metrics import REGISTRY
+
+EXCEL_EXTENSIONS = (".xlsx", ".xls")
+PARTIAL_SUFFIX = ".part"
+_STORED_PATTERN = re.compile(r"^([0-9a-f]{64})\.(xlsx|xls)$")
+
+UPLOADS = REGISTRY.counter("tableqa_uploads_total", "Excel uploads by outcome (stored, duplicate, rejected)", ("outcome",))
+UPLOAD_EVICTIONS = REGISTRY.counter("tableqa_upload_evictions_total", "Uploaded files removed", ("reason",))
+
+
+class StoredUpload(NamedTuple):
+    path: str
+    sha256: str
+    size: int
+    duplicate: bool  # 相同内容的文件已存在，本次未写入新文件
+
+
+def _write_chunk(file, hasher, chunk: bytes):
+    hasher.update(chunk)
+    file.write(chunk)
+
+
+def file_sha256(path: str, chunk_bytes: int = 1024 * 1024) -> str:
+    """
+    文件内容的 SHA-256
+
+    Raises:
+        FileNotFoundError: 文件不存在
+    """
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_bytes), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class UploadStore:
+    """按内容哈希保存上传文件，并按保留时间与总大小淘汰"""
+
+    def __init__(self, directory: str = UPLOAD_DIR, max_bytes: int = UPLOAD_MAX_BYTES,
+                 quota_bytes: int = UPLOAD_QUOTA_BYTES, ttl: float = UPLOAD_TTL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.quota_bytes = quota_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    def path(self, sha256: str, extension: str) -> str:
+        return os.path.join(self.directory, sha256 + extension)
+
+    def _in_directory(self, path: str) -> bool:
+        """文件（解析符号链接后）是否直接位于存储目录中"""
+        return os.path.dirname(os.path.realpath(path)) == os.path.realpath(self.directory)
+
+    @staticmethod
+    def _owned(name: str) -> bool:
+        """文件名是否为存储自己写入的文件：<哈希><扩展名> 或未完成上传的临时文件"""
+        return bool(_STORED_PATTERN.match(name)) or name.endswith(PARTIAL_SUFFIX)
+
+    def sha256(self, path: str) -> str:
+        """
+        文件内容的 SHA-256；存储目录中按哈希命名的文件直接取文件名中的哈希，其他文件读取内容计算
+
+        Raises:
+            FileNotFoundError: 文件不存在
+        """
+        real = os.path.realpath(path)
+        match = _STORED_PATTERN.match(os.path.basename(real))
+        if match and self._in_directory(real) and os.path.exists(real):
+            return match.group(1)
+        return file_sha256(path)
+
+    @staticmethod
+    def extension(filename: Optional[str]) -> str:
+        """
+        校验文件名并返回扩展名（小写）
+
+        Raises:
+            HTTPException: 不是 .xlsx / .xls 文件（400）
+        """
+        extension = os.path.splitext(filename or "")[1].lower()
+        if extension not in EXCEL_EXTENSIONS:
+            UPLOADS.inc(outcome="rejected")
+            raise HTTPException(status_code=400, detail="仅支持 .xlsx 或 .xls 文件")
+        return extension
+
+    def too_large(self) -> HTTPException:
+        UPLOADS.inc(outcome="rejected")
+        return HTTPException(status_code=413, detail=f"文件超过上传大小上限 {self.max_bytes} 字节")
+
+    async def save(self, chunks: AsyncIterator[bytes], filename: Optional[str]) -> StoredUpload:
+        """
+        边接收边计算哈希并写入临时文件，完成后按哈希保存；相同内容的文件已存在时删除临时文件
+
+        Raises:
+            HTTPException: 文件类型不支持（400）、超过大小上限（413）
+        """
+        extension = self.extension(filename)
+        os.makedirs(self.directory, exist_ok=True)
+        partial = os.path.join(self.directory, uuid.uuid4().hex + PARTIAL_SUFFIX)
+        hasher = hashlib.sha256()
+        size = 0
+        file = await run_in_threadpool(open, partial, "wb")
+        try:
+            async for chunk in chunks:
+                if not chunk:
+                    continue
+                size += len(chunk)
+                if size > self.max_bytes:
+                    raise self.too_large()
+                await run_in_threadpool(_write_chunk, file, hasher, chunk)
+            await run_in_threadpool(file.close)
+        except BaseException:
+            file.close()
+            self._remove(partial, None)
+            raise
+        return await run_in_threadpool(self._commit, partial, hasher.hexdigest(), extension, size)
+
+    def _commit(self, partial: str, sha256: str, extension: str, size: int) -> StoredUpload:
+        path = self.path(sha256, extension)
+        with self._lock:
+            if os.path.exists(path):
+                os.remove(partial)
+                self.touch(path)
+                UPLOADS.inc(outcome="duplicate")
+                print(f"[INFO] 上传文件与已有文件内容相同: {path}")
+                return StoredUpload(path, sha256, size, True)
+            os.replace(partial, path)
+        UPLOADS.inc(outcome="stored")
+        self.evict(keep=path)
+        return StoredUpload(path, sha256, size, False)
+
+    def touch(self, path: str):
+        """记录文件被使用（上传或导入），淘汰时按最后使用时间排序"""
+        if not self._in_directory(path) or not self._owned(os.path.basename(os.path.realpath(path))):
+            return
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    # ---------- 淘汰 ----------
+    def _remove(self, path: str, reason: Optional[str]) -> bool:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        if reason:
+            UPLOAD_EVICTIONS.inc(reason=reason)
+            print(f"[INFO] 已删除上传文件 {path}（{reason}）")
+        return True
+
+    def _entries(self) -> List[Tuple[str, float, int]]:
+        """存储自己写入的文件与未完成的上传：(路径, 最后使用时间, 大小)；其他文件不参与统计与淘汰"""
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if not entry.is_file(follow_symlinks=False) or not self._owned(entry.name):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((entry.path, stat.st_mtime, stat.st_size))
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def evict(self, keep: Optional[str] = None, now: Optional[float] = None) -> int:
+        """删除超过保留时间的文件（含异常中断遗留的临时文件），再按总大小从最久未使用的开始删除；返回删除的文件数"""
+        now = time.time() if now is None else now
+        removed = 0
+        with self._lock:
+            entries = []
+            for path, mtime, size in self._entries():
+                if path != keep and mtime + self.ttl < now:
+                    removed += self._remove(path, "expired")
+                else:
+                    entries.append((path, mtime, size))
+            used = sum(size for _, _, size in entries)
+            for path, _, size in sorted(entries, key=lambda e: e[1]):
+                if used <= self.quota_bytes:
+                    break
+                if path == keep or path.endswith(PARTIAL_SUFFIX):
+                    continue
+                if self._remove(path, "quota"):
+                    removed += 1
+                    used -= size
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        entries = self._entries()
+        return {
+            "files": sum(1 for path, _, _ in entries if not path.endswith(PARTIAL_SUFFIX)),
+            "uploading": sum(1 for path, _, _ in entries if path.endswith(PARTIAL_SUFFIX)),
+            "bytes": sum(size for _, _, size in entries),
+            "max_bytes": self.max_bytes,
+            "quota_bytes": self.quota_bytes,
+            "ttl": self.ttl,
+        }
+
+
+_store = UploadStore()
+
+
+def get_upload_store() -> UploadStore:
+    """获取全局上传文件存储"""
+    return _store
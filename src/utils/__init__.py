@@ -1,11 +1,14 @@
 # -*- coding: utf-8 -*-
 from .sql_validator import validate_sql_readonly
 from .sql_parser import extract_sql, fix_table_name
-from .logger import save_query_log
+from .sql_normalizer import normalize_sql
+from .logger import save_query_log, get_query_log_writer
 
 __all__ = [
     "validate_sql_readonly",
     "extract_sql",
     "fix_table_name",
+    "normalize_sql",
     "save_query_log",
+    "get_query_log_writer",
 ]
@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+"""
+单表聚合查询的解析与改写
+
+只处理如下形式的查询（基于 sql_lexer 的 token 流解析）：
+
+    SELECT ... FROM 表 [别名] [WHERE ...] [GROUP BY 列, ...] [HAVING ...] [ORDER BY ...] [LIMIT ...]
+
+聚合函数限于 COUNT / SUM / AVG / MIN / MAX / TOTAL，参数只能是 * 或单个列；
+含 JOIN、子查询、DISTINCT、窗口函数、UNION、CTE 的查询一律不处理。
+
+解析结果用于：
+- 从查询日志中挖掘汇总表：维度 = GROUP BY 列 + WHERE 中引用的列，度量 = 聚合函数的参数列
+- 把查询改写为读取汇总表：汇总表按维度分组，保存 COUNT(*) 与各度量列的 SUM / COUNT / MIN / MAX，
+  在汇总表上再聚合一次即得到与原查询相同的结果（AVG 由 SUM / COUNT 计算）
+"""
+import functools
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from .sql_lexer import ERROR, FENCE, IDENT, KEYWORD, OP, PARAM, PUNCT, QUOTED_IDENT, Token, tokenize, unquote_identifier
+
+AGGREGATES = frozenset(["COUNT", "SUM", "AVG", "MIN", "MAX", "TOTAL"])
+# 无法由汇总表还原的聚合函数
+_UNSUPPORTED_AGGREGATES = frozenset(["GROUP_CONCAT", "STRING_AGG", "JSON_GROUP_ARRAY", "JSON_GROUP_OBJECT"])
+_REJECT_KEYWORDS = frozenset([
+    "JOIN", "UNION", "INTERSECT", "EXCEPT", "WITH", "RECURSIVE", "DISTINCT", "OVER", "WINDOW", "FILTER",
+    "EXISTS", "NATURAL", "USING", "ON", "COLLATE",
+])
+_CLAUSE_ORDER = ("FROM", "WHERE", "GROUP", "HAVING", "ORDER", "LIMIT")
+
+COUNT_COLUMN = "__cnt"
+
+
+class AggregateCall(NamedTuple):
+    func: str
+    column: Optional[str]  # None 表示 COUNT(*)
+    start: int
+    end: int
+
+
+class ColumnRef(NamedTuple):
+    name: str
+    clause: str  # SELECT / WHERE / GROUP / HAVING / ORDER
+    in_aggregate: bool
+
+
+class SelectItem(NamedTuple):
+    start: int
+    end: int
+    alias: Optional[str]
+
+
+class AggregateQuery(NamedTuple):
+    sql: str
+    table: str
+    table_start: int
+    table_end: int
+    alias: Optional[str]
+    group_by: Tuple[str, ...]
+    aggregates: Tuple[AggregateCall, ...]
+    refs: Tuple[ColumnRef, ...]
+    items: Tuple[SelectItem, ...]
+
+    @property
+    def dimensions(self) -> Tuple[str, ...]:
+        """汇总表需要的维度：GROUP BY 列与 WHERE 中引用的列"""
+        names = list(self.group_by) + [r.name for r in self.refs if r.clause == "WHERE"]
+        return _unique(names)
+
+    @property
+    def measures(self) -> Tuple[str, ...]:
+        return _unique(a.column for a in self.aggregates if a.column is not None)
+
+
+def _unique(names: Iterable[str]) -> Tuple[str, ...]:
+    seen = {}
+    for name in names:
+        seen.setdefault(name.lower(), name)
+    return tuple(seen.values())
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def measure_columns(measure: str) -> Dict[str, str]:
+    """度量列在汇总表中对应的列名"""
+    return {kind: f"__{kind}__{measure}" for kind in ("sum", "cnt", "min", "max")}
+
+
+def _is_name(token: Token) -> bool:
+    return token.kind == IDENT or token.kind == QUOTED_IDENT
+
+
+def _is_punct(token: Token, text: str) -> bool:
+    return token.kind == PUNCT and token.text == text
+
+
+def _split_commas(tokens: Sequence[Token]) -> List[List[Token]]:
+    parts, current, depth = [], [], 0
+    for t in tokens:
+        if _is_punct(t, "("):
+            depth += 1
+        elif _is_punct(t, ")"):
+            depth -= 1
+        elif depth == 0 and _is_punct(t, ","):
+            parts.append(current)
+            current = []
+            continue
+        current.append(t)
+    parts.append(current)
+    return parts
+
+
+class _Reject(Exception):
+    pass
+
+
+class _Parser:
+    def __init__(self, sql: str, tokens: List[Token]):
+        self.sql = sql
+        self.tokens = tokens
+        self.qualifiers = set()
+        self.aggregates: List[AggregateCall] = []
+        self.refs: List[ColumnRef] = []
+
+    def _column(self, tokens: Sequence[Token], i: int) -> Tuple[str, int]:
+        """解析 列 或 限定名.列，返回列名与下一个位置"""
+        if i + 1 < len(tokens) and _is_punct(tokens[i + 1], "."):
+            if i + 2 >= len(tokens) or not _is_name(tokens[i + 2]):
+                raise _Reject()
+            if unquote_identifier(tokens[i]).lower() not in self.qualifiers:
+                raise _Reject()
+            return unquote_identifier(tokens[i + 2]), i + 3
+        return unquote_identifier(tokens[i]), i + 1
+
+    def scan(self, tokens: Sequence[Token], clause: str):
+        """在表达式中找出聚合函数调用与列引用"""
+        i = 0
+        while i < len(tokens):
+            t = tokens[i]
+            followed_by_paren = i + 1 < len(tokens) and _is_punct(tokens[i + 1], "(")
+            if t.kind in (IDENT, KEYWORD) and followed_by_paren:
+                func = t.upper
+                if func in _UNSUPPORTED_AGGREGATES:
+                    raise _Reject()
+                if func not in AGGREGATES:
+                    i += 1  # 标量函数：参数按普通表达式处理
+                    continue
+                if clause in ("WHERE", "GROUP"):
+                    raise _Reject()
+                close = self._matching_paren(tokens, i + 1)
+                inner = tokens[i + 2:close]
+                if func == "COUNT" and len(inner) == 1 and inner[0].kind == OP and inner[0].text == "*":
+                    column = None
+                elif inner and _is_name(inner[0]):
+                    column, end = self._column(inner, 0)
+                    if end != len(inner):
+                        raise _Reject()
+                else:
+                    raise _Reject()
+                close_token = tokens[close]
+                self.aggregates.append(AggregateCall(func, column, t.pos, close_token.pos + 1))
+                if column is not None:
+                    self.refs.append(ColumnRef(column, clause, True))
+                i = close + 1
+                continue
+            if _is_name(t):
+                column, i = self._column(tokens, i)
+                self.refs.append(ColumnRef(column, clause, False))
+                continue
+            if t.kind == KEYWORD and t.upper == "AS" and clause != "SELECT":
+                raise _Reject()  # CAST(... AS 类型) 等
+            i += 1
+
+    @staticmethod
+    def _matching_paren(tokens: Sequence[Token], open_index: int) -> int:
+        depth = 0
+        for j in range(open_index, len(tokens)):
+            if _is_punct(tokens[j], "("):
+                depth += 1
+            elif _is_punct(tokens[j], ")"):
+                depth -= 1
+                if depth == 0:
+                    return j
+        raise _Reject()
+
+    def parse(self) -> AggregateQuery:
+        tokens = self.tokens
+        if not tokens or tokens[0].kind != KEYWORD or tokens[0].upper != "SELECT":
+            raise _Reject()
+
+        # 顶层子句的起止位置
+        clauses: Dict[str, int] = {}
+        order: List[str] = []
+        depth = 0
+        for i, t in enumerate(tokens):
+            if t.kind in (ERROR, PARAM, FENCE) or _is_punct(t, ";"):
+                raise _Reject()
+            if t.kind == KEYWORD and (t.upper in _REJECT_KEYWORDS or (t.upper == "SELECT" and i > 0)):
+                raise _Reject()
+            if _is_punct(t, "("):
+                depth += 1
+            elif _is_punct(t, ")"):
+                depth -= 1
+                if depth < 0:
+                    raise _Reject()
+            elif depth == 0 and t.kind == KEYWORD and t.upper in _CLAUSE_ORDER:
+                name = t.upper
+                start = i + 1
+                if name in ("GROUP", "ORDER"):
+                    if i + 1 >= len(tokens) or tokens[i + 1].upper != "BY":
+                        raise _Reject()
+                    start = i + 2
+                if name in clauses:
+                    raise _Reject()
+                clauses[name] = start
+                order.append(name)
+        if depth != 0 or "FROM" not in clauses:
+            raise _Reject()
+        if order != sorted(order, key=_CLAUSE_ORDER.index):
+            raise _Reject()
+
+        def body(name: str) -> List[Token]:
+            if name not in clauses:
+                return []
+            idx = order.index(name)
+            end = len(tokens)
+            if idx + 1 < len(order):
+                nxt = order[idx + 1]
+                end = clauses[nxt] - (2 if nxt in ("GROUP", "ORDER") else 1)
+            return tokens[clauses[name]:end]
+
+        # FROM 表 [AS] [别名]
+        source = body("FROM")
+        if not source or not _is_name(source[0]):
+            raise _Reject()
+        table_token = source[0]
+        alias = None
+        if len(source) == 2 and _is_name(source[1]):
+            alias = unquote_identifier(source[1])
+        elif len(source) == 3 and source[1].upper == "AS" and _is_name(source[2]):
+            alias = unquote_identifier(source[2])
+        elif len(source) != 1:
+            raise _Reject()
+        table = unquote_identifier(table_token)
+        self.qualifiers = {table.lower()} | ({alias.lower()} if alias else set())
+
+        # SELECT 列表
+        items = []
+        for part in _split_commas(tokens[1:clauses["FROM"] - 1]):
+            if not part:
+                raise _Reject()
+            item_alias = None
+            expr = part
+            if len(part) >= 3 and part[-2].upper == "AS" and _is_name(part[-1]):
+                item_alias, expr = unquote_identifier(part[-1]), part[:-2]
+            elif len(part) >= 2 and _is_name(part[-1]) and (
+                _is_punct(part[-2], ")") or _is_name(part[-2]) or part[-2].upper == "END"
+            ):
+                item_alias, expr = unquote_identifier(part[-1]), part[:-1]
+            if len(expr) == 1 and expr[0].kind == OP and expr[0].text == "*":
+                raise _Reject()
+            self.scan(expr, "SELECT")
+            items.append(SelectItem(expr[0].pos, expr[-1].pos + len(expr[-1].text), item_alias))
+
+        self.scan(body("WHERE"), "WHERE")
+
+        group_by = []
+        if "GROUP" in clauses:
+            for part in _split_commas(body("GROUP")):
+                if not part or not _is_name(part[0]):
+                    raise _Reject()
+                column, end = self._column(part, 0)
+                if end != len(part):
+                    raise _Reject()
+                group_by.append(column)
+                self.refs.append(ColumnRef(column, "GROUP", False))
+
+        self.scan(body("HAVING"), "HAVING")
+        self.scan(body("ORDER"), "ORDER")
+        if any(_is_name(t) for t in body("LIMIT")):
+            raise _Reject()
+        if not self.aggregates and not group_by:
+            raise _Reject()
+
+        return AggregateQuery(
+            sql=self.sql,
+            table=table,
+            table_start=table_token.pos,
+            table_end=table_token.pos + len(table_token.text),
+            alias=alias,
+            group_by=tuple(group_by),
+            aggregates=tuple(self.aggregates),
+            refs=tuple(self.refs),
+            items=tuple(items),
+        )
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_aggregate(sql: str) -> Optional[AggregateQuery]:
+    """解析单表聚合查询；不是可处理的形式时返回 None"""
+    if not sql:
+        return None
+    text = sql.strip().rstrip(";").rstrip()
+    try:
+        return _Parser(text, tokenize(text)).parse()
+    except _Reject:
+        return None
+
+
+def covers(query: AggregateQuery, dimensions: Iterable[str], measures: Iterable[str],
+           base_columns: Iterable[str]) -> bool:
+    """汇总表（dimensions / measures）能否还原该查询的结果"""
+    dims = {d.lower() for d in dimensions}
+    meas = {m.lower() for m in measures}
+    base = {c.lower() for c in base_columns}
+    group = {g.lower() for g in query.group_by}
+    aliases = {item.alias.lower() for item in query.items if item.alias}
+    if not group <= dims:
+        return False
+    for ref in query.refs:
+        key = ref.name.lower()
+        if ref.in_aggregate:
+            if key not in meas:
+                return False
+        elif ref.clause in ("WHERE", "GROUP"):
+            if key not in dims:
+                return False
+        elif key in base:
+            # 非聚合的列引用必须是分组列，否则 SQLite 取任意一行的值，无法还原
+            if key not in group:
+                return False
+        elif not (key in aliases and ref.clause in ("HAVING", "ORDER")):
+            return False
+    return True
+
+
+def _view_expression(call: AggregateCall, measure_names: Dict[str, str]) -> str:
+    if call.column is None:
+        return f"COALESCE(SUM({quote_identifier(COUNT_COLUMN)}), 0)"
+    cols = {k: quote_identifier(v) for k, v in measure_columns(measure_names[call.column.lower()]).items()}
+    if call.func == "COUNT":
+        return f"COALESCE(SUM({cols['cnt']}), 0)"
+    if call.func in ("SUM", "TOTAL"):
+        return f"{call.func}({cols['sum']})"
+    if call.func == "AVG":
+        return f"(SUM({cols['sum']}) * 1.0 / SUM({cols['cnt']}))"
+    return f"{call.func}({cols[call.func.lower()]})"
+
+
+def rewrite_aggregate(query: AggregateQuery, view_table: str, measures: Iterable[str]) -> str:
+    """
+    把查询改写为读取汇总表（调用前需用 covers 确认汇总表可以还原结果）
+
+    没有别名的聚合列补上与原查询相同的列名，结果的列名与原查询一致。
+    """
+    measure_names = {m.lower(): m for m in measures}
+    sql = query.sql
+    edits: List[Tuple[int, int, str]] = []
+    source = quote_identifier(view_table)
+    if query.alias is None:
+        source += " AS " + sql[query.table_start:query.table_end]
+    edits.append((query.table_start, query.table_end, source))
+    for call in query.aggregates:
+        edits.append((call.start, call.end, _view_expression(call, measure_names)))
+    for item in query.items:
+        if item.alias is None and any(item.start <= c.start < item.end for c in query.aggregates):
+            edits.append((item.end, item.end, " AS " + quote_identifier(sql[item.start:item.end])))
+
+    pieces = []
+    last = 0
+    for start, end, text in sorted(edits, key=lambda e: (e[0], e[1])):
+        pieces.append(sql[last:start])
+        pieces.append(text)
+        last = end
+    pieces.append(sql[last:])
+    return "".join(pieces)
+
+
+def build_view_sql(base_table: str, view_table: str, dimensions: Sequence[str], measures: Sequence[str]) -> str:
+    """创建汇总表的 SQL：按维度分组，保存行数与各度量列的 SUM / COUNT / MIN / MAX"""
+    columns = [quote_identifier(d) for d in dimensions]
+    columns.append(f"COUNT(*) AS {quote_identifier(COUNT_COLUMN)}")
+    for measure in measures:
+        cols = measure_columns(measure)
+        src = quote_identifier(measure)
+        columns.append(f"SUM({src}) AS {quote_identifier(cols['sum'])}")
+        columns.append(f"COUNT({src}) AS {quote_identifier(cols['cnt'])}")
+        columns.append(f"MIN({src}) AS {quote_identifier(cols['min'])}")
+        columns.append(f"MAX({src}) AS {quote_identifier(cols['max'])}")
+    sql = f"CREATE TABLE {quote_identifier(view_table)} AS SELECT {', '.join(columns)} FROM {quote_identifier(base_table)}"
+    if dimensions:
+        sql += " GROUP BY " + ", ".join(quote_identifier(d) for d in dimensions)
+    return sql
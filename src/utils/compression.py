@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+响应压缩
+
+按请求的 Accept-Encoding 协商 br（安装了 brotli 时）或 gzip，只压缩超过 RESPONSE_COMPRESS_MIN_BYTES 的
+文本类响应，较大的响应体在线程池中压缩。流式响应（如 NDJSON）逐条发送，不做缓冲与压缩，避免推迟首条结果。
+"""
+import gzip
+from typing import List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from ..config.settings import (
+    RESPONSE_BROTLI_QUALITY,
+    RESPONSE_COMPRESS_MIN_BYTES,
+    RESPONSE_COMPRESS_THREAD_BYTES,
+    RESPONSE_GZIP_LEVEL,
+)
+from .metrics import stage, REGISTRY
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript")
+
+COMPRESSED_BYTES = REGISTRY.counter(
+    "tableqa_response_bytes_total", "Response body bytes before (raw) and after (sent) compression", ("kind",)
+)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """从 Accept-Encoding 中选出服务端支持且 q 值最高的编码（相同时优先 br）"""
+    best, best_q = None, 0.0
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name == "*":
+            candidates = ["br", "gzip"]
+        else:
+            candidates = [name]
+        for candidate in candidates:
+            if candidate not in ("br", "gzip") or (candidate == "br" and brotli is None):
+                continue
+            if q > best_q or (q == best_q and q > 0 and candidate == "br"):
+                best, best_q = candidate, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL)
+
+
+def add_vary(headers: List[Tuple[bytes, bytes]], field: bytes = b"Accept-Encoding") -> List[Tuple[bytes, bytes]]:
+    """在 Vary 中加入 field：已有 Vary（如 CORS 的 Origin）时追加到原值之后，不重复添加"""
+    result = []
+    merged = False
+    for key, value in headers:
+        if key.lower() == b"vary" and not merged:
+            fields = [f.strip().lower() for f in value.split(b",")]
+            if field.lower() not in fields and b"*" not in fields:
+                value = value + b", " + field
+            merged = True
+        result.append((key, value))
+    if not merged:
+        result.append((b"vary", field))
+    return result
+
+
+class CompressionMiddleware:
+    """ASGI 中间件：压缩一次性发送的较大响应体"""
+
+    def __init__(self, app, minimum_size: int = RESPONSE_COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept = ""
+        for key, value in scope.get("headers", []):
+            if key == b"accept-encoding":
+                accept = value.decode("latin-1")
+                break
+        encoding = choose_encoding(accept) if accept else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            headers: List[Tuple[bytes, bytes]] = list(start_message.get("headers", []))
+            if message.get("more_body", False) or not self._should_compress(headers, body):
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            with stage("compress"):
+                if len(body) >= RESPONSE_COMPRESS_THREAD_BYTES:
+                    compressed = await run_in_threadpool(compress, body, encoding)
+                else:
+                    compressed = compress(body, encoding)
+            COMPRESSED_BYTES.inc(len(body), kind="raw")
+            COMPRESSED_BYTES.inc(len(compressed), kind="sent")
+            headers = [(k, v) for k, v in headers if k.lower() != b"content-length"]
+            headers.append((b"content-encoding", encoding.encode("ascii")))
+            headers.append((b"content-length", str(len(compressed)).encode("ascii")))
+            headers = add_vary(headers)
+            await send({**start_message, "headers": headers})
+            await send({"type": "http.response.body", "body": compressed, "more_body": False})
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _should_compress(self, headers: List[Tuple[bytes, bytes]], body: bytes) -> bool:
+        if len(body) < self.minimum_size:
+            return False
+        content_type = b""
+        for key, value in headers:
+            name = key.lower()
+            if name == b"content-encoding":
+                return False
+            if name == b"content-type":
+                content_type = value
+        return content_type.decode("latin-1").lower().startswith(COMPRESSIBLE_TYPES)
@@ -2,13 +2,20 @@
 """
 Excel 导入工具模块
 提供 Excel 文件导入到 SQLite 数据库的功能
+
+pandas（以及读取 .xlsx 用到的 openpyxl）较重，只在实际导入、扫描时才加载，不拖慢服务启动。
 """
-import pandas as pd
 import sqlite3
 import os
 import json
 import random
-from typing import Dict, Any
+from typing import TYPE_CHECKING, Any, Dict, List, NamedTuple, Optional
+
+from ..config.settings import MV_TABLE_PREFIX, SCHEMA_SAMPLE_ROWS, SCHEMA_SAMPLE_SEED
+from .table_sampler import analyze_table, ensure_stats, sample_rows
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 
 def normalize_column_name(col_name: str) -> str:
@@ -39,7 +46,7 @@ def normalize_column_name(col_name: str) -> str:
     return name
 
 
-def get_sqlite_type_from_series(series: pd.Series) -> str:
+def get_sqlite_type_from_series(series: "pd.Series") -> str:
     """
     根据 pandas Series 推断 SQLite 数据类型
 
@@ -62,13 +69,17 @@ def get_sqlite_type_from_series(series: pd.Series) -> str:
         return "TEXT"
 
 
-def generate_create_table_with_comments(df: pd.DataFrame, table_name: str) -> str:
+def generate_create_table_with_comments(df: "pd.DataFrame", table_name: str, seed: int = SCHEMA_SAMPLE_SEED) -> str:
     """
     根据 DataFrame 生成带注释的 CREATE TABLE 语句
 
+    样例值按 (seed, 表名, 列名) 固定抽取：数据不变时重新扫描得到的建表语句逐字节相同，
+    便于模型服务端的前缀缓存命中。
+
     Args:
         df: pandas DataFrame
         table_name: 表名
+        seed: 样例值抽取的随机种子
 
     Returns:
         CREATE TABLE SQL 语句
@@ -80,7 +91,8 @@ def generate_create_table_with_comments(df: pd.DataFrame, table_name: str) -> st
         example_value = ""
 
         if not non_nulls.empty:
-            example_value = str(random.choice(non_nulls.values))
+            rng = random.Random(f"{seed}:{table_name}:{col}")
+            example_value = str(rng.choice(non_nulls.values))
             example_value = example_value.replace("\n", " ").replace("'", "'").replace('"', '"')
 
         # 截断过长的样例值
@@ -93,6 +105,50 @@ def generate_create_table_with_comments(df: pd.DataFrame, table_name: str) -> st
     return f"CREATE TABLE {table_name} ({', '.join(fields)});"
 
 
+class ExcelFrame(NamedTuple):
+    """读取并标准化列名后的 Sheet"""
+    df: "pd.DataFrame"
+    original_columns: List[str]
+
+
+def read_excel_frame(excel_path: str, sheet_name: str) -> ExcelFrame:
+    """
+    读取 Excel 的一个 Sheet 并标准化列名（不访问数据库）
+
+    Raises:
+        FileNotFoundError: Excel 文件不存在
+    """
+    if not os.path.exists(excel_path):
+        raise FileNotFoundError(f"Excel 文件不存在: {excel_path}")
+
+    import pandas as pd
+
+    df = pd.read_excel(excel_path, sheet_name=sheet_name)
+    original_columns = df.columns.tolist()
+    df.columns = [normalize_column_name(c) for c in df.columns]
+    return ExcelFrame(df, original_columns)
+
+
+def write_excel_frame(conn: sqlite3.Connection, frame: ExcelFrame, table_name: str, if_exists: str = "replace"):
+    """把读取的 Sheet 写入数据库表（需要可写连接）"""
+    frame.df.to_sql(table_name, conn, if_exists=if_exists, index=False)
+    # 刷新 sqlite_stat1，预览与抽样据此估计行数，不必 COUNT(*)
+    analyze_table(conn, table_name)
+
+
+def excel_import_result(frame: ExcelFrame, table_name: str) -> Dict[str, Any]:
+    """导入结果：行列数、原始与标准化后的列名以及建表语句"""
+    df = frame.df
+    return {
+        "table_name": table_name,
+        "row_count": len(df),
+        "column_count": len(df.columns),
+        "original_columns": frame.original_columns,
+        "normalized_columns": df.columns.tolist(),
+        "create_statement": generate_create_table_with_comments(df, table_name)
+    }
+
+
 def inject_excel_to_db(
     excel_path: str,
     sheet_name: str,
@@ -103,6 +159,8 @@ def inject_excel_to_db(
     """
     将 Excel 文件导入 SQLite 数据库
 
+    直接打开 db_path 写入；服务中的导入经由数据库写线程执行（见 services.db_writer）。
+
     Args:
         excel_path: Excel 文件路径
         sheet_name: Sheet 名称
@@ -117,43 +175,22 @@ def inject_excel_to_db(
         FileNotFoundError: Excel 文件不存在
         Exception: 导入过程中的其他错误
     """
-    if not os.path.exists(excel_path):
-        raise FileNotFoundError(f"Excel 文件不存在: {excel_path}")
-
-    # 读取 Excel
-    df = pd.read_excel(excel_path, sheet_name=sheet_name)
-    original_columns = df.columns.tolist()
-
-    # 标准化列名
-    df.columns = [normalize_column_name(c) for c in df.columns]
-    normalized_columns = df.columns.tolist()
+    frame = read_excel_frame(excel_path, sheet_name)
 
-    # 连接数据库并导入
     conn = sqlite3.connect(db_path)
     try:
-        df.to_sql(table_name, conn, if_exists=if_exists, index=False)
-        row_count = len(df)
-        col_count = len(df.columns)
+        write_excel_frame(conn, frame, table_name, if_exists)
     finally:
         conn.close()
 
-    # 生成建表语句
-    create_statement = generate_create_table_with_comments(df, table_name)
-
-    return {
-        "table_name": table_name,
-        "row_count": row_count,
-        "column_count": col_count,
-        "original_columns": original_columns,
-        "normalized_columns": normalized_columns,
-        "create_statement": create_statement
-    }
+    return excel_import_result(frame, table_name)
 
 
 def update_db_config(
     db_path: str,
     output_path: str,
-    mode: str = "add"
+    mode: str = "add",
+    conn: Optional[sqlite3.Connection] = None
 ) -> Dict[str, Any]:
     """
     扫描数据库结构并输出到 JSON 文件
@@ -162,6 +199,7 @@ def update_db_config(
         db_path: 数据库路径
         output_path: 输出 JSON 文件路径
         mode: 更新模式 ("add": 仅新增, "replace": 完全替换)
+        conn: 可写连接（在数据库写线程中执行时传入），不指定时打开 db_path
 
     Returns:
         数据库配置字典
@@ -181,13 +219,24 @@ def update_db_config(
         except Exception as e:
             print(f"⚠️ 读取旧配置失败，将重新生成: {e}")
 
+    import pandas as pd
+
     # 连接数据库
-    conn = sqlite3.connect(db_path)
+    own_conn = conn is None
+    if own_conn:
+        conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
     # 获取所有表名
     cursor.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name;")
-    tables = [t[0] for t in cursor.fetchall() if not t[0].startswith("sqlite_")]
+    # 跳过 SQLite 内部表与物化汇总表
+    tables = [t[0] for t in cursor.fetchall() if not t[0].startswith(("sqlite_", MV_TABLE_PREFIX))]
+
+    # 为缺少统计信息的表补充（限量的）ANALYZE，用于行数估计与抽样
+    try:
+        ensure_stats(conn, [t for t in tables if mode == "replace" or t not in old_config])
+    except sqlite3.Error as e:
+        print(f"⚠️ 收集表统计信息失败: {e}")
 
     # 初始化配置
     db_schema = {} if mode == "replace" else old_config.copy()
@@ -201,7 +250,9 @@ def update_db_config(
             continue
 
         try:
-            df = pd.read_sql_query(f"SELECT * FROM {table} LIMIT 200;", conn)
+            # 在整张表上随机抽样（而不是只取前几行），种子固定以保持建表语句稳定
+            sample = sample_rows(conn, table, SCHEMA_SAMPLE_ROWS, seed=f"{SCHEMA_SAMPLE_SEED}:{table}")
+            df = pd.DataFrame.from_records(sample.rows, columns=sample.columns, coerce_float=True)
             db_schema[table] = {"build": generate_create_table_with_comments(df, table)}
 
             if table in old_config:
@@ -211,7 +262,8 @@ def update_db_config(
         except Exception as e:
             print(f"⚠️ 无法读取表 {table}: {e}")
 
-    conn.close()
+    if own_conn:
+        conn.close()
 
     # 写入配置文件
     with open(output_path, "w", encoding="utf-8") as f:
@@ -239,5 +291,7 @@ def get_excel_sheets(excel_path: str) -> list:
     if not os.path.exists(excel_path):
         raise FileNotFoundError(f"Excel 文件不存在: {excel_path}")
 
+    import pandas as pd
+
     excel_file = pd.ExcelFile(excel_path)
     return excel_file.sheet_names
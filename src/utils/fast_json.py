@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+快速 JSON 序列化
+
+查询结果（可能有数万行）直接序列化为字节，不经过 pydantic 响应模型校验与 jsonable_encoder 逐项转换。
+安装了 orjson 时使用 orjson，否则退回标准库 json（紧凑格式、不转义中文）。
+"""
+import datetime
+import decimal
+import json
+from typing import Any
+
+from pydantic import BaseModel
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    """orjson / json 不能直接处理的类型（与 jsonable_encoder 的结果一致）"""
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return bytes(obj).decode("utf-8", errors="replace")
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, (datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, BaseModel):
+        return obj.dict()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> bytes:
+    """序列化为 UTF-8 JSON 字节"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def loads(data: Any) -> Any:
+    """反序列化 JSON（接受 bytes / memoryview / str；orjson 可直接读取 memoryview，不复制）"""
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+class FastJSONResponse(Response):
+    """用 dumps 序列化的 JSON 响应；路由直接返回它时，FastAPI 不再按 response_model 校验"""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,15 +1,276 @@
 # -*- coding: utf-8 -*-
 """
 日志记录工具
+
+查询日志由后台线程异步批量写入：请求线程只负责把记录放入有界队列，
+队列满时直接丢弃并计数，不会阻塞请求。写入线程按条数或时间间隔批量刷盘，
+并按大小或按天轮转日志文件（可选 gzip 压缩）。
+多个 worker 进程写同一文件时，通过旁路锁文件 (flock) 串行化轮转与写入。
+写盘成功后，整批记录还会交给已注册的 sink（如查询日志索引库）；重建 sink 的数据时用 paused() 暂停写出。
 """
+import atexit
+import gzip
 import json
 import os
-from typing import Dict, Any
-from ..config import LOG_FILE
+import queue
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Any, List, Optional
+
+from ..config import (
+    LOG_FILE,
+    LOG_QUEUE_SIZE,
+    LOG_BATCH_SIZE,
+    LOG_FLUSH_INTERVAL,
+    LOG_ROTATE_BYTES,
+    LOG_ROTATE_DAILY,
+    LOG_COMPRESS,
+)
+
+from .metrics import REGISTRY
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，退化为进程内互斥
+    fcntl = None
+
+
+class QueryLogWriter:
+    """查询日志后台批量写入器"""
+
+    def __init__(
+        self,
+        log_file: str = LOG_FILE,
+        queue_size: int = LOG_QUEUE_SIZE,
+        batch_size: int = LOG_BATCH_SIZE,
+        flush_interval: float = LOG_FLUSH_INTERVAL,
+        rotate_bytes: int = LOG_ROTATE_BYTES,
+        rotate_daily: bool = LOG_ROTATE_DAILY,
+        compress: bool = LOG_COMPRESS,
+    ):
+        self.log_file = log_file
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rotate_bytes = rotate_bytes
+        self.rotate_daily = rotate_daily
+        self.compress = compress
+
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=queue_size)
+        self._sinks: List[Callable[[List[Dict[str, Any]]], None]] = []
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._start_lock = threading.Lock()
+        self._io_lock = threading.Lock()  # 串行化本进程的文件写入，并保护各计数器
+        self._batch_lock = threading.RLock()  # 一批记录的写盘、压缩与 sink 整体串行（paused 期间暂停）
+
+        self.written = 0
+        self.dropped = 0
+        self.rotations = 0
+        self.write_errors = 0
+
+    # ---------- 生命周期 ----------
+    def start(self):
+        """启动后台写入线程（fork 后的子进程会重新启动自己的线程）"""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                # fork 继承来的队列可能处于不一致状态，重新创建
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="query-log-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """停止写入线程，并把队列中剩余的日志全部刷盘"""
+        thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                pass
+            thread.join(timeout)
+        self._thread = None
+        # 线程已退出或未启动，同步写出剩余记录
+        self._write_batch(self._drain())
+
+    def flush(self):
+        """在调用线程中立即写出队列中已提交的记录（后台线程已取出、尚未写盘的批次不包括在内）"""
+        self._write_batch(self._drain())
+
+    @contextmanager
+    def paused(self):
+        """
+        暂停写出批次：进入时正在写出的批次已写盘并交给 sink，退出前不会再有批次写盘或交给 sink
+
+        期间提交的记录留在队列中（队列满时照常丢弃），用于重建 sink 的数据（如查询日志索引库）
+        """
+        with self._batch_lock:
+            yield
+
+    def add_sink(self, sink: Callable[[List[Dict[str, Any]]], None]):
+        """注册批量记录的下游消费者，在后台线程中调用"""
+        if sink not in self._sinks:
+            self._sinks.append(sink)
+
+    # ---------- 写入接口 ----------
+    def submit(self, record: Dict[str, Any]) -> bool:
+        """提交一条日志，队列已满时丢弃并返回 False"""
+        if self._thread is None or self._pid != os.getpid():
+            self.start()
+        if "timestamp" not in record:
+            record = dict(record, timestamp=round(time.time(), 3))
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            with self._io_lock:
+                self.dropped += 1
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        """写入器运行状态"""
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "rotations": self.rotations,
+            "write_errors": self.write_errors,
+            "running": self._thread is not None and self._thread.is_alive(),
+        }
+
+    # ---------- 后台线程 ----------
+    def _run(self):
+        batch: List[Dict[str, Any]] = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = {}  # 超时，触发按时间刷盘
+
+            if item is None:
+                batch.extend(self._drain())
+                self._write_batch(batch)
+                return
+            if item:
+                batch.append(item)
+
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._write_batch(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _drain(self) -> List[Dict[str, Any]]:
+        lines = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return lines
+            if item:
+                lines.append(item)
+
+    def _write_batch(self, records: List[Dict[str, Any]]):
+        if not records:
+            return
+        with self._batch_lock:
+            self._write_locked(records)
+
+    def _write_locked(self, records: List[Dict[str, Any]]):
+        lines = [json.dumps(r, ensure_ascii=False, default=str) for r in records]
+        payload = ("\n".join(lines) + "\n").encode("utf-8")
+        try:
+            with self._io_lock:
+                os.makedirs(os.path.dirname(self.log_file) or ".", exist_ok=True)
+                with open(self.log_file + ".lock", "a") as lock_fp:
+                    if fcntl is not None:
+                        fcntl.flock(lock_fp, fcntl.LOCK_EX)
+                    try:
+                        rotated = self._rotate_if_needed(len(payload))
+                        # O_APPEND + 单次 write，保证多进程下整批追加不交错
+                        fd = os.open(self.log_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                        try:
+                            os.write(fd, payload)
+                        finally:
+                            os.close(fd)
+                    finally:
+                        if fcntl is not None:
+                            fcntl.flock(lock_fp, fcntl.LOCK_UN)
+                self.written += len(lines)
+        except Exception as e:
+            with self._io_lock:
+                self.write_errors += 1
+            print(f"[ERROR] 写入查询日志失败，丢弃 {len(lines)} 条: {e}")
+            return
+
+        if rotated and self.compress:
+            self._compress(rotated)
+
+        for sink in self._sinks:
+            try:
+                sink(records)
+            except Exception as e:
+                print(f"[WARNING] 查询日志 sink 处理失败: {e}")
+
+    def _rotate_if_needed(self, incoming: int) -> Optional[str]:
+        """在持有文件锁时检查并执行轮转，返回轮转后的文件路径"""
+        try:
+            st = os.stat(self.log_file)
+        except FileNotFoundError:
+            return None
+        if st.st_size == 0:
+            return None
+
+        need_rotate = False
+        if self.rotate_bytes and st.st_size + incoming > self.rotate_bytes:
+            need_rotate = True
+        if self.rotate_daily and datetime.fromtimestamp(st.st_mtime).date() != datetime.now().date():
+            need_rotate = True
+        if not need_rotate:
+            return None
+
+        stamp = datetime.fromtimestamp(st.st_mtime).strftime("%Y%m%d-%H%M%S")
+        base, ext = os.path.splitext(self.log_file)
+        target = f"{base}.{stamp}{ext}"
+        suffix = 1
+        while os.path.exists(target) or os.path.exists(target + ".gz"):
+            target = f"{base}.{stamp}-{suffix}{ext}"
+            suffix += 1
+        os.rename(self.log_file, target)
+        self.rotations += 1
+        return target
+
+    @staticmethod
+    def _compress(path: str):
+        try:
+            with open(path, "rb") as src, gzip.open(path + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(path)
+        except Exception as e:
+            print(f"[WARNING] 压缩轮转日志失败 {path}: {e}")
+
+
+_writer = QueryLogWriter()
+atexit.register(_writer.stop)
+
+REGISTRY.gauge(
+    "tableqa_query_log_writer",
+    "Async query log writer queue depth and counters",
+    ("state",),
+    callback=lambda: {(k,): float(v) for k, v in _writer.stats().items()},
+)
+
+
+def get_query_log_writer() -> QueryLogWriter:
+    """获取全局查询日志写入器"""
+    return _writer
 
 
 def save_query_log(record: Dict[str, Any]):
-    """保存请求记录到 JSONL 文件"""
-    os.makedirs(os.path.dirname(LOG_FILE) or ".", exist_ok=True)
-    with open(LOG_FILE, "a", encoding="utf-8") as f:
-        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    """保存请求记录到 JSONL 文件（异步，不阻塞请求）"""
+    _writer.submit(record)
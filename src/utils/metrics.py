@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+"""
+指标采集工具
+
+提供轻量的 Counter / Gauge / Histogram 以及 Prometheus 文本格式输出，
+并通过 contextvars 记录每个请求内各阶段的耗时：
+
+    with stage("llm_call"):
+        ...
+
+阶段耗时同时写入全局直方图和当前请求的 StageTimer（用于日志与 Server-Timing 响应头）。
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# 默认直方图分桶（秒），覆盖从亚毫秒级的 SQL 校验到数十秒的模型调用
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0,
+)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items
+        ]
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值，也可以用回调函数在采集时取值"""
+    kind = "gauge"
+
+    def __init__(self, *args, callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._callback = callback
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        if self._callback is not None:
+            try:
+                values.update(self._callback())
+            except Exception as e:
+                print(f"[WARNING] 采集指标 {self.name} 失败: {e}")
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    """累计分桶直方图"""
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Iterable[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [各桶计数..., sum, count]
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines = self.header()
+        for key, state in items:
+            cumulative = 0
+            for i, bound in enumerate(self.buckets):
+                cumulative += state[i]
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = (), callback=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, callback=callback))
+
+    def histogram(
+        self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets=buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_DURATION = REGISTRY.histogram(
+    "tableqa_stage_duration_seconds", "Duration of each request processing stage", ("endpoint", "stage")
+)
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "tableqa_http_request_duration_seconds", "End-to-end HTTP request duration", ("method", "route", "status")
+)
+LLM_INFLIGHT = REGISTRY.gauge("tableqa_llm_inflight_requests", "In-flight LLM API calls", ("model",))
+LLM_REQUESTS = REGISTRY.counter("tableqa_llm_requests_total", "LLM API calls by outcome", ("model", "outcome"))
+LLM_TOKENS = REGISTRY.counter("tableqa_llm_tokens_total", "Tokens used by LLM API calls", ("model", "kind"))
+LLM_PROMPT_TOKENS = REGISTRY.histogram(
+    "tableqa_llm_prompt_tokens",
+    "Prompt tokens per LLM API call",
+    ("model",),
+    buckets=(128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072),
+)
+CACHE_REQUESTS = REGISTRY.counter("tableqa_cache_requests_total", "Cache lookups by result", ("cache", "result"))
+
+
+def _cache_hit_ratio() -> Dict[Tuple[str, ...], float]:
+    totals: Dict[str, List[float]] = {}
+    with CACHE_REQUESTS._lock:
+        items = list(CACHE_REQUESTS._values.items())
+    for (cache, result), value in items:
+        hit_miss = totals.setdefault(cache, [0.0, 0.0])
+        hit_miss[0 if result == "hit" else 1] += value
+    return {(cache,): hit / (hit + miss) for cache, (hit, miss) in totals.items() if hit + miss}
+
+
+CACHE_HIT_RATIO = REGISTRY.gauge(
+    "tableqa_cache_hit_ratio", "Cache hit ratio since process start", ("cache",), callback=_cache_hit_ratio
+)
+
+
+def record_cache(cache: str, hit: bool):
+    """记录一次缓存命中/未命中"""
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+# ---------- 请求级阶段计时 ----------
+class StageTimer:
+    """单个请求内的阶段耗时"""
+
+    def __init__(self, endpoint: str = "", scope: Optional[dict] = None):
+        self._endpoint = endpoint
+        self._scope = scope
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.usage: Dict[str, int] = {}
+
+    @property
+    def endpoint(self) -> str:
+        """路由模板（如 /tables/{table_name}），避免按原始路径产生过多标签"""
+        if self._scope is not None:
+            route = self._scope.get("route")
+            return getattr(route, "path", None) or "unmatched"
+        return self._endpoint
+
+    def record(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def record_usage(self, **tokens: int):
+        """累计本请求内模型调用的 token 数（prompt_tokens / completion_tokens 等）"""
+        for name, count in tokens.items():
+            if count is not None:
+                self.usage[name] = self.usage.get(name, 0) + int(count)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def as_ms(self) -> Dict[str, float]:
+        return {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()}
+
+    def server_timing(self) -> str:
+        """生成 Server-Timing 响应头"""
+        return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items())
+
+
+_current_timer: ContextVar[Optional[StageTimer]] = ContextVar("stage_timer", default=None)
+
+
+def start_request_timer(endpoint: str = "", scope: Optional[dict] = None) -> StageTimer:
+    """为当前请求上下文创建阶段计时器"""
+    timer = StageTimer(endpoint, scope)
+    _current_timer.set(timer)
+    return timer
+
+
+def current_timer() -> Optional[StageTimer]:
+    """当前请求的阶段计时器（不在请求上下文中时为 None）"""
+    return _current_timer.get()
+
+
+@contextmanager
+def stage(name: str):
+    """记录一个处理阶段的耗时"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        timer = _current_timer.get()
+        STAGE_DURATION.observe(elapsed, endpoint=timer.endpoint if timer else "", stage=name)
+        if timer is not None:
+            timer.record(name, elapsed)
+
+
+class MetricsMiddleware:
+    """ASGI 中间件：为每个 HTTP 请求建立阶段计时器，记录总耗时并输出 Server-Timing 头"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timer = start_request_timer(scope=scope)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if timer.stages:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", timer.server_timing().encode("latin-1")))
+                    message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUEST_DURATION.observe(
+                timer.elapsed(), method=scope.get("method", ""), route=timer.endpoint, status=str(status["code"])
+            )
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+查询形态分析
+
+基于 SQL 词法分析得到只读查询的形态，供执行引擎路由使用：
+引用了哪些表（FROM / JOIN 之后的表名，不含 WITH 定义的临时结果集）、是否为聚合查询、调用了哪些函数，
+以及 FROM 之后是否出现了不是表名的数据源（字符串路径、表函数调用等）。
+
+另提供交给 DuckDB 执行前的方言改写：模型生成的 SQL 使用 MySQL 风格的反引号，DuckDB 只接受标准 SQL 的双引号，
+LIKE 的大小写规则也不同（见 to_duckdb_dialect）。
+"""
+import functools
+from typing import FrozenSet, List, NamedTuple, Optional, Tuple
+
+from .sql_lexer import IDENT, KEYWORD, PUNCT, QUOTED_IDENT, Token, iter_tokens, tokenize, unquote_identifier
+
+AGGREGATE_FUNCTIONS = frozenset({"count", "sum", "avg", "min", "max", "total", "group_concat"})
+
+# 出现在 FROM 子句之后、结束表列表的关键字
+# （ON / USING 之后的连接条件中没有顶层逗号，不结束表列表：JOIN ... ON ..., t2 中的 t2 仍是表）
+_FROM_END = frozenset({"WHERE", "GROUP", "HAVING", "ORDER", "LIMIT", "OFFSET", "UNION", "INTERSECT", "EXCEPT",
+                       "WINDOW", "SELECT"})
+
+
+class QueryShape(NamedTuple):
+    tables: Tuple[str, ...]  # 按出现顺序去重；带 schema 前缀的保留为 "schema.table"
+    aggregate: bool  # 含 GROUP BY 或聚合函数
+    functions: FrozenSet[str]  # 调用的函数名（小写，不含 CAST 等关键字形式）
+    foreign_sources: bool  # FROM / JOIN 之后出现了表函数、字符串等非表名的数据源
+
+
+def _is_punct(token: Optional[Token], text: str) -> bool:
+    return token is not None and token.kind == PUNCT and token.text == text
+
+
+def _is_name(token: Optional[Token]) -> bool:
+    return token is not None and (token.kind == IDENT or token.kind == QUOTED_IDENT)
+
+
+@functools.lru_cache(maxsize=1024)
+def analyze_query(sql: str) -> QueryShape:
+    """分析只读查询的形态（不校验语法，无法识别的部分按保守方式处理）"""
+    tokens: List[Token] = tokenize(sql or "")
+    n = len(tokens)
+    tables: List[str] = []
+    ctes = set()
+    functions = set()
+    aggregate = False
+    foreign = False
+    in_from = [False]  # 每层括号是否处于 FROM 子句的表列表中
+    expect_table = False
+
+    i = 0
+    while i < n:
+        t = tokens[i]
+        nxt = tokens[i + 1] if i + 1 < n else None
+        if _is_punct(t, "("):
+            if expect_table:
+                expect_table = False  # 子查询
+            in_from.append(False)
+        elif _is_punct(t, ")"):
+            if len(in_from) > 1:
+                in_from.pop()
+        elif _is_punct(t, ","):
+            expect_table = in_from[-1]
+        elif t.kind == KEYWORD:
+            word = t.upper
+            if word == "FROM" or word == "JOIN":
+                in_from[-1] = True
+                expect_table = True
+            else:
+                if word in _FROM_END:
+                    in_from[-1] = False
+                if word == "GROUP" and nxt is not None and nxt.upper == "BY":
+                    aggregate = True
+                expect_table = False
+        elif _is_name(t):
+            if _is_punct(nxt, "("):
+                name = t.text.lower()
+                functions.add(name)
+                aggregate = aggregate or (t.kind == IDENT and name in AGGREGATE_FUNCTIONS)
+                foreign = foreign or expect_table
+                expect_table = False
+            elif nxt is not None and nxt.kind == KEYWORD and nxt.upper == "AS" and _is_punct(
+                    tokens[i + 2] if i + 2 < n else None, "("):
+                ctes.add(unquote_identifier(t).lower())  # WITH name AS (...)
+            elif expect_table:
+                name = unquote_identifier(t)
+                if _is_punct(nxt, ".") and i + 2 < n and _is_name(tokens[i + 2]):
+                    name = f"{name}.{unquote_identifier(tokens[i + 2])}"
+                    i += 2
+                tables.append(name)
+                expect_table = False
+        elif expect_table:
+            foreign = True  # FROM 'file.csv' 之类
+            expect_table = False
+        i += 1
+
+    seen = set()
+    unique = []
+    for name in tables:
+        key = name.lower()
+        if key not in ctes and key not in seen:
+            seen.add(key)
+            unique.append(name)
+    return QueryShape(tuple(unique), aggregate, frozenset(functions), foreign)
+
+
+@functools.lru_cache(maxsize=1024)
+def to_duckdb_dialect(sql: str) -> str:
+    """
+    交给 DuckDB 执行前的改写：标识符改为双引号；LIKE 改为 ILIKE（SQLite 的 LIKE 对 ASCII 字母不区分大小写，
+    DuckDB 的 LIKE 区分）。整数相除与 NULL 排序由 DuckDB 的会话设置对齐；SQLite 特有的函数写法
+    （如 strftime('%Y', 列)）在 DuckDB 中执行失败，由调用方退回 SQLite
+    """
+    parts = []
+    for t in iter_tokens(sql):
+        if t.kind == QUOTED_IDENT and t.text[0] != '"':
+            parts.append('"' + unquote_identifier(t).replace('"', '""') + '"')
+        elif t.kind == KEYWORD and t.upper == "LIKE":
+            parts.append("ILIKE")
+        else:
+            parts.append(t.text)
+    return "".join(parts)
@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+"""
+查询结果摘要
+
+把 SQL 查询结果整理成发给 Chat 模型的 table_info 文本。
+
+结果较小时原样给出全部行；超出 token 预算时改为统计摘要，全部按列向量化计算（pandas/NumPy）：
+- 列统计：数值列给出最小/最大/均值/中位数/合计，其他列给出不同值个数与高频值
+- 分组计数：按取值最少的文本列分组，给出各组记录数与数值列合计
+- 分层抽样：按分组列分层（没有分组列时等间隔）抽取样例行，行数由剩余预算决定
+
+pandas/NumPy 只在需要生成摘要时才导入，行数较少的结果直接格式化，不加载它们。
+"""
+import math
+from typing import TYPE_CHECKING, Any, Dict, List, NamedTuple, Optional, Tuple
+
+from ..config.settings import (
+    CHAT_RESULT_TOKEN_BUDGET,
+    DIGEST_GROUP_MAX,
+    DIGEST_MAX_NUMERIC_AGGS,
+    DIGEST_PLAIN_MAX_ROWS,
+    DIGEST_SAMPLE_ROWS,
+    DIGEST_SAMPLE_SEED,
+    DIGEST_TOP_VALUES,
+)
+from .tokens import CHARS_PER_TOKEN, CJK_PATTERN, estimate_tokens
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+
+EMPTY_RESULT = "查询结果为空"
+SEPARATOR = " | "
+
+
+class ResultDigest(NamedTuple):
+    """结果摘要：发送的文本及其相对完整结果节省的 token 数"""
+    text: str
+    mode: str  # full（完整结果）/ digest（统计摘要）
+    total_rows: int
+    sample_rows: int
+    raw_tokens: int  # 完整结果表的估算 token 数
+    tokens: int  # 实际发送文本的估算 token 数
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(0, self.raw_tokens - self.tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "total_rows": self.total_rows,
+            "sample_rows": self.sample_rows,
+            "raw_tokens": self.raw_tokens,
+            "tokens": self.tokens,
+            "saved_tokens": self.saved_tokens,
+            "saved_ratio": round(self.saved_tokens / self.raw_tokens, 3) if self.raw_tokens else 0.0,
+        }
+
+
+def format_result_table(columns: List[str], data: List[Dict[str, Any]], max_rows: int = 20) -> str:
+    """
+    将查询结果格式化为 Markdown 风格的表格文本
+
+    Args:
+        columns: 列名
+        data: 行数据（字典列表）
+        max_rows: 最多展示的行数
+    """
+    if not data:
+        return EMPTY_RESULT
+
+    lines = [f"查询结果（共 {len(data)} 条记录）：", ""] + _table_lines(columns, data[:max_rows])
+    if len(data) > max_rows:
+        lines.append("")
+        lines.append(f"... 还有 {len(data) - max_rows} 条记录未显示")
+    return "\n".join(lines)
+
+
+def _table_lines(columns: List[str], rows: List[Dict[str, Any]]) -> List[str]:
+    lines = [SEPARATOR.join(columns), SEPARATOR.join("---" for _ in columns)]
+    for row in rows:
+        lines.append(SEPARATOR.join(_cell(row.get(col)) for col in columns))
+    return lines
+
+
+def _cell(value: Any) -> str:
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    return str(value)
+
+
+def _fmt_number(value: Any) -> str:
+    """数值保留有效数字，整数值不带小数点"""
+    if value is None:
+        return ""
+    value = float(value)
+    if math.isnan(value):
+        return ""
+    if value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return f"{value:.6g}"
+
+
+def _cell_strings(df: "pd.DataFrame") -> "pd.DataFrame":
+    """按表格输出的方式把每个单元格转为字符串（空值为空串）"""
+    return df.astype(object).where(df.notna(), "").astype(str)
+
+
+def _row_tokens(cells: "pd.DataFrame") -> "np.ndarray":
+    """逐行估算表格行的 token 数（与 estimate_tokens 的估算方式一致，按列向量化）"""
+    import numpy as np
+
+    chars = np.zeros(len(cells), dtype=np.int64)
+    cjk = np.zeros(len(cells), dtype=np.int64)
+    for col in cells.columns:
+        text = cells[col]
+        chars += text.str.len().to_numpy(dtype=np.int64)
+        cjk += text.str.count(CJK_PATTERN).to_numpy(dtype=np.int64)
+    # 列分隔符与换行
+    chars += len(SEPARATOR) * max(0, cells.shape[1] - 1) + 1
+    return cjk + np.ceil((chars - cjk) / CHARS_PER_TOKEN).astype(np.int64)
+
+
+def _numeric_columns(df: "pd.DataFrame") -> Dict[str, "pd.Series"]:
+    """识别数值列：SQLite 返回的数值列直接使用，文本形式的数字（如解析自表格文本）全部可转换时也视为数值"""
+    import pandas as pd
+
+    numeric = {}
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_bool_dtype(series):
+            continue
+        if pd.api.types.is_numeric_dtype(series):
+            numeric[col] = series
+            continue
+        non_null = series.dropna()
+        if non_null.empty:
+            continue
+        converted = pd.to_numeric(non_null, errors="coerce")
+        if converted.notna().all():
+            numeric[col] = pd.to_numeric(series, errors="coerce")
+    return numeric
+
+
+def _column_stats(df: "pd.DataFrame", numeric: Dict[str, "pd.Series"], top_values: int) -> List[str]:
+    lines = ["列统计："]
+    for col in df.columns:
+        series = df[col]
+        non_null = int(series.notna().sum())
+        if col in numeric:
+            values = numeric[col].dropna()
+            if values.empty:
+                lines.append(f"- {col}（数值）：非空 0")
+                continue
+            lines.append(
+                f"- {col}（数值）：非空 {non_null}，最小 {_fmt_number(values.min())}，"
+                f"最大 {_fmt_number(values.max())}，均值 {_fmt_number(values.mean())}，"
+                f"中位数 {_fmt_number(values.median())}，合计 {_fmt_number(values.sum())}"
+            )
+        else:
+            text = series.dropna().astype(str)
+            distinct = int(text.nunique())
+            line = f"- {col}（文本）：非空 {non_null}，不同值 {distinct}"
+            counts = text.value_counts().head(top_values) if top_values and distinct else None
+            # 所有值都只出现一次时高频值没有意义，不列出
+            if counts is not None and counts.iloc[0] > 1:
+                line += "，高频值 " + "、".join(f"{value}({count})" for value, count in counts.items())
+            lines.append(line)
+    return lines
+
+
+def _group_column(df: "pd.DataFrame", numeric: Dict[str, "pd.Series"]) -> Optional[str]:
+    """选取不同值最少（2 ~ DIGEST_GROUP_MAX 个）的非数值列作为分组列"""
+    best, best_distinct = None, None
+    for col in df.columns:
+        if col in numeric:
+            continue
+        distinct = int(df[col].nunique(dropna=False))
+        if 2 <= distinct <= DIGEST_GROUP_MAX and (best_distinct is None or distinct < best_distinct):
+            best, best_distinct = col, distinct
+    return best
+
+
+def _group_counts(df: "pd.DataFrame", group_col: str, numeric: Dict[str, "pd.Series"]) -> List[str]:
+    import pandas as pd
+
+    agg_cols = list(numeric)[:DIGEST_MAX_NUMERIC_AGGS]
+    keys = df[group_col].astype(object).where(df[group_col].notna(), "(空)").astype(str)
+    frame = pd.DataFrame({col: numeric[col] for col in agg_cols})
+    frame["__count"] = 1
+    grouped = frame.groupby(keys.to_numpy(), sort=False).sum(min_count=1)
+    grouped = grouped.sort_values("__count", ascending=False, kind="stable")
+
+    header = [group_col, "记录数"] + [f"{col}合计" for col in agg_cols]
+    lines = [f"按 {group_col} 分组：", SEPARATOR.join(header), SEPARATOR.join("---" for _ in header)]
+    for key, row in grouped.iterrows():
+        values = [str(key), str(int(row["__count"]))] + [_fmt_number(row[col]) for col in agg_cols]
+        lines.append(SEPARATOR.join(values))
+    return lines
+
+
+def _sample_positions(df: "pd.DataFrame", group_col: Optional[str], n: int) -> "np.ndarray":
+    """
+    抽取 n 行的位置（按原顺序返回）
+
+    有分组列时按各组行数比例分配名额（每组至少 1 行），组内用固定种子随机抽取，结果可复现；
+    否则等间隔抽取，包含首行与末行。
+    """
+    import numpy as np
+    import pandas as pd
+
+    total = len(df)
+    if n >= total:
+        return np.arange(total)
+    if n <= 0:
+        return np.arange(0)
+    if group_col is None:
+        return np.unique(np.linspace(0, total - 1, n).round().astype(np.int64))
+
+    rng = np.random.default_rng(DIGEST_SAMPLE_SEED)
+    order = rng.permutation(total)
+    keys = df[group_col].astype(object).where(df[group_col].notna(), "(空)").astype(str).to_numpy()[order]
+    shuffled = pd.Series(keys)
+    sizes = shuffled.value_counts()
+    quota = np.maximum(1, np.floor(sizes * n / total)).astype(np.int64)
+    rank = shuffled.groupby(shuffled, sort=False).cumcount().to_numpy()
+    chosen = order[rank < shuffled.map(quota).to_numpy()]
+    if len(chosen) > n:
+        # 组数多于名额时，保留打乱顺序中靠前的行
+        chosen = chosen[:n]
+    elif len(chosen) < n:
+        # 按比例取整后的剩余名额，由未选中的行按打乱顺序补齐
+        picked = np.zeros(total, dtype=bool)
+        picked[chosen] = True
+        rest = order[~picked[order]][: n - len(chosen)]
+        chosen = np.concatenate([chosen, rest])
+    return np.sort(chosen)
+
+
+def _assemble(header: str, stats: List[str], groups: List[str], columns: List[str],
+              sample: List[Dict[str, Any]]) -> str:
+    sections = [header, "\n".join(stats)]
+    if groups:
+        sections.append("\n".join(groups))
+    if sample:
+        sections.append("\n".join([f"样例行（抽样 {len(sample)} 条）："] + _table_lines(columns, sample)))
+    return "\n\n".join(sections)
+
+
+def digest_result(columns: List[str], data: List[Dict[str, Any]],
+                  token_budget: int = CHAT_RESULT_TOKEN_BUDGET, total_rows: Optional[int] = None) -> ResultDigest:
+    """
+    生成不超过 token 预算的结果文本
+
+    完整结果表在预算内时原样给出；否则给出列统计、分组计数与分层抽样行，
+    抽样行数由扣除统计部分后的剩余预算决定。
+
+    Args:
+        columns: 列名
+        data: 行数据（字典列表）
+        token_budget: 结果文本的 token 上限
+        total_rows: data 只是结果的抽样行时，结果的总行数（此时总是生成统计摘要，统计值基于抽样行）
+    """
+    total = max(total_rows or 0, len(data))
+    sampled = total > len(data)
+    if not data:
+        tokens = estimate_tokens(EMPTY_RESULT)
+        return ResultDigest(EMPTY_RESULT, "full", 0, 0, tokens, tokens)
+
+    # 行数不多时先直接格式化，在预算内即可返回，不必加载 pandas
+    if not sampled and len(data) <= DIGEST_PLAIN_MAX_ROWS:
+        text = format_result_table(columns, data, max_rows=len(data))
+        tokens = estimate_tokens(text)
+        if tokens <= token_budget:
+            return ResultDigest(text, "full", len(data), len(data), tokens, tokens)
+
+    import pandas as pd
+
+    df = pd.DataFrame.from_records(data, columns=columns)
+    cells = _cell_strings(df)
+    row_tokens = _row_tokens(cells)
+    table_head = f"查询结果（共 {total} 条记录）：\n\n" + "\n".join(_table_lines(columns, []))
+    raw_tokens = estimate_tokens(table_head) + int(row_tokens.sum() * total / len(df))
+
+    if not sampled and raw_tokens <= token_budget:
+        text = format_result_table(columns, data, max_rows=len(data))
+        tokens = estimate_tokens(text)
+        return ResultDigest(text, "full", len(df), len(df), tokens, tokens)
+
+    numeric = _numeric_columns(df)
+    group_col = _group_column(df, numeric)
+    header = f"查询结果（共 {total} 条记录，{len(columns)} 列），完整结果过长，以下为统计摘要与抽样："
+    if sampled:
+        header += f"\n（统计值基于等间隔抽取的 {len(df)} 行）"
+    stats = _column_stats(df, numeric, DIGEST_TOP_VALUES)
+    groups = _group_counts(df, group_col, numeric) if group_col else []
+
+    # 统计部分超出预算时依次去掉分组计数、高频值，最后截断列统计
+    text = _assemble(header, stats, groups, columns, [])
+    if estimate_tokens(text) > token_budget and groups:
+        groups = []
+        text = _assemble(header, stats, groups, columns, [])
+    if estimate_tokens(text) > token_budget:
+        stats = _column_stats(df, numeric, 0)
+        text = _assemble(header, stats, groups, columns, [])
+    truncated = False
+    while estimate_tokens(text) > token_budget and len(stats) > 1:
+        stats = stats[:-1]
+        truncated = True
+        text = _assemble(header, stats + ["- ……"], groups, columns, [])
+    if truncated:
+        stats = stats + ["- ……"]
+
+    # 剩余预算用于样例行
+    sample_head = estimate_tokens("\n".join(["样例行（抽样 N 条）："] + _table_lines(columns, []))) + 2
+    remaining = token_budget - estimate_tokens(text) - sample_head
+    avg_row = max(1.0, float(row_tokens.mean()))
+    n = int(min(DIGEST_SAMPLE_ROWS, max(0, remaining) // avg_row))
+    positions = _sample_positions(df, group_col, n)
+    # 抽中的行偏长时逐行去掉，直到总长度回到预算内
+    while len(positions) and estimate_tokens(text) + sample_head + int(row_tokens[positions].sum()) > token_budget:
+        positions = positions[:-1]
+
+    sample = [data[i] for i in positions]
+    text = _assemble(header, stats, groups, columns, sample)
+    return ResultDigest(text, "digest", total, len(sample), raw_tokens, estimate_tokens(text))
+
+
+def parse_result_table(text: str) -> Optional[Tuple[List[str], List[Dict[str, Any]]]]:
+    """
+    从 format_result_table 格式的文本中解析出列名与行数据
+
+    用于对客户端直接提交给 /chat 的 table_info 做摘要；不是该格式时返回 None。
+    """
+    lines = text.splitlines()
+    for i in range(len(lines) - 1):
+        columns = lines[i].split(SEPARATOR)
+        if lines[i + 1] != SEPARATOR.join("---" for _ in columns):
+            continue
+        data = []
+        for line in lines[i + 2:]:
+            if not line.strip():
+                break
+            values = line.split(SEPARATOR, len(columns) - 1)
+            values += [""] * (len(columns) - len(values))
+            data.append({col: (value if value != "" else None) for col, value in zip(columns, values)})
+        return columns, data
+    return None
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+建表语句裁剪
+
+多表查询会把每张表的建表语句都拼进 prompt，超出模型上下文时按优先级从低到高裁剪：
+1. 去掉与问题无关的字段上的样例值注释
+2. 去掉所有字段的样例值注释
+3. 整张去掉与问题最不相关的表（至少保留一张）
+
+表的优先级：问题中提到表名或字段名越多越靠前，相同时保持用户指定的顺序。
+"""
+import re
+from typing import List, Tuple
+
+from .tokens import estimate_tokens
+
+# 由 generate_create_table_with_comments 生成的字段定义：`列名` 类型 COMMENT '样例：xxx'
+_COLUMN_RE = re.compile(r"`([^`]+)`")
+_SAMPLE_COMMENT_RE = re.compile(r" COMMENT '样例：.*?'(?=, `|\);\s*$)", re.S)
+
+
+def render_schema(tables: List[Tuple[str, str]]) -> str:
+    """把 (表名, 建表语句) 拼接为 prompt 中的 build 部分"""
+    return "\n\n".join(f"【{name}】\n{build}" for name, build in tables)
+
+
+def _strip_comments(build: str, keep_columns: List[str] = ()) -> str:
+    """去掉字段的样例值注释，keep_columns 中的字段保留"""
+    def replace(match):
+        prefix = build[:match.start()]
+        column = _COLUMN_RE.findall(prefix)
+        if column and column[-1] in keep_columns:
+            return match.group(0)
+        return ""
+    return _SAMPLE_COMMENT_RE.sub(replace, build)
+
+
+def _relevance(query: str, name: str, build: str) -> int:
+    score = 2 if name and name in query else 0
+    return score + sum(1 for column in set(_COLUMN_RE.findall(build)) if column in query)
+
+
+def fit_schema(query: str, tables: List[Tuple[str, str]], budget: int) -> Tuple[str, List[str]]:
+    """
+    在 token 预算内拼接建表语句
+
+    Args:
+        query: 用户问题（用于判断相关性）
+        tables: (表名, 建表语句) 列表，按用户指定顺序
+        budget: build 部分的 token 上限
+
+    Returns:
+        (build 文本, 裁剪说明列表)；裁剪到只剩一张表仍超出预算时返回该结果，由调用方决定是否拒绝
+    """
+    text = render_schema(tables)
+    if estimate_tokens(text) <= budget:
+        return text, []
+
+    ranked = sorted(range(len(tables)), key=lambda i: -_relevance(query, *tables[i]))
+    parts = {i: tables[i] for i in ranked}
+    notes: List[str] = []
+
+    def current() -> str:
+        return render_schema([parts[i] for i in sorted(parts)])
+
+    # 从优先级最低的表开始
+    for keep_relevant in (True, False):
+        for i in reversed(ranked):
+            name, build = parts[i]
+            keep = [c for c in _COLUMN_RE.findall(build) if c in query] if keep_relevant else []
+            stripped = _strip_comments(build, keep)
+            if stripped != build:
+                parts[i] = (name, stripped)
+                notes.append(f"去掉表 {name} {'无关字段' if keep_relevant else '全部字段'}的样例值")
+                text = current()
+                if estimate_tokens(text) <= budget:
+                    return text, notes
+
+    for i in reversed(ranked[1:]):
+        notes.append(f"去掉表 {parts.pop(i)[0]}")
+        text = current()
+        if estimate_tokens(text) <= budget:
+            break
+    return text, notes
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+SQL 词法分析工具
+
+用一个联合正则单遍扫描 SQL，把文本切分为字符串、注释、标识符、关键字等 token。
+SQL 校验、SQL 提取与 SQL 归一化都基于同一个 token 流：
+字符串字面量和反引号/双引号标识符（如 `REPLACE-费率`）中的内容不会被误判为关键字。
+"""
+import re
+from typing import Iterator, List, NamedTuple, Optional
+
+# token 类型
+WS = "ws"
+COMMENT = "comment"
+FENCE = "fence"  # Markdown 代码块标记 ```
+STRING = "string"
+QUOTED_IDENT = "quoted_ident"
+NUMBER = "number"
+PARAM = "param"
+KEYWORD = "keyword"
+IDENT = "ident"
+OP = "op"
+PUNCT = "punct"
+ERROR = "error"  # 未闭合的字符串/标识符/注释，或无法识别的字符
+
+SQL_KEYWORDS = frozenset("""
+SELECT FROM WHERE AND OR NOT IN IS NULL LIKE GLOB REGEXP MATCH BETWEEN EXISTS CASE WHEN THEN ELSE END
+AS ON USING JOIN INNER LEFT RIGHT FULL OUTER CROSS NATURAL GROUP BY HAVING ORDER ASC DESC LIMIT OFFSET
+UNION ALL INTERSECT EXCEPT DISTINCT WITH RECURSIVE CAST COLLATE ESCAPE OVER PARTITION WINDOW ROWS RANGE
+PRECEDING FOLLOWING UNBOUNDED CURRENT ROW FILTER NULLS FIRST LAST TRUE FALSE
+INSERT UPDATE DELETE REPLACE MERGE CREATE ALTER DROP TRUNCATE ATTACH DETACH VACUUM PRAGMA
+BEGIN COMMIT ROLLBACK SAVEPOINT RELEASE EXEC EXECUTE INTO VALUES SET TABLE INDEX VIEW TRIGGER
+DATABASE REINDEX ANALYZE EXPLAIN
+""".split())
+
+_COMMENT_PATTERN = r"--[^\n]*|/\*[\s\S]*?\*/"
+_STRING_PATTERN = r"'(?:[^']|'')*'"
+_QUOTED_IDENT_PATTERN = r'`(?:[^`]|``)*`|"(?:[^"]|"")*"|\[[^\]]*\]'
+
+_TOKEN_RE = re.compile(
+    rf"""
+    (?P<ws>\s+)
+  | (?P<comment>{_COMMENT_PATTERN})
+  | (?P<fence>```)
+  | (?P<string>{_STRING_PATTERN})
+  | (?P<quoted_ident>{_QUOTED_IDENT_PATTERN})
+  | (?P<number>0[xX][0-9a-fA-F]+|(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<param>\?\d*|[:@$][^\W\d]\w*)
+  | (?P<word>[^\W\d]\w*)
+  | (?P<op>\|\||<=|>=|<>|!=|==|<<|>>|[-+*/%<>=~&|])
+  | (?P<punct>[(),.;])
+  | (?P<error>'[\s\S]*|`[\s\S]*|"[\s\S]*|/\*[\s\S]*|[\s\S])
+    """,
+    re.VERBOSE,
+)
+
+# 只识别会"遮蔽"代码块结束标记的 token（注释、字符串、带引号标识符），其余字符由正则引擎直接跳过
+_FENCE_SCAN_RE = re.compile(
+    rf"(?P<fence>```)|(?P<comment>{_COMMENT_PATTERN})|(?P<string>{_STRING_PATTERN})|(?P<quoted_ident>{_QUOTED_IDENT_PATTERN})"
+)
+
+
+class Token(NamedTuple):
+    kind: str
+    text: str
+    pos: int
+
+    @property
+    def upper(self) -> str:
+        return self.text.upper()
+
+
+def iter_tokens(sql: str, pos: int = 0) -> Iterator[Token]:
+    """单遍扫描，按顺序产出 token（包含空白与注释）"""
+    for m in _TOKEN_RE.finditer(sql, pos):
+        kind = m.lastgroup
+        text = m.group(kind)
+        if kind == "word":
+            kind = KEYWORD if text.upper() in SQL_KEYWORDS else IDENT
+        yield Token(kind, text, m.start())
+
+
+def tokenize(sql: str, skip_trivia: bool = True) -> List[Token]:
+    """切分 SQL；默认去掉空白和注释"""
+    if skip_trivia:
+        return [t for t in iter_tokens(sql) if t.kind != WS and t.kind != COMMENT]
+    return list(iter_tokens(sql))
+
+
+def fingerprint(tokens: List[Token]) -> str:
+    """
+    SQL 指纹：关键字统一大写，字面量替换为 ?，去掉空白与注释。
+    只差在字面量上的 SQL 得到相同的指纹。
+    """
+    parts = []
+    for t in tokens:
+        if t.kind == STRING or t.kind == NUMBER:
+            parts.append("?")
+        elif t.kind == KEYWORD:
+            parts.append(t.upper)
+        elif t.kind == WS or t.kind == COMMENT:
+            continue
+        else:
+            parts.append(t.text)
+    return " ".join(parts)
+
+
+def unquote_identifier(token: Token) -> str:
+    """标识符的名称：去掉反引号/双引号/方括号，还原转义的引号"""
+    text = token.text
+    if token.kind != QUOTED_IDENT:
+        return text
+    if text[0] == "[":
+        return text[1:-1]
+    quote = text[0]
+    return text[1:-1].replace(quote * 2, quote)
+
+
+def find_fenced_block(text: str) -> Optional[str]:
+    """
+    提取第一个 ```sql ... ``` 代码块的内容；代码块内字符串中的 ``` 不会被当作结束标记。
+    没有完整代码块时返回 None。
+    """
+    start = text.find("```")
+    if start < 0:
+        return None
+    body = start + 3
+    if text[body:body + 3].lower() == "sql":
+        body += 3
+    end = text.find("```", body)
+    if end < 0:
+        return None
+    block = text[body:end]
+    # 快速路径：代码块内没有任何引号或注释时不存在歧义
+    if "'" not in block and '"' not in block and "`" not in block and "-" not in block and "/" not in block:
+        return block.strip()
+    for m in _FENCE_SCAN_RE.finditer(text, body):
+        if m.lastgroup == FENCE:
+            return text[body:m.start()].strip()
+    # 代码块内有未闭合的引号时退化为按字面查找结束标记
+    return block.strip()
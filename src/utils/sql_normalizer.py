@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+SQL 归一化工具
+
+基于 sql_lexer 的 token 流，把模型生成的 SQL 转换为：
+- fingerprint:     所有字面量替换为 ? 的规范化文本，用于日志/指标按查询形态分组
+- fingerprint_id:  指纹的短哈希
+- text / params:   参数化后的 SQL 与绑定参数，供 sqlite3 预编译语句缓存复用
+
+只有 WHERE / HAVING / ON / LIMIT / OFFSET 中的字面量会被参数化：
+SELECT 列表中的字面量会影响结果列名，ORDER BY / GROUP BY 中的数字表示列序号，都保持原样。
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, List, NamedTuple, Tuple
+
+from .sql_lexer import COMMENT, KEYWORD, NUMBER, PARAM, PUNCT, STRING, WS, fingerprint, iter_tokens
+
+NORMALIZE_CACHE_SIZE = 4096
+
+# 进入后参数化字面量的子句
+_PARAM_CLAUSES = frozenset(["WHERE", "HAVING", "ON", "LIMIT", "OFFSET"])
+# 进入后保留字面量的子句
+_LITERAL_CLAUSES = frozenset(["SELECT", "FROM", "GROUP", "ORDER", "WINDOW", "PARTITION"])
+
+
+class NormalizedSQL(NamedTuple):
+    fingerprint: str
+    fingerprint_id: str
+    text: str
+    params: Tuple[Any, ...]
+
+
+def _literal_value(kind: str, text: str) -> Any:
+    if kind == STRING:
+        return text[1:-1].replace("''", "'")
+    lowered = text.lower()
+    if lowered.startswith("0x"):
+        return int(text, 16)
+    if "." in text or "e" in lowered:
+        return float(text)
+    return int(text)
+
+
+def _normalize(sql: str) -> NormalizedSQL:
+    tokens = [t for t in iter_tokens(sql) if t.kind != WS and t.kind != COMMENT]
+    fp = fingerprint(tokens)
+    fp_id = hashlib.sha1(fp.encode("utf-8")).hexdigest()[:12]
+    if any(t.kind == PARAM for t in tokens):
+        # 原文已含占位符时不再参数化，避免参数错位
+        return NormalizedSQL(fp, fp_id, sql, ())
+
+    # 在原文上按位置替换被参数化的字面量，其余文本（包括无别名表达式的列名）保持不变
+    pieces: List[str] = []
+    params: List[Any] = []
+    last = 0
+    # 每层括号各自记录当前子句是否参数化，子查询结束后恢复外层状态
+    modes = [False]
+    for t in tokens:
+        if t.kind == KEYWORD:
+            word = t.upper
+            if word in _PARAM_CLAUSES:
+                modes[-1] = True
+            elif word in _LITERAL_CLAUSES:
+                modes[-1] = False
+        elif t.kind == PUNCT and t.text == "(":
+            modes.append(modes[-1])
+        elif t.kind == PUNCT and t.text == ")":
+            if len(modes) > 1:
+                modes.pop()
+        elif (t.kind == STRING or t.kind == NUMBER) and modes[-1]:
+            params.append(_literal_value(t.kind, t.text))
+            pieces.append(sql[last:t.pos])
+            pieces.append("?")
+            last = t.pos + len(t.text)
+
+    pieces.append(sql[last:])
+    text = "".join(pieces) if params else sql
+    return NormalizedSQL(fp, fp_id, text, tuple(params))
+
+
+_cache: "OrderedDict[str, NormalizedSQL]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def normalize_sql(sql: str) -> NormalizedSQL:
+    """归一化 SQL（按原文缓存）"""
+    with _lock:
+        cached = _cache.get(sql)
+        if cached is not None:
+            _cache.move_to_end(sql)
+            return cached
+    result = _normalize(sql)
+    with _lock:
+        _cache[sql] = result
+        while len(_cache) > NORMALIZE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
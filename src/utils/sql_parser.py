@@ -2,19 +2,27 @@
 """
 SQL 解析工具
 """
-import re
 from typing import List
 
+from .sql_lexer import find_fenced_block
+
 
 def extract_sql(resp: str) -> str:
     """从模型返回文本中提取SQL"""
     if not resp:
         return resp
     text = str(resp).strip()
-    pattern = r"```(?:sql)?\s*([\s\S]*?)```"
-    m = re.search(pattern, text, flags=re.IGNORECASE)
-    if m:
-        return m.group(1).strip()
+    block = find_fenced_block(text)
+    if block is not None:
+        return block
+    # 生成在结束标记处被 stop 截断（或超出 max_tokens）时只有开始标记
+    start = text.find("```")
+    if start >= 0:
+        body = text[start + 3:]
+        if body[:3].lower() == "sql":
+            body = body[3:]
+        if body.strip():
+            return body.strip()
     return text
 
 
@@ -1,10 +1,82 @@
 # -*- coding: utf-8 -*-
 """
 SQL 安全验证工具
+
+基于 sql_lexer 的 token 流做单遍检查，字符串字面量、注释和带引号的标识符不参与关键字匹配。
+校验结论按 SQL 指纹缓存：只差在字面量上的 SQL 共享同一个结论。
 """
-import re
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
 from fastapi import HTTPException
 
+from .metrics import record_cache
+from .sql_lexer import COMMENT, ERROR, KEYWORD, PUNCT, WS, fingerprint, iter_tokens
+
+# 包含了修改、删除、结构变更及 SQLite 危险元指令
+BLACKLIST = frozenset([
+    "INSERT", "UPDATE", "DELETE", "REPLACE", "MERGE",
+    "CREATE", "ALTER", "DROP", "TRUNCATE",
+    "ATTACH", "DETACH", "VACUUM", "PRAGMA",
+    "BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE",
+    "EXEC", "EXECUTE",
+])
+
+# 同名的只读标量函数，后面紧跟 "(" 时不算违禁关键字
+READONLY_FUNCTIONS = frozenset(["REPLACE"])
+
+VERDICT_CACHE_SIZE = 4096
+
+# 结论: None 表示通过，否则为 (status_code, detail)
+Verdict = Optional[Tuple[int, str]]
+
+_text_cache: "OrderedDict[str, Verdict]" = OrderedDict()
+_fingerprint_cache: "OrderedDict[str, Verdict]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cache_get(cache: "OrderedDict[str, Verdict]", key: str):
+    with _cache_lock:
+        if key in cache:
+            cache.move_to_end(key)
+            return True, cache[key]
+    return False, None
+
+
+def _cache_put(cache: "OrderedDict[str, Verdict]", key: str, verdict: Verdict):
+    with _cache_lock:
+        cache[key] = verdict
+        cache.move_to_end(key)
+        while len(cache) > VERDICT_CACHE_SIZE:
+            cache.popitem(last=False)
+
+
+def _check(tokens) -> Verdict:
+    """对去掉空白/注释的 token 流做只读检查"""
+    # 1. 必须以 SELECT 开头 (忽略大小写)
+    if not tokens or tokens[0].kind != KEYWORD or tokens[0].upper != "SELECT":
+        return 403, "安全策略拦截：仅允许执行 SELECT 查询语句。"
+
+    for i, t in enumerate(tokens):
+        if t.kind == ERROR:
+            return 403, "安全策略拦截：SQL 语句中存在未闭合的字符串、标识符或注释。"
+
+        # 2. 禁止多条语句执行：分号只能作为最后一个 token
+        if t.kind == PUNCT and t.text == ";" and i != len(tokens) - 1:
+            return 403, "安全策略拦截：禁止执行多条 SQL 语句（检测到分号）。"
+
+        # 3. 黑名单关键词检测（只看未加引号的关键字）
+        if t.kind == KEYWORD:
+            word = t.upper
+            if word in BLACKLIST:
+                next_token = tokens[i + 1] if i + 1 < len(tokens) else None
+                if word in READONLY_FUNCTIONS and next_token is not None and next_token.text == "(":
+                    continue
+                return 403, f"安全策略拦截：检测到禁止使用的关键词 '{word}'。"
+
+    return None
+
 
 def validate_sql_readonly(sql: str):
     """
@@ -13,43 +85,18 @@ def validate_sql_readonly(sql: str):
     if not sql:
         raise HTTPException(status_code=400, detail="SQL语句为空")
 
-    # 1. 清理空白字符
-    clean_sql = sql.strip()
-
-    # 2. 必须以 SELECT 开头 (忽略大小写)
-    # 使用 re.I (IGNORECASE) 确保捕获 Select, select, SELECT 等
-    if not re.match(r'^\s*SELECT\b', clean_sql, re.I):
-        raise HTTPException(
-            status_code=403,
-            detail="安全策略拦截：仅允许执行 SELECT 查询语句。"
-        )
-
-    # 3. 禁止多条语句执行 (检查分号)
-    # 如果有分号，且分号不是在字符串最后，或者分号后还有内容，则拒绝
-    if ";" in clean_sql:
-        # 允许末尾有唯一的分号，但不允许分号后跟其他字符
-        if not re.match(r'^[^;]+;\s*$', clean_sql):
-             raise HTTPException(
-                status_code=403,
-                detail="安全策略拦截：禁止执行多条 SQL 语句（检测到分号）。"
-            )
-
-    # 4. 黑名单关键词检测 (使用 \b 单词边界防止误伤字段名)
-    # 包含了修改、删除、结构变更及 SQLite 危险元指令
-    blacklist = [
-        r"\bINSERT\b", r"\bUPDATE\b", r"\bDELETE\b", r"\bREPLACE\b", r"\bMERGE\b",
-        r"\bCREATE\b", r"\bALTER\b", r"\bDROP\b", r"\bTRUNCATE\b",
-        r"\bATTACH\b", r"\bDETACH\b", r"\bVACUUM\b", r"\bPRAGMA\b",
-        r"\bBEGIN\b", r"\bCOMMIT\b", r"\bROLLBACK\b", r"\bSAVEPOINT\b", r"\bRELEASE\b",
-        r"\bEXEC\b", r"\bEXECUTE\b"
-    ]
-
-    for pattern in blacklist:
-        if re.search(pattern, clean_sql, re.I):
-            clean_name = pattern.replace(r"\b", "")
-            raise HTTPException(
-                status_code=403,
-                detail=f"安全策略拦截：检测到禁止使用的关键词 '{clean_name}'。"
-            )
+    hit, verdict = _cache_get(_text_cache, sql)
+    record_cache("sql_verdict", hit)
+    if not hit:
+        tokens = [t for t in iter_tokens(sql) if t.kind != WS and t.kind != COMMENT]
+        key = fingerprint(tokens)
+        hit, verdict = _cache_get(_fingerprint_cache, key)
+        record_cache("sql_fingerprint_verdict", hit)
+        if not hit:
+            verdict = _check(tokens)
+            _cache_put(_fingerprint_cache, key, verdict)
+        _cache_put(_text_cache, sql, verdict)
 
+    if verdict is not None:
+        raise HTTPException(status_code=verdict[0], detail=verdict[1])
     return True
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+表随机抽样与行数估计
+
+抽样不使用 ORDER BY RANDOM()（需要全表扫描并排序），而是在 rowid 范围内随机取候选 rowid，
+用 rowid 主键查找命中的行，代价与抽样行数成正比：
+- 候选 rowid 在 [最小 rowid, 最大 rowid] 内均匀抽取，命中即保留，结果是存活行上的均匀抽样
+- 按估计的 rowid 密度放大候选数；几轮后仍不足（rowid 非常稀疏）时，从随机位置向后探测补齐，
+  此时紧跟在 rowid 空洞之后的行被抽中的概率略高
+- 没有 rowid 的表（WITHOUT ROWID）与视图退回为读取前 n 行
+
+行数估计优先读取 ANALYZE 维护的 sqlite_stat1，没有统计信息时用 rowid 范围作为上界，均不执行 COUNT(*)。
+"""
+import math
+import random
+import sqlite3
+from typing import Any, List, NamedTuple, Optional, Tuple
+
+from ..config.settings import (
+    SAMPLE_ANALYSIS_LIMIT,
+    SAMPLE_MAX_CANDIDATES_PER_ROW,
+    SAMPLE_MAX_ROUNDS,
+    SAMPLE_OVERSAMPLE,
+)
+
+# 单条语句中绑定参数的上限（旧版本 SQLite 的默认值）
+MAX_BIND_PARAMS = 999
+
+
+class RowCountEstimate(NamedTuple):
+    rows: int
+    source: str  # stat1（ANALYZE 统计）/ rowid_range（rowid 范围上界）
+
+
+class TableSample(NamedTuple):
+    columns: List[str]
+    rows: List[Tuple[Any, ...]]
+    sampled: bool  # False 表示返回的是全表或前 n 行
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def table_exists(conn: sqlite3.Connection, table: str) -> bool:
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?", (table,)
+    ).fetchone()
+    return row is not None
+
+
+def _rowid_bounds(conn: sqlite3.Connection, table: str) -> Optional[Tuple[int, int]]:
+    """最小与最大 rowid（两次主键查找）；空表返回 (0, -1)，没有 rowid 时返回 None"""
+    name = quote_identifier(table)
+    try:
+        lo = conn.execute(f"SELECT rowid FROM {name} ORDER BY rowid LIMIT 1").fetchone()
+        hi = conn.execute(f"SELECT rowid FROM {name} ORDER BY rowid DESC LIMIT 1").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    if lo is None or hi is None:
+        return 0, -1
+    return lo[0], hi[0]
+
+
+def _stat1_rows(conn: sqlite3.Connection, table: str) -> Optional[int]:
+    try:
+        rows = conn.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = ?", (table,)).fetchall()
+    except sqlite3.OperationalError:
+        return None  # 从未执行过 ANALYZE
+    counts = []
+    for (stat,) in rows:
+        head = (stat or "").split(" ", 1)[0]
+        if head.isdigit():
+            counts.append(int(head))
+    return max(counts) if counts else None
+
+
+def estimate_row_count(conn: sqlite3.Connection, table: str) -> Optional[RowCountEstimate]:
+    """估计表的行数：sqlite_stat1 的统计值，其次是 rowid 范围；都无法得到时返回 None"""
+    rows = _stat1_rows(conn, table)
+    if rows is not None:
+        return RowCountEstimate(rows, "stat1")
+    bounds = _rowid_bounds(conn, table)
+    if bounds is not None:
+        return RowCountEstimate(max(0, bounds[1] - bounds[0] + 1), "rowid_range")
+    return None
+
+
+def analyze_table(conn: sqlite3.Connection, table: str, limit: int = 0):
+    """
+    为表收集 sqlite_stat1 统计信息（需要可写连接）
+
+    limit > 0 时设置 analysis_limit，每个索引只扫描约 limit 行，得到近似统计。
+    """
+    conn.execute(f"PRAGMA analysis_limit = {int(limit)}")
+    conn.execute(f"ANALYZE {quote_identifier(table)}")
+    conn.commit()
+
+
+def ensure_stats(conn: sqlite3.Connection, tables: List[str], limit: int = SAMPLE_ANALYSIS_LIMIT) -> List[str]:
+    """为没有统计信息的表执行（限量的）ANALYZE，返回新收集了统计信息的表"""
+    analyzed = []
+    for table in tables:
+        if _stat1_rows(conn, table) is None:
+            analyze_table(conn, table, limit)
+            analyzed.append(table)
+    return analyzed
+
+
+def _fetch_by_rowids(conn: sqlite3.Connection, table: str, rowids: List[int]) -> List[Tuple[Any, ...]]:
+    name = quote_identifier(table)
+    rows = []
+    for i in range(0, len(rowids), MAX_BIND_PARAMS):
+        chunk = rowids[i:i + MAX_BIND_PARAMS]
+        placeholders = ",".join("?" * len(chunk))
+        rows.extend(conn.execute(f"SELECT rowid, * FROM {name} WHERE rowid IN ({placeholders})", chunk).fetchall())
+    return rows
+
+
+def _columns(cursor: sqlite3.Cursor, skip_rowid: bool) -> List[str]:
+    names = [c[0] for c in cursor.description]
+    return names[1:] if skip_rowid else names
+
+
+def sample_rows(conn: sqlite3.Connection, table: str, n: int, seed: Any = None) -> TableSample:
+    """
+    从表中均匀随机抽取 n 行（按 rowid 顺序返回）
+
+    Args:
+        conn: 数据库连接
+        table: 表名（调用方需确认表存在）
+        n: 抽取行数
+        seed: 随机种子，相同种子在表内容不变时得到相同结果
+    """
+    name = quote_identifier(table)
+    bounds = _rowid_bounds(conn, table)
+    if bounds is None:
+        cur = conn.execute(f"SELECT * FROM {name} LIMIT ?", (n,))
+        return TableSample(_columns(cur, False), cur.fetchall(), False)
+
+    lo, hi = bounds
+    span = hi - lo + 1
+    if span <= n:
+        # rowid 范围不超过 n 时全表行数也不超过 n
+        cur = conn.execute(f"SELECT rowid, * FROM {name} ORDER BY rowid")
+        return TableSample(_columns(cur, True), [row[1:] for row in cur.fetchall()], False)
+
+    estimate = _stat1_rows(conn, table)
+    density = min(1.0, estimate / span) if estimate else 1.0
+    rng = random.Random(seed)
+    picked = {}
+    tried = set()
+    for _ in range(SAMPLE_MAX_ROUNDS):
+        missing = n - len(picked)
+        if missing <= 0 or len(tried) >= span:
+            break
+        # 候选数上限与缺少的行数成正比，rowid 稀疏时不会退化为扫描整个范围
+        want = min(span - len(tried), math.ceil(missing / max(density, 1e-6) * SAMPLE_OVERSAMPLE),
+                   missing * SAMPLE_MAX_CANDIDATES_PER_ROW)
+        candidates = [r for r in rng.sample(range(lo, hi + 1), want) if r not in tried]
+        tried.update(candidates)
+        hits = _fetch_by_rowids(conn, table, candidates)
+        for row in hits:
+            picked[row[0]] = row
+        # 用实际命中率修正密度（统计信息可能过期）
+        if candidates:
+            density = max(len(hits) / len(candidates), 1.0 / span)
+
+    if len(picked) < n:
+        # rowid 很稀疏：从随机位置向后找第一条未抽中的行
+        probe = f"SELECT rowid, * FROM {name} WHERE rowid >= ? ORDER BY rowid LIMIT ?"
+        for _ in range((n - len(picked)) * 4):
+            limit = len(picked) + 1
+            for row in conn.execute(probe, (rng.randint(lo, hi), limit)):
+                if row[0] not in picked:
+                    picked[row[0]] = row
+                    break
+            if len(picked) >= n:
+                break
+
+    keep = sorted(picked)
+    if len(keep) > n:
+        keep = sorted(rng.sample(keep, n))
+    cur = conn.execute(f"SELECT rowid, * FROM {name} LIMIT 0")
+    return TableSample(_columns(cur, True), [picked[r][1:] for r in keep], True)
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+Prompt 模板加载工具
+
+模板文件按修改时间缓存，避免每次请求都读盘；通过配置接口保存模板后会自动重新加载。
+"""
+import os
+import threading
+from typing import Dict, Tuple
+
+from .metrics import record_cache
+
+_cache: Dict[str, Tuple[float, int, str]] = {}
+_lock = threading.Lock()
+
+
+def load_template(path: str) -> str:
+    """读取模板内容（文件未变化时直接返回缓存）"""
+    st = os.stat(path)
+    cached = _cache.get(path)
+    if cached is not None and cached[0] == st.st_mtime and cached[1] == st.st_size:
+        record_cache("template", True)
+        return cached[2]
+
+    record_cache("template", False)
+    with open(path, encoding="utf-8") as f:
+        content = f.read()
+    with _lock:
+        _cache[path] = (st.st_mtime, st.st_size, content)
+    return content
+
+
+def invalidate_template(path: str):
+    """模板被修改后主动清除缓存"""
+    with _lock:
+        _cache.pop(path, None)
+
+
+def template_version(path: str) -> Tuple[int, int]:
+    """模板版本（修改时间与大小），用于区分不同模板生成的结果"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return 0, 0
+    return st.st_mtime_ns, st.st_size
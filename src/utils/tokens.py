@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+"""
+Token 数估算
+
+不依赖具体模型的分词器，按字符类别粗略估算：
+中日韩字符约 1 个 token，其余字符（英文、数字、标点、空白）约 4 个字符 1 个 token。
+"""
+import math
+import re
+
+CJK_PATTERN = r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]"
+CHARS_PER_TOKEN = 4
+
+_CJK_RE = re.compile(CJK_PATTERN)
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文本的 token 数"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / CHARS_PER_TOKEN)